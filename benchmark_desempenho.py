@@ -0,0 +1,1127 @@
+#!/usr/bin/env python3
+"""
+Benchmarks de desempenho do GeoChat
+
+Uso:
+    python3 benchmark_desempenho.py              # executa todos os benchmarks
+    python3 benchmark_desempenho.py grafo        # executa apenas os indicados
+
+Benchmarks do broker usam o RabbitMQ configurado; para rodar sem rede,
+com o broker em memória:
+    GEOCHAT_BROKER=memoria python3 benchmark_desempenho.py ponta_a_ponta
+"""
+
+import random
+import sys
+import threading
+import time
+
+
+def _gerar_multidao(quantidade: int, raio_area: float = 0.05, semente: int = 42) -> list:
+    """Gera usuários aleatórios ao redor do centro de São Paulo"""
+    from common.usuario import Usuario, StatusUsuario
+    from common.config import config
+
+    gerador = random.Random(semente)
+    lat_centro, lon_centro = config.get_default_location()
+    usuarios = []
+    for indice in range(quantidade):
+        usuarios.append(Usuario(
+            f"user{indice}",
+            lat_centro + gerador.uniform(-raio_area, raio_area),
+            lon_centro + gerador.uniform(-raio_area, raio_area),
+            gerador.uniform(500, 1500),
+            StatusUsuario.ONLINE
+        ))
+    return usuarios
+
+
+def benchmark_grafo_proximidade():
+    """Custo de atualizar o grafo de proximidade com uma multidão em movimento"""
+    print("📍 Grafo de proximidade (multidão em movimento)...")
+
+    from server.grafo_proximidade import GrafoProximidade
+
+    gerador = random.Random(7)
+    for quantidade in (1000, 5000, 20000):
+        # Área cresce com a multidão para manter a densidade local constante
+        usuarios = _gerar_multidao(quantidade, raio_area=0.05 * (quantidade / 1000) ** 0.5)
+        grafo = GrafoProximidade()
+
+        inicio = time.perf_counter()
+        for usuario in usuarios:
+            grafo.adicionar_usuario(usuario)
+        tempo_carga = time.perf_counter() - inicio
+
+        def mover_multidao():
+            # Cada passo move 10% da multidão alguns metros
+            movimentos = 0
+            inicio = time.perf_counter()
+            for _ in range(5):
+                for usuario in gerador.sample(usuarios, quantidade // 10):
+                    usuario.atualizar_localizacao(
+                        usuario.latitude + gerador.uniform(-0.0005, 0.0005),
+                        usuario.longitude + gerador.uniform(-0.0005, 0.0005)
+                    )
+                    grafo.atualizar_usuario(usuario)
+                    movimentos += 1
+            return (time.perf_counter() - inicio) / movimentos
+
+        tempo_incremental = mover_multidao()
+
+        # Referência: recalcular o par (movido, todos) como antes do grafo
+        amostra = usuarios[:50]
+        inicio = time.perf_counter()
+        for usuario in amostra:
+            for outro in usuarios:
+                if outro is not usuario:
+                    usuario.pode_comunicar_sincronamente(outro)
+                    outro.pode_comunicar_sincronamente(usuario)
+        tempo_ingenuo = (time.perf_counter() - inicio) / len(amostra)
+
+        grau_medio = grafo.numero_arestas() / quantidade
+        print(f"   {quantidade:>6} usuários | carga {tempo_carga * 1000:8.1f} ms | "
+              f"grau médio {grau_medio:6.1f} | por movimento: "
+              f"incremental {tempo_incremental * 1e6:8.1f} µs, "
+              f"varredura completa {tempo_ingenuo * 1e6:10.1f} µs")
+
+        # Um único usuário com raio grande não deve encarecer o movimento dos demais
+        usuarios[0].atualizar_raio(50000.0)
+        grafo.atualizar_usuario(usuarios[0])
+        tempo_raio_grande = mover_multidao()
+        print(f"   {'':>6}          | com um usuário de 50 km: "
+              f"incremental {tempo_raio_grande * 1e6:8.1f} µs")
+    return True
+
+
+def benchmark_listagem_usuarios():
+    """CPU por listagem de usuários com serialização em cache vs. recodificação completa"""
+    print("📋 Listagem de usuários (10k usuários conectados)...")
+
+    import json
+    import socket
+    import threading
+    from datetime import datetime
+    from server.servidor_socket import ServidorSocket
+    from common.protocolo import LeitorFrames
+
+    servidor = ServidorSocket()
+    usuarios = _gerar_multidao(10000)
+    for usuario in usuarios:
+        servidor.usuarios_conectados[usuario.nome] = usuario
+        servidor.grafo_proximidade.adicionar_usuario(usuario)
+
+    # Par de sockets local: o servidor escreve em uma ponta, uma thread drena a outra
+    conexao_servidor, conexao_cliente = socket.socketpair()
+    servidor.conexoes[usuarios[0].nome] = conexao_servidor
+    leitor = LeitorFrames(conexao_cliente)
+    tamanhos = []
+
+    def drenar():
+        try:
+            while True:
+                frame = leitor.receber_frame()
+                if frame is None:
+                    break
+                tamanhos.append(len(frame))
+        except OSError:
+            pass
+
+    threading.Thread(target=drenar, daemon=True).start()
+
+    def listagem_recodificando():
+        """Listagem como era antes do cache: um dicionário novo por usuário + json.dumps"""
+        with servidor.lock:
+            solicitante = usuarios[0]
+            lista = []
+            for nome, usuario in servidor.usuarios_conectados.items():
+                if nome != solicitante.nome:
+                    lista.append({
+                        'nome': usuario.nome,
+                        'latitude': usuario.latitude,
+                        'longitude': usuario.longitude,
+                        'status': usuario.status.value,
+                        'distancia': round(solicitante.calcular_distancia(usuario), 2),
+                        'no_raio': solicitante.esta_no_raio(usuario)
+                    })
+        resposta = {'tipo': 'lista_usuarios', 'usuarios': lista, 'timestamp': datetime.now().isoformat()}
+        servidor._enviar_mensagem(conexao_servidor, resposta)
+
+    repeticoes = 20
+    servidor._processar_listagem_usuarios(conexao_servidor)  # aquece o cache de fragmentos
+    for descricao, funcao in (("recodificando tudo", listagem_recodificando),
+                              ("fragmentos em cache",
+                               lambda: servidor._processar_listagem_usuarios(conexao_servidor))):
+        inicio_cpu = time.process_time()
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            funcao()
+        cpu = (time.process_time() - inicio_cpu) / repeticoes
+        parede = (time.perf_counter() - inicio) / repeticoes
+        print(f"   {descricao:<22} CPU {cpu * 1000:7.2f} ms/listagem | tempo {parede * 1000:7.2f} ms")
+
+    time.sleep(0.2)
+    if tamanhos:
+        print(f"   Tamanho da resposta: {tamanhos[-1] / 1024:.0f} KB")
+    conexao_servidor.close()
+    conexao_cliente.close()
+    return True
+
+
+def benchmark_roteamento_localizacao():
+    """Cópias entregues por atualização de localização: fanout contra topic por célula"""
+    print("🗺️  Roteamento de localização (cópias por atualização)...")
+
+    from collections import Counter
+    from broker.rabbitmq_manager import ConfiguradorRabbitMQ
+
+    # Só usa as funções de cálculo de chaves; não conecta ao broker
+    configurador = ConfiguradorRabbitMQ()
+    for quantidade in (1000, 5000, 20000):
+        usuarios = _gerar_multidao(quantidade, raio_area=0.05 * (quantidade / 1000) ** 0.5)
+
+        # Bindings de todas as filas, como o topic exchange os veria
+        vinculos = Counter()
+        for usuario in usuarios:
+            vinculos.update(configurador.chaves_vinculo_localizacao(
+                usuario.latitude, usuario.longitude, usuario.raio_comunicacao))
+
+        copias = 0
+        for usuario in usuarios:
+            chave = configurador.chave_roteamento_localizacao(usuario.latitude, usuario.longitude)
+            palavras = chave.split('.')
+            copias += vinculos[chave] + sum(
+                vinculos['.'.join(palavras[:tamanho]) + '.#'] for tamanho in range(1, len(palavras))
+            )
+
+        print(f"   {quantidade:>6} usuários: fanout {quantidade:>6} cópias/atualização, "
+              f"topic {copias / quantidade:8.1f} cópias/atualização")
+    return True
+
+
+def _conectar_broker_benchmark(nome_fila: str):
+    """Conecta ao broker configurado e cria a fila usada no benchmark (None se indisponível)"""
+    from broker.rabbitmq_manager import ConfiguradorRabbitMQ
+    from common.config import config
+
+    configurador = ConfiguradorRabbitMQ(config.RABBITMQ_HOST, config.RABBITMQ_PORT,
+                                        config.RABBITMQ_USER, config.RABBITMQ_PASS)
+    if not configurador.conectar():
+        print("   ⚠️  Broker indisponível - inicie o RabbitMQ para este benchmark")
+        return None
+    if not (configurador.configurar_topologia() and configurador.criar_fila_usuario(nome_fila)):
+        configurador.desconectar()
+        return None
+    return configurador
+
+
+def benchmark_publisher_confirms():
+    """Vazão de publicações sem confirmação, com confirmação síncrona e com pipelining"""
+    print("📨 Publisher confirms (vazão de publicação)...")
+
+    import contextlib
+    import io
+    from broker.rabbitmq_manager import PublisherMensagem
+
+    configurador = _conectar_broker_benchmark("benchmark_confirms")
+    if not configurador:
+        return False
+
+    quantidade = 5000
+    try:
+        for descricao, confirmacoes, pipelined, total in (
+            ("sem confirmação", False, True, quantidade),
+            ("confirmação síncrona", True, False, quantidade // 10),
+            ("confirmação pipelined", True, True, quantidade),
+        ):
+            # A fila tem x-max-length com reject-publish: cada rodada começa
+            # com ela vazia, senão as últimas publicações seriam recusadas
+            with contextlib.redirect_stdout(io.StringIO()):
+                recriada = configurador.deletar_fila_usuario("benchmark_confirms") and \
+                    configurador.criar_fila_usuario("benchmark_confirms")
+            if not recriada:
+                return False
+
+            publisher = PublisherMensagem(configurador, confirmacoes=confirmacoes)
+            if not publisher.conectar():
+                return False
+
+            inicio = time.perf_counter()
+            if pipelined:
+                futuros = [publisher.enviar_mensagem_confirmada("bench", "benchmark_confirms", f"msg {i}")
+                           for i in range(total)]
+                confirmadas = sum(1 for futuro in futuros if futuro.result(30))
+            else:
+                confirmadas = sum(
+                    1 for i in range(total)
+                    if publisher.enviar_mensagem_confirmada("bench", "benchmark_confirms", f"msg {i}").result(30)
+                )
+            duracao = time.perf_counter() - inicio
+            publisher.desconectar()
+
+            print(f"   {descricao:<24} {total / duracao:10.0f} msg/s "
+                  f"({confirmadas}/{total} confirmadas)")
+    finally:
+        configurador.deletar_fila_usuario("benchmark_confirms")
+        configurador.desconectar()
+    return True
+
+
+# Vazão mínima de enviar_mensagens_lote em relação ao loop de chamadas
+GANHO_MINIMO_LOTE = 5.0
+
+
+def benchmark_publicacao_lote():
+    """Vazão de enviar_mensagens_lote contra um loop de enviar_mensagem_assincrona"""
+    print("📦 Publicação em lote (rajada de mensagens offline)...")
+
+    import contextlib
+    import io
+    from broker.rabbitmq_manager import PublisherMensagem
+    from common.config import config
+
+    configurador = _conectar_broker_benchmark("benchmark_lote")
+    if not configurador:
+        return False
+
+    quantidade = 2000
+    itens = [("benchmark_lote", f"mensagem {i}", "offline") for i in range(quantidade)]
+    publisher = PublisherMensagem(configurador)
+    try:
+        if not publisher.conectar():
+            return False
+
+        vazoes = {}
+        for descricao, enviar in (
+            ("loop de chamadas", lambda: [publisher.enviar_mensagem_assincrona("bench", *item)
+                                          for item in itens]),
+            ("enviar_mensagens_lote", lambda: publisher.enviar_mensagens_lote("bench", itens)),
+        ):
+            # Os prints por mensagem não entram na medição
+            with contextlib.redirect_stdout(io.StringIO()):
+                inicio = time.perf_counter()
+                resultados = enviar()
+                duracao = time.perf_counter() - inicio
+            vazoes[descricao] = quantidade / duracao
+            print(f"   {descricao:<24} {vazoes[descricao]:10.0f} msg/s "
+                  f"({sum(resultados)}/{quantidade} confirmadas)")
+
+        ganho = vazoes["enviar_mensagens_lote"] / vazoes["loop de chamadas"]
+        print(f"   Ganho do lote: {ganho:.1f}x (meta: {GANHO_MINIMO_LOTE:.0f}x, "
+              f"{'atingida' if ganho >= GANHO_MINIMO_LOTE else 'NÃO atingida'}; broker: {config.BROKER_BACKEND})")
+    finally:
+        publisher.desconectar()
+        configurador.deletar_fila_usuario("benchmark_lote")
+        configurador.desconectar()
+    return True
+
+
+def benchmark_ponta_a_ponta():
+    """Vazão e latência do fluxo assíncrono completo: publisher -> broker -> callback do consumer"""
+    print("🔁 Fluxo assíncrono ponta a ponta...")
+
+    import contextlib
+    import io
+    import threading
+    from broker.rabbitmq_manager import PublisherMensagem, ConsumerMensagem
+    from common.config import config
+
+    configurador = _conectar_broker_benchmark("benchmark_destino")
+    if not configurador:
+        return False
+    print(f"   Broker: {config.BROKER_BACKEND}")
+
+    quantidade = 10000
+    enviadas_em = {}
+    latencias = []
+    todas_recebidas = threading.Event()
+
+    def on_mensagem(dados):
+        latencias.append(time.perf_counter() - enviadas_em[dados['conteudo']])
+        if len(latencias) == quantidade:
+            todas_recebidas.set()
+
+    publisher = PublisherMensagem(configurador)
+    consumer = ConsumerMensagem(configurador, "benchmark_destino")
+    try:
+        if not (publisher.conectar() and consumer.conectar()):
+            return False
+        consumer.definir_callback_mensagem(on_mensagem)
+        with contextlib.redirect_stdout(io.StringIO()):
+            consumer.iniciar_consumo()
+
+            inicio = time.perf_counter()
+            for bloco in range(0, quantidade, 500):
+                itens = [("benchmark_destino", f"msg {i}", "offline")
+                         for i in range(bloco, min(bloco + 500, quantidade))]
+                agora = time.perf_counter()
+                for _, conteudo, _ in itens:
+                    enviadas_em[conteudo] = agora
+                publisher.enviar_mensagens_lote("bench", itens)
+            completo = todas_recebidas.wait(60)
+            duracao = time.perf_counter() - inicio
+
+        if not completo:
+            print(f"   ⚠️  Só {len(latencias)}/{quantidade} mensagens recebidas em 60s")
+            return False
+
+        latencias.sort()
+        print(f"   {quantidade} mensagens em {duracao:.2f}s ({quantidade / duracao:.0f} msg/s)")
+        print(f"   Latência publicação -> callback: p50 {latencias[len(latencias) // 2] * 1000:.1f} ms, "
+              f"p99 {latencias[int(len(latencias) * 0.99)] * 1000:.1f} ms")
+        metricas = consumer.obter_metricas()
+        print(f"   Acks: {metricas['frames_ack']} frames para {metricas['confirmadas']} entregas")
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            consumer.desconectar()
+            publisher.desconectar()
+            configurador.deletar_fila_usuario("benchmark_destino")
+            configurador.desconectar()
+    return True
+
+
+def benchmark_drenagem_backlog():
+    """Tempo até o backlog offline estar disponível: callback por mensagem vs drenagem em lote"""
+    print("📥 Drenagem do backlog offline na reconexão...")
+
+    import contextlib
+    import io
+    import threading
+    from broker.rabbitmq_manager import PublisherMensagem, ConsumerMensagem
+    from common.config import config
+
+    configurador = _conectar_broker_benchmark("benchmark_backlog")
+    if not configurador:
+        return False
+    print(f"   Broker: {config.BROKER_BACKEND}")
+
+    quantidade = 10000
+    publisher = PublisherMensagem(configurador)
+
+    def medir(drenagem: bool):
+        """Acumula o backlog com o consumer offline e mede até a última mensagem chegar ao app"""
+        recebidas = [0, 0]  # [mensagens, chamadas de callback]
+        completo = threading.Event()
+
+        def registrar(quantas):
+            recebidas[0] += quantas
+            recebidas[1] += 1
+            if recebidas[0] >= quantidade:
+                completo.set()
+
+        itens = [("benchmark_backlog", f"msg {i}", "offline") for i in range(quantidade)]
+        publisher.enviar_mensagens_lote("bench", itens)
+
+        consumer = ConsumerMensagem(configurador, "benchmark_backlog")
+        try:
+            if not consumer.conectar():
+                return None
+            consumer.definir_callback_mensagem(lambda dados: registrar(1))
+            if drenagem:
+                consumer.definir_callback_backlog(lambda mensagens: registrar(len(mensagens)))
+            inicio = time.perf_counter()
+            consumer.iniciar_consumo()
+            if not completo.wait(60):
+                return None
+            return time.perf_counter() - inicio, recebidas[1]
+        finally:
+            consumer.desconectar()
+
+    try:
+        if not publisher.conectar():
+            return False
+        with contextlib.redirect_stdout(io.StringIO()):
+            por_mensagem = medir(drenagem=False)
+            drenado = medir(drenagem=True)
+
+        if not (por_mensagem and drenado):
+            print(f"   ⚠️  Backlog de {quantidade} mensagens não foi entregue em 60s")
+            return False
+
+        print(f"   Backlog de {quantidade} mensagens até estar disponível no app:")
+        print(f"   Callback por mensagem: {por_mensagem[0] * 1000:.1f} ms ({por_mensagem[1]} chamadas)")
+        print(f"   Drenagem em lote:      {drenado[0] * 1000:.1f} ms ({drenado[1]} chamadas)")
+        print(f"   Ganho: {por_mensagem[0] / drenado[0]:.1f}x")
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            publisher.desconectar()
+            configurador.deletar_fila_usuario("benchmark_backlog")
+            configurador.desconectar()
+    return True
+
+
+def benchmark_spool_queda():
+    """Spool de queda: fsync por mensagem vs em lote e vazão do reenvio na reconexão"""
+    print("💾 Spool de mensagens durante queda do broker...")
+
+    import contextlib
+    import io
+    import os
+    import tempfile
+    from broker.rabbitmq_manager import PublisherMensagem
+    from broker.spool import SpoolMensagens
+    from common.config import config
+
+    configurador = _conectar_broker_benchmark("benchmark_spool")
+    if not configurador:
+        return False
+    print(f"   Broker: {config.BROKER_BACKEND}")
+
+    quantidade = 10000
+    diretorio = tempfile.mkdtemp(prefix="geochat_spool_")
+    registros = [(configurador.exchange_mensagens, "benchmark_spool",
+                  f'{{"tipo": "mensagem_assincrona", "id": "{i}", "conteudo": "msg {i}"}}', 2)
+                 for i in range(quantidade)]
+
+    # Gravação: um anexar (e um fsync) por mensagem vs o lote inteiro de uma vez
+    amostra = 500
+    spool = SpoolMensagens(os.path.join(diretorio, "individual.jsonl"))
+    inicio = time.perf_counter()
+    for registro in registros[:amostra]:
+        spool.anexar([registro])
+    individual = (time.perf_counter() - inicio) / amostra
+    spool.fechar()
+
+    caminho = os.path.join(diretorio, "lote.jsonl")
+    spool = SpoolMensagens(caminho)
+    inicio = time.perf_counter()
+    spool.anexar(registros)
+    lote = (time.perf_counter() - inicio) / quantidade
+    spool.fechar()
+
+    print(f"   Gravação no spool ({quantidade} mensagens):")
+    print(f"   fsync por mensagem: {individual * 1e6:.1f} µs/msg")
+    print(f"   fsync em lote:      {lote * 1e6:.1f} µs/msg ({individual / lote:.0f}x)")
+
+    # Reenvio: o publisher encontra o spool pendente ao conectar
+    publisher = PublisherMensagem(configurador, caminho_spool=caminho)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            if not publisher.conectar():
+                return False
+            thread = publisher._thread_reconexao
+            if thread:
+                thread.join(60)
+        metricas = publisher.obter_metricas()
+        if metricas['spool_pendentes']:
+            print(f"   ⚠️  Spool não foi reenviado em 60s ({metricas['spool_pendentes']} pendentes)")
+            return False
+
+        print(f"   Reenvio em blocos de {publisher.tamanho_bloco_reenvio}: "
+              f"{metricas['ultimo_reenvio_mensagens']} mensagens em "
+              f"{metricas['ultimo_reenvio_segundos'] * 1000:.1f} ms "
+              f"({metricas['ultimo_reenvio_mensagens_por_segundo']:.0f} msg/s)")
+        print(f"   Spool após o reenvio: {metricas['spool_bytes']} bytes")
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            publisher.desconectar()
+            configurador.deletar_fila_usuario("benchmark_spool")
+            configurador.desconectar()
+        for nome in os.listdir(diretorio):
+            os.remove(os.path.join(diretorio, nome))
+        os.rmdir(diretorio)
+    return True
+
+
+def benchmark_consumer_multiusuario():
+    """Consumer multiusuário: 10k filas assinadas em um pool de canais, vazão e atraso"""
+    print("👥 Consumer multiusuário (10k filas em um pool de canais)...")
+
+    import contextlib
+    import io
+    import threading
+    from broker.consumer_multiusuario import ConsumerMultiusuario
+    from broker.rabbitmq_manager import PublisherMensagem
+    from common.config import config
+
+    configurador = _conectar_broker_benchmark("benchmark_multiusuario")
+    if not configurador:
+        return False
+    print(f"   Broker: {config.BROKER_BACKEND}")
+
+    quantidade = 10000
+    por_usuario = 2
+    nomes = [f"benchmark_mu_{i}" for i in range(quantidade)]
+    consumer = ConsumerMultiusuario(configurador, numero_canais=4, prefetch=20)
+    publisher = PublisherMensagem(configurador)
+    recebidas = [0]
+    lock = threading.Lock()
+    todas = threading.Event()
+
+    def receber(dados: dict) -> bool:
+        with lock:
+            recebidas[0] += 1
+            if recebidas[0] == quantidade * por_usuario:
+                todas.set()
+        return True
+
+    try:
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            criadas = sum(1 for nome in nomes if configurador.criar_fila_usuario(nome))
+        print(f"   Declaração de {criadas} filas: {time.perf_counter() - inicio:.2f} s")
+
+        threads_antes = threading.active_count()
+        if not (consumer.conectar() and publisher.conectar()):
+            return False
+
+        inicio = time.perf_counter()
+        assinadas = consumer.assinar_varios({nome: receber for nome in nomes})
+        print(f"   {assinadas} assinaturas em {consumer.numero_canais} canais: "
+              f"{(time.perf_counter() - inicio) * 1000:.0f} ms")
+
+        itens = [(nome, f"mensagem {i}", "offline") for i in range(por_usuario) for nome in nomes]
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            publisher.enviar_mensagens_lote("bench", itens)
+        todas.wait(120)
+        duracao = time.perf_counter() - inicio
+
+        metricas = consumer.obter_metricas()
+        print(f"   Entrega de {recebidas[0]}/{len(itens)} mensagens: {duracao:.2f} s "
+              f"({recebidas[0] / duracao:.0f} msg/s)")
+        print(f"   Atraso publicação->callback: médio {metricas['atraso_medio_ms']:.0f} ms, "
+              f"máximo {metricas['atraso_max_ms']:.0f} ms")
+        print(f"   Frames de ack: {metricas['frames_ack']} "
+              f"({len(itens) / max(metricas['frames_ack'], 1):.0f} entregas por ack)")
+        print(f"   Threads novas: {threading.active_count() - threads_antes} "
+              f"(um ConsumerMensagem por usuário: {quantidade} canais e {quantidade} pools)")
+
+        # Alterações em tempo de execução
+        amostra = nomes[:1000]
+        inicio = time.perf_counter()
+        for nome in amostra:
+            consumer.cancelar(nome)
+        cancelar = (time.perf_counter() - inicio) / len(amostra)
+        inicio = time.perf_counter()
+        for nome in amostra:
+            consumer.assinar(nome, receber)
+        assinar = (time.perf_counter() - inicio) / len(amostra)
+        print(f"   Em execução: assinar {assinar * 1e6:.0f} µs, cancelar {cancelar * 1e6:.0f} µs por usuário")
+        return todas.is_set()
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            publisher.desconectar()
+            consumer.desconectar()
+            for nome in nomes + ["benchmark_multiusuario"]:
+                configurador.deletar_fila_usuario(nome)
+            configurador.desconectar()
+
+
+def benchmark_compressao():
+    """Bytes economizados vs CPU gasta ao comprimir listagens e mensagens grandes"""
+    print("🗜️  Compressão de payloads...")
+
+    import json
+    from common.compressao import CompressorPayload, algoritmos_disponiveis, ZLIB
+
+    usuarios = _gerar_multidao(10000)
+    solicitante = usuarios[0]
+    listagem = json.dumps({
+        'tipo': 'lista_usuarios',
+        'usuarios': [dict(usuario.to_dict(), distancia=round(solicitante.calcular_distancia(usuario), 2),
+                          no_raio=solicitante.esta_no_raio(usuario)) for usuario in usuarios[1:]],
+    }).encode('utf-8')
+    mensagem = json.dumps({'tipo': 'mensagem_assincrona', 'remetente': 'ana', 'destinatario': 'bob',
+                           'conteudo': 'Chegando no ponto de encontro em 5 minutos. ' * 60}).encode('utf-8')
+    curta = json.dumps({'tipo': 'mensagem_assincrona', 'conteudo': 'oi!'}).encode('utf-8')
+
+    configuracoes = [(ZLIB, {'nivel_zlib': 1}), (ZLIB, {'nivel_zlib': 6})]
+    if 'zstd' in algoritmos_disponiveis():
+        configuracoes.append(('zstd', {'nivel_zstd': 3}))
+    else:
+        print("   (zstd indisponível - instale 'zstandard' para compará-lo)")
+
+    repeticoes = 20
+    for descricao, payload in (("listagem de 10k usuários", listagem),
+                               ("mensagem de 2.7 KB", mensagem),
+                               ("mensagem curta", curta)):
+        print(f"   {descricao} ({len(payload) / 1024:.1f} KB):")
+        for algoritmo, niveis in configuracoes:
+            compressor = CompressorPayload(algoritmo, **niveis)
+            for _ in range(repeticoes):
+                comprimido, usado = compressor.comprimir(payload)
+                compressor.descomprimir(comprimido, usado)
+            metricas = compressor.obter_metricas()
+            nivel = niveis.get('nivel_zlib', niveis.get('nivel_zstd'))
+            if not metricas['comprimidos']:
+                print(f"      {algoritmo}-{nivel}: abaixo do limite de {compressor.limite} bytes, enviado como está")
+                continue
+            print(f"      {algoritmo}-{nivel}: {metricas['razao']:5.1f}x, "
+                  f"{metricas['bytes_economizados'] / repeticoes / 1024:7.1f} KB economizados, "
+                  f"CPU {metricas['cpu_compressao_ms'] / repeticoes:6.2f} ms para comprimir e "
+                  f"{metricas['cpu_descompressao_ms'] / repeticoes:6.2f} ms para descomprimir "
+                  f"({metricas['kb_economizados_por_ms_cpu']:.0f} KB/ms)")
+    return True
+
+
+class _TreeviewSimulada:
+    """
+    Substituto do ttk.Treeview para rodar o benchmark da tabela sem display
+
+    Guarda as linhas em memória e conta as chamadas que iriam para o Tk,
+    que é o que custa caro no widget real.
+    """
+
+    def __init__(self):
+        self.chamadas = 0
+        self._ordem = []
+        self._valores = {}
+        self._selecao = ()
+        self._contador = 0
+
+    def insert(self, parent, index, iid=None, values=()):
+        self.chamadas += 1
+        if iid is None:
+            self._contador += 1
+            iid = f"I{self._contador:05X}"
+        self._ordem.append(iid)
+        self._valores[iid] = tuple(values)
+        return iid
+
+    def item(self, iid, values=None):
+        self.chamadas += 1
+        if values is not None:
+            self._valores[iid] = tuple(values)
+        return {'values': list(self._valores[iid])}
+
+    def delete(self, *iids):
+        self.chamadas += 1
+        apagar = set(iids)
+        self._ordem = [iid for iid in self._ordem if iid not in apagar]
+        for iid in iids:
+            del self._valores[iid]
+        self._selecao = tuple(iid for iid in self._selecao if iid not in apagar)
+
+    def move(self, iid, parent, index):
+        self.chamadas += 1
+        self._ordem.remove(iid)
+        self._ordem.insert(index, iid)
+
+    def get_children(self, item=''):
+        self.chamadas += 1
+        return tuple(self._ordem)
+
+    def selection(self):
+        return self._selecao
+
+    def selection_set(self, *iids):
+        self._selecao = iids
+
+
+def benchmark_tabela_usuarios():
+    """Atualização da lista de usuários na GUI: apagar e reinserir vs TabelaIncremental"""
+    print("🗂️  Lista de usuários na GUI (10k linhas)...")
+
+    from gui.tabela_incremental import TabelaIncremental
+
+    def criar_tree():
+        try:
+            import tkinter as tk
+            from tkinter import ttk
+            root = tk.Tk()
+            root.withdraw()
+            tree = ttk.Treeview(root, columns=('nome', 'distancia', 'no_raio', 'status', 'comunicacao'),
+                                show='headings')
+            return root, tree
+        except Exception:
+            return None, _TreeviewSimulada()
+
+    quantidade = 10000
+    gerador = random.Random(3)
+    linhas = [(f"user{i}", (f"user{i}", f"{gerador.uniform(0, 3000):.1f}", "Sim", "online", "Síncrona"))
+              for i in range(quantidade)]
+
+    # Próxima atualização: 1% mudou de distância/status, 50 entraram e 50 saíram
+    seguinte = list(linhas[50:])
+    for indice in gerador.sample(range(len(seguinte)), quantidade // 100):
+        nome, valores = seguinte[indice]
+        seguinte[indice] = (nome, (nome, f"{gerador.uniform(0, 3000):.1f}", "Não", "offline", "Assíncrona"))
+    seguinte += [(f"novo{i}", (f"novo{i}", "10.0", "Sim", "online", "Síncrona")) for i in range(50)]
+
+    def atualizar_tudo(tree, atualizacao):
+        tree.delete(*tree.get_children())
+        for _, valores in atualizacao:
+            tree.insert('', 'end', values=valores)
+
+    root, tree = criar_tree()
+    simulada = isinstance(tree, _TreeviewSimulada)
+    print(f"   Widget: {'Treeview simulado (sem display), conta chamadas ao Tk' if simulada else 'ttk.Treeview real'}")
+    try:
+        resultados = {}
+        for descricao in ("apagar e reinserir", "TabelaIncremental"):
+            tree.delete(*tree.get_children(''))
+            tabela = TabelaIncremental(tree)
+            atualizar = (lambda atualizacao: atualizar_tudo(tree, atualizacao)) \
+                if descricao == "apagar e reinserir" else tabela.sincronizar
+
+            inicio = time.perf_counter()
+            atualizar(linhas)
+            carga = time.perf_counter() - inicio
+
+            # Seleciona um usuário que continua na lista
+            alvo = tree.get_children('')[5000]
+            tree.selection_set(alvo)
+
+            tempos = {}
+            for cenario, atualizacao in (("sem mudanças", linhas), ("1% mudou, ±50 usuários", seguinte)):
+                chamadas_antes = tree.chamadas if simulada else 0
+                inicio = time.perf_counter()
+                atualizar(atualizacao)
+                tempos[cenario] = (time.perf_counter() - inicio,
+                                   (tree.chamadas - chamadas_antes) if simulada else None)
+                if cenario == "sem mudanças":
+                    selecao_mantida = alvo in tree.selection()
+            resultados[descricao] = tempos
+            print(f"   {descricao}: carga {carga * 1000:.0f} ms, seleção "
+                  f"{'mantida' if selecao_mantida else 'perdida'}")
+            for cenario, (tempo, chamadas) in tempos.items():
+                extra = f" ({chamadas} chamadas ao Tk)" if chamadas is not None else ""
+                print(f"      {cenario:<24} {tempo * 1000:8.1f} ms{extra}")
+
+        for cenario, (tempo, chamadas) in resultados["apagar e reinserir"].items():
+            tempo_incremental, chamadas_incremental = resultados["TabelaIncremental"][cenario]
+            if simulada:
+                # Sem o Tk o tempo não diz nada: o custo real está nas chamadas
+                print(f"   {cenario}: {chamadas} -> {chamadas_incremental} chamadas ao Tk")
+            else:
+                print(f"   Ganho ({cenario}): {tempo / max(tempo_incremental, 1e-9):.0f}x")
+    finally:
+        if root is not None:
+            root.destroy()
+    return True
+
+
+class _RootSimulada:
+    """Substituto de tk.Tk para medir a fila da interface sem display: guarda os after()"""
+
+    def __init__(self):
+        self.agendados = []
+        self.total_agendados = 0
+
+    def after(self, ms, funcao, *args):
+        self.agendados.append((funcao, args))
+        self.total_agendados += 1
+        return len(self.agendados)
+
+    def after_cancel(self, identificador):
+        pass
+
+    def rodar_pendentes(self):
+        """Uma passagem do loop do Tk: executa o que já estava agendado"""
+        pendentes, self.agendados = self.agendados, []
+        for funcao, args in pendentes:
+            funcao(*args)
+
+
+class _TextoSimulado:
+    """Substituto de um widget Text que conta chamadas ao Tk e linhas inseridas"""
+
+    def __init__(self):
+        self.chamadas = 0
+        self.linhas = 0
+
+    def config(self, **opcoes):
+        self.chamadas += 1
+
+    def insert(self, indice, texto):
+        self.chamadas += 1
+        self.linhas += texto.count("\n")
+
+    def see(self, indice):
+        self.chamadas += 1
+
+
+def benchmark_fila_interface():
+    """Rajada de mensagens na GUI: root.after(0, ...) por evento vs FilaEventosUI"""
+    print("🖥️  Rajada de 10k mensagens na interface...")
+
+    from gui.fila_eventos import FilaEventosUI
+
+    quantidade = 10000
+    listas = 200  # Listas de usuários intercaladas na rajada
+
+    def inserir(texto_widget, texto):
+        texto_widget.config(state='normal')
+        texto_widget.insert('end', texto)
+        texto_widget.config(state='disabled')
+        texto_widget.see('end')
+
+    # Antes: cada frame do socket agenda o seu callback
+    root, texto_widget = _RootSimulada(), _TextoSimulado()
+    aplicacoes_lista = [0]
+    for i in range(quantidade):
+        linha = f"[12:00:00] user{i % 50} (Síncrona): mensagem {i}\n"
+        root.after(0, lambda linha=linha: inserir(texto_widget, linha))
+        if i % (quantidade // listas) == 0:
+            root.after(0, lambda: aplicacoes_lista.__setitem__(0, aplicacoes_lista[0] + 1))
+    inicio = time.perf_counter()
+    root.rodar_pendentes()
+    tempo_antes = time.perf_counter() - inicio
+    print(f"   root.after(0, ...): {root.total_agendados} callbacks no Tk numa passagem só "
+          f"({tempo_antes * 1000:.0f} ms sem voltar ao loop), "
+          f"{texto_widget.chamadas} chamadas ao widget, {aplicacoes_lista[0]} listas aplicadas")
+
+    # Depois: uma thread produtora enche a fila; a bomba drena por quadro
+    root, texto_widget = _RootSimulada(), _TextoSimulado()
+    fila = FilaEventosUI(root)
+    fila.registrar_texto('chat', lambda texto: inserir(texto_widget, texto))
+    aplicacoes_lista = [0]
+
+    def produzir():
+        for i in range(quantidade):
+            fila.adicionar_texto('chat', f"[12:00:00] user{i % 50} (Síncrona): mensagem {i}\n")
+            if i % (quantidade // listas) == 0:
+                fila.agendar_unico('lista_usuarios',
+                                   lambda: aplicacoes_lista.__setitem__(0, aplicacoes_lista[0] + 1))
+
+    produtora = threading.Thread(target=produzir)
+    produtora.start()
+    fila.iniciar()
+    maior_quadro = 0.0
+    while produtora.is_alive() or fila.pendentes():
+        inicio = time.perf_counter()
+        root.rodar_pendentes()
+        maior_quadro = max(maior_quadro, time.perf_counter() - inicio)
+        time.sleep(fila.intervalo_ms / 1000)
+    produtora.join()
+    fila.parar()
+
+    metricas = fila.obter_metricas()
+    print(f"   FilaEventosUI: {root.total_agendados} callbacks no Tk ({metricas['quadros']} quadros, "
+          f"maior {maior_quadro * 1000:.1f} ms), {texto_widget.chamadas} chamadas ao widget, "
+          f"{aplicacoes_lista[0]} listas aplicadas")
+    print(f"   Linhas no chat: {texto_widget.linhas}/{quantidade}")
+    return texto_widget.linhas == quantidade
+
+
+class _TextoLinhasSimulado:
+    """Substituto de um widget Text que guarda as linhas (índices 'L.0', 'end', 'end-1c', '@0,0')"""
+
+    def __init__(self, altura: int = 20):
+        self.linhas = []
+        self.altura = altura
+        self.topo = 1
+        self.ociosos = []
+
+    def _linha(self, indice: str) -> int:
+        if indice == 'end':
+            return len(self.linhas) + 2
+        if indice == 'end-1c':
+            return len(self.linhas) + 1
+        return int(str(indice).split('.')[0])
+
+    def config(self, **opcoes):
+        pass
+
+    configure = config
+
+    def insert(self, indice, texto):
+        novas = texto.split('\n')[:-1]
+        if self._linha(indice) == 1:
+            self.linhas[:0] = novas
+        else:
+            self.linhas.extend(novas)
+
+    def delete(self, inicio, fim):
+        self.linhas[self._linha(inicio) - 1:self._linha(fim) - 1] = []
+
+    def index(self, indice):
+        return f"{self.topo}.0"
+
+    def yview(self, indice):
+        self.topo = self._linha(indice)
+
+    def see(self, indice):
+        self.topo = max(1, len(self.linhas) - self.altura + 1)
+
+    def after_idle(self, funcao):
+        self.ociosos.append(funcao)
+
+    def rolar(self, visao, para_cima: bool):
+        """Leva a vista a uma ponta e executa a paginação agendada"""
+        self.topo = 1 if para_cima else max(1, len(self.linhas) - self.altura + 1)
+        visao._on_rolagem('0.0' if para_cima else '0.5', '0.5' if para_cima else '1.0')
+        while self.ociosos:
+            self.ociosos.pop(0)()
+
+
+def benchmark_historico_chat():
+    """Chat/log numa sessão longa: widget sem limite vs VisaoTextoLimitada + HistoricoLocal"""
+    print("📜 Chat com 200k linhas (sessão longa)...")
+
+    from gui.historico_texto import VisaoTextoLimitada, HistoricoLocal
+
+    quantidade = 200000
+    por_quadro = 50  # Linhas por inserção (um quadro da FilaEventosUI)
+    limite = 5000
+
+    sem_limite = _TextoLinhasSimulado()
+    widget = _TextoLinhasSimulado()
+    visao = VisaoTextoLimitada(widget, HistoricoLocal(limite), limite_linhas=limite)
+    try:
+        inicio = time.perf_counter()
+        for quadro in range(0, quantidade, por_quadro):
+            texto = "".join(f"[12:00:00] user{i % 50} (Síncrona): mensagem {i}\n"
+                            for i in range(quadro, quadro + por_quadro))
+            sem_limite.insert('end', texto)
+            visao.adicionar(texto)
+        tempo = time.perf_counter() - inicio
+        metricas = visao.historico.obter_metricas()
+        print(f"   Linhas no widget: sem limite {len(sem_limite.linhas)}, limitado {len(widget.linhas)} "
+              f"(limite {limite} + bloco {visao.bloco})")
+        print(f"   Histórico: {metricas['linhas_memoria']} linhas em memória, {metricas['linhas_disco']} em disco "
+              f"({metricas['bytes_disco'] / 1024 / 1024:.1f} MB); inserção {tempo * 1000:.0f} ms no total")
+
+        # Rola para trás 20 páginas (lidas do disco) e volta ao fim
+        tempos = []
+        for _ in range(20):
+            inicio = time.perf_counter()
+            widget.rolar(visao, para_cima=True)
+            tempos.append(time.perf_counter() - inicio)
+        esperado = [f"[12:00:00] user{i % 50} (Síncrona): mensagem {i}" for i in range(visao.inicio, visao.fim)]
+        corretas = widget.linhas == esperado
+        print(f"   Rolagem para trás: {visao.bloco} linhas por página, média {sum(tempos) / len(tempos) * 1000:.2f} ms, "
+              f"trecho {visao.inicio}-{visao.fim} {'correto' if corretas else 'INCORRETO'}")
+
+        visao.adicionar("[12:00:01] user1 (Síncrona): enquanto lia o passado\n")
+        paginas = 0
+        while not visao.ao_vivo and paginas < 1000:
+            widget.rolar(visao, para_cima=False)
+            paginas += 1
+        de_volta = visao.ao_vivo and widget.linhas[-1].endswith("enquanto lia o passado") \
+            and len(widget.linhas) <= limite + visao.bloco
+        print(f"   De volta ao vivo em {paginas} páginas: {'ok' if de_volta else 'FALHOU'}")
+        return corretas and de_volta
+    finally:
+        visao.fechar()
+
+
+def benchmark_clientes_simulados():
+    """Milhares de ClienteGeoChat num processo: conexão, requisições correlacionadas e threads"""
+    print("🤖 Clientes simulados num único processo...")
+
+    import contextlib
+    import io
+    import socket
+    from client import ClienteGeoChat, LacoRecebimento
+    from server.servidor_socket import ServidorSocket
+
+    quantidade = 1000
+    requisicoes = 5  # Atualizações de localização em voo por cliente
+
+    with socket.socket() as livre:
+        livre.bind(('localhost', 0))
+        porta = livre.getsockname()[1]
+
+    multidao = _gerar_multidao(quantidade)
+    servidor = ServidorSocket('localhost', porta)
+    clientes = []
+    recebidas = []
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            if not servidor.iniciar_servidor():
+                return False
+            threads_antes = threading.active_count()
+
+            inicio = time.perf_counter()
+            for usuario in multidao:
+                cliente = ClienteGeoChat(usuario.nome, usuario.latitude, usuario.longitude, 1000)
+                cliente.adicionar_callback('mensagem', recebidas.append)
+                cliente.conectar('localhost', porta)
+                clientes.append(cliente)
+            tempo_conexao = time.perf_counter() - inicio
+
+            # Todas as requisições em voo ao mesmo tempo; cada Future é
+            # resolvido pela resposta com o seu id_requisicao
+            latencias = []
+            inicio = time.perf_counter()
+            pendentes = []
+            for cliente in clientes:
+                for passo in range(requisicoes):
+                    enviada_em = time.perf_counter()
+                    futuro = cliente.atualizar_localizacao(cliente.usuario.latitude + passo * 1e-5,
+                                                           cliente.usuario.longitude)
+                    futuro.add_done_callback(
+                        lambda _, enviada_em=enviada_em: latencias.append(time.perf_counter() - enviada_em))
+                    pendentes.append(futuro)
+            respondidas = sum(1 for futuro in pendentes if futuro.exception(30) is None)
+            tempo_requisicoes = time.perf_counter() - inicio
+
+            # Cada cliente pede os vizinhos no raio e manda uma mensagem ao primeiro
+            listas = [cliente.listar_usuarios(apenas_no_raio=True) for cliente in clientes]
+            envios = []
+            for cliente, lista in zip(clientes, listas):
+                vizinhos = lista.result(30)
+                if vizinhos:
+                    envios.append(cliente.enviar_mensagem(vizinhos[0]['nome'], "oi", 'Síncrono'))
+            entregues = sum(1 for futuro in envios if futuro.exception(30) is None)
+            limite = time.time() + 10
+            while len(recebidas) < entregues and time.time() < limite:
+                time.sleep(0.05)
+
+            threads_clientes = threading.active_count() - threads_antes - quantidade  # o servidor tem 1 por conexão
+
+        latencias.sort()
+        print(f"   {quantidade} clientes conectados em {tempo_conexao:.2f}s "
+              f"({tempo_conexao / quantidade * 1000:.2f} ms por handshake)")
+        print(f"   {respondidas}/{len(pendentes)} requisições respondidas em {tempo_requisicoes:.2f}s "
+              f"({len(pendentes) / tempo_requisicoes:.0f} req/s); latência p50 "
+              f"{latencias[len(latencias) // 2] * 1000:.1f} ms, p95 {latencias[int(len(latencias) * 0.95)] * 1000:.1f} ms")
+        print(f"   Mensagens síncronas a um vizinho no raio: {entregues}/{len(envios)} confirmadas, "
+              f"{len(recebidas)} recebidas")
+        print(f"   Threads de recebimento dos clientes: {threads_clientes} "
+              f"(laço compartilhado com {LacoRecebimento.padrao().conexoes()} conexões; "
+              f"antes: 1 thread por cliente = {quantidade})")
+        return respondidas == len(pendentes) and len(recebidas) == entregues == len(envios)
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for cliente in clientes:
+                cliente.desconectar()
+            servidor.parar_servidor()
+
+
+BENCHMARKS = {
+    'grafo': benchmark_grafo_proximidade,
+    'listagem': benchmark_listagem_usuarios,
+    'roteamento': benchmark_roteamento_localizacao,
+    'confirms': benchmark_publisher_confirms,
+    'lote': benchmark_publicacao_lote,
+    'ponta_a_ponta': benchmark_ponta_a_ponta,
+    'backlog': benchmark_drenagem_backlog,
+    'spool': benchmark_spool_queda,
+    'multiusuario': benchmark_consumer_multiusuario,
+    'compressao': benchmark_compressao,
+    'tabela': benchmark_tabela_usuarios,
+    'fila_ui': benchmark_fila_interface,
+    'historico': benchmark_historico_chat,
+    'clientes': benchmark_clientes_simulados,
+}
+
+
+def main():
+    """Executa os benchmarks selecionados na linha de comando"""
+    print("🚀 GeoChat - Benchmarks de Desempenho\n")
+
+    nomes = sys.argv[1:] or list(BENCHMARKS)
+    desconhecidos = [nome for nome in nomes if nome not in BENCHMARKS]
+    if desconhecidos:
+        print(f"❌ Benchmarks desconhecidos: {', '.join(desconhecidos)}")
+        print(f"   Disponíveis: {', '.join(BENCHMARKS)}")
+        return False
+
+    sucessos = 0
+    for nome in nomes:
+        try:
+            if BENCHMARKS[nome]():
+                sucessos += 1
+        except Exception as e:
+            print(f"❌ Erro inesperado em {nome}: {e}")
+        print()
+
+    print(f"📊 Resultado: {sucessos}/{len(nomes)} benchmarks executados")
+    return sucessos == len(nomes)
+
+
+if __name__ == "__main__":
+    main()
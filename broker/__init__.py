@@ -3,5 +3,17 @@ Módulo do broker RabbitMQ para comunicação assíncrona
 """
 
 from .rabbitmq_manager import ConfiguradorRabbitMQ, PublisherMensagem, ConsumerMensagem
+from .gerenciador_conexao import GerenciadorConexaoAMQP
+from .executor_ordenado import ExecutorOrdenado
+from .broker_memoria import BrokerMemoria, GerenciadorConexaoMemoria
+from .rabbitmq_asyncio import ConfiguradorRabbitMQAsync, PublisherMensagemAsync, ConsumerMensagemAsync
+from .dead_letters import InspetorDeadLetters
+from .spool import SpoolMensagens
+from .consumer_multiusuario import ConsumerMultiusuario
+from .metricas import MetricasBroker, AmostradorFilas
 
-__all__ = ['ConfiguradorRabbitMQ', 'PublisherMensagem', 'ConsumerMensagem']
+__all__ = ['ConfiguradorRabbitMQ', 'PublisherMensagem', 'ConsumerMensagem', 'GerenciadorConexaoAMQP',
+           'ExecutorOrdenado', 'ConfiguradorRabbitMQAsync', 'PublisherMensagemAsync',
+           'ConsumerMensagemAsync', 'BrokerMemoria', 'GerenciadorConexaoMemoria',
+           'InspetorDeadLetters', 'SpoolMensagens', 'ConsumerMultiusuario', 'MetricasBroker',
+           'AmostradorFilas']
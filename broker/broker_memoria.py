@@ -0,0 +1,902 @@
+"""
+Broker em memória, no mesmo processo, compatível com a API de canal do pika
+
+SUBSTITUTO DO RABBITMQ: Benchmarks e testes do fluxo assíncrono precisavam
+de um RabbitMQ rodando (docker-compose). Este módulo implementa, em memória,
+o subconjunto do protocolo usado pelo GeoChat - exchanges direct, fanout e
+topic, filas duráveis, publisher confirms, prefetch, ack/nack e reentrega,
+TTL e dead-lettering - com a mesma interface de conexão e canal do pika.
+
+ONDE ENTRA: ConfiguradorRabbitMQ, PublisherMensagem e ConsumerMensagem não
+mudam. GerenciadorConexaoMemoria só troca a conexão criada pelo gerenciador
+(_criar_conexao); a seleção é feita por Config.BROKER_BACKEND = 'memoria'
+(variável de ambiente GEOCHAT_BROKER).
+
+THREADS: Como no pika, cada conexão tem seu ioloop e seus canais só são
+usados na thread dele. O estado do broker (exchanges, filas, entregas sem
+ack) é compartilhado pelo processo e protegido por um lock; entregas para
+um consumer são executadas no ioloop da conexão dele.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, List, Optional, Set
+
+import pika
+from pika import exceptions as pika_exceptions
+from pika.frame import Method
+from pika.spec import Basic, Confirm, Exchange, Queue
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from broker.gerenciador_conexao import GerenciadorConexaoAMQP
+
+TIPOS_EXCHANGE = ('direct', 'fanout', 'topic')
+
+
+class IOLoopMemoria:
+    """
+    Loop de eventos mínimo com a interface do ioloop do pika
+
+    Executa callbacks agendados por qualquer thread (add_callback_threadsafe)
+    e timers (call_later) na thread que chamou start().
+    """
+
+    def __init__(self):
+        self._condicao = threading.Condition()
+        self._callbacks: Deque[Callable] = deque()
+        self._timers: list = []  # heap de (quando, handle, funcao)
+        self._cancelados: Set[int] = set()
+        self._handles = itertools.count()
+        self._parar = False
+
+    def add_callback_threadsafe(self, funcao: Callable[[], None]):
+        with self._condicao:
+            self._callbacks.append(funcao)
+            self._condicao.notify()
+
+    def call_later(self, atraso: float, funcao: Callable[[], None]) -> int:
+        with self._condicao:
+            handle = next(self._handles)
+            heapq.heappush(self._timers, (time.monotonic() + atraso, handle, funcao))
+            self._condicao.notify()
+            return handle
+
+    def remove_timeout(self, handle: int):
+        with self._condicao:
+            self._cancelados.add(handle)
+
+    def stop(self):
+        with self._condicao:
+            self._parar = True
+            self._condicao.notify()
+
+    def close(self):
+        """Nada a liberar em memória (existe pela interface do ioloop do pika)"""
+
+    def start(self):
+        """Roda o loop até stop() ser chamado"""
+        while True:
+            with self._condicao:
+                while not (self._parar or self._callbacks or self._timer_vencido()):
+                    espera = self._timers[0][0] - time.monotonic() if self._timers else None
+                    self._condicao.wait(espera)
+                if self._parar:
+                    self._parar = False
+                    return
+                prontos = list(self._callbacks)
+                self._callbacks.clear()
+                while self._timer_vencido():
+                    _, handle, funcao = heapq.heappop(self._timers)
+                    if handle in self._cancelados:
+                        self._cancelados.discard(handle)
+                    else:
+                        prontos.append(funcao)
+
+            for funcao in prontos:
+                try:
+                    funcao()
+                except Exception as e:
+                    print(f"Erro em callback do ioloop em memória: {e}")
+
+    def _timer_vencido(self) -> bool:
+        return bool(self._timers) and self._timers[0][0] <= time.monotonic()
+
+
+class IOLoopAsyncio:
+    """Adapta um event loop asyncio à interface de ioloop usada pela ConexaoMemoria"""
+
+    def __init__(self, loop):
+        self.loop = loop
+
+    def add_callback_threadsafe(self, funcao: Callable[[], None]):
+        self.loop.call_soon_threadsafe(funcao)
+
+    def call_later(self, atraso: float, funcao: Callable[[], None]):
+        return self.loop.call_later(atraso, funcao)
+
+    def remove_timeout(self, handle):
+        handle.cancel()
+
+    def stop(self):
+        # O event loop pertence à aplicação; não é parado pela conexão
+        pass
+
+
+class MensagemMemoria:
+    """Mensagem armazenada em uma fila"""
+
+    __slots__ = ('body', 'properties', 'exchange', 'routing_key', 'redelivered', 'expira_em')
+
+    def __init__(self, body: bytes, properties: pika.BasicProperties, exchange: str,
+                 routing_key: str, expira_em: Optional[float] = None):
+        self.body = body
+        self.properties = properties
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.redelivered = False
+        self.expira_em = expira_em
+
+    def persistente(self) -> bool:
+        return self.properties.delivery_mode == 2
+
+
+class ConsumidorMemoria:
+    """Registro de basic_consume"""
+
+    __slots__ = ('canal', 'fila', 'tag', 'callback', 'auto_ack', 'prefetch', 'sem_ack')
+
+    def __init__(self, canal: 'CanalMemoria', fila: 'FilaMemoria', tag: str, callback: Callable,
+                 auto_ack: bool, prefetch: int = 0):
+        self.canal = canal
+        self.fila = fila
+        self.tag = tag
+        self.callback = callback
+        self.auto_ack = auto_ack
+        # Limite por consumidor (basic_qos com global_qos=False, o padrão do RabbitMQ)
+        self.prefetch = prefetch
+        self.sem_ack = 0
+
+    def tem_capacidade(self) -> bool:
+        """Se os prefetches do consumidor e do canal permitem mais uma entrega (com o lock)"""
+        if self.auto_ack:
+            return True
+        if self.prefetch and self.sem_ack >= self.prefetch:
+            return False
+        return self.canal.tem_capacidade()
+
+
+class FilaMemoria:
+    """Fila do broker em memória"""
+
+    def __init__(self, nome: str, durable: bool, arguments: Optional[dict]):
+        self.nome = nome
+        self.durable = durable
+        self.arguments = dict(arguments or {})
+        self.mensagens: Deque[MensagemMemoria] = deque()
+        self.consumidores: List[ConsumidorMemoria] = []
+        self._proximo_consumidor = 0
+
+    @property
+    def ttl(self) -> Optional[float]:
+        ttl_ms = self.arguments.get('x-message-ttl')
+        return ttl_ms / 1000.0 if ttl_ms is not None else None
+
+    def retirar_expiradas(self, agora: float) -> List[MensagemMemoria]:
+        """Remove as mensagens vencidas do início da fila (como o RabbitMQ)"""
+        expiradas = []
+        while self.mensagens and self.mensagens[0].expira_em is not None \
+                and self.mensagens[0].expira_em <= agora:
+            expiradas.append(self.mensagens.popleft())
+        return expiradas
+
+    def escolher_consumidor(self) -> Optional[ConsumidorMemoria]:
+        """Round-robin entre consumidores com espaço no prefetch"""
+        total = len(self.consumidores)
+        for deslocamento in range(total):
+            indice = (self._proximo_consumidor + deslocamento) % total
+            consumidor = self.consumidores[indice]
+            if consumidor.tem_capacidade():
+                self._proximo_consumidor = (indice + 1) % total
+                return consumidor
+        return None
+
+
+class ExchangeMemoria:
+    """Exchange com seus bindings"""
+
+    def __init__(self, nome: str, tipo: str, durable: bool):
+        self.nome = nome
+        self.tipo = tipo
+        self.durable = durable
+        # Bindings exatos {routing_key: {fila}} e com curinga [(padrao, fila)]
+        self.vinculos: Dict[str, Set[str]] = {}
+        self.vinculos_curinga: List[tuple] = []
+
+    def vincular(self, fila: str, chave: str):
+        if self.tipo == 'topic' and ('*' in chave or '#' in chave):
+            if (chave, fila) not in self.vinculos_curinga:
+                self.vinculos_curinga.append((chave, fila))
+        else:
+            self.vinculos.setdefault(chave, set()).add(fila)
+
+    def desvincular(self, fila: str, chave: str):
+        if (chave, fila) in self.vinculos_curinga:
+            self.vinculos_curinga.remove((chave, fila))
+        filas = self.vinculos.get(chave)
+        if filas:
+            filas.discard(fila)
+            if not filas:
+                del self.vinculos[chave]
+
+    def remover_fila(self, fila: str):
+        for chave in list(self.vinculos):
+            self.desvincular(fila, chave)
+        self.vinculos_curinga = [(p, f) for p, f in self.vinculos_curinga if f != fila]
+
+    def rotear(self, chaves: List[str]) -> Set[str]:
+        """Filas que recebem uma mensagem publicada com as routing keys dadas"""
+        if self.tipo == 'fanout':
+            return set().union(*self.vinculos.values()) if self.vinculos else set()
+        destinos = set()
+        for chave in chaves:
+            destinos |= self.vinculos.get(chave, set())
+            for padrao, fila in self.vinculos_curinga:
+                if fila not in destinos and casa_topico(padrao, chave):
+                    destinos.add(fila)
+        return destinos
+
+
+def casa_topico(padrao: str, chave: str) -> bool:
+    """Casamento de routing key com padrão de topic ('*' = uma palavra, '#' = zero ou mais)"""
+    palavras_padrao = padrao.split('.')
+    palavras_chave = chave.split('.') if chave else []
+
+    def casa(i: int, j: int) -> bool:
+        if i == len(palavras_padrao):
+            return j == len(palavras_chave)
+        if palavras_padrao[i] == '#':
+            return any(casa(i + 1, k) for k in range(j, len(palavras_chave) + 1))
+        if j == len(palavras_chave):
+            return False
+        if palavras_padrao[i] in ('*', palavras_chave[j]):
+            return casa(i + 1, j + 1)
+        return False
+
+    return casa(0, 0)
+
+
+class BrokerMemoria:
+    """
+    Estado do broker compartilhado pelo processo
+
+    DURABILIDADE: reiniciar() simula um restart do RabbitMQ - derruba as
+    conexões, apaga filas e exchanges não duráveis e mensagens transientes.
+
+    DEAD-LETTERING: Filas com x-dead-letter-exchange repassam mensagens
+    expiradas, rejeitadas sem requeue ou descartadas por x-max-length. Uma
+    thread de timers vence o TTL dessas filas mesmo sem consumidores (filas
+    de retentativa com atraso).
+    """
+
+    _padrao: Optional['BrokerMemoria'] = None
+    _lock_padrao = threading.Lock()
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.exchanges: Dict[str, ExchangeMemoria] = {}
+        self.filas: Dict[str, FilaMemoria] = {}
+        self.conexoes: Set['ConexaoMemoria'] = set()
+        self.disponivel = True
+
+        # Vencimentos de TTL em filas com dead-letter: heap de (instante, seq, fila)
+        self._vencimentos: List[tuple] = []
+        self._sequencia_vencimentos = itertools.count()
+        self._condicao_vencimentos = threading.Condition(self.lock)
+        self._thread_vencimentos: Optional[threading.Thread] = None
+
+    @classmethod
+    def padrao(cls) -> 'BrokerMemoria':
+        """Instância única do processo"""
+        with cls._lock_padrao:
+            if cls._padrao is None:
+                cls._padrao = cls()
+            return cls._padrao
+
+    def parar(self):
+        """Simula queda do broker: conexões caem e novas conexões falham"""
+        with self.lock:
+            self.disponivel = False
+            conexoes = list(self.conexoes)
+            # Entregas sem ack voltam para as filas antes do restart filtrar
+            # o que não é durável
+            for conexao in conexoes:
+                for canal in list(conexao._canais.values()):
+                    canal._devolver_sem_ack()
+        for conexao in conexoes:
+            conexao.fechar_pelo_broker(320, "CONNECTION_FORCED - broker em memória parado")
+        self._aplicar_reinicio()
+
+    def iniciar(self):
+        """Volta a aceitar conexões após parar()"""
+        with self.lock:
+            self.disponivel = True
+
+    def reiniciar(self):
+        """Simula restart do broker (parar + iniciar)"""
+        self.parar()
+        self.iniciar()
+
+    def _aplicar_reinicio(self):
+        with self.lock:
+            for nome in [n for n, f in self.filas.items() if not f.durable]:
+                self.remover_fila(nome)
+            for fila in self.filas.values():
+                fila.consumidores.clear()
+                fila.mensagens = deque(m for m in fila.mensagens if m.persistente())
+            for nome in [n for n, e in self.exchanges.items() if not e.durable]:
+                del self.exchanges[nome]
+
+    def remover_fila(self, nome: str) -> int:
+        fila = self.filas.pop(nome, None)
+        if fila is None:
+            return 0
+        for exchange in self.exchanges.values():
+            exchange.remover_fila(nome)
+        return len(fila.mensagens)
+
+    def publicar(self, exchange: str, routing_key: str, body: bytes,
+                 properties: pika.BasicProperties) -> Optional[bool]:
+        """
+        Roteia e enfileira uma mensagem (com o lock)
+
+        Returns:
+            None se o exchange não existe; False se alguma fila recusou a
+            mensagem (x-overflow = reject-publish); True caso contrário
+        """
+        if exchange == '':
+            destinos = {routing_key} if routing_key in self.filas else set()
+        else:
+            origem = self.exchanges.get(exchange)
+            if origem is None:
+                return None
+            chaves = [routing_key]
+            cabecalhos = properties.headers or {}
+            chaves += list(cabecalhos.get('CC', [])) + list(cabecalhos.get('BCC', []))
+            destinos = origem.rotear(chaves)
+
+        aceita = True
+        agora = time.monotonic()
+        for nome in destinos:
+            fila = self.filas[nome]
+            ttl = fila.ttl
+            if properties.expiration is not None:
+                ttl_mensagem = int(properties.expiration) / 1000.0
+                ttl = ttl_mensagem if ttl is None else min(ttl, ttl_mensagem)
+            mensagem = MensagemMemoria(body, properties, exchange, routing_key,
+                                       agora + ttl if ttl is not None else None)
+            if self.enfileirar(fila, mensagem):
+                self.despachar(fila)
+            else:
+                aceita = False
+        return aceita
+
+    def enfileirar(self, fila: FilaMemoria, mensagem: MensagemMemoria) -> bool:
+        """
+        Coloca a mensagem na fila respeitando x-max-length
+
+        Returns:
+            False se a fila recusou a mensagem (x-overflow = reject-publish)
+        """
+        limite = fila.arguments.get('x-max-length')
+        if limite is not None and len(fila.mensagens) >= limite:
+            if fila.arguments.get('x-overflow') == 'reject-publish':
+                return False
+            while len(fila.mensagens) >= limite and fila.mensagens:
+                # drop-head (padrão do RabbitMQ)
+                self.enviar_para_dead_letter(fila, fila.mensagens.popleft(), 'maxlen')
+            if limite == 0:
+                return True
+        fila.mensagens.append(mensagem)
+        if mensagem.expira_em is not None and 'x-dead-letter-exchange' in fila.arguments:
+            self._agendar_vencimento(fila, mensagem.expira_em)
+        return True
+
+    def expirar(self, fila: FilaMemoria):
+        """Remove as mensagens vencidas da fila, repassando ao dead-letter (com o lock)"""
+        for mensagem in fila.retirar_expiradas(time.monotonic()):
+            self.enviar_para_dead_letter(fila, mensagem, 'expired')
+
+    def enviar_para_dead_letter(self, fila: FilaMemoria, mensagem: MensagemMemoria, motivo: str):
+        """
+        Republica uma mensagem morta no x-dead-letter-exchange da fila (com o lock)
+
+        ROUTING KEY: x-dead-letter-routing-key da fila, se houver; senão as
+        chaves originais da publicação (incluindo CC), como no RabbitMQ.
+        """
+        exchange = fila.arguments.get('x-dead-letter-exchange')
+        if exchange is None:
+            return
+        properties = mensagem.properties
+        cabecalhos = dict(properties.headers or {})
+        cabecalhos['x-death'] = [{'queue': fila.nome, 'reason': motivo,
+                                  'exchange': mensagem.exchange,
+                                  'routing-keys': [mensagem.routing_key]}] + \
+            list(cabecalhos.get('x-death', []))
+        chave = fila.arguments.get('x-dead-letter-routing-key')
+        if chave is not None:
+            cabecalhos.pop('CC', None)
+        cabecalhos.pop('BCC', None)
+        # TTL por mensagem não se aplica de novo no destino
+        nova = pika.BasicProperties(
+            content_type=properties.content_type, content_encoding=properties.content_encoding,
+            headers=cabecalhos, delivery_mode=properties.delivery_mode,
+            message_id=properties.message_id, timestamp=properties.timestamp,
+            type=properties.type, app_id=properties.app_id
+        )
+        self.publicar(exchange, chave if chave is not None else mensagem.routing_key,
+                      mensagem.body, nova)
+
+    def _agendar_vencimento(self, fila: FilaMemoria, instante: float):
+        """Agenda a expiração ativa de uma fila com dead-letter (com o lock)"""
+        heapq.heappush(self._vencimentos, (instante, next(self._sequencia_vencimentos), fila))
+        if self._thread_vencimentos is None:
+            self._thread_vencimentos = threading.Thread(target=self._loop_vencimentos, daemon=True,
+                                                        name="geochat-broker-memoria-ttl")
+            self._thread_vencimentos.start()
+        self._condicao_vencimentos.notify()
+
+    def _loop_vencimentos(self):
+        """Thread de timers: expira as mensagens das filas com dead-letter no instante certo"""
+        with self.lock:
+            while True:
+                if not self._vencimentos:
+                    self._condicao_vencimentos.wait()
+                    continue
+                instante, _, fila = self._vencimentos[0]
+                espera = instante - time.monotonic()
+                if espera > 0:
+                    self._condicao_vencimentos.wait(espera)
+                    continue
+                heapq.heappop(self._vencimentos)
+                if self.filas.get(fila.nome) is fila:
+                    self.expirar(fila)
+                    self.despachar(fila)
+
+    def despachar(self, fila: FilaMemoria):
+        """Entrega mensagens prontas aos consumidores com capacidade (com o lock)"""
+        while fila.mensagens and fila.consumidores:
+            self.expirar(fila)
+            if not fila.mensagens:
+                return
+            consumidor = fila.escolher_consumidor()
+            if consumidor is None:
+                return
+            mensagem = fila.mensagens.popleft()
+            consumidor.canal.agendar_entrega(consumidor, fila, mensagem)
+
+
+class ConexaoMemoria:
+    """Conexão com o broker em memória (interface de pika.SelectConnection)"""
+
+    def __init__(self, broker: BrokerMemoria, ioloop,
+                 on_open_callback: Optional[Callable] = None,
+                 on_open_error_callback: Optional[Callable] = None,
+                 on_close_callback: Optional[Callable] = None):
+        self.broker = broker
+        self.ioloop = ioloop
+        self._on_close_callback = on_close_callback
+        self._canais: Dict[int, 'CanalMemoria'] = {}
+        self._numeros_canal = itertools.count(1)
+        self._estado = 'abrindo'
+
+        def abrir():
+            with broker.lock:
+                if not broker.disponivel:
+                    self._estado = 'fechada'
+                    erro = pika_exceptions.AMQPConnectionError("Broker em memória indisponível")
+                else:
+                    self._estado = 'aberta'
+                    broker.conexoes.add(self)
+                    erro = None
+            if erro is None:
+                if on_open_callback:
+                    on_open_callback(self)
+            elif on_open_error_callback:
+                on_open_error_callback(self, erro)
+
+        # Como no pika, a abertura é concluída dentro do ioloop
+        ioloop.add_callback_threadsafe(abrir)
+
+    @property
+    def is_open(self) -> bool:
+        return self._estado == 'aberta'
+
+    @property
+    def is_closing(self) -> bool:
+        return self._estado == 'fechando'
+
+    @property
+    def is_closed(self) -> bool:
+        return self._estado == 'fechada'
+
+    def channel(self, channel_number: Optional[int] = None,
+                on_open_callback: Optional[Callable] = None) -> 'CanalMemoria':
+        if not self.is_open:
+            raise pika_exceptions.ConnectionWrongStateError("Conexão não está aberta")
+        numero = channel_number or next(self._numeros_canal)
+        canal = CanalMemoria(self, numero)
+        self._canais[numero] = canal
+        if on_open_callback:
+            self.ioloop.add_callback_threadsafe(lambda: on_open_callback(canal))
+        return canal
+
+    def close(self, reply_code: int = 200, reply_text: str = 'Normal shutdown'):
+        if not self.is_open:
+            return
+        self._estado = 'fechando'
+        self.ioloop.add_callback_threadsafe(
+            lambda: self._finalizar(pika_exceptions.ConnectionClosedByClient(reply_code, reply_text))
+        )
+
+    def fechar_pelo_broker(self, reply_code: int, reply_text: str):
+        """Fecha a conexão por iniciativa do broker (qualquer thread)"""
+        self.ioloop.add_callback_threadsafe(
+            lambda: self._finalizar(pika_exceptions.ConnectionClosedByBroker(reply_code, reply_text))
+        )
+
+    def _finalizar(self, motivo: Exception):
+        if self._estado == 'fechada':
+            return
+        for canal in list(self._canais.values()):
+            canal._finalizar(motivo)
+        with self.broker.lock:
+            self.broker.conexoes.discard(self)
+        self._estado = 'fechada'
+        if self._on_close_callback:
+            self._on_close_callback(self, motivo)
+
+
+class CanalMemoria:
+    """Canal do broker em memória (subconjunto de pika.channel.Channel)"""
+
+    def __init__(self, conexao: ConexaoMemoria, numero: int):
+        self.connection = conexao
+        self.channel_number = numero
+        self.broker = conexao.broker
+        self._aberto = True
+        self._callbacks_fechamento: List[Callable] = []
+
+        # Consumo: {consumer_tag: ConsumidorMemoria} e entregas sem ack
+        # {delivery_tag: (fila, mensagem, consumidor)}; alterados com o lock do broker
+        self._consumidores: Dict[str, ConsumidorMemoria] = {}
+        self._sem_ack: 'OrderedDict[int, tuple]' = OrderedDict()
+        self._proxima_entrega = 1
+        # Como no RabbitMQ: global_qos=False limita cada consumidor criado
+        # depois do basic_qos; global_qos=True limita o canal inteiro
+        self._prefetch = 0
+        self._prefetch_consumidor = 0
+        self._tags_consumo = itertools.count(1)
+
+        # Publisher confirms
+        self._confirmacoes = False
+        self._callback_confirmacao: Optional[Callable] = None
+        self._proxima_publicacao = 1
+        self._ack_pendente = 0
+        self._nacks: List[int] = []
+        self._confirmacao_agendada = False
+
+    # Estado
+
+    @property
+    def is_open(self) -> bool:
+        return self._aberto
+
+    @property
+    def is_closed(self) -> bool:
+        return not self._aberto
+
+    @property
+    def is_closing(self) -> bool:
+        return False
+
+    def add_on_close_callback(self, callback: Callable):
+        self._callbacks_fechamento.append(callback)
+
+    def close(self, reply_code: int = 0, reply_text: str = 'Normal shutdown'):
+        if self._aberto:
+            self.connection.ioloop.add_callback_threadsafe(
+                lambda: self._finalizar(pika_exceptions.ChannelClosedByClient(reply_code, reply_text))
+            )
+
+    def _fechar_por_erro(self, reply_code: int, reply_text: str):
+        """Erro de protocolo: o broker fecha o canal (como no RabbitMQ)"""
+        self.connection.ioloop.add_callback_threadsafe(
+            lambda: self._finalizar(pika_exceptions.ChannelClosedByBroker(reply_code, reply_text))
+        )
+
+    def _finalizar(self, motivo: Exception):
+        if not self._aberto:
+            return
+        self._aberto = False
+        with self.broker.lock:
+            filas_afetadas = self._devolver_sem_ack()
+            for consumidor in self._consumidores.values():
+                if consumidor in consumidor.fila.consumidores:
+                    consumidor.fila.consumidores.remove(consumidor)
+            self._consumidores.clear()
+            for fila in filas_afetadas:
+                self.broker.despachar(fila)
+        self.connection._canais.pop(self.channel_number, None)
+        for callback in self._callbacks_fechamento:
+            callback(self, motivo)
+
+    def _devolver_sem_ack(self) -> List[FilaMemoria]:
+        """
+        Devolve as entregas sem ack ao início das filas, como reentrega (com o lock)
+
+        Returns:
+            Filas que receberam mensagens de volta
+        """
+        afetadas = {}
+        for fila, mensagem, consumidor in reversed(list(self._sem_ack.values())):
+            consumidor.sem_ack -= 1
+            if self.broker.filas.get(fila.nome) is fila:
+                mensagem.redelivered = True
+                fila.mensagens.appendleft(mensagem)
+                afetadas[id(fila)] = fila
+        self._sem_ack.clear()
+        return list(afetadas.values())
+
+    def _responder(self, callback: Optional[Callable], metodo):
+        """Entrega a resposta de um método síncrono do AMQP pelo ioloop"""
+        if callback:
+            frame = Method(self.channel_number, metodo)
+            self.connection.ioloop.add_callback_threadsafe(lambda: callback(frame))
+
+    # Exchanges e filas
+
+    def exchange_declare(self, exchange: str, exchange_type: str = 'direct', passive: bool = False,
+                         durable: bool = False, auto_delete: bool = False, internal: bool = False,
+                         arguments: Optional[dict] = None, callback: Optional[Callable] = None):
+        with self.broker.lock:
+            existente = self.broker.exchanges.get(exchange)
+            if passive:
+                if existente is None:
+                    return self._fechar_por_erro(404, f"NOT_FOUND - no exchange '{exchange}'")
+            elif existente is None:
+                if exchange_type not in TIPOS_EXCHANGE:
+                    return self._fechar_por_erro(503, f"COMMAND_INVALID - unknown exchange type '{exchange_type}'")
+                self.broker.exchanges[exchange] = ExchangeMemoria(exchange, exchange_type, durable)
+            elif existente.tipo != exchange_type or existente.durable != durable:
+                return self._fechar_por_erro(
+                    406, f"PRECONDITION_FAILED - inequivalent arg for exchange '{exchange}'")
+        self._responder(callback, Exchange.DeclareOk())
+
+    def queue_declare(self, queue: str, passive: bool = False, durable: bool = False,
+                      exclusive: bool = False, auto_delete: bool = False,
+                      arguments: Optional[dict] = None, callback: Optional[Callable] = None):
+        with self.broker.lock:
+            fila = self.broker.filas.get(queue)
+            if passive:
+                if fila is None:
+                    return self._fechar_por_erro(404, f"NOT_FOUND - no queue '{queue}'")
+            elif fila is None:
+                fila = FilaMemoria(queue, durable, arguments)
+                self.broker.filas[queue] = fila
+            elif fila.durable != durable or fila.arguments != dict(arguments or {}):
+                return self._fechar_por_erro(
+                    406, f"PRECONDITION_FAILED - inequivalent arg for queue '{queue}'")
+            self.broker.expirar(fila)
+            resposta = Queue.DeclareOk(queue, len(fila.mensagens), len(fila.consumidores))
+        self._responder(callback, resposta)
+
+    def queue_bind(self, queue: str, exchange: str, routing_key: Optional[str] = None,
+                   arguments: Optional[dict] = None, callback: Optional[Callable] = None):
+        with self.broker.lock:
+            destino = self.broker.exchanges.get(exchange)
+            if destino is None or queue not in self.broker.filas:
+                return self._fechar_por_erro(404, f"NOT_FOUND - no exchange '{exchange}' or queue '{queue}'")
+            destino.vincular(queue, routing_key if routing_key is not None else queue)
+        self._responder(callback, Queue.BindOk())
+
+    def queue_unbind(self, queue: str, exchange: Optional[str] = None, routing_key: Optional[str] = None,
+                     arguments: Optional[dict] = None, callback: Optional[Callable] = None):
+        with self.broker.lock:
+            origem = self.broker.exchanges.get(exchange)
+            if origem is not None:
+                origem.desvincular(queue, routing_key if routing_key is not None else queue)
+        self._responder(callback, Queue.UnbindOk())
+
+    def queue_delete(self, queue: str, if_unused: bool = False, if_empty: bool = False,
+                     callback: Optional[Callable] = None):
+        with self.broker.lock:
+            removidas = self.broker.remover_fila(queue)
+        self._responder(callback, Queue.DeleteOk(removidas))
+
+    def queue_purge(self, queue: str, callback: Optional[Callable] = None):
+        with self.broker.lock:
+            fila = self.broker.filas.get(queue)
+            if fila is None:
+                return self._fechar_por_erro(404, f"NOT_FOUND - no queue '{queue}'")
+            removidas = len(fila.mensagens)
+            fila.mensagens.clear()
+        self._responder(callback, Queue.PurgeOk(removidas))
+
+    # Publicação
+
+    def confirm_delivery(self, ack_nack_callback: Callable, callback: Optional[Callable] = None):
+        self._confirmacoes = True
+        self._callback_confirmacao = ack_nack_callback
+        self._responder(callback, Confirm.SelectOk())
+
+    def basic_publish(self, exchange: str, routing_key: str, body, properties=None,
+                      mandatory: bool = False):
+        if not self._aberto:
+            raise pika_exceptions.ChannelWrongStateError("Canal fechado")
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        properties = properties or pika.BasicProperties()
+
+        with self.broker.lock:
+            aceita = self.broker.publicar(exchange, routing_key, body, properties)
+        if aceita is None:
+            self._fechar_por_erro(404, f"NOT_FOUND - no exchange '{exchange}'")
+            return
+
+        if self._confirmacoes:
+            tag = self._proxima_publicacao
+            self._proxima_publicacao += 1
+            if aceita:
+                self._ack_pendente = tag
+            else:
+                self._nacks.append(tag)
+            self._agendar_confirmacoes()
+
+    def _agendar_confirmacoes(self):
+        """
+        ACKS EM LOTE: Como o RabbitMQ, confirma várias publicações em um único
+        Basic.Ack com multiple=True, enviado na próxima volta do ioloop
+        """
+        if self._confirmacao_agendada:
+            return
+        self._confirmacao_agendada = True
+
+        def enviar():
+            self._confirmacao_agendada = False
+            if not (self._aberto and self._callback_confirmacao):
+                return
+            for tag in self._nacks:
+                self._callback_confirmacao(Method(self.channel_number, Basic.Nack(tag, False, False)))
+            self._nacks = []
+            if self._ack_pendente:
+                tag, self._ack_pendente = self._ack_pendente, 0
+                self._callback_confirmacao(Method(self.channel_number, Basic.Ack(tag, True)))
+
+        self.connection.ioloop.add_callback_threadsafe(enviar)
+
+    # Consumo
+
+    def basic_qos(self, prefetch_size: int = 0, prefetch_count: int = 0, global_qos: bool = False,
+                  callback: Optional[Callable] = None):
+        with self.broker.lock:
+            if global_qos:
+                self._prefetch = prefetch_count
+            else:
+                self._prefetch_consumidor = prefetch_count
+            for fila in self._filas_consumidas():
+                self.broker.despachar(fila)
+        self._responder(callback, Basic.QosOk())
+
+    def basic_consume(self, queue: str, on_message_callback: Callable, auto_ack: bool = False,
+                      exclusive: bool = False, consumer_tag: Optional[str] = None,
+                      arguments: Optional[dict] = None, callback: Optional[Callable] = None) -> str:
+        tag = consumer_tag or f"ctag{self.channel_number}.{next(self._tags_consumo)}"
+        with self.broker.lock:
+            fila = self.broker.filas.get(queue)
+            if fila is None:
+                self._fechar_por_erro(404, f"NOT_FOUND - no queue '{queue}'")
+                return tag
+            consumidor = ConsumidorMemoria(self, fila, tag, on_message_callback, auto_ack,
+                                           self._prefetch_consumidor)
+            self._consumidores[tag] = consumidor
+            fila.consumidores.append(consumidor)
+            self.broker.despachar(fila)
+        self._responder(callback, Basic.ConsumeOk(tag))
+        return tag
+
+    def basic_cancel(self, consumer_tag: str = '', callback: Optional[Callable] = None):
+        with self.broker.lock:
+            consumidor = self._consumidores.pop(consumer_tag, None)
+            if consumidor and consumidor in consumidor.fila.consumidores:
+                consumidor.fila.consumidores.remove(consumidor)
+        self._responder(callback, Basic.CancelOk(consumer_tag))
+
+    def basic_ack(self, delivery_tag: int = 0, multiple: bool = False):
+        with self.broker.lock:
+            retiradas = list(self._retirar_sem_ack(delivery_tag, multiple))
+            for fila in self._filas_liberadas(retiradas):
+                self.broker.despachar(fila)
+
+    def basic_nack(self, delivery_tag: int = 0, multiple: bool = False, requeue: bool = True):
+        with self.broker.lock:
+            retiradas = list(self._retirar_sem_ack(delivery_tag, multiple))
+            for fila, mensagem, _ in reversed(retiradas):
+                if self.broker.filas.get(fila.nome) is not fila:
+                    continue
+                if requeue:
+                    mensagem.redelivered = True
+                    fila.mensagens.appendleft(mensagem)
+                else:
+                    self.broker.enviar_para_dead_letter(fila, mensagem, 'rejected')
+            for fila in self._filas_liberadas(retiradas):
+                self.broker.despachar(fila)
+
+    def basic_reject(self, delivery_tag: int = 0, requeue: bool = True):
+        self.basic_nack(delivery_tag, False, requeue)
+
+    def tem_capacidade(self) -> bool:
+        """Se o prefetch do canal permite mais uma entrega (chamado com o lock)"""
+        return self._aberto and (self._prefetch == 0 or len(self._sem_ack) < self._prefetch)
+
+    def agendar_entrega(self, consumidor: ConsumidorMemoria, fila: FilaMemoria,
+                        mensagem: MensagemMemoria):
+        """Registra a entrega (com o lock) e a executa no ioloop deste canal"""
+        delivery_tag = self._proxima_entrega
+        self._proxima_entrega += 1
+        if not consumidor.auto_ack:
+            self._sem_ack[delivery_tag] = (fila, mensagem, consumidor)
+            consumidor.sem_ack += 1
+
+        metodo = Basic.Deliver(consumidor.tag, delivery_tag, mensagem.redelivered,
+                               mensagem.exchange, mensagem.routing_key)
+
+        def entregar():
+            if self._aberto and consumidor.tag in self._consumidores:
+                consumidor.callback(self, metodo, mensagem.properties, mensagem.body)
+
+        self.connection.ioloop.add_callback_threadsafe(entregar)
+
+    def _retirar_sem_ack(self, delivery_tag: int, multiple: bool):
+        if multiple:
+            while self._sem_ack and next(iter(self._sem_ack)) <= delivery_tag:
+                entrega = self._sem_ack.popitem(last=False)[1]
+                entrega[2].sem_ack -= 1
+                yield entrega
+        elif delivery_tag in self._sem_ack:
+            entrega = self._sem_ack.pop(delivery_tag)
+            entrega[2].sem_ack -= 1
+            yield entrega
+
+    def _filas_consumidas(self) -> List[FilaMemoria]:
+        return list({id(c.fila): c.fila for c in self._consumidores.values()}.values())
+
+    def _filas_liberadas(self, retiradas: List[tuple]) -> List[FilaMemoria]:
+        """
+        Filas a redespachar depois de acks/nacks (com o lock)
+
+        OTIMIZAÇÃO: Com limite só por consumidor, apenas os consumidores das
+        entregas retiradas ganharam espaço; redespachar todas as filas do
+        canal custaria O(consumidores) por ack com milhares de assinaturas.
+        """
+        if self._prefetch:
+            return self._filas_consumidas()
+        return list({id(fila): fila for fila, _, _ in retiradas}.values())
+
+
+class GerenciadorConexaoMemoria(GerenciadorConexaoAMQP):
+    """Gerenciador de conexão que usa o broker em memória no lugar do RabbitMQ"""
+
+    def _criar_conexao(self):
+        return ConexaoMemoria(
+            BrokerMemoria.padrao(),
+            IOLoopMemoria(),
+            on_open_callback=self._on_conexao_aberta,
+            on_open_error_callback=self._on_erro_abertura,
+            on_close_callback=self._on_conexao_fechada
+        )
@@ -0,0 +1,706 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.compressao import CompressorPayload, decodificar_json
+from broker.gerenciador_conexao import GerenciadorConexaoAMQP
+from broker.executor_ordenado import ExecutorOrdenado
+from broker.metricas import MetricasBroker, atraso_desde
+from broker.rabbitmq_manager import ConfiguradorRabbitMQ, PublisherMensagem
+
+class AssinaturaUsuario:
+    """Assinatura de um usuário no ConsumerMultiusuario (contadores escritos só na thread de I/O)"""
+
+    __slots__ = ('nome', 'callback', 'canal', 'tag', 'entregas', 'confirmadas', 'devolvidas',
+                 'falhas', 'em_voo', 'concluidas_sem_ack', 'soma_atraso', 'max_atraso', 'ultimo_atraso', 'com_atraso')
+
+    def __init__(self, nome: str, callback: Callable[[dict], Optional[bool]], canal: 'CanalConsumo'):
+        self.nome = nome
+        self.callback = callback
+        self.canal = canal
+        self.tag: Optional[str] = None
+
+        self.entregas = 0
+        self.confirmadas = 0
+        self.devolvidas = 0
+        self.falhas = 0
+        self.em_voo = 0
+        self.concluidas_sem_ack = 0
+        self.soma_atraso = 0.0
+        self.max_atraso = 0.0
+        self.ultimo_atraso = 0.0
+        self.com_atraso = 0
+
+    def metricas(self) -> Dict[str, float]:
+        """Contadores e atraso (ms) entre a publicação e o início do callback"""
+        return {
+            'entregas': self.entregas,
+            'confirmadas': self.confirmadas,
+            'devolvidas': self.devolvidas,
+            'falhas': self.falhas,
+            'em_voo': self.em_voo,
+            'atraso_medio_ms': (self.soma_atraso / self.com_atraso * 1000) if self.com_atraso else 0.0,
+            'atraso_max_ms': self.max_atraso * 1000,
+            'atraso_ultimo_ms': self.ultimo_atraso * 1000,
+        }
+
+class CanalConsumo:
+    """Um canal do pool, com suas entregas sem ack (só acessado na thread de I/O)"""
+
+    def __init__(self, indice: int, canal):
+        self.indice = indice
+        self.canal = canal
+        self.assinantes = 0
+
+        # {delivery_tag: [recebida_em, estado, assinatura, method, properties, body]}
+        # estado: None (em andamento ou republicação sem confirmação), 'ack',
+        # 'falha' (republicada com confirmação, também recebe ack) ou 'devolver'
+        self.entregas: 'OrderedDict[int, list]' = OrderedDict()
+        self.processadas_sem_ack = 0
+        self.timer_ack = None
+
+class ConsumerMultiusuario:
+    """
+    Consumer das filas de mensagens de muitos usuários em um pool de canais
+
+    POOL DE CANAIS: ConsumerMensagem tem um canal e um pool de workers por
+    usuário. Aqui poucos canais da conexão compartilhada recebem um
+    basic_consume por usuário, adicionados e removidos em tempo de
+    execução (assinar/cancelar); cada assinatura vai para o canal com menos
+    assinantes. O prefetch vale por consumidor, então um usuário lento não
+    segura as entregas dos outros no mesmo canal.
+
+    ROTEAMENTO: Cada entrega vai para o callback do seu usuário, em um pool
+    de workers compartilhado (ExecutorOrdenado, em ordem por usuário). O
+    callback retorna False para devolver a mensagem à fila (ex: usuário
+    desconectou); exceções seguem o caminho de retentativa/dead-letter de
+    ConfiguradorRabbitMQ.destino_falha, republicadas por um PublisherMensagem
+    em confirm mode: a original só recebe ack depois da confirmação e, sem
+    ela, é devolvida à fila.
+
+    ACKS EM LOTE: Por canal, como no ConsumerMensagem: o prefixo contíguo de
+    entregas concluídas é confirmado com um ack multiple=True; as
+    devolvidas recebem nack individual.
+
+    ATRASO (lag): Por usuário e agregado, o tempo entre a publicação
+    (timestamp da mensagem) e o fim do callback, as entregas em voo (sem
+    ack) e, sob demanda, a profundidade da fila no broker.
+
+    RECONEXÃO: Um canal do pool que cai (ex: basic_consume em fila
+    inexistente, queda do broker) é reaberto com backoff e as assinaturas
+    que estavam nele são refeitas. Se as tentativas se esgotam (ex: a
+    conexão caiu), o callback de assinaturas perdidas recebe os usuários
+    que ficaram sem consumo para que o dono do consumer os assine de novo.
+
+    As filas devem existir antes de assinar (ConfiguradorRabbitMQ.criar_fila_usuario):
+    basic_consume em fila inexistente fecha o canal inteiro.
+    """
+
+    def __init__(self, configurador: ConfiguradorRabbitMQ, numero_canais: int = 4,
+                 prefetch: int = 20, lote_ack: int = 50, intervalo_ack: float = 0.2,
+                 max_workers: int = 8):
+        """
+        Inicializa o consumer
+
+        Args:
+            configurador: Configurador já conectado (com a topologia declarada)
+            numero_canais: Canais do pool
+            prefetch: Entregas sem ack por usuário
+            lote_ack: Entregas concluídas em um canal que disparam um ack multiple=True
+            intervalo_ack: Tempo máximo (s) que uma entrega concluída espera pelo ack
+            max_workers: Threads do pool que executa os callbacks
+        """
+        self.configurador = configurador
+        self.numero_canais = numero_canais
+        self.prefetch = prefetch
+        self.lote_ack = lote_ack
+        self.intervalo_ack = intervalo_ack
+        self.max_workers = max_workers
+
+        self.gerenciador = None
+        self.canais: List[CanalConsumo] = []
+        self.executor: Optional[ExecutorOrdenado] = None
+
+        # DECISÃO: Falhas são republicadas fora dos canais do pool: um
+        # exchange de retentativa/dead-letter inexistente fecharia o canal e
+        # derrubaria as assinaturas de todos os usuários nele
+        self.publisher_falhas: Optional[PublisherMensagem] = None
+        # Espera (s) antes de devolver à fila uma falha cuja republicação não
+        # foi confirmada (ex: publisher_falhas fora do ar)
+        self.atraso_devolucao_falha = 5.0
+
+        # {nome_usuario: AssinaturaUsuario}. Alterado na thread de I/O; o lock
+        # só protege leituras de outras threads (métricas)
+        self.assinaturas: Dict[str, AssinaturaUsuario] = {}
+        self._lock = threading.Lock()
+
+        # Só descomprime (corpos com content_encoding zlib/zstd)
+        self.compressor = CompressorPayload(None)
+
+        # Métricas por exchange compartilhadas no processo (MetricasBroker).
+        # Entregas e atrasos são acumulados aqui e enviados junto com cada ack
+        # (thread de I/O)
+        self.metricas = MetricasBroker.padrao()
+        self._entregas_nao_registradas = 0
+        self._reentregas_nao_registradas = 0
+        self._atrasos_nao_registrados: List[float] = []
+
+        # RECONEXÃO: backoff exponencial (s) e tentativas ao reabrir um canal
+        # do pool. Assinaturas de canais caídos esperam a reabertura em
+        # {nome_usuario: callback} (protegido por _lock)
+        self.reabrir_canais = True
+        self.atraso_reabertura_inicial = 0.5
+        self.atraso_reabertura_maximo = 30.0
+        self.tentativas_reabertura = 5
+        self.callback_assinaturas_perdidas: Optional[Callable[[List[str]], None]] = None
+        self._aguardando_reabertura: Dict[str, Callable[[dict], Optional[bool]]] = {}
+        self._encerrado = threading.Event()
+
+        # Canal das consultas de profundidade (aberto na primeira)
+        self._canal_consulta = None
+        self._lock_consulta = threading.Lock()
+
+        # Métricas agregadas (escritas só na thread de I/O)
+        self._frames_ack = 0
+        self._total_invalidas = 0
+        self._total_perdidas = 0
+        self._total_restauradas = 0
+
+    def conectar(self) -> bool:
+        """Abre os canais do pool e o pool de workers"""
+        try:
+            self._encerrado.clear()
+            self.gerenciador = GerenciadorConexaoAMQP.obter_para(self.configurador)
+            for indice in range(self.numero_canais):
+                self.canais.append(self._abrir_canal_consumo(indice))
+
+            self.publisher_falhas = PublisherMensagem(self.configurador, compressao=None)
+            if not self.publisher_falhas.conectar():
+                raise ConnectionError("Publisher de falhas não conectou")
+
+            self.executor = ExecutorOrdenado(self.max_workers, prefixo_thread="geochat-multiusuario")
+            return True
+
+        except Exception as e:
+            print(f"Erro ao conectar consumer multiusuário: {e}")
+            return False
+
+    def _abrir_canal_consumo(self, indice: int) -> CanalConsumo:
+        """Abre um canal do pool com o prefetch por consumidor (fora da thread de I/O)"""
+        canal = self.gerenciador.abrir_canal().result(self.configurador.timeout_operacao)
+        canal_consumo = CanalConsumo(indice, canal)
+        canal.add_on_close_callback(
+            lambda canal, motivo: self._on_canal_fechado(canal_consumo, motivo)
+        )
+        # global_qos=False: o limite vale para cada consumidor do canal
+        self.gerenciador.executar_com_callback(
+            canal,
+            lambda concluir: canal.basic_qos(prefetch_count=self.prefetch, global_qos=False,
+                                             callback=concluir)
+        ).result(self.configurador.timeout_operacao)
+        return canal_consumo
+
+    def desconectar(self):
+        """Fecha o pool (entregas sem ack voltam para as filas no broker)"""
+        try:
+            # Fechamento pedido: não dispara a reabertura dos canais
+            self._encerrado.set()
+            if self.executor:
+                self.executor.encerrar(esperar=False)
+                self.executor = None
+            if self.publisher_falhas:
+                self.publisher_falhas.desconectar()
+                self.publisher_falhas = None
+            if self.gerenciador:
+                for canal_consumo in self.canais:
+                    self.gerenciador.fechar_canal(canal_consumo.canal)
+                if self._canal_consulta is not None:
+                    self.gerenciador.fechar_canal(self._canal_consulta)
+                self.gerenciador.liberar()
+            self.gerenciador = None
+            self.canais = []
+            self._canal_consulta = None
+            with self._lock:
+                self.assinaturas.clear()
+                self._aguardando_reabertura.clear()
+        except Exception as e:
+            print(f"Erro ao desconectar consumer multiusuário: {e}")
+
+    def definir_callback_assinaturas_perdidas(self, callback: Callable[[List[str]], None]):
+        """
+        Define o callback para assinaturas que não puderam ser refeitas
+
+        Args:
+            callback: Recebe os nomes dos usuários que ficaram sem consumo
+                      depois de esgotadas as tentativas de reabrir o canal
+                      (chamado na thread de reabertura)
+        """
+        self.callback_assinaturas_perdidas = callback
+
+    def assinar(self, nome_usuario: str, callback: Callable[[dict], Optional[bool]]) -> bool:
+        """
+        Passa a consumir a fila de mensagens de um usuário
+
+        Args:
+            nome_usuario: Usuário cuja fila será consumida
+            callback: Recebe cada mensagem (thread do pool); retornar False
+                      devolve a mensagem à fila
+
+        Returns:
+            True se a assinatura está ativa (ou já estava)
+        """
+        return self.assinar_varios({nome_usuario: callback}) == 1
+
+    def assinar_varios(self, callbacks: Dict[str, Callable[[dict], Optional[bool]]]) -> int:
+        """
+        Assina várias filas com um único despacho para a thread de I/O
+
+        Args:
+            callbacks: {nome_usuario: callback}
+
+        Returns:
+            Quantidade de assinaturas ativas entre as pedidas
+        """
+        try:
+            return self.gerenciador.executar(self._assinar_na_thread_io, callbacks).result(
+                self.configurador.timeout_operacao
+            )
+        except Exception as e:
+            print(f"Erro ao assinar filas no consumer multiusuário: {e}")
+            return 0
+
+    def _assinar_na_thread_io(self, callbacks: Dict[str, Callable]) -> int:
+        """Registra os basic_consume (o pika devolve a consumer tag sem esperar o broker)"""
+        ativas = 0
+        for nome_usuario, callback in callbacks.items():
+            if nome_usuario in self.assinaturas:
+                ativas += 1
+                continue
+            canais_abertos = [c for c in self.canais if c.canal.is_open]
+            if not canais_abertos:
+                break
+            # Canal com menos assinantes
+            canal_consumo = min(canais_abertos, key=lambda c: c.assinantes)
+            assinatura = AssinaturaUsuario(nome_usuario, callback, canal_consumo)
+            assinatura.tag = canal_consumo.canal.basic_consume(
+                queue=self.configurador.fila_mensagens(nome_usuario),
+                on_message_callback=lambda channel, method, properties, body, assinatura=assinatura:
+                    self._on_entrega(assinatura, method, properties, body),
+                auto_ack=False
+            )
+            canal_consumo.assinantes += 1
+            with self._lock:
+                self.assinaturas[nome_usuario] = assinatura
+            ativas += 1
+        return ativas
+
+    def cancelar(self, nome_usuario: str) -> bool:
+        """
+        Para de consumir a fila de um usuário
+
+        Entregas ainda em andamento terminam normalmente; as que não forem
+        confirmadas voltam para a fila.
+
+        Returns:
+            True se havia assinatura
+        """
+        try:
+            return self.gerenciador.executar(self._cancelar_na_thread_io, nome_usuario).result(
+                self.configurador.timeout_operacao
+            )
+        except Exception as e:
+            print(f"Erro ao cancelar assinatura de {nome_usuario}: {e}")
+            return False
+
+    def _cancelar_na_thread_io(self, nome_usuario: str) -> bool:
+        with self._lock:
+            assinatura = self.assinaturas.pop(nome_usuario, None)
+            aguardando = self._aguardando_reabertura.pop(nome_usuario, None)
+        if assinatura is None:
+            return aguardando is not None
+        canal_consumo = assinatura.canal
+        canal_consumo.assinantes -= 1
+        if canal_consumo.canal.is_open:
+            canal_consumo.canal.basic_cancel(assinatura.tag)
+        return True
+
+    def assinado(self, nome_usuario: str) -> bool:
+        """Indica se a fila do usuário está sendo consumida"""
+        return nome_usuario in self.assinaturas
+
+    def assinados(self) -> List[str]:
+        """Usuários cujas filas estão sendo consumidas"""
+        with self._lock:
+            return list(self.assinaturas)
+
+    def profundidade_fila(self, nome_usuario: str) -> int:
+        """
+        Mensagens prontas na fila do usuário, ainda não entregues (declare passivo)
+
+        DECISÃO: Canal próprio para as consultas: um declare passivo de fila
+        inexistente fecha o canal, e nos canais do pool isso derrubaria as
+        assinaturas de outros usuários.
+        """
+        try:
+            with self._lock_consulta:
+                if self._canal_consulta is None or not self._canal_consulta.is_open:
+                    self._canal_consulta = self.gerenciador.abrir_canal().result(
+                        self.configurador.timeout_operacao
+                    )
+                canal = self._canal_consulta
+                resposta = self.gerenciador.executar_com_callback(
+                    canal,
+                    lambda concluir: canal.queue_declare(
+                        queue=self.configurador.fila_mensagens(nome_usuario),
+                        passive=True, callback=concluir
+                    )
+                ).result(self.configurador.timeout_operacao)
+            return resposta.method.message_count
+        except Exception as e:
+            print(f"Erro ao consultar a fila de {nome_usuario}: {e}")
+            return 0
+
+    def obter_metricas_usuario(self, nome_usuario: str,
+                               incluir_fila: bool = False) -> Optional[Dict[str, float]]:
+        """
+        Métricas de uma assinatura
+
+        Args:
+            nome_usuario: Usuário assinado
+            incluir_fila: Também consulta no broker as mensagens ainda na fila
+                          ('na_fila'; custa uma ida e volta)
+
+        Returns:
+            Dicionário de métricas, ou None se o usuário não está assinado
+        """
+        with self._lock:
+            assinatura = self.assinaturas.get(nome_usuario)
+        if assinatura is None:
+            return None
+        metricas = assinatura.metricas()
+        metricas['canal'] = assinatura.canal.indice
+        if incluir_fila:
+            metricas['na_fila'] = self.profundidade_fila(nome_usuario)
+        return metricas
+
+    def obter_metricas(self, maiores_atrasos: int = 5) -> dict:
+        """
+        Métricas agregadas do consumer
+
+        Args:
+            maiores_atrasos: Quantos usuários com maior atraso listar
+
+        Returns:
+            Dicionário com assinaturas, distribuição por canal, totais,
+            entregas em voo, callbacks na fila do pool, atraso médio/máximo
+            (ms) e os usuários com maior atraso na última mensagem
+        """
+        with self._lock:
+            assinaturas = list(self.assinaturas.values())
+
+        com_atraso = sum(a.com_atraso for a in assinaturas)
+        soma_atraso = sum(a.soma_atraso for a in assinaturas)
+        atrasados = sorted(assinaturas, key=lambda a: a.ultimo_atraso, reverse=True)[:maiores_atrasos]
+        return {
+            'assinaturas': len(assinaturas),
+            'assinaturas_por_canal': [c.assinantes for c in self.canais],
+            'entregas': sum(a.entregas for a in assinaturas),
+            'confirmadas': sum(a.confirmadas for a in assinaturas),
+            'devolvidas': sum(a.devolvidas for a in assinaturas),
+            'falhas': sum(a.falhas for a in assinaturas),
+            'invalidas': self._total_invalidas,
+            'em_voo': sum(a.em_voo for a in assinaturas),
+            'callbacks_pendentes': self.executor.pendentes() if self.executor else 0,
+            'frames_ack': self._frames_ack,
+            'assinaturas_perdidas': self._total_perdidas,
+            'assinaturas_restauradas': self._total_restauradas,
+            'aguardando_reabertura': len(self._aguardando_reabertura),
+            'atraso_medio_ms': (soma_atraso / com_atraso * 1000) if com_atraso else 0.0,
+            'atraso_max_ms': max((a.max_atraso for a in assinaturas), default=0.0) * 1000,
+            'maiores_atrasos': [(a.nome, a.ultimo_atraso * 1000) for a in atrasados if a.com_atraso],
+            'descomprimidas': self.compressor.obter_metricas()['descomprimidos'],
+        }
+
+    def _on_entrega(self, assinatura: AssinaturaUsuario, method, properties, body: bytes):
+        """Thread de I/O: registra a entrega e envia o callback do usuário para o pool"""
+        canal_consumo = assinatura.canal
+        delivery_tag = method.delivery_tag
+        canal_consumo.entregas[delivery_tag] = [time.monotonic(), None, assinatura,
+                                                method, properties, body]
+        assinatura.entregas += 1
+        assinatura.em_voo += 1
+        self._entregas_nao_registradas += 1
+        if method.redelivered:
+            self._reentregas_nao_registradas += 1
+
+        try:
+            dados = decodificar_json(body, properties.content_encoding, self.compressor)
+        except (ValueError, UnicodeDecodeError) as e:
+            self._total_invalidas += 1
+            self._concluir_entrega(canal_consumo, delivery_tag, 'falha', f"JSON inválido: {e}")
+            return
+
+        if self.executor is None:
+            return
+        self.executor.submeter(assinatura.nome, self._executar_callback, assinatura,
+                               canal_consumo, delivery_tag, dados)
+
+    def _executar_callback(self, assinatura: AssinaturaUsuario, canal_consumo: CanalConsumo,
+                           delivery_tag: int, dados: dict):
+        """Executa o callback do usuário (thread do pool) e devolve o resultado ao I/O"""
+        atraso = atraso_desde(dados.get('timestamp'))
+        erro = ''
+        try:
+            resultado = 'devolver' if assinatura.callback(dados) is False else 'ok'
+        except Exception as e:
+            print(f"Erro ao processar mensagem de {assinatura.nome}: {e}")
+            resultado, erro = 'falha', repr(e)
+
+        gerenciador = self.gerenciador
+        if gerenciador:
+            gerenciador.executar(self._concluir_entrega, canal_consumo, delivery_tag,
+                                 resultado, erro, atraso)
+
+    def _concluir_entrega(self, canal_consumo: CanalConsumo, delivery_tag: int, resultado: str,
+                          erro: str = '', atraso: Optional[float] = None):
+        """
+        Marca uma entrega como concluída (thread de I/O)
+
+        Args:
+            resultado: 'ok' (ack), 'devolver' (nack com requeue) ou 'falha'
+                       (republicada por destino_falha; confirmada em
+                       _concluir_republicacao)
+        """
+        canal = canal_consumo.canal
+        if not canal.is_open or self.gerenciador is None:
+            return
+        entrega = canal_consumo.entregas.get(delivery_tag)
+        if entrega is None or entrega[1] is not None:
+            return
+
+        if resultado == 'falha':
+            # A entrega segue em andamento (e segura o ack em lote) até a confirmação
+            _, _, _, method, properties, body = entrega
+            exchange, routing_key, propriedades = self.configurador.destino_falha(
+                method, properties, erro
+            )
+            gerenciador = self.gerenciador
+            republicacao = self.publisher_falhas.republicar(exchange, routing_key, body, propriedades)
+            republicacao.add_done_callback(
+                lambda futuro: gerenciador.executar(
+                    self._concluir_republicacao, canal_consumo, canal, delivery_tag, futuro, atraso
+                )
+            )
+            return
+
+        estado = 'devolver' if resultado == 'devolver' else 'ack'
+        self._marcar_concluida(canal_consumo, entrega, estado, atraso)
+
+    def _concluir_republicacao(self, canal_consumo: CanalConsumo, canal, delivery_tag: int,
+                               republicacao: Future, atraso: Optional[float]):
+        """
+        Resultado da republicação de uma falha (thread de I/O)
+
+        Confirmada, a original entra no próximo ack em lote; recusada ou
+        perdida (canal do publisher caiu, exchange inexistente), volta para
+        a fila com nack e requeue depois de atraso_devolucao_falha segundos
+        (devolver na hora, com o publisher fora do ar, faria a mesma
+        mensagem falhar em loop).
+        """
+        if canal_consumo.canal is not canal or not canal.is_open or self.gerenciador is None:
+            return
+        entrega = canal_consumo.entregas.get(delivery_tag)
+        if entrega is None or entrega[1] is not None:
+            return
+        if republicacao.exception() is None and republicacao.result():
+            self._marcar_concluida(canal_consumo, entrega, 'falha', atraso)
+            return
+        self.gerenciador.chamar_depois(
+            self.atraso_devolucao_falha,
+            lambda: self._devolver_falha(canal_consumo, canal, delivery_tag, atraso)
+        )
+
+    def _devolver_falha(self, canal_consumo: CanalConsumo, canal, delivery_tag: int,
+                        atraso: Optional[float]):
+        """Devolve à fila uma falha não republicada, após o atraso (thread de I/O)"""
+        if canal_consumo.canal is not canal or not canal.is_open or self.gerenciador is None:
+            return
+        entrega = canal_consumo.entregas.get(delivery_tag)
+        if entrega is None or entrega[1] is not None:
+            return
+        self._marcar_concluida(canal_consumo, entrega, 'devolver', atraso)
+
+    def _marcar_concluida(self, canal_consumo: CanalConsumo, entrega: list, estado: str,
+                          atraso: Optional[float]):
+        """Registra o estado final da entrega e agenda o ack em lote (thread de I/O)"""
+        assinatura = entrega[2]
+        assinatura.em_voo -= 1
+        if atraso is not None:
+            self._atrasos_nao_registrados.append(atraso)
+        entrega[1] = estado
+        if estado == 'devolver':
+            assinatura.devolvidas += 1
+        elif estado == 'falha':
+            assinatura.falhas += 1
+        else:
+            assinatura.confirmadas += 1
+            if atraso is not None:
+                assinatura.ultimo_atraso = atraso
+                assinatura.soma_atraso += atraso
+                assinatura.max_atraso = max(assinatura.max_atraso, atraso)
+                assinatura.com_atraso += 1
+
+        canal_consumo.processadas_sem_ack += 1
+        assinatura.concluidas_sem_ack += 1
+        # O prefetch é por usuário: com metade dele esperando ack, o broker
+        # logo para de entregar para esse usuário, então não espera o timer
+        if canal_consumo.processadas_sem_ack >= self.lote_ack or \
+                assinatura.concluidas_sem_ack * 2 >= self.prefetch:
+            self._enviar_acks(canal_consumo)
+        elif canal_consumo.timer_ack is None:
+            canal_consumo.timer_ack = self.gerenciador.chamar_depois(
+                self.intervalo_ack, lambda: self._on_timer_ack(canal_consumo)
+            )
+
+    def _on_timer_ack(self, canal_consumo: CanalConsumo):
+        canal_consumo.timer_ack = None
+        self._enviar_acks(canal_consumo)
+
+    def _enviar_acks(self, canal_consumo: CanalConsumo):
+        """
+        Confirma o prefixo contíguo de entregas concluídas de um canal (thread de I/O)
+
+        As devolvidas no meio do prefixo recebem nack individual com requeue;
+        as demais são confirmadas por um único ack multiple=True.
+        """
+        if canal_consumo.timer_ack is not None:
+            self.gerenciador.cancelar_chamada(canal_consumo.timer_ack)
+            canal_consumo.timer_ack = None
+        canal = canal_consumo.canal
+        if not canal.is_open:
+            return
+
+        ultima_tag = None
+        contagem = {'ack': 0, 'falha': 0, 'devolver': 0}
+        while canal_consumo.entregas:
+            tag, entrega = next(iter(canal_consumo.entregas.items()))
+            if entrega[1] is None:
+                break
+            canal_consumo.entregas.popitem(last=False)
+            canal_consumo.processadas_sem_ack -= 1
+            entrega[2].concluidas_sem_ack -= 1
+            contagem[entrega[1]] += 1
+            if entrega[1] == 'devolver':
+                canal.basic_nack(delivery_tag=tag, requeue=True)
+            else:
+                ultima_tag = tag
+
+        if ultima_tag is not None:
+            canal.basic_ack(delivery_tag=ultima_tag, multiple=True)
+            self._frames_ack += 1
+        if ultima_tag is not None or contagem['devolver']:
+            # Todas as filas de usuário ligam ao exchange de mensagens
+            exchange = self.configurador.exchange_mensagens
+            self.metricas.registrar_entregas(exchange, self._entregas_nao_registradas,
+                                             self._reentregas_nao_registradas)
+            self._entregas_nao_registradas = self._reentregas_nao_registradas = 0
+            self.metricas.registrar_atrasos(exchange, self._atrasos_nao_registrados)
+            self._atrasos_nao_registrados = []
+            self.metricas.registrar_conclusoes(exchange, confirmadas=contagem['ack'],
+                                               falhas=contagem['falha'],
+                                               devolvidas=contagem['devolver'])
+
+        # Concluídas atrás de uma em andamento: tenta de novo depois
+        if canal_consumo.processadas_sem_ack and canal_consumo.timer_ack is None:
+            canal_consumo.timer_ack = self.gerenciador.chamar_depois(
+                self.intervalo_ack, lambda: self._on_timer_ack(canal_consumo)
+            )
+
+    def _on_canal_fechado(self, canal_consumo: CanalConsumo, motivo):
+        """
+        Entregas sem ack voltam para as filas; as assinaturas do canal
+        esperam a reabertura dele (thread de I/O)
+        """
+        canal_consumo.entregas.clear()
+        canal_consumo.processadas_sem_ack = 0
+        canal_consumo.timer_ack = None
+        canal_consumo.assinantes = 0
+
+        with self._lock:
+            perdidas = {nome: assinatura.callback for nome, assinatura in self.assinaturas.items()
+                        if assinatura.canal is canal_consumo}
+            for nome in perdidas:
+                del self.assinaturas[nome]
+            if not self._encerrado.is_set():
+                self._aguardando_reabertura.update(perdidas)
+        if self._encerrado.is_set():
+            return
+
+        self._total_perdidas += len(perdidas)
+        if perdidas:
+            print(f"Canal {canal_consumo.indice} do consumer multiusuário fechado ({motivo}): "
+                  f"{len(perdidas)} assinatura(s) aguardando reabertura")
+        if self.reabrir_canais:
+            threading.Thread(target=self._loop_reabertura, args=(canal_consumo.indice,),
+                             daemon=True,
+                             name=f"geochat-multiusuario-reabertura-{canal_consumo.indice}").start()
+        else:
+            self._desistir_reabertura()
+
+    def _loop_reabertura(self, indice: int):
+        """
+        Reabre um canal do pool e refaz as assinaturas que esperam reabertura
+
+        BACKOFF: As esperas dobram a cada tentativa (até atraso_reabertura_maximo)
+        e são sorteadas entre metade e o total do atraso, como na reconexão
+        do PublisherMensagem.
+        """
+        atraso = self.atraso_reabertura_inicial
+        for tentativa in range(1, self.tentativas_reabertura + 1):
+            if self._encerrado.wait(random.uniform(atraso / 2, atraso)):
+                return
+            atraso = min(atraso * 2, self.atraso_reabertura_maximo)
+            try:
+                canal_consumo = self._abrir_canal_consumo(indice)
+                restauradas = self.gerenciador.executar(
+                    self._restaurar_na_thread_io, canal_consumo
+                ).result(self.configurador.timeout_operacao)
+                print(f"Canal {indice} do consumer multiusuário reaberto (tentativa {tentativa}): "
+                      f"{restauradas} assinatura(s) refeita(s)")
+                return
+            except Exception as e:
+                print(f"Reabertura do canal {indice} falhou (tentativa {tentativa}): "
+                      f"{e or type(e).__name__}")
+        self._desistir_reabertura()
+
+    def _restaurar_na_thread_io(self, canal_consumo: CanalConsumo) -> int:
+        """Põe o canal reaberto no pool e assina de novo os usuários que esperam reabertura"""
+        if self._encerrado.is_set():
+            canal_consumo.canal.close()
+            return 0
+        self.canais[canal_consumo.indice] = canal_consumo
+        with self._lock:
+            pendentes, self._aguardando_reabertura = self._aguardando_reabertura, {}
+        restauradas = self._assinar_na_thread_io(pendentes)
+        self._total_restauradas += restauradas
+        return restauradas
+
+    def _desistir_reabertura(self):
+        """Entrega ao callback de assinaturas perdidas os usuários que esperavam reabertura"""
+        with self._lock:
+            pendentes, self._aguardando_reabertura = self._aguardando_reabertura, {}
+        if not pendentes:
+            return
+        print(f"Consumer multiusuário: {len(pendentes)} assinatura(s) não refeita(s)")
+        if self.callback_assinaturas_perdidas:
+            try:
+                self.callback_assinaturas_perdidas(list(pendentes))
+            except Exception as e:
+                print(f"Erro em callback de assinaturas perdidas: {e}")
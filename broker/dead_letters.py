@@ -0,0 +1,225 @@
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+import pika
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.compressao import ErroCompressao, descomprimir
+from broker.gerenciador_conexao import GerenciadorConexaoAMQP
+from broker.rabbitmq_manager import ConfiguradorRabbitMQ, PublisherMensagem
+
+class InspetorDeadLetters:
+    """
+    Inspeção e reprocessamento da fila de dead letters
+
+    LEITURA SEM REMOVER: As mensagens são consumidas sem ack e, depois de
+    lidas, devolvidas à fila (nack com requeue), na mesma ordem.
+
+    REPROCESSAMENTO: Cada mensagem é republicada no exchange e routing key
+    de origem, sem os cabeçalhos de tentativas, e só sai do dead-letter
+    depois que o broker confirma a republicação.
+    """
+
+    # Cabeçalhos de controle removidos ao reprocessar
+    CABECALHOS_CONTROLE = ('geochat-tentativas', 'geochat-erro', 'geochat-exchange-origem',
+                           'geochat-routing-key-origem', 'geochat-morta-em', 'x-death')
+
+    def __init__(self, configurador: ConfiguradorRabbitMQ, ociosidade: float = 0.5):
+        """
+        Inicializa o inspetor
+
+        Args:
+            configurador: Configurador já conectado (com a topologia declarada)
+            ociosidade: Tempo (s) sem entregas que encerra uma leitura
+        """
+        self.configurador = configurador
+        self.ociosidade = ociosidade
+        self.gerenciador = None
+        self.channel = None
+        self.publisher = PublisherMensagem(configurador)
+
+    def conectar(self) -> bool:
+        """Abre o canal de leitura e o publisher de reprocessamento"""
+        try:
+            self.gerenciador = GerenciadorConexaoAMQP.obter_para(self.configurador)
+            self.channel = self.gerenciador.abrir_canal().result(self.configurador.timeout_operacao)
+            return self.publisher.conectar()
+
+        except Exception as e:
+            print(f"Erro ao conectar inspetor de dead letters: {e}")
+            return False
+
+    def desconectar(self):
+        """Fecha o canal (mensagens ainda sem ack voltam para a fila)"""
+        try:
+            self.publisher.desconectar()
+            if self.gerenciador:
+                if self.channel:
+                    self.gerenciador.fechar_canal(self.channel)
+                self.gerenciador.liberar()
+            self.gerenciador = None
+            self.channel = None
+        except Exception as e:
+            print(f"Erro ao desconectar inspetor de dead letters: {e}")
+
+    def listar(self, limite: int = 100) -> List[dict]:
+        """
+        Lê as primeiras mensagens do dead-letter sem removê-las
+
+        Args:
+            limite: Máximo de mensagens lidas
+
+        Returns:
+            Lista de resumos (tentativas, erro, origem, horário e corpo)
+        """
+        try:
+            entregas = self._coletar(limite)
+            self._devolver([method.delivery_tag for method, _, _ in entregas])
+            return [self._resumir(method, properties, body)
+                    for method, properties, body in entregas]
+
+        except Exception as e:
+            print(f"Erro ao listar dead letters: {e}")
+            return []
+
+    def reprocessar(self, limite: int = 100,
+                    filtro: Optional[Callable[[dict], bool]] = None) -> int:
+        """
+        Republica mensagens do dead-letter na origem
+
+        Args:
+            limite: Máximo de mensagens lidas
+            filtro: Recebe o resumo da mensagem; só as aceitas são
+                    reprocessadas (as demais continuam no dead-letter)
+
+        Returns:
+            Quantidade de mensagens reprocessadas
+        """
+        try:
+            entregas = self._coletar(limite)
+            publicadas = []
+            ignoradas = []
+            for method, properties, body in entregas:
+                resumo = self._resumir(method, properties, body)
+                if filtro and not filtro(resumo):
+                    ignoradas.append(method.delivery_tag)
+                    continue
+                futuro = self.publisher.republicar(resumo['exchange'], resumo['routing_key'],
+                                                   body, self._propriedades_originais(properties))
+                publicadas.append((method.delivery_tag, futuro))
+
+            confirmadas = []
+            for delivery_tag, futuro in publicadas:
+                try:
+                    confirmada = futuro.result(self.configurador.timeout_operacao)
+                except Exception:
+                    confirmada = False
+                (confirmadas if confirmada else ignoradas).append(delivery_tag)
+
+            def concluir():
+                for delivery_tag in confirmadas:
+                    self.channel.basic_ack(delivery_tag=delivery_tag)
+            self.gerenciador.executar(concluir).result(self.configurador.timeout_operacao)
+            self._devolver(ignoradas)
+            return len(confirmadas)
+
+        except Exception as e:
+            print(f"Erro ao reprocessar dead letters: {e}")
+            return 0
+
+    def descartar(self) -> int:
+        """
+        Apaga todas as mensagens do dead-letter
+
+        Returns:
+            Quantidade de mensagens apagadas
+        """
+        try:
+            resposta = self.gerenciador.executar_com_callback(
+                self.channel,
+                lambda concluir: self.channel.queue_purge(
+                    queue=self.configurador.fila_dead_letters, callback=concluir
+                )
+            ).result(self.configurador.timeout_operacao)
+            return resposta.method.message_count
+
+        except Exception as e:
+            print(f"Erro ao descartar dead letters: {e}")
+            return 0
+
+    def _coletar(self, limite: int) -> List[Tuple]:
+        """
+        Consome até 'limite' mensagens sem ack e para de consumir
+
+        PREFETCH = limite: o broker não entrega mais do que o pedido, e a
+        leitura termina quando o limite chega ou as entregas param.
+        """
+        entregas = []
+        completo = threading.Event()
+        ultima_entrega = [time.monotonic()]
+
+        def on_entrega(channel, method, properties, body):
+            entregas.append((method, properties, body))
+            ultima_entrega[0] = time.monotonic()
+            if len(entregas) >= limite:
+                completo.set()
+
+        self.gerenciador.executar_com_callback(
+            self.channel,
+            lambda concluir: self.channel.basic_qos(prefetch_count=limite, callback=concluir)
+        ).result(self.configurador.timeout_operacao)
+        tag = self.gerenciador.executar(
+            self.channel.basic_consume, queue=self.configurador.fila_dead_letters,
+            on_message_callback=on_entrega, auto_ack=False
+        ).result(self.configurador.timeout_operacao)
+
+        while not completo.wait(self.ociosidade / 5):
+            if time.monotonic() - ultima_entrega[0] >= self.ociosidade:
+                break
+
+        self.gerenciador.executar(self.channel.basic_cancel, tag).result(
+            self.configurador.timeout_operacao
+        )
+        return entregas[:limite]
+
+    def _devolver(self, tags: List[int]):
+        """Devolve entregas lidas à fila, na ordem original (nack com requeue)"""
+        def devolver():
+            for delivery_tag in reversed(tags):
+                self.channel.basic_nack(delivery_tag=delivery_tag, requeue=True)
+        if tags:
+            self.gerenciador.executar(devolver).result(self.configurador.timeout_operacao)
+
+    def _resumir(self, method, properties, body: bytes) -> dict:
+        """Resumo legível de uma dead letter"""
+        cabecalhos = properties.headers or {}
+        try:
+            corpo = descomprimir(body, properties.content_encoding)
+        except ErroCompressao:
+            corpo = body
+        return {
+            'delivery_tag': method.delivery_tag,
+            'exchange': cabecalhos.get('geochat-exchange-origem', ''),
+            'routing_key': cabecalhos.get('geochat-routing-key-origem', method.routing_key),
+            'tentativas': cabecalhos.get('geochat-tentativas', 0),
+            'erro': cabecalhos.get('geochat-erro', ''),
+            'morta_em': cabecalhos.get('geochat-morta-em', ''),
+            'corpo': corpo.decode('utf-8', errors='replace'),
+        }
+
+    def _propriedades_originais(self, properties: pika.BasicProperties) -> pika.BasicProperties:
+        """Propriedades da mensagem sem os cabeçalhos de controle do dead-letter"""
+        cabecalhos = {chave: valor for chave, valor in (properties.headers or {}).items()
+                      if chave not in self.CABECALHOS_CONTROLE}
+        return pika.BasicProperties(
+            content_type=properties.content_type,
+            content_encoding=properties.content_encoding,
+            delivery_mode=properties.delivery_mode,
+            message_id=properties.message_id,
+            timestamp=properties.timestamp,
+            headers=cabecalhos or None
+        )
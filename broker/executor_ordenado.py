@@ -0,0 +1,75 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Hashable, Tuple
+
+class ExecutorOrdenado:
+    """
+    Pool de threads limitado que preserva a ordem das tarefas de mesma chave
+
+    ORDEM POR CHAVE: Tarefas com a mesma chave (ex: remetente) rodam uma de
+    cada vez, na ordem de submissão. Tarefas de chaves diferentes rodam em
+    paralelo, até max_workers threads.
+
+    ENCADEAMENTO: Enquanto uma chave tem tarefa rodando, as seguintes ficam
+    em uma fila própria e são executadas pela mesma thread quando ela
+    termina, sem voltar ao pool.
+    """
+
+    def __init__(self, max_workers: int = 4, prefixo_thread: str = "geochat-worker"):
+        """
+        Inicializa o executor
+
+        Args:
+            max_workers: Número máximo de threads executando tarefas
+            prefixo_thread: Prefixo do nome das threads (facilita depuração)
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix=prefixo_thread)
+        self._lock = threading.Lock()
+
+        # Tarefas aguardando por chave ativa: {chave: deque[(funcao, args)]}
+        self._filas: Dict[Hashable, Deque[Tuple[Callable, tuple]]] = {}
+        self._pendentes = 0
+
+    def submeter(self, chave: Hashable, funcao: Callable, *args):
+        """
+        Agenda uma tarefa, respeitando a ordem das tarefas de mesma chave
+
+        Args:
+            chave: Chave de ordenação
+            funcao: Função a executar
+            *args: Argumentos da função
+        """
+        with self._lock:
+            self._pendentes += 1
+            fila = self._filas.get(chave)
+            if fila is not None:
+                fila.append((funcao, args))
+                return
+            self._filas[chave] = deque()
+        self._executor.submit(self._executar_cadeia, chave, funcao, args)
+
+    def pendentes(self) -> int:
+        """Retorna quantas tarefas foram submetidas e ainda não terminaram"""
+        return self._pendentes
+
+    def encerrar(self, esperar: bool = False):
+        """Encerra o pool (tarefas ainda na fila não são executadas se esperar=False)"""
+        self._executor.shutdown(wait=esperar)
+
+    def _executar_cadeia(self, chave: Hashable, funcao: Callable, args: tuple):
+        """Executa a tarefa e, em seguida, as que chegaram para a mesma chave"""
+        while True:
+            try:
+                funcao(*args)
+            except Exception as e:
+                print(f"Erro em tarefa do executor: {e}")
+
+            with self._lock:
+                self._pendentes -= 1
+                fila = self._filas[chave]
+                if not fila:
+                    del self._filas[chave]
+                    return
+                funcao, args = fila.popleft()
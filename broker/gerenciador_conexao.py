@@ -0,0 +1,333 @@
+import pika
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Set
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.config import config
+
+class CanalFechadoErro(ConnectionError):
+    """Canal fechado antes da resposta de uma operação"""
+
+    def __init__(self, numero: Optional[int], motivo):
+        """
+        Args:
+            numero: Número do canal
+            motivo: Exceção do pika; reply_code (ex: 406 PRECONDITION_FAILED
+                    para argumentos de fila diferentes) fica disponível
+        """
+        super().__init__(f"Canal {numero} fechado: {motivo}")
+        self.reply_code = getattr(motivo, 'reply_code', 0)
+
+class GerenciadorConexaoAMQP:
+    """
+    Gerenciador da conexão AMQP compartilhada por processo
+
+    UMA CONEXÃO, UMA THREAD: pika.BlockingConnection não pode ser usada por
+    várias threads, então antes cada publisher e consumer abria sua própria
+    conexão. O gerenciador é dono de uma única pika.SelectConnection cujo
+    ioloop roda em uma thread de I/O dedicada. Configurador, publisher e
+    consumer recebem canais dessa conexão.
+
+    MARSHALLING: Toda operação em canal é enviada para a thread de I/O via
+    add_callback_threadsafe (método executar). Chamadores de qualquer thread
+    recebem um Future com o resultado, sem locks por publicação.
+
+    CONTAGEM DE REFERÊNCIAS: Instâncias são compartilhadas por (host, porta,
+    usuário). A conexão é fechada quando o último componente chama liberar().
+    """
+
+    _instancias: Dict[tuple, 'GerenciadorConexaoAMQP'] = {}
+    _lock_instancias = threading.Lock()
+
+    def __init__(self, host: str, porta: int, usuario: str, senha: str,
+                 timeout_conexao: float = 10.0):
+        """
+        Inicializa o gerenciador (a conexão só é aberta em iniciar())
+
+        Args:
+            host: Host do RabbitMQ
+            porta: Porta do RabbitMQ
+            usuario: Usuário do RabbitMQ
+            senha: Senha do RabbitMQ
+            timeout_conexao: Tempo máximo de espera pela abertura da conexão
+        """
+        self.host = host
+        self.porta = porta
+        self.usuario = usuario
+        self.senha = senha
+        self.timeout_conexao = timeout_conexao
+
+        self.connection = None
+        self.thread_io = None
+        self.conectado = False
+
+        self._referencias = 0
+        self._evento_aberta = threading.Event()
+        self._encerrar = threading.Event()
+        self._erro_abertura: Optional[Exception] = None
+
+        # Futures aguardando resposta do broker, por número de canal.
+        # Se o canal fechar (ex: PRECONDITION_FAILED), eles falham na hora
+        # em vez de esperar o timeout
+        self._pendentes_por_canal: Dict[int, Set[Future]] = {}
+
+    @classmethod
+    def obter(cls, host: str, porta: int, usuario: str, senha: str) -> 'GerenciadorConexaoAMQP':
+        """
+        Retorna o gerenciador compartilhado para os parâmetros, conectando se necessário
+
+        Cada chamada bem-sucedida deve ser pareada com um liberar().
+
+        Raises:
+            ConnectionError: Se não foi possível abrir a conexão
+        """
+        chave = (host, porta, usuario)
+        with cls._lock_instancias:
+            gerenciador = cls._instancias.get(chave)
+            if gerenciador is None or not gerenciador.conectado:
+                gerenciador = cls._classe_backend()(host, porta, usuario, senha)
+                gerenciador.iniciar()
+                cls._instancias[chave] = gerenciador
+            gerenciador._referencias += 1
+            return gerenciador
+
+    @classmethod
+    def obter_para(cls, configurador) -> 'GerenciadorConexaoAMQP':
+        """Atalho para obter o gerenciador com os parâmetros de um ConfiguradorRabbitMQ"""
+        return cls.obter(configurador.host, configurador.porta,
+                         configurador.usuario, configurador.senha)
+
+    @classmethod
+    def _classe_backend(cls) -> type:
+        """Classe do gerenciador para o broker configurado (Config.BROKER_BACKEND)"""
+        if cls is GerenciadorConexaoAMQP and config.BROKER_BACKEND == 'memoria':
+            # Import tardio: broker_memoria importa este módulo
+            from broker.broker_memoria import GerenciadorConexaoMemoria
+            return GerenciadorConexaoMemoria
+        return cls
+
+    def liberar(self):
+        """Devolve uma referência; a última fecha a conexão"""
+        with self._lock_instancias:
+            self._referencias -= 1
+            if self._referencias > 0:
+                return
+            chave = (self.host, self.porta, self.usuario)
+            if self._instancias.get(chave) is self:
+                del self._instancias[chave]
+        self.fechar()
+
+    def iniciar(self):
+        """
+        Abre a conexão e inicia a thread de I/O
+
+        Raises:
+            ConnectionError: Se a conexão não abrir dentro do timeout
+        """
+        self.thread_io = threading.Thread(target=self._loop_io, daemon=True,
+                                          name="geochat-amqp-io")
+        self.thread_io.start()
+
+        if not self._evento_aberta.wait(self.timeout_conexao):
+            self.fechar()
+            raise ConnectionError("Timeout ao conectar ao RabbitMQ")
+        if self._erro_abertura:
+            raise ConnectionError(f"Falha ao conectar ao RabbitMQ: {self._erro_abertura!r}")
+
+    def fechar(self):
+        """
+        Fecha a conexão e aguarda a thread de I/O terminar
+
+        Vale também depois de um iniciar() que estourou o timeout antes de a
+        conexão existir: a thread de I/O vê o pedido e não roda o ioloop.
+        """
+        self._encerrar.set()
+
+        if self.connection is not None:
+            def _fechar():
+                if not (self.connection.is_closing or self.connection.is_closed):
+                    self.connection.close()
+
+            try:
+                self._agendar(_fechar)
+            except Exception as e:
+                print(f"Erro ao fechar conexão AMQP: {e}")
+
+        if self.thread_io and self.thread_io is not threading.current_thread():
+            self.thread_io.join(timeout=5)
+
+    def _criar_parametros(self) -> pika.ConnectionParameters:
+        """Cria os parâmetros de conexão do pika"""
+        credentials = pika.PlainCredentials(self.usuario, self.senha)
+        return pika.ConnectionParameters(
+            host=self.host,
+            port=self.porta,
+            credentials=credentials
+        )
+
+    def _criar_conexao(self):
+        """Cria a conexão assíncrona (sobrescrito por transportes alternativos)"""
+        return pika.SelectConnection(
+            self._criar_parametros(),
+            on_open_callback=self._on_conexao_aberta,
+            on_open_error_callback=self._on_erro_abertura,
+            on_close_callback=self._on_conexao_fechada
+        )
+
+    def _loop_io(self):
+        """Thread de I/O: roda o ioloop da conexão até ela fechar"""
+        try:
+            self.connection = self._criar_conexao()
+            if self._encerrar.is_set():
+                # fechar() veio antes da conexão existir (timeout em iniciar())
+                self.connection.ioloop.close()
+                return
+            self.connection.ioloop.start()
+        except Exception as e:
+            print(f"Erro no loop de I/O AMQP: {e}")
+            self._erro_abertura = self._erro_abertura or e
+        finally:
+            self.conectado = False
+            self._evento_aberta.set()
+
+    def _on_conexao_aberta(self, connection):
+        self.conectado = True
+        self._evento_aberta.set()
+
+    def _on_erro_abertura(self, connection, erro):
+        self._erro_abertura = erro if isinstance(erro, Exception) else Exception(str(erro))
+        self._evento_aberta.set()
+        connection.ioloop.stop()
+
+    def _on_conexao_fechada(self, connection, motivo):
+        self.conectado = False
+        self._falhar_pendentes(None, ConnectionError(f"Conexão AMQP fechada: {motivo}"))
+        connection.ioloop.stop()
+
+    def na_thread_io(self) -> bool:
+        """Indica se o chamador já está na thread de I/O"""
+        return threading.current_thread() is self.thread_io
+
+    def _agendar(self, funcao: Callable[[], None]):
+        """Agenda uma função para rodar na thread de I/O"""
+        if self.na_thread_io():
+            funcao()
+        else:
+            self.connection.ioloop.add_callback_threadsafe(funcao)
+
+    def chamar_depois(self, segundos: float, funcao: Callable[[], None]):
+        """
+        Agenda uma função no ioloop após um atraso (chamar só na thread de I/O)
+
+        Returns:
+            Handle do timer, aceito por cancelar_chamada
+        """
+        return self.connection.ioloop.call_later(segundos, funcao)
+
+    def cancelar_chamada(self, handle):
+        """Cancela um timer criado por chamar_depois (chamar só na thread de I/O)"""
+        self.connection.ioloop.remove_timeout(handle)
+
+    def executar(self, funcao: Callable, *args, **kwargs) -> Future:
+        """
+        Executa uma função na thread de I/O
+
+        Returns:
+            Future com o valor de retorno (ou exceção) da função
+        """
+        futuro = Future()
+
+        def tarefa():
+            if not futuro.set_running_or_notify_cancel():
+                return
+            try:
+                futuro.set_result(funcao(*args, **kwargs))
+            except Exception as e:
+                futuro.set_exception(e)
+
+        if not self.conectado:
+            futuro.set_exception(ConnectionError("Conexão AMQP não está aberta"))
+            return futuro
+        self._agendar(tarefa)
+        return futuro
+
+    def executar_com_callback(self, canal, funcao: Callable[[Callable], None]) -> Future:
+        """
+        Executa uma operação pika que responde por callback (queue_declare, queue_bind...)
+
+        Args:
+            canal: Canal em que a operação roda (None para operações da conexão).
+                   Se ele fechar antes da resposta, o Future falha.
+            funcao: Recebe 'concluir' e deve passá-lo como callback da operação
+
+        Returns:
+            Future resolvido com o argumento recebido pelo callback do pika
+        """
+        futuro = Future()
+        numero = canal.channel_number if canal is not None else None
+
+        def concluir(resultado=None):
+            self._pendentes_por_canal.get(numero, set()).discard(futuro)
+            if not futuro.done():
+                futuro.set_result(resultado)
+
+        def tarefa():
+            self._pendentes_por_canal.setdefault(numero, set()).add(futuro)
+            try:
+                funcao(concluir)
+            except Exception as e:
+                self._pendentes_por_canal[numero].discard(futuro)
+                if not futuro.done():
+                    futuro.set_exception(e)
+
+        if not self.conectado:
+            futuro.set_exception(ConnectionError("Conexão AMQP não está aberta"))
+            return futuro
+        self._agendar(tarefa)
+        return futuro
+
+    def abrir_canal(self) -> Future:
+        """
+        Abre um novo canal na conexão compartilhada
+
+        Returns:
+            Future resolvido com o canal (pika.channel.Channel)
+        """
+        def abrir(concluir):
+            self.connection.channel(on_open_callback=self._registrar_canal(concluir))
+        return self.executar_com_callback(None, abrir)
+
+    def _registrar_canal(self, concluir: Callable) -> Callable:
+        """Monitora o fechamento do canal recém-aberto antes de entregá-lo"""
+        def on_aberto(canal):
+            canal.add_on_close_callback(self._on_canal_fechado)
+            concluir(canal)
+        return on_aberto
+
+    def _on_canal_fechado(self, canal, motivo):
+        self._falhar_pendentes(canal.channel_number,
+                               CanalFechadoErro(canal.channel_number, motivo))
+
+    def _falhar_pendentes(self, numero: Optional[int], erro: Exception):
+        """Falha os Futures pendentes de um canal (ou de todos, se numero for None)"""
+        if numero is None:
+            grupos = list(self._pendentes_por_canal.values())
+            self._pendentes_por_canal.clear()
+        else:
+            grupos = [self._pendentes_por_canal.pop(numero, set())]
+        for pendentes in grupos:
+            for futuro in pendentes:
+                if not futuro.done():
+                    futuro.set_exception(erro)
+
+    def fechar_canal(self, canal):
+        """Fecha um canal a partir de qualquer thread"""
+        def _fechar():
+            if canal.is_open:
+                canal.close()
+        if self.conectado:
+            self._agendar(_fechar)
@@ -0,0 +1,515 @@
+"""
+Métricas do caminho assíncrono (broker): publicação, consumo e filas
+
+PARA QUE SERVE: Sem números não dá para saber quando o caminho assíncrono
+está ficando para trás. Publisher e consumers registram aqui, sem prints:
+- publicação: publicações/s e latência até a confirmação, por exchange
+- consumo: entregas/s, reentregas, atraso entre o 'timestamp' da mensagem
+  e o início do callback, e taxa de falhas/devoluções (nacks), por exchange
+- filas: profundidade amostrada com queue_declare passivo (AmostradorFilas)
+
+LEITURA: MetricasBroker.padrao().obter() devolve tudo por exchange/fila
+(endpoint de métricas); resumo() devolve um dicionário plano com os números
+que a interface do servidor mostra.
+
+CUSTO: Cada registro é um lock e alguns incrementos; lotes (acks multiple,
+blocos de publicação, backlog) registram tudo em uma única chamada.
+"""
+
+import bisect
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from broker.gerenciador_conexao import GerenciadorConexaoAMQP
+
+
+def atraso_desde(timestamp: Optional[str], agora: Optional[datetime] = None) -> Optional[float]:
+    """
+    Segundos desde o 'timestamp' de uma mensagem (ISO 8601, hora local)
+
+    DECISÃO: Usa o relógio de quem publicou, então o atraso inclui o tempo
+    na fila; relógios fora de sincronia entre máquinas distorcem o número.
+
+    Returns:
+        O atraso, ou None se o timestamp está ausente ou é inválido
+    """
+    if not timestamp:
+        return None
+    try:
+        return ((agora or datetime.now()) - datetime.fromisoformat(timestamp)).total_seconds()
+    except (TypeError, ValueError):
+        return None
+
+
+class HistogramaLatencia:
+    """
+    Histograma de latências com faixas fixas (ms)
+
+    DECISÃO: Faixas fixas em vez de guardar as amostras: memória constante
+    e percentis aproximados pelo limite superior da faixa, o que basta para
+    ver tendências. Não é thread safe sozinho (MetricasBroker protege).
+    """
+
+    LIMITES_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000,
+                  10000, 30000, 60000, 300000)
+
+    def __init__(self):
+        self.contagens = [0] * (len(self.LIMITES_MS) + 1)
+        self.total = 0
+        self.soma_ms = 0.0
+        self.max_ms = 0.0
+
+    def registrar(self, segundos: float):
+        """Registra uma latência (s); valores negativos (relógios) contam como 0"""
+        ms = max(segundos, 0.0) * 1000
+        self.contagens[bisect.bisect_left(self.LIMITES_MS, ms)] += 1
+        self.total += 1
+        self.soma_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentil(self, p: float) -> float:
+        """Limite superior (ms) da faixa que contém o percentil p (0-100)"""
+        if not self.total:
+            return 0.0
+        alvo = max(1, int(self.total * p / 100 + 0.999999))
+        acumulado = 0
+        for indice, contagem in enumerate(self.contagens):
+            acumulado += contagem
+            if acumulado >= alvo:
+                if indice < len(self.LIMITES_MS):
+                    return min(float(self.LIMITES_MS[indice]), self.max_ms)
+                return self.max_ms
+        return self.max_ms
+
+    def resumo(self) -> Dict[str, float]:
+        """Contagem, média, máximo e percentis 50/95/99 (ms)"""
+        return {
+            'contagem': self.total,
+            'media_ms': self.soma_ms / self.total if self.total else 0.0,
+            'p50_ms': self.percentil(50),
+            'p95_ms': self.percentil(95),
+            'p99_ms': self.percentil(99),
+            'max_ms': self.max_ms,
+        }
+
+
+class TaxaJanela:
+    """
+    Eventos por segundo em uma janela deslizante
+
+    Guarda um contador por segundo inteiro; a taxa é a soma da janela
+    dividida pela sua duração. Não é thread safe sozinho.
+    """
+
+    def __init__(self, janela: int = 10):
+        """
+        Args:
+            janela: Duração da janela (s)
+        """
+        self.janela = janela
+        self._segundos: deque = deque()  # [segundo, contagem]
+
+    def registrar(self, quantidade: int = 1, agora: Optional[float] = None):
+        segundo = int(time.monotonic() if agora is None else agora)
+        if self._segundos and self._segundos[-1][0] == segundo:
+            self._segundos[-1][1] += quantidade
+        else:
+            self._segundos.append([segundo, quantidade])
+            self._descartar(segundo)
+
+    def taxa(self, agora: Optional[float] = None) -> float:
+        """Eventos por segundo na janela que termina agora"""
+        segundo = int(time.monotonic() if agora is None else agora)
+        self._descartar(segundo)
+        return sum(contagem for _, contagem in self._segundos) / self.janela
+
+    def _descartar(self, segundo: int):
+        while self._segundos and self._segundos[0][0] <= segundo - self.janela:
+            self._segundos.popleft()
+
+
+class _MetricasPublicacao:
+    """Contadores de publicação de um exchange"""
+
+    def __init__(self):
+        self.publicadas = 0
+        self.confirmadas = 0
+        self.recusadas = 0
+        self.perdidas = 0
+        self.taxa = TaxaJanela()
+        self.latencia = HistogramaLatencia()
+
+    def obter(self) -> Dict[str, float]:
+        latencia = self.latencia.resumo()
+        return {
+            'publicadas': self.publicadas,
+            'por_segundo': self.taxa.taxa(),
+            'confirmadas': self.confirmadas,
+            'recusadas': self.recusadas,
+            'perdidas': self.perdidas,
+            'latencia_media_ms': latencia['media_ms'],
+            'latencia_p50_ms': latencia['p50_ms'],
+            'latencia_p95_ms': latencia['p95_ms'],
+            'latencia_p99_ms': latencia['p99_ms'],
+            'latencia_max_ms': latencia['max_ms'],
+        }
+
+
+class _MetricasConsumo:
+    """Contadores de consumo de um exchange"""
+
+    def __init__(self):
+        self.entregas = 0
+        self.reentregas = 0
+        self.confirmadas = 0
+        self.falhas = 0
+        self.devolvidas = 0
+        self.taxa = TaxaJanela()
+        self.taxa_nacks = TaxaJanela()
+        self.atraso = HistogramaLatencia()
+
+    def obter(self) -> Dict[str, float]:
+        atraso = self.atraso.resumo()
+        concluidas = self.confirmadas + self.falhas + self.devolvidas
+        return {
+            'entregas': self.entregas,
+            'por_segundo': self.taxa.taxa(),
+            'reentregas': self.reentregas,
+            'confirmadas': self.confirmadas,
+            'falhas': self.falhas,
+            'devolvidas': self.devolvidas,
+            'nacks_por_segundo': self.taxa_nacks.taxa(),
+            'taxa_nack': (self.falhas + self.devolvidas) / concluidas if concluidas else 0.0,
+            'atraso_media_ms': atraso['media_ms'],
+            'atraso_p50_ms': atraso['p50_ms'],
+            'atraso_p95_ms': atraso['p95_ms'],
+            'atraso_p99_ms': atraso['p99_ms'],
+            'atraso_max_ms': atraso['max_ms'],
+        }
+
+
+class MetricasBroker:
+    """
+    Registro das métricas do broker no processo
+
+    Uma instância por processo (padrao()), compartilhada por todos os
+    publishers e consumers; thread safe.
+    """
+
+    _padrao: Optional['MetricasBroker'] = None
+    _lock_padrao = threading.Lock()
+
+    def __init__(self, limite_atraso_ms: float = 5000.0, limite_fila: int = 1000):
+        """
+        Args:
+            limite_atraso_ms: Atraso de consumo (p95) a partir do qual o
+                              caminho assíncrono é considerado atrasado
+            limite_fila: Mensagens em uma fila a partir das quais ela é
+                         considerada acumulando
+        """
+        self.limite_atraso_ms = limite_atraso_ms
+        self.limite_fila = limite_fila
+        self._lock = threading.Lock()
+        self._publicacao: Dict[str, _MetricasPublicacao] = {}
+        self._consumo: Dict[str, _MetricasConsumo] = {}
+        # Última amostra de cada fila: {fila: (mensagens, consumidores, amostrada_em)}
+        self._filas: Dict[str, tuple] = {}
+
+    @classmethod
+    def padrao(cls) -> 'MetricasBroker':
+        """Instância única do processo"""
+        with cls._lock_padrao:
+            if cls._padrao is None:
+                cls._padrao = cls()
+            return cls._padrao
+
+    def _publicacao_de(self, exchange: str) -> _MetricasPublicacao:
+        metricas = self._publicacao.get(exchange)
+        if metricas is None:
+            metricas = self._publicacao[exchange] = _MetricasPublicacao()
+        return metricas
+
+    def _consumo_de(self, exchange: str) -> _MetricasConsumo:
+        metricas = self._consumo.get(exchange)
+        if metricas is None:
+            metricas = self._consumo[exchange] = _MetricasConsumo()
+        return metricas
+
+    # ---- Publicação ----
+
+    def registrar_publicacoes(self, exchange: str, quantidade: int = 1):
+        """Mensagens entregues ao canal (basic_publish)"""
+        with self._lock:
+            metricas = self._publicacao_de(exchange)
+            metricas.publicadas += quantidade
+            metricas.taxa.registrar(quantidade)
+
+    def registrar_confirmacoes(self, exchange: str, latencias: Iterable[float], confirmada: bool):
+        """
+        Respostas do broker a publicações
+
+        Args:
+            exchange: Exchange das publicações
+            latencias: Tempo (s) entre o pedido de publicação e a resposta, por mensagem
+            confirmada: True para ack, False para nack (recusa do broker)
+        """
+        with self._lock:
+            metricas = self._publicacao_de(exchange)
+            quantidade = 0
+            for latencia in latencias:
+                metricas.latencia.registrar(latencia)
+                quantidade += 1
+            if confirmada:
+                metricas.confirmadas += quantidade
+            else:
+                metricas.recusadas += quantidade
+
+    def registrar_publicacoes_perdidas(self, exchange: str, quantidade: int = 1):
+        """Publicações sem resposta porque o canal fechou"""
+        with self._lock:
+            self._publicacao_de(exchange).perdidas += quantidade
+
+    # ---- Consumo ----
+
+    def registrar_entregas(self, exchange: str, quantidade: int = 1, reentregas: int = 0):
+        """Entregas recebidas, das quais 'reentregas' com method.redelivered"""
+        with self._lock:
+            metricas = self._consumo_de(exchange)
+            metricas.entregas += quantidade
+            metricas.reentregas += reentregas
+            metricas.taxa.registrar(quantidade)
+
+    def registrar_atrasos(self, exchange: str, atrasos: Iterable[Optional[float]]):
+        """
+        Atraso (s) entre a criação das mensagens e o início do callback
+
+        Args:
+            exchange: Exchange das mensagens
+            atrasos: Resultado de atraso_desde() por mensagem; None é ignorado
+        """
+        with self._lock:
+            histograma = self._consumo_de(exchange).atraso
+            for atraso in atrasos:
+                if atraso is not None:
+                    histograma.registrar(atraso)
+
+    def registrar_conclusoes(self, exchange: str, confirmadas: int = 0, falhas: int = 0,
+                             devolvidas: int = 0):
+        """
+        Entregas concluídas
+
+        Args:
+            exchange: Exchange das entregas
+            confirmadas: Processadas com sucesso (ack)
+            falhas: Rejeitadas pelo callback (retentativa/dead-letter)
+            devolvidas: Devolvidas à fila (nack com requeue)
+        """
+        with self._lock:
+            metricas = self._consumo_de(exchange)
+            metricas.confirmadas += confirmadas
+            metricas.falhas += falhas
+            metricas.devolvidas += devolvidas
+            if falhas or devolvidas:
+                metricas.taxa_nacks.registrar(falhas + devolvidas)
+
+    # ---- Filas ----
+
+    def registrar_profundidade(self, fila: str, mensagens: int, consumidores: int):
+        """Resultado de um queue_declare passivo"""
+        with self._lock:
+            self._filas[fila] = (mensagens, consumidores, time.time())
+
+    def esquecer_filas(self, filas: Iterable[str]):
+        """Descarta as amostras das filas"""
+        with self._lock:
+            for fila in filas:
+                self._filas.pop(fila, None)
+
+    # ---- Leitura ----
+
+    def obter(self) -> dict:
+        """
+        Todas as métricas
+
+        Returns:
+            Dicionário com 'publicacao' e 'consumo' (por exchange), 'filas'
+            (última amostra de cada fila) e 'alertas' (motivos pelos quais
+            o caminho assíncrono parece atrasado; vazio se está em dia)
+        """
+        with self._lock:
+            publicacao = {exchange: metricas.obter() for exchange, metricas in self._publicacao.items()}
+            consumo = {exchange: metricas.obter() for exchange, metricas in self._consumo.items()}
+            filas = {
+                fila: {'mensagens': mensagens, 'consumidores': consumidores,
+                       'amostrada_em': datetime.fromtimestamp(amostrada_em).isoformat()}
+                for fila, (mensagens, consumidores, amostrada_em) in self._filas.items()
+            }
+        return {
+            'publicacao': publicacao,
+            'consumo': consumo,
+            'filas': filas,
+            'alertas': self._alertas(consumo, filas),
+        }
+
+    def _alertas(self, consumo: dict, filas: dict) -> List[str]:
+        alertas = []
+        for exchange, metricas in consumo.items():
+            if metricas['atraso_p95_ms'] >= self.limite_atraso_ms:
+                alertas.append(f"Atraso de consumo em {exchange or '(padrão)'}: "
+                               f"p95 {metricas['atraso_p95_ms']:.0f} ms")
+        for fila, amostra in filas.items():
+            if amostra['mensagens'] >= self.limite_fila:
+                alertas.append(f"Fila {fila} acumulando: {amostra['mensagens']} mensagens")
+        return alertas
+
+    def resumo(self) -> Dict[str, float]:
+        """
+        Números agregados de todos os exchanges e filas
+
+        Returns:
+            Dicionário plano com publicações/s, latência de publicação p95,
+            entregas/s, atraso de consumo p95, reentregas, taxa de nack,
+            mensagens nas filas amostradas, a maior fila e a quantidade de
+            alertas
+        """
+        metricas = self.obter()
+        publicacao = metricas['publicacao'].values()
+        consumo = metricas['consumo'].values()
+        filas = metricas['filas']
+        concluidas = sum(m['confirmadas'] + m['falhas'] + m['devolvidas'] for m in consumo)
+        nacks = sum(m['falhas'] + m['devolvidas'] for m in consumo)
+        maior_fila = max(filas.items(), key=lambda item: item[1]['mensagens'], default=(None, None))
+        return {
+            'publicadas': sum(m['publicadas'] for m in publicacao),
+            'publicadas_por_segundo': sum(m['por_segundo'] for m in publicacao),
+            'latencia_publicacao_p95_ms': max((m['latencia_p95_ms'] for m in publicacao), default=0.0),
+            'entregas': sum(m['entregas'] for m in consumo),
+            'entregas_por_segundo': sum(m['por_segundo'] for m in consumo),
+            'atraso_consumo_p95_ms': max((m['atraso_p95_ms'] for m in consumo), default=0.0),
+            'reentregas': sum(m['reentregas'] for m in consumo),
+            'taxa_nack': nacks / concluidas if concluidas else 0.0,
+            'mensagens_em_filas': sum(amostra['mensagens'] for amostra in filas.values()),
+            'maior_fila': maior_fila[0] or '',
+            'maior_fila_mensagens': maior_fila[1]['mensagens'] if maior_fila[1] else 0,
+            'alertas': len(metricas['alertas']),
+        }
+
+
+class AmostradorFilas:
+    """
+    Amostra periodicamente a profundidade de filas (queue_declare passivo)
+
+    DECISÃO: Canal próprio: um declare passivo de fila inexistente fecha o
+    canal, e isso não pode derrubar publishers ou consumers. Uma fila que
+    sumiu só some das métricas; o canal é reaberto na próxima amostra.
+    """
+
+    def __init__(self, configurador, filas: Callable[[], Iterable[str]], intervalo: float = 5.0,
+                 tamanho_bloco: int = 200, metricas: Optional[MetricasBroker] = None):
+        """
+        Args:
+            configurador: ConfiguradorRabbitMQ (parâmetros de conexão)
+            filas: Retorna os nomes das filas a amostrar a cada rodada
+            intervalo: Tempo (s) entre rodadas
+            tamanho_bloco: Declares passivos enviados de uma vez
+            metricas: Onde registrar (padrão: MetricasBroker.padrao())
+        """
+        self.configurador = configurador
+        self.filas = filas
+        self.intervalo = intervalo
+        self.tamanho_bloco = tamanho_bloco
+        self.metricas = metricas or MetricasBroker.padrao()
+        self.gerenciador = None
+        self._canal = None
+        self._amostradas: Set[str] = set()
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def iniciar(self) -> bool:
+        """Conecta e inicia a thread de amostragem"""
+        try:
+            self.gerenciador = GerenciadorConexaoAMQP.obter_para(self.configurador)
+        except Exception as e:
+            print(f"Erro ao iniciar amostragem de filas: {e}")
+            return False
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True,
+                                        name="geochat-amostrador-filas")
+        self._thread.start()
+        return True
+
+    def parar(self):
+        """Para a thread e libera a conexão"""
+        self._parar.set()
+        if self._thread:
+            self._thread.join(timeout=self.configurador.timeout_operacao)
+            self._thread = None
+        if self.gerenciador:
+            if self._canal is not None and self._canal.is_open:
+                self.gerenciador.fechar_canal(self._canal)
+            self._canal = None
+            self.gerenciador.liberar()
+            self.gerenciador = None
+
+    def _loop(self):
+        while not self._parar.is_set():
+            try:
+                self.amostrar()
+            except Exception as e:
+                print(f"Erro ao amostrar filas: {e}")
+            self._parar.wait(self.intervalo)
+
+    def amostrar(self) -> Dict[str, int]:
+        """
+        Faz uma rodada de amostragem
+
+        PIPELINING: Os declares de um bloco são enviados juntos e as
+        respostas esperadas no final, em vez de uma ida e volta por fila.
+        Uma fila inexistente fecha o canal e faz falhar as seguintes do
+        bloco; ela sai da rodada e as seguintes são reenviadas.
+
+        Returns:
+            {fila: mensagens prontas} das filas que responderam
+        """
+        timeout = self.configurador.timeout_operacao
+        restantes = list(self.filas())
+        amostras = {}
+        while restantes and not self._parar.is_set():
+            if self._canal is None or not self._canal.is_open:
+                self._canal = self.gerenciador.abrir_canal().result(timeout)
+            canal = self._canal
+            bloco, restantes = restantes[:self.tamanho_bloco], restantes[self.tamanho_bloco:]
+            futuros = [
+                self.gerenciador.executar_com_callback(
+                    canal,
+                    lambda concluir, fila=fila: canal.queue_declare(queue=fila, passive=True,
+                                                                    callback=concluir)
+                )
+                for fila in bloco
+            ]
+            for indice, (fila, futuro) in enumerate(zip(bloco, futuros)):
+                try:
+                    resposta = futuro.result(timeout).method
+                except Exception:
+                    # Fila inexistente (o broker já fechou o canal) ou timeout
+                    # (o canal segue aberto): fecha para não vazar canais
+                    self.gerenciador.fechar_canal(canal)
+                    self._canal = None
+                    restantes = bloco[indice + 1:] + restantes
+                    break
+                amostras[fila] = resposta.message_count
+                self.metricas.registrar_profundidade(fila, resposta.message_count,
+                                                     resposta.consumer_count)
+
+        # Filas que saíram da lista (ou sumiram do broker) saem das métricas
+        self.metricas.esquecer_filas(self._amostradas - amostras.keys())
+        self._amostradas = set(amostras)
+        return amostras
@@ -0,0 +1,617 @@
+import asyncio
+import pika
+import time
+from pika.adapters.asyncio_connection import AsyncioConnection
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.usuario import Usuario
+from common.config import config
+from common.compressao import decodificar_json
+from broker.gerenciador_conexao import CanalFechadoErro
+from broker.rabbitmq_manager import ConfiguradorRabbitMQ, PublisherMensagem
+from broker.broker_memoria import BrokerMemoria, ConexaoMemoria, IOLoopAsyncio
+
+class ConfiguradorRabbitMQAsync(ConfiguradorRabbitMQ):
+    """
+    Versão asyncio do ConfiguradorRabbitMQ
+
+    SEM THREADS: Usa pika.AsyncioConnection no event loop de quem chama.
+    Callbacks do pika e corrotinas da aplicação rodam na mesma thread, então
+    não há marshalling nem locks - cada operação do canal vira um
+    asyncio.Future resolvido pelo callback do pika.
+
+    MESMA TOPOLOGIA: Nomes, argumentos de filas e bindings vêm dos métodos
+    _passos_* herdados; só a forma de esperar as respostas muda. Os métodos
+    públicos têm os mesmos nomes, mas são corrotinas.
+    """
+
+    def __init__(self, host: str = 'localhost', porta: int = 5672,
+                 usuario: str = 'geochat', senha: str = 'geochat123'):
+        """
+        Inicializa o configurador (a conexão só é aberta em conectar())
+
+        Args:
+            host: Host do RabbitMQ
+            porta: Porta do RabbitMQ
+            usuario: Usuário do RabbitMQ
+            senha: Senha do RabbitMQ
+        """
+        super().__init__(host, porta, usuario, senha)
+        self.connection: Optional[AsyncioConnection] = None
+        self._fechamento: Optional[asyncio.Future] = None
+
+        # Futures aguardando resposta do broker, por número de canal
+        # (None para operações da conexão)
+        self._pendentes_por_canal: Dict[Optional[int], Set[asyncio.Future]] = {}
+
+    async def conectar(self) -> bool:
+        """
+        Abre a conexão no event loop atual e o canal de topologia
+
+        Returns:
+            True se conectado com sucesso, False caso contrário
+        """
+        try:
+            loop = asyncio.get_running_loop()
+            aberta = loop.create_future()
+
+            def on_aberta(connection):
+                if not aberta.done():
+                    aberta.set_result(connection)
+
+            def on_erro_abertura(connection, erro):
+                if not aberta.done():
+                    aberta.set_exception(ConnectionError(f"Falha ao conectar ao RabbitMQ: {erro!r}"))
+
+            self.connection = self._criar_conexao(loop, on_aberta, on_erro_abertura)
+            await asyncio.wait_for(aberta, self.timeout_operacao)
+            self.channel = await self.abrir_canal()
+
+            return True
+
+        except Exception as e:
+            print(f"Erro ao conectar ao RabbitMQ: {e}")
+            self.connection = None
+            return False
+
+    def _criar_conexao(self, loop, on_aberta: Callable, on_erro_abertura: Callable):
+        """Cria a conexão no event loop para o broker configurado (Config.BROKER_BACKEND)"""
+        if config.BROKER_BACKEND == 'memoria':
+            return ConexaoMemoria(BrokerMemoria.padrao(), IOLoopAsyncio(loop),
+                                  on_open_callback=on_aberta,
+                                  on_open_error_callback=on_erro_abertura,
+                                  on_close_callback=self._on_conexao_fechada)
+        return AsyncioConnection(
+            pika.ConnectionParameters(
+                host=self.host,
+                port=self.porta,
+                credentials=pika.PlainCredentials(self.usuario, self.senha)
+            ),
+            on_open_callback=on_aberta,
+            on_open_error_callback=on_erro_abertura,
+            on_close_callback=self._on_conexao_fechada,
+            custom_ioloop=loop
+        )
+
+    async def desconectar(self):
+        """Fecha o canal e a conexão"""
+        try:
+            if self.connection and not (self.connection.is_closing or self.connection.is_closed):
+                fechada = asyncio.get_running_loop().create_future()
+                self._fechamento = fechada
+                self.connection.close()
+                await asyncio.wait_for(fechada, self.timeout_operacao)
+            self.connection = None
+            self.channel = None
+        except Exception as e:
+            print(f"Erro ao desconectar do RabbitMQ: {e}")
+
+    def _on_conexao_fechada(self, connection, motivo):
+        self._falhar_pendentes(None, ConnectionError(f"Conexão AMQP fechada: {motivo}"))
+        if self._fechamento and not self._fechamento.done():
+            self._fechamento.set_result(None)
+
+    async def abrir_canal(self):
+        """
+        Abre um novo canal na conexão
+
+        Returns:
+            Canal aberto (pika.channel.Channel)
+        """
+        def abrir(concluir):
+            def on_aberto(canal):
+                canal.add_on_close_callback(self._on_canal_fechado)
+                concluir(canal)
+            self.connection.channel(on_open_callback=on_aberto)
+        return await self.executar(None, abrir)
+
+    def fechar_canal(self, canal):
+        """Fecha um canal (se ainda estiver aberto)"""
+        if canal is not None and canal.is_open:
+            canal.close()
+
+    async def executar(self, canal, operacao: Callable[[Callable], None]):
+        """
+        Executa uma operação pika que responde por callback e aguarda a resposta
+
+        Args:
+            canal: Canal em que a operação roda (None para operações da conexão).
+                   Se ele fechar antes da resposta, a espera falha.
+            operacao: Recebe 'concluir' e deve passá-lo como callback da operação
+
+        Returns:
+            Argumento recebido pelo callback do pika
+        """
+        if self.connection is None or not self.connection.is_open:
+            raise ConnectionError("Conexão AMQP não está aberta")
+
+        futuro = asyncio.get_running_loop().create_future()
+        numero = canal.channel_number if canal is not None else None
+        pendentes = self._pendentes_por_canal.setdefault(numero, set())
+        pendentes.add(futuro)
+
+        def concluir(resultado=None):
+            if not futuro.done():
+                futuro.set_result(resultado)
+
+        try:
+            operacao(concluir)
+            return await asyncio.wait_for(futuro, self.timeout_operacao)
+        finally:
+            pendentes.discard(futuro)
+
+    def _on_canal_fechado(self, canal, motivo):
+        self._falhar_pendentes(canal.channel_number,
+                               CanalFechadoErro(canal.channel_number, motivo))
+
+    def _falhar_pendentes(self, numero: Optional[int], erro: Exception):
+        """Falha as esperas pendentes de um canal (ou de todos, se numero for None)"""
+        if numero is None:
+            grupos = list(self._pendentes_por_canal.values())
+        else:
+            grupos = [self._pendentes_por_canal.get(numero, set())]
+        for pendentes in grupos:
+            for futuro in list(pendentes):
+                if not futuro.done():
+                    futuro.set_exception(erro)
+
+    async def _executar(self, operacao: Callable[[Callable], None]):
+        return await self.executar(self.channel, operacao)
+
+    async def _conduzir(self, passos: Iterator[Callable[[Callable], None]]):
+        for operacao in passos:
+            await self._executar(operacao)
+
+    def _conexao_atual(self):
+        return self.connection
+
+    async def configurar_topologia(self) -> bool:
+        """Declara os exchanges (ver ConfiguradorRabbitMQ.configurar_topologia)"""
+        try:
+            if not self.channel:
+                print("Canal não está conectado")
+                return False
+
+            await self._conduzir(self._passos_topologia())
+
+            print("Topologia do RabbitMQ configurada com sucesso")
+            return True
+
+        except Exception as e:
+            print(f"Erro ao configurar topologia: {e}")
+            return False
+
+    async def atualizar_vinculos_localizacao(self, usuario: Usuario) -> bool:
+        """Religa a fila de localização às células do raio do usuário"""
+        try:
+            if not self.channel:
+                print("Canal não está conectado")
+                return False
+
+            await self._conduzir(self._passos_vinculos_localizacao(usuario))
+            return True
+
+        except Exception as e:
+            print(f"Erro ao atualizar bindings de localização de {usuario.nome}: {e}")
+            return False
+
+    async def criar_fila_usuario(self, nome_usuario: str, usuario: Optional[Usuario] = None) -> bool:
+        """Cria as filas de um usuário (ver ConfiguradorRabbitMQ.criar_fila_usuario)"""
+        try:
+            if not self.channel:
+                print("Canal não está conectado")
+                return False
+
+            # Uma nova tentativa para cada fila antiga com outros argumentos
+            for _ in range(3):
+                try:
+                    await self._conduzir(self._passos_criar_fila_usuario(nome_usuario, usuario))
+                    break
+                except CanalFechadoErro as e:
+                    if not self._tratar_fila_legada(e):
+                        raise
+                    self.channel = await self.abrir_canal()
+
+            print(f"Filas criadas para usuário: {nome_usuario}")
+            return True
+
+        except Exception as e:
+            print(f"Erro ao criar fila para usuário {nome_usuario}: {e}")
+            return False
+
+    async def deletar_fila_usuario(self, nome_usuario: str) -> bool:
+        """Deleta as filas de um usuário"""
+        try:
+            if not self.channel:
+                print("Canal não está conectado")
+                return False
+
+            await self._conduzir(self._passos_deletar_fila_usuario(nome_usuario))
+
+            print(f"Filas deletadas para usuário: {nome_usuario}")
+            return True
+
+        except Exception as e:
+            print(f"Erro ao deletar filas do usuário {nome_usuario}: {e}")
+            return False
+
+class PublisherMensagemAsync(PublisherMensagem):
+    """
+    Versão asyncio do PublisherMensagem
+
+    AWAITABLE: enviar_mensagem_confirmada retorna um asyncio.Future (pode
+    ser aguardado com await); os demais métodos de envio são corrotinas.
+    Confirmações continuam pipelined e resolvidas pelos acks em lote do
+    broker, agora direto no event loop.
+    """
+
+    def __init__(self, configurador: ConfiguradorRabbitMQAsync, confirmacoes: bool = True):
+        """
+        Inicializa o publisher
+
+        Args:
+            configurador: Configurador asyncio já conectado
+            confirmacoes: Se True, usa publisher confirms do RabbitMQ
+        """
+        # Sem a reconexão em thread do PublisherMensagem: a conexão pertence
+        # ao event loop do configurador
+        super().__init__(configurador, confirmacoes, reconectar=False)
+
+    async def conectar(self) -> bool:
+        """Abre um canal na conexão do configurador"""
+        try:
+            self.channel = await self.configurador.abrir_canal()
+            self.channel.add_on_close_callback(self._on_canal_fechado)
+
+            if self.confirmacoes:
+                # Delivery tags de confirmação começam em 1 a cada canal novo
+                self._proxima_tag = 1
+                await self.configurador.executar(
+                    self.channel,
+                    lambda concluir: self.channel.confirm_delivery(
+                        ack_nack_callback=self._on_confirmacao,
+                        callback=concluir
+                    )
+                )
+
+            return True
+
+        except Exception as e:
+            print(f"Erro ao conectar publisher: {e}")
+            return False
+
+    async def desconectar(self):
+        """Fecha o canal do publisher"""
+        try:
+            self.configurador.fechar_canal(self.channel)
+            self.channel = None
+        except Exception as e:
+            print(f"Erro ao desconectar publisher: {e}")
+
+    def _novo_futuro(self) -> asyncio.Future:
+        return asyncio.get_running_loop().create_future()
+
+    def _publicar_bloco(self, exchange: str, bloco: List[Tuple[str, str, asyncio.Future]],
+                        properties: pika.BasicProperties):
+        # Já estamos na thread do event loop: publica direto
+        enviada_em = time.monotonic()
+        for routing_key, body, futuro in bloco:
+            self._publicar_na_thread_io(exchange, routing_key, body, properties, futuro,
+                                        enviada_em)
+        self._registrar_bloco_publicado(exchange, len(bloco), enviada_em)
+
+    async def _aguardar(self, futuro: asyncio.Future) -> bool:
+        return bool(await asyncio.wait_for(futuro, self.configurador.timeout_operacao))
+
+    async def enviar_mensagem_assincrona(self, remetente: str, destinatario: str,
+                                         conteudo: str, motivo: str = "offline") -> bool:
+        """
+        Envia mensagem assíncrona e aguarda a confirmação do broker
+
+        Returns:
+            True se enviada (e confirmada) com sucesso, False caso contrário
+        """
+        try:
+            if not self.channel:
+                print("Publisher não está conectado")
+                return False
+
+            if not await self._aguardar(
+                self.enviar_mensagem_confirmada(remetente, destinatario, conteudo, motivo)
+            ):
+                print(f"Mensagem assíncrona rejeitada pelo broker: {remetente} -> {destinatario}")
+                return False
+
+            print(f"Mensagem assíncrona enviada: {remetente} -> {destinatario} (motivo: {motivo})")
+            return True
+
+        except Exception as e:
+            print(f"Erro ao enviar mensagem assíncrona: {e}")
+            return False
+
+    async def enviar_mensagens_lote(self, remetente: str, itens: Iterable[Tuple[str, str, str]],
+                                    tamanho_bloco: int = 500) -> List[bool]:
+        """
+        Envia várias mensagens assíncronas de uma vez
+
+        Returns:
+            Lista de bool, na ordem dos itens: True se enviada (e confirmada)
+        """
+        itens = list(itens)
+        if not self.channel:
+            print("Publisher não está conectado")
+            return [False] * len(itens)
+
+        resultados = []
+        for resultado in await asyncio.gather(
+            *(self._aguardar(futuro) for futuro in self._publicar_lote(remetente, itens, tamanho_bloco)),
+            return_exceptions=True
+        ):
+            if isinstance(resultado, BaseException):
+                print(f"Erro ao enviar mensagem do lote: {resultado}")
+                resultado = False
+            resultados.append(resultado)
+
+        print(f"Lote assíncrono enviado por {remetente}: {sum(resultados)}/{len(resultados)} mensagens")
+        return resultados
+
+    async def publicar_atualizacao_localizacao(self, usuario: Usuario) -> bool:
+        """Publica atualização de localização e aguarda a confirmação"""
+        try:
+            if not self.channel:
+                print("Publisher não está conectado")
+                return False
+
+            futuro, celula = self._publicar_localizacao(usuario)
+            if not await self._aguardar(futuro):
+                print(f"Atualização de localização rejeitada pelo broker: {usuario.nome}")
+                return False
+            self._celula_publicada[usuario.nome] = celula
+
+            print(f"Atualização de localização publicada para: {usuario.nome}")
+            return True
+
+        except Exception as e:
+            print(f"Erro ao publicar atualização de localização: {e}")
+            return False
+
+class ConsumerMensagemAsync:
+    """
+    Versão asyncio do ConsumerMensagem, consumida com async for
+
+    ITERADORES ASSÍNCRONOS: mensagens() e localizacoes() produzem os
+    dicionários recebidos. A entrega é confirmada (ack) quando o corpo do
+    async for termina e o próximo item é pedido; se o loop for interrompido
+    por exceção, a entrega atual é rejeitada e volta para a fila quando o
+    iterador é fechado (use contextlib.aclosing para fechar na hora).
+
+    CONTROLE DE FLUXO: basic_qos limita as entregas sem ack, então as filas
+    internas (asyncio.Queue) nunca passam de 'prefetch' itens.
+
+    FALHAS: Corpos inválidos são republicados na retentativa/dead-letter por
+    um PublisherMensagemAsync em confirm mode; a original só recebe ack
+    depois da confirmação e, sem ela, volta para a fila.
+    """
+
+    def __init__(self, configurador: ConfiguradorRabbitMQAsync, nome_usuario: str,
+                 prefetch: int = 50):
+        """
+        Inicializa o consumer
+
+        Args:
+            configurador: Configurador asyncio já conectado
+            nome_usuario: Nome do usuário que irá consumir mensagens
+            prefetch: Máximo de entregas sem ack no canal
+        """
+        self.configurador = configurador
+        self.nome_usuario = nome_usuario
+        self.prefetch = prefetch
+        self.channel = None
+
+        # Republica as falhas com confirmação, fora do canal de consumo
+        # (um exchange inexistente fecha o canal de quem publica)
+        self.publisher_falhas = PublisherMensagemAsync(configurador)
+        # Espera (s) antes de devolver à fila uma falha não republicada
+        self.atraso_devolucao_falha = 5.0
+
+        self.consumindo = False
+        self.tags_consumo = []
+
+        # Entregas recebidas e ainda não consumidas: (method, properties, body).
+        # (None, None, None) sinaliza o fim do consumo
+        self._fila_mensagens: asyncio.Queue = asyncio.Queue()
+        self._fila_localizacoes: asyncio.Queue = asyncio.Queue()
+
+    async def conectar(self) -> bool:
+        """Abre um canal na conexão do configurador"""
+        try:
+            self.channel = await self.configurador.abrir_canal()
+            self.channel.add_on_close_callback(self._on_canal_fechado)
+            return await self.publisher_falhas.conectar()
+
+        except Exception as e:
+            print(f"Erro ao conectar consumer: {e}")
+            return False
+
+    async def desconectar(self):
+        """Para o consumo e fecha o canal (entregas sem ack voltam para a fila)"""
+        try:
+            await self.parar_consumo()
+            await self.publisher_falhas.desconectar()
+            self.configurador.fechar_canal(self.channel)
+            self.channel = None
+        except Exception as e:
+            print(f"Erro ao desconectar consumer: {e}")
+
+    async def iniciar_consumo(self) -> bool:
+        """
+        Registra o consumo das filas de mensagens e de localização
+
+        Returns:
+            True se iniciado com sucesso, False caso contrário
+        """
+        try:
+            if not self.channel:
+                print("Consumer não está conectado")
+                return False
+
+            await self.configurador.executar(
+                self.channel,
+                lambda concluir: self.channel.basic_qos(
+                    prefetch_count=self.prefetch, callback=concluir
+                )
+            )
+
+            self.consumindo = True
+            self.tags_consumo = [
+                self.channel.basic_consume(
+                    queue=self.configurador.fila_mensagens(self.nome_usuario),
+                    on_message_callback=self._enfileirar(self._fila_mensagens),
+                    auto_ack=False  # ACK manual para confiabilidade
+                ),
+                self.channel.basic_consume(
+                    queue=self.configurador.fila_localizacao(self.nome_usuario),
+                    on_message_callback=self._enfileirar(self._fila_localizacoes),
+                    auto_ack=False
+                ),
+            ]
+
+            print(f"Consumo iniciado para usuário: {self.nome_usuario}")
+            return True
+
+        except Exception as e:
+            print(f"Erro ao iniciar consumo: {e}")
+            return False
+
+    async def parar_consumo(self):
+        """Cancela o consumo e encerra os iteradores"""
+        try:
+            self.consumindo = False
+            if self.channel and self.channel.is_open:
+                for tag in self.tags_consumo:
+                    self.channel.basic_cancel(tag)
+            self.tags_consumo = []
+            self._encerrar_iteradores()
+
+            print(f"Consumo parado para usuário: {self.nome_usuario}")
+
+        except Exception as e:
+            print(f"Erro ao parar consumo: {e}")
+
+    def mensagens(self) -> AsyncIterator[dict]:
+        """Itera sobre as mensagens diretas recebidas"""
+        return self._iterar(self._fila_mensagens)
+
+    async def localizacoes(self) -> AsyncIterator[dict]:
+        """Itera sobre as atualizações de localização (sem as do próprio usuário)"""
+        async for dados in self._iterar(self._fila_localizacoes,
+                                        ignorar=lambda dados: dados.get('usuario', {}).get('nome')
+                                        == self.nome_usuario):
+            yield dados
+
+    def _enfileirar(self, fila: asyncio.Queue) -> Callable:
+        """Callback do pika que repassa a entrega para a fila do iterador"""
+        def on_entrega(channel, method, properties, body):
+            fila.put_nowait((method, properties, body))
+        return on_entrega
+
+    async def _iterar(self, fila: asyncio.Queue,
+                      ignorar: Optional[Callable[[dict], bool]] = None) -> AsyncIterator[dict]:
+        """Produz os dados de cada entrega, confirmando-a quando o próximo item é pedido"""
+        canal = self.channel
+        while True:
+            method, properties, body = await fila.get()
+            if method is None:
+                return
+            delivery_tag = method.delivery_tag
+
+            try:
+                dados = decodificar_json(body, properties.content_encoding)
+            except Exception as e:
+                # MENSAGEM VENENOSA: Voltar para a fila só faria ela falhar de novo
+                print(f"Erro ao processar mensagem: {e}")
+                await self._encaminhar_falha(canal, method, properties, body, f"JSON inválido: {e}")
+                continue
+
+            if ignorar and ignorar(dados):
+                self._confirmar(canal, delivery_tag)
+                continue
+
+            try:
+                yield dados
+            except BaseException:
+                # Loop interrompido (exceção ou fechamento do iterador)
+                self._rejeitar(canal, delivery_tag)
+                raise
+            self._confirmar(canal, delivery_tag)
+
+    def _confirmar(self, canal, delivery_tag: int):
+        if canal.is_open:
+            canal.basic_ack(delivery_tag=delivery_tag)
+
+    def _rejeitar(self, canal, delivery_tag: int):
+        if canal.is_open:
+            canal.basic_nack(delivery_tag=delivery_tag, requeue=True)
+
+    async def _encaminhar_falha(self, canal, method, properties, body: bytes, erro: str):
+        """
+        Republica na retentativa ou no dead-letter e confirma a original
+
+        A original só recebe ack depois que o broker confirma a cópia; se a
+        republicação for recusada ou o canal do publisher cair, ela volta
+        para a fila (o canal é reaberto na próxima falha) depois de
+        atraso_devolucao_falha segundos, para não falhar em loop.
+        """
+        if not canal.is_open:
+            return
+        exchange, routing_key, propriedades = self.configurador.destino_falha(
+            method, properties, erro
+        )
+        try:
+            if not (self.publisher_falhas.channel and self.publisher_falhas.channel.is_open):
+                await self.publisher_falhas.conectar()
+            confirmada = await self.publisher_falhas._aguardar(
+                self.publisher_falhas.republicar(exchange, routing_key, body, propriedades)
+            )
+        except Exception as e:
+            print(f"Erro ao republicar mensagem com falha: {e}")
+            confirmada = False
+        if confirmada:
+            self._confirmar(canal, method.delivery_tag)
+        else:
+            await asyncio.sleep(self.atraso_devolucao_falha)
+            self._rejeitar(canal, method.delivery_tag)
+
+    def _encerrar_iteradores(self):
+        self._fila_mensagens.put_nowait((None, None, None))
+        self._fila_localizacoes.put_nowait((None, None, None))
+
+    def _on_canal_fechado(self, canal, motivo):
+        """Entregas sem ack voltam para a fila no broker; encerra os iteradores"""
+        if self.consumindo:
+            self.consumindo = False
+            self._encerrar_iteradores()
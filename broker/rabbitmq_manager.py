@@ -1,8 +1,13 @@
 import pika
+import itertools
 import json
+import random
 import threading
 import time
-from typing import Dict, Callable, Optional
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, Callable, Optional, Iterable, Iterator, List, Set, Tuple
 from datetime import datetime
 
 import sys
@@ -10,6 +15,88 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from common.usuario import Usuario
+from common.config import config
+from common.compressao import CompressorPayload, decodificar_json
+from common.geohash import (codificar_geohash, celulas_cobertura, precisao_para_raio,
+                            geohash_para_topico)
+from broker.gerenciador_conexao import GerenciadorConexaoAMQP, CanalFechadoErro
+from broker.executor_ordenado import ExecutorOrdenado
+from broker.spool import SpoolMensagens
+from broker.metricas import MetricasBroker, atraso_desde
+
+class CacheTopologia:
+    """
+    Topologia já declarada em um broker, compartilhada pelo processo
+    
+    DECLARAÇÕES REDUNDANTES: Cada conexão do cliente cria um configurador
+    novo, que redeclarava todos os exchanges, filas e bindings - uma ida e
+    volta ao broker para cada um. Entidades declaradas com sucesso ficam
+    registradas aqui e são puladas nas conexões seguintes.
+    
+    VALIDADE: Entidades duráveis valem por 'validade' segundos (bem menos
+    que o x-expires das filas, para não confiar em uma fila que o broker já
+    apagou). Entidades não duráveis só valem na conexão em que foram
+    declaradas, porque somem quando o broker reinicia.
+    """
+    
+    _caches: Dict[tuple, 'CacheTopologia'] = {}
+    _lock_caches = threading.Lock()
+    
+    def __init__(self, validade: float = 600.0):
+        """
+        Args:
+            validade: Tempo (s) em que uma declaração durável é considerada válida
+        """
+        self.validade = validade
+        self._lock = threading.Lock()
+        # {chave: (registrada_em, conexao)}; conexao None = entidade durável
+        self._entradas: Dict[tuple, tuple] = {}
+    
+    @classmethod
+    def para(cls, host: str, porta: int, usuario: str) -> 'CacheTopologia':
+        """Cache compartilhado do broker (host, porta, usuário)"""
+        chave = (host, porta, usuario)
+        with cls._lock_caches:
+            cache = cls._caches.get(chave)
+            if cache is None:
+                cache = cls._caches[chave] = cls()
+            return cache
+    
+    def contem(self, chave: tuple, conexao=None) -> bool:
+        """Se a entidade já foi declarada (e a declaração ainda vale para a conexão)"""
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                return False
+            registrada_em, conexao_entrada = entrada
+            if time.monotonic() - registrada_em > self.validade or \
+                    (conexao_entrada is not None and conexao_entrada is not conexao):
+                del self._entradas[chave]
+                return False
+            return True
+    
+    def registrar(self, chave: tuple, conexao=None):
+        """
+        Registra uma entidade declarada
+        
+        Args:
+            chave: ('exchange', nome), ('fila', nome), ('vinculo', fila, exchange, chave)...
+            conexao: Conexão da declaração, para entidades não duráveis
+                     (None para duráveis)
+        """
+        with self._lock:
+            self._entradas[chave] = (time.monotonic(), conexao)
+    
+    def remover_fila(self, fila: str):
+        """Esquece uma fila e tudo o que depende dela (bindings)"""
+        with self._lock:
+            for chave in [c for c in self._entradas if c[1] == fila]:
+                del self._entradas[chave]
+    
+    def limpar(self):
+        """Esquece toda a topologia (ex: após apagar entidades manualmente)"""
+        with self._lock:
+            self._entradas.clear()
 
 class ConfiguradorRabbitMQ:
     """
@@ -17,12 +104,24 @@ class ConfiguradorRabbitMQ:
     
     TOPOLOGIA DO RABBITMQ: O sistema usa dois exchanges:
     1. 'geochat_messages' (DIRECT): Para mensagens diretas usuário-a-usuário
-    2. 'geochat_location' (FANOUT): Para broadcast de atualizações de localização
+    2. 'geochat_location_geo' (TOPIC): Atualizações de localização roteadas
+       pela célula geohash de quem publicou
+    
+    Entregas que falham no consumer passam por 'geochat_retry_<ms>'
+    (FANOUT + fila com TTL que devolve ao exchange de mensagens) e, sem
+    mais tentativas, terminam em 'geochat_dead_letters' (FANOUT + fila).
     
     PADRÃO PUBLISHER-CONSUMER: Implementa tanto publisher quanto consumer
     de forma thread-safe para comunicação assíncrona.
     
     CONFIGURAÇÃO DOCKER: Usa credenciais padrão do Docker Compose
+    
+    CONEXÃO COMPARTILHADA: Configurador, publisher e consumer usam canais
+    da mesma conexão AMQP (ver GerenciadorConexaoAMQP).
+    
+    CICLO DE VIDA: Filas de usuário expiram (x-expires) depois de um tempo
+    sem uso, têm tamanho máximo e o que já foi declarado fica em um
+    CacheTopologia, então reconectar não repete declarações.
     """
     
     def __init__(self, host: str = 'localhost', porta: int = 5672, 
@@ -43,10 +142,53 @@ class ConfiguradorRabbitMQ:
         
         # Nomes dos exchanges e filas
         self.exchange_mensagens = 'geochat_messages'
-        self.exchange_localizacao = 'geochat_location'
+        # DECISÃO: Nome novo porque redeclarar o antigo exchange fanout
+        # 'geochat_location' como topic falharia com PRECONDITION_FAILED
+        self.exchange_localizacao = 'geochat_location_geo'
+        
+        # Precisão geohash das routing keys de localização
+        # (5 = células de ~4,9 km x 4,9 km no equador)
+        self.precisao_roteamento = 5
         
-        self.connection = None
+        # Tempo máximo de espera por respostas do broker
+        self.timeout_operacao = 10.0
+        
+        self.gerenciador = None
         self.channel = None
+        
+        # Filas de localização guardam só posições recentes: mensagens
+        # expiram após o TTL e o limite descarta as mais antigas (drop-head)
+        self.ttl_localizacao_ms = 60000
+        self.max_localizacoes_fila = 1000
+        
+        # Bindings de localização atuais por usuário: {nome: {binding_key}}.
+        # Só é confiável para filas recriadas por este configurador (ver
+        # _passos_criar_fila_usuario)
+        self._vinculos_localizacao: Dict[str, Set[str]] = {}
+        
+        # CICLO DE VIDA: O broker apaga filas sem consumidores nem
+        # redeclaração por x-expires (antes as filas de todo nome já usado
+        # ficavam para sempre). Mensagens offline duram o prazo da fila
+        self.expiracao_fila_mensagens_ms = 30 * 24 * 3600 * 1000  # 30 dias
+        self.expiracao_fila_localizacao_ms = 24 * 3600 * 1000  # 1 dia
+        
+        # Fila de mensagens cheia: 'reject-publish' faz o broker recusar a
+        # publicação (nack no publisher confirm - o remetente fica sabendo)
+        # em vez de apagar as mensagens mais antigas ('drop-head')
+        self.max_mensagens_fila = 10000
+        self.overflow_mensagens = 'reject-publish'
+        
+        # 'classica', 'lazy' ou 'quorum' (Config.TIPO_FILA_MENSAGENS)
+        self.tipo_fila_mensagens = config.TIPO_FILA_MENSAGENS
+        
+        self.cache_topologia = CacheTopologia.para(host, porta, usuario)
+        self._fila_em_declaracao: Optional[str] = None
+        
+        # Mensagens que falham são retentadas após cada atraso (backoff) e,
+        # depois da última tentativa, vão para o dead-letter
+        self.atrasos_retentativa_ms = (1000, 10000, 60000)
+        self.exchange_dead_letter = 'geochat_dead_letters'
+        self.fila_dead_letters = 'geochat_dead_letters'
     
     def conectar(self) -> bool:
         """
@@ -56,15 +198,8 @@ class ConfiguradorRabbitMQ:
             True se conectado com sucesso, False caso contrário
         """
         try:
-            credentials = pika.PlainCredentials(self.usuario, self.senha)
-            parameters = pika.ConnectionParameters(
-                host=self.host,
-                port=self.porta,
-                credentials=credentials
-            )
-            
-            self.connection = pika.BlockingConnection(parameters)
-            self.channel = self.connection.channel()
+            self.gerenciador = GerenciadorConexaoAMQP.obter_para(self)
+            self.channel = self.gerenciador.abrir_canal().result(self.timeout_operacao)
             
             return True
             
@@ -75,11 +210,71 @@ class ConfiguradorRabbitMQ:
     def desconectar(self):
         """Desconecta do RabbitMQ"""
         try:
-            if self.connection and not self.connection.is_closed:
-                self.connection.close()
+            if self.gerenciador:
+                if self.channel:
+                    self.gerenciador.fechar_canal(self.channel)
+                self.gerenciador.liberar()
+            self.gerenciador = None
+            self.channel = None
         except Exception as e:
             print(f"Erro ao desconectar do RabbitMQ: {e}")
     
+    def fila_mensagens(self, nome_usuario: str) -> str:
+        """Nome da fila de mensagens diretas de um usuário"""
+        return f"user_{nome_usuario}_messages"
+    
+    def fila_localizacao(self, nome_usuario: str) -> str:
+        """
+        Nome da fila de atualizações de localização de um usuário
+        
+        DECISÃO: Sufixo '_latest' porque a fila antiga (durável, sem TTL)
+        não pode ser redeclarada com outros argumentos (PRECONDITION_FAILED).
+        """
+        return f"user_{nome_usuario}_location_latest"
+    
+    def _executar(self, operacao: Callable[[Callable], None]):
+        """
+        Executa uma operação do canal na thread de I/O e aguarda a resposta
+        
+        Args:
+            operacao: Recebe o callback de conclusão e o repassa ao método do pika
+        """
+        futuro = self.gerenciador.executar_com_callback(self.channel, operacao)
+        return futuro.result(self.timeout_operacao)
+    
+    def _conduzir(self, passos: Iterator[Callable[[Callable], None]]):
+        """
+        Executa em sequência as operações geradas por um método _passos_*
+        
+        DECISÃO: Os métodos _passos_* só descrevem as operações do canal
+        (sem I/O); cada transporte decide como esperar a resposta. Assim a
+        versão asyncio (ConfiguradorRabbitMQAsync) reaproveita a topologia.
+        """
+        for operacao in passos:
+            self._executar(operacao)
+    
+    def _conexao_atual(self):
+        """Conexão em uso (identifica declarações não duráveis no cache)"""
+        return self.gerenciador.connection if self.gerenciador else None
+    
+    def _reabrir_canal(self):
+        """Abre um canal novo depois que o broker fechou o atual"""
+        self.channel = self.gerenciador.abrir_canal().result(self.timeout_operacao)
+    
+    def _uma_vez(self, chave: tuple, operacao: Callable[[Callable], None],
+                 duravel: bool = True) -> Iterator[Callable[[Callable], None]]:
+        """
+        Gera a operação só se a entidade não estiver no cache de topologia
+        
+        O registro no cache acontece depois que o broker confirma a operação
+        (o driver só retoma o gerador após a resposta).
+        """
+        conexao = None if duravel else self._conexao_atual()
+        if self.cache_topologia.contem(chave, conexao):
+            return
+        yield operacao
+        self.cache_topologia.registrar(chave, conexao)
+    
     def configurar_topologia(self) -> bool:
         """
         Configura a topologia do RabbitMQ (exchanges, filas, bindings)
@@ -92,10 +287,12 @@ class ConfiguradorRabbitMQ:
            - Cada usuário tem sua fila pessoal
            - Padrão Point-to-Point
         
-        2. FANOUT EXCHANGE (geochat_location):
-           - Broadcast de atualizações de localização
-           - Todos os usuários conectados recebem
-           - Padrão Publish-Subscribe
+        2. TOPIC EXCHANGE (geochat_location_geo):
+           - Atualizações de localização particionadas por região
+           - Routing key = célula geohash do publicador ('6.g.y.c.f')
+           - Cada fila só é ligada às células que cobrem o raio do usuário
+           - Padrão Publish-Subscribe geográfico: a carga no broker cresce
+             com a densidade local, não com o total de usuários
         
         DURABILIDADE: Exchanges são duráveis (sobrevivem a reinicializações)
         
@@ -107,35 +304,243 @@ class ConfiguradorRabbitMQ:
                 print("Canal não está conectado")
                 return False
             
-            # Exchange para mensagens diretas (direct)
-            # DECISÃO: Direct permite roteamento específico por nome de usuário
-            self.channel.exchange_declare(
+            self._conduzir(self._passos_topologia())
+            
+            print("Topologia do RabbitMQ configurada com sucesso")
+            return True
+            
+        except Exception as e:
+            print(f"Erro ao configurar topologia: {e}")
+            return False
+    
+    def _passos_topologia(self) -> Iterator[Callable[[Callable], None]]:
+        """Operações que declaram os exchanges"""
+        # Exchange para mensagens diretas (direct)
+        # DECISÃO: Direct permite roteamento específico por nome de usuário
+        yield from self._uma_vez(
+            ('exchange', self.exchange_mensagens),
+            lambda concluir: self.channel.exchange_declare(
                 exchange=self.exchange_mensagens,
                 exchange_type='direct',  # Roteamento por routing key
-                durable=True  # Sobrevive a restart do RabbitMQ
+                durable=True,  # Sobrevive a restart do RabbitMQ
+                callback=concluir
             )
-            
-            # Exchange para atualizações de localização (fanout)
-            # DECISÃO: Fanout permite broadcast para todos os usuários
-            self.channel.exchange_declare(
+        )
+        
+        # Exchange para atualizações de localização (topic)
+        # DECISÃO: Topic com células geohash evita copiar cada atualização
+        # para a fila de todos os usuários (como um fanout faria)
+        yield from self._uma_vez(
+            ('exchange', self.exchange_localizacao),
+            lambda concluir: self.channel.exchange_declare(
                 exchange=self.exchange_localizacao,
-                exchange_type='fanout',  # Broadcast para todas as filas ligadas
-                durable=True
+                exchange_type='topic',  # Roteamento por célula geográfica
+                durable=True,
+                callback=concluir
+            )
+        )
+        
+        # Dead-letter: destino final de mensagens que falharam em todas as
+        # tentativas, inspecionado/reprocessado com ferramenta_dead_letters.py
+        yield from self._uma_vez(
+            ('exchange', self.exchange_dead_letter),
+            lambda concluir: self.channel.exchange_declare(
+                exchange=self.exchange_dead_letter,
+                exchange_type='fanout',
+                durable=True,
+                callback=concluir
+            )
+        )
+        yield from self._uma_vez(
+            ('fila', self.fila_dead_letters),
+            lambda concluir: self.channel.queue_declare(
+                queue=self.fila_dead_letters,
+                durable=True,
+                callback=concluir
+            )
+        )
+        yield from self._uma_vez(
+            ('vinculo', self.fila_dead_letters, self.exchange_dead_letter, ''),
+            lambda concluir: self.channel.queue_bind(
+                exchange=self.exchange_dead_letter,
+                queue=self.fila_dead_letters,
+                routing_key='',
+                callback=concluir
+            )
+        )
+        
+        # Retentativas com atraso: uma fila por atraso, sem consumidores.
+        # DECISÃO: Quando o TTL vence, o broker faz o dead-letter de volta
+        # para o exchange de mensagens com a routing key original
+        # (o destinatário), então a mensagem volta à fila de quem falhou
+        for atraso in self.atrasos_retentativa_ms:
+            yield from self._passos_fila_retentativa(atraso)
+    
+    def _passos_fila_retentativa(self, atraso_ms: int) -> Iterator[Callable[[Callable], None]]:
+        """Operações que declaram o exchange e a fila de retentativa de um atraso"""
+        nome = self.exchange_retentativa(atraso_ms)
+        yield from self._uma_vez(
+            ('exchange', nome),
+            lambda concluir: self.channel.exchange_declare(
+                exchange=nome,
+                exchange_type='fanout',
+                durable=True,
+                callback=concluir
+            )
+        )
+        yield from self._uma_vez(
+            ('fila', nome),
+            lambda concluir: self.channel.queue_declare(
+                queue=nome,
+                durable=True,
+                arguments={
+                    'x-message-ttl': atraso_ms,
+                    'x-dead-letter-exchange': self.exchange_mensagens,
+                },
+                callback=concluir
+            )
+        )
+        yield from self._uma_vez(
+            ('vinculo', nome, nome, ''),
+            lambda concluir: self.channel.queue_bind(
+                exchange=nome,
+                queue=nome,
+                routing_key='',
+                callback=concluir
             )
+        )
+    
+    def exchange_retentativa(self, atraso_ms: int) -> str:
+        """Nome do exchange (e da fila) de retentativa com um atraso"""
+        return f"geochat_retry_{atraso_ms}"
+    
+    def destino_falha(self, method, properties: pika.BasicProperties,
+                      erro: str) -> Tuple[str, str, pika.BasicProperties]:
+        """
+        Para onde republicar uma entrega cujo processamento falhou
+        
+        CONTAGEM: O número de tentativas viaja no cabeçalho
+        'geochat-tentativas'. Mensagens diretas voltam pelas filas de
+        retentativa, com atraso crescente; esgotados os atrasos, vão para o
+        dead-letter com a origem e o último erro nos cabeçalhos.
+        Atualizações de localização vão direto para o dead-letter: retentar
+        uma posição antiga não tem valor.
+        
+        Args:
+            method: Basic.Deliver da entrega
+            properties: Propriedades originais da mensagem
+            erro: Descrição da falha
             
-            print("Topologia do RabbitMQ configurada com sucesso")
+        Returns:
+            Tupla (exchange, routing_key, propriedades) da republicação
+        """
+        cabecalhos = dict(properties.headers or {})
+        cabecalhos.pop('CC', None)  # Não copiar de novo para outras células
+        tentativas = int(cabecalhos.get('geochat-tentativas', 0)) + 1
+        cabecalhos['geochat-tentativas'] = tentativas
+        cabecalhos['geochat-erro'] = erro[:500]
+        
+        if method.exchange != self.exchange_localizacao and \
+                tentativas <= len(self.atrasos_retentativa_ms):
+            exchange = self.exchange_retentativa(self.atrasos_retentativa_ms[tentativas - 1])
+        else:
+            exchange = self.exchange_dead_letter
+            cabecalhos['geochat-exchange-origem'] = method.exchange
+            cabecalhos['geochat-routing-key-origem'] = method.routing_key
+            cabecalhos['geochat-morta-em'] = datetime.now().isoformat()
+        
+        propriedades = pika.BasicProperties(
+            content_type=properties.content_type,
+            content_encoding=properties.content_encoding,
+            delivery_mode=properties.delivery_mode,
+            message_id=properties.message_id,
+            timestamp=properties.timestamp,
+            headers=cabecalhos
+        )
+        return exchange, method.routing_key, propriedades
+    
+    def chave_roteamento_localizacao(self, latitude: float, longitude: float) -> str:
+        """Routing key da célula onde uma posição está"""
+        return geohash_para_topico(codificar_geohash(latitude, longitude,
+                                                     self.precisao_roteamento))
+    
+    def chaves_vinculo_localizacao(self, latitude: float, longitude: float,
+                                   raio: float) -> Set[str]:
+        """
+        Binding keys que cobrem o raio em torno de uma posição
+        
+        DECISÃO: Raios pequenos usam as células de roteamento que cobrem o
+        círculo (até 3x3). Raios maiores que uma célula usam uma precisão
+        menor com '#', que casa todas as células internas.
+        
+        Returns:
+            Conjunto de binding keys ('6.g.y.c.f' ou '6.g.y.#')
+        """
+        precisao = min(precisao_para_raio(raio, latitude), self.precisao_roteamento)
+        sufixo = '' if precisao == self.precisao_roteamento else '.#'
+        return {geohash_para_topico(celula) + sufixo
+                for celula in celulas_cobertura(latitude, longitude, raio, precisao)}
+    
+    def atualizar_vinculos_localizacao(self, usuario: Usuario) -> bool:
+        """
+        Religa a fila de localização às células que cobrem o raio do usuário
+        
+        INCREMENTAL: Só os bindings que mudaram são criados ou removidos;
+        pequenos deslocamentos dentro da mesma célula não geram tráfego.
+        
+        Args:
+            usuario: Usuário (posição e raio atuais)
+            
+        Returns:
+            True se os bindings foram atualizados, False caso contrário
+        """
+        try:
+            if not self.channel:
+                print("Canal não está conectado")
+                return False
+            
+            self._conduzir(self._passos_vinculos_localizacao(usuario))
             return True
             
         except Exception as e:
-            print(f"Erro ao configurar topologia: {e}")
+            print(f"Erro ao atualizar bindings de localização de {usuario.nome}: {e}")
             return False
     
-    def criar_fila_usuario(self, nome_usuario: str) -> bool:
+    def _passos_vinculos_localizacao(self, usuario: Usuario) -> Iterator[Callable[[Callable], None]]:
+        """Operações que trocam os bindings de localização (atualiza o cache a cada passo)"""
+        fila_localizacao = self.fila_localizacao(usuario.nome)
+        atuais = self._vinculos_localizacao.setdefault(usuario.nome, set())
+        desejados = self.chaves_vinculo_localizacao(usuario.latitude, usuario.longitude,
+                                                    usuario.raio_comunicacao)
+        
+        # Liga as novas células antes de desligar as antigas para não
+        # perder atualizações durante a troca
+        for chave in desejados - atuais:
+            yield lambda concluir, chave=chave: self.channel.queue_bind(
+                exchange=self.exchange_localizacao,
+                queue=fila_localizacao,
+                routing_key=chave,
+                callback=concluir
+            )
+            atuais.add(chave)
+        
+        for chave in atuais - desejados:
+            yield lambda concluir, chave=chave: self.channel.queue_unbind(
+                exchange=self.exchange_localizacao,
+                queue=fila_localizacao,
+                routing_key=chave,
+                callback=concluir
+            )
+            atuais.discard(chave)
+    
+    def criar_fila_usuario(self, nome_usuario: str, usuario: Optional[Usuario] = None) -> bool:
         """
         Cria fila específica para um usuário
         
         Args:
             nome_usuario: Nome do usuário
+            usuario: Se informado, liga a fila de localização às células
+                     da sua posição (ver atualizar_vinculos_localizacao)
             
         Returns:
             True se criada com sucesso, False caso contrário
@@ -145,26 +550,15 @@ class ConfiguradorRabbitMQ:
                 print("Canal não está conectado")
                 return False
             
-            # Fila para mensagens do usuário
-            fila_mensagens = f"user_{nome_usuario}_messages"
-            self.channel.queue_declare(queue=fila_mensagens, durable=True)
-            
-            # Bind da fila ao exchange de mensagens
-            self.channel.queue_bind(
-                exchange=self.exchange_mensagens,
-                queue=fila_mensagens,
-                routing_key=nome_usuario
-            )
-            
-            # Fila para atualizações de localização do usuário
-            fila_localizacao = f"user_{nome_usuario}_location"
-            self.channel.queue_declare(queue=fila_localizacao, durable=True)
-            
-            # Bind da fila ao exchange de localização
-            self.channel.queue_bind(
-                exchange=self.exchange_localizacao,
-                queue=fila_localizacao
-            )
+            # Uma nova tentativa para cada fila antiga com outros argumentos
+            for _ in range(3):
+                try:
+                    self._conduzir(self._passos_criar_fila_usuario(nome_usuario, usuario))
+                    break
+                except CanalFechadoErro as e:
+                    if not self._tratar_fila_legada(e):
+                        raise
+                    self._reabrir_canal()
             
             print(f"Filas criadas para usuário: {nome_usuario}")
             return True
@@ -173,6 +567,111 @@ class ConfiguradorRabbitMQ:
             print(f"Erro ao criar fila para usuário {nome_usuario}: {e}")
             return False
     
+    def argumentos_fila_mensagens(self) -> dict:
+        """Argumentos da fila de mensagens de um usuário (expiração, limite e tipo)"""
+        argumentos = {
+            'x-expires': self.expiracao_fila_mensagens_ms,
+            'x-max-length': self.max_mensagens_fila,
+            'x-overflow': self.overflow_mensagens,
+        }
+        if self.tipo_fila_mensagens == 'quorum':
+            # Replicada entre os nós do cluster (exige fila durável)
+            argumentos['x-queue-type'] = 'quorum'
+        elif self.tipo_fila_mensagens == 'lazy':
+            # Mensagens vão direto para o disco: backlogs grandes de
+            # usuários offline não ocupam memória do broker
+            argumentos['x-queue-mode'] = 'lazy'
+        return argumentos
+    
+    def argumentos_fila_localizacao(self) -> dict:
+        """Argumentos da fila de localização de um usuário"""
+        return {
+            'x-message-ttl': self.ttl_localizacao_ms,
+            'x-max-length': self.max_localizacoes_fila,
+            'x-overflow': 'drop-head',
+            'x-expires': self.expiracao_fila_localizacao_ms,
+        }
+    
+    def _tratar_fila_legada(self, erro: CanalFechadoErro) -> bool:
+        """
+        Trata a recusa do broker em redeclarar uma fila com outros argumentos
+        
+        MIGRAÇÃO: Filas criadas por versões anteriores (sem x-expires,
+        limite etc.) não podem ser redeclaradas com argumentos novos
+        (PRECONDITION_FAILED fecha o canal). A fila existente é mantida - com
+        as mensagens pendentes - e passa a ser declarada de forma passiva.
+        Para aplicar os limites nela, use uma policy do RabbitMQ.
+        
+        Returns:
+            True se a falha foi de argumentos e a fila foi marcada como legada
+        """
+        fila = self._fila_em_declaracao
+        if erro.reply_code != 406 or fila is None:
+            return False
+        print(f"Aviso: fila {fila} existente com outros argumentos; usando-a como está")
+        self.cache_topologia.registrar(('legada', fila))
+        return True
+    
+    def _declarar_fila_usuario(self, fila: str, duravel: bool,
+                               argumentos: dict) -> Iterator[Callable[[Callable], None]]:
+        """Operação que declara uma fila de usuário (passiva se ela for legada)"""
+        self._fila_em_declaracao = fila
+        passiva = self.cache_topologia.contem(('legada', fila))
+        yield from self._uma_vez(
+            ('fila', fila),
+            lambda concluir: self.channel.queue_declare(
+                queue=fila,
+                passive=passiva,
+                durable=duravel,
+                arguments=None if passiva else argumentos,
+                callback=concluir
+            ),
+            duravel=duravel
+        )
+        self._fila_em_declaracao = None
+    
+    def _passos_criar_fila_usuario(self, nome_usuario: str,
+                                   usuario: Optional[Usuario]) -> Iterator[Callable[[Callable], None]]:
+        """Operações que declaram e ligam as filas de um usuário"""
+        # Fila para mensagens do usuário
+        fila_mensagens = self.fila_mensagens(nome_usuario)
+        yield from self._declarar_fila_usuario(fila_mensagens, True,
+                                               self.argumentos_fila_mensagens())
+        
+        # Bind da fila ao exchange de mensagens
+        yield from self._uma_vez(
+            ('vinculo', fila_mensagens, self.exchange_mensagens, nome_usuario),
+            lambda concluir: self.channel.queue_bind(
+                exchange=self.exchange_mensagens,
+                queue=fila_mensagens,
+                routing_key=nome_usuario,
+                callback=concluir
+            )
+        )
+        
+        # Fila para atualizações de localização do usuário
+        # DECISÃO: Posições são efêmeras - fila não durável, mensagens
+        # transientes (sem fsync) e só as recentes são mantidas para
+        # quem está offline
+        fila_localizacao = self.fila_localizacao(nome_usuario)
+        if usuario and nome_usuario not in self._vinculos_localizacao:
+            # RECONEXÃO: A fila sobrevive à conexão (x-expires) com os
+            # bindings da posição anterior, que este configurador não conhece
+            # (o AMQP não lista bindings). Recriá-la zera os bindings, senão as
+            # células antigas nunca seriam desligadas. Só posições recentes se
+            # perdem.
+            self.cache_topologia.remover_fila(fila_localizacao)
+            yield lambda concluir: self.channel.queue_delete(
+                queue=fila_localizacao, callback=concluir
+            )
+            self._vinculos_localizacao[nome_usuario] = set()
+        yield from self._declarar_fila_usuario(fila_localizacao, False,
+                                               self.argumentos_fila_localizacao())
+        
+        # Bindings ao exchange de localização dependem da posição
+        if usuario:
+            yield from self._passos_vinculos_localizacao(usuario)
+    
     def deletar_fila_usuario(self, nome_usuario: str) -> bool:
         """
         Deleta filas de um usuário
@@ -188,11 +687,7 @@ class ConfiguradorRabbitMQ:
                 print("Canal não está conectado")
                 return False
             
-            fila_mensagens = f"user_{nome_usuario}_messages"
-            fila_localizacao = f"user_{nome_usuario}_location"
-            
-            self.channel.queue_delete(queue=fila_mensagens)
-            self.channel.queue_delete(queue=fila_localizacao)
+            self._conduzir(self._passos_deletar_fila_usuario(nome_usuario))
             
             print(f"Filas deletadas para usuário: {nome_usuario}")
             return True
@@ -201,6 +696,21 @@ class ConfiguradorRabbitMQ:
             print(f"Erro ao deletar filas do usuário {nome_usuario}: {e}")
             return False
     
+    def _passos_deletar_fila_usuario(self, nome_usuario: str) -> Iterator[Callable[[Callable], None]]:
+        """Operações que removem as filas de um usuário"""
+        fila_mensagens = self.fila_mensagens(nome_usuario)
+        fila_localizacao = self.fila_localizacao(nome_usuario)
+        self.cache_topologia.remover_fila(fila_mensagens)
+        self.cache_topologia.remover_fila(fila_localizacao)
+        
+        yield lambda concluir: self.channel.queue_delete(
+            queue=fila_mensagens, callback=concluir
+        )
+        yield lambda concluir: self.channel.queue_delete(
+            queue=fila_localizacao, callback=concluir
+        )
+        self._vinculos_localizacao.pop(nome_usuario, None)
+    
     def listar_filas(self) -> list:
         """
         Lista todas as filas do RabbitMQ
@@ -218,6 +728,64 @@ class ConfiguradorRabbitMQ:
             print(f"Erro ao listar filas: {e}")
             return []
 
+class ParteBloco:
+    """
+    Posição de uma publicação em um ConfirmacaoBloco
+    
+    Tem só a parte da interface de Future que a publicação e as
+    confirmações usam (done, set_result, set_exception).
+    """
+    
+    __slots__ = ('bloco', 'indice', 'feito')
+    
+    def __init__(self, bloco: 'ConfirmacaoBloco', indice: int):
+        self.bloco = bloco
+        self.indice = indice
+        self.feito = False
+    
+    def done(self) -> bool:
+        return self.feito
+    
+    def set_result(self, resultado: bool):
+        self.feito = True
+        self.bloco._resolver(self.indice, resultado)
+    
+    def set_exception(self, erro: BaseException):
+        self.feito = True
+        self.bloco._resolver(self.indice, erro)
+
+class ConfirmacaoBloco:
+    """
+    Confirmações de um bloco de publicações, resolvidas por um único Future
+    
+    CUSTO: Um Future por mensagem custa um Condition na criação e uma
+    notificação entre threads na confirmação. Aqui cada publicação ocupa
+    uma ParteBloco e o Future do bloco é resolvido uma vez, quando chega a
+    confirmação da última (ex: um ack multiple=True até o último tag).
+    
+    O Future resolve com a lista de resultados na ordem do bloco: True
+    (confirmada), False (rejeitada pelo broker) ou a exceção da publicação.
+    As partes são resolvidas só na thread de I/O (ou todas no chamador,
+    quando o despacho para ela falha).
+    """
+    
+    def __init__(self, quantidade: int):
+        self.futuro = Future()
+        self.resultados: list = [None] * quantidade
+        self._restantes = quantidade
+        if not quantidade:
+            self.futuro.set_result([])
+    
+    def parte(self, indice: int) -> ParteBloco:
+        """Posição da publicação de índice 'indice' no bloco"""
+        return ParteBloco(self, indice)
+    
+    def _resolver(self, indice: int, resultado):
+        self.resultados[indice] = resultado
+        self._restantes -= 1
+        if not self._restantes:
+            self.futuro.set_result(self.resultados)
+
 class PublisherMensagem:
     """
     Publisher para enviar mensagens assíncronas
@@ -229,34 +797,91 @@ class PublisherMensagem:
     1. Usuário destinatário offline
     2. Usuário destinatário fora do raio
     3. Modo assíncrono forçado pelo usuário
+    
+    PUBLISHER CONFIRMS: Com confirmacoes=True o canal entra em confirm mode e
+    uma mensagem só é considerada enviada quando o broker a confirma. As
+    publicações são pipelined: cada uma recebe um delivery tag e um Future,
+    várias ficam pendentes ao mesmo tempo e os acks em lote do broker
+    (multiple=True) resolvem todos os Futures até aquele tag de uma vez.
+    
+    QUEDA DO BROKER: Se o canal cair, uma thread reconecta com backoff
+    exponencial e jitter. Com caminho_spool, as mensagens assíncronas
+    enviadas durante a queda vão para um spool em disco (SpoolMensagens) e
+    são reenviadas em ordem, em blocos, quando a conexão volta. Atualizações
+    de localização não passam pelo spool: posição antiga não vale a entrega
+    atrasada, a próxima atualização a substitui.
+    
+    COMPRESSÃO: Corpos de mensagens assíncronas acima do limite de
+    CompressorPayload são comprimidos e marcados no content_encoding
+    ('zlib' ou 'zstd'); ConsumerMensagem descomprime sozinho. O spool guarda
+    o corpo original e a compressão acontece na publicação.
     """
     
-    def __init__(self, configurador: ConfiguradorRabbitMQ):
+    def __init__(self, configurador: ConfiguradorRabbitMQ, confirmacoes: bool = True,
+                 caminho_spool: Optional[str] = None, max_bytes_spool: int = 64 * 1024 * 1024,
+                 reconectar: bool = True, compressao: Optional[str] = config.COMPRESSAO):
         """
         Inicializa o publisher
         
         Args:
             configurador: Instância do configurador RabbitMQ
+            confirmacoes: Se True, usa publisher confirms do RabbitMQ
+            caminho_spool: Arquivo do spool de queda (None desliga o spool)
+            max_bytes_spool: Tamanho máximo do spool em disco
+            reconectar: Se True, reconecta sozinho quando o canal cai
+            compressao: Algoritmo para corpos grandes ('auto', 'zlib', 'zstd'
+                        ou 'nenhuma')
         """
         self.configurador = configurador
-        self.connection = None
+        self.confirmacoes = confirmacoes
+        self.gerenciador = None
         self.channel = None
+        self.compressor = CompressorPayload(compressao)
+        
+        # RECONEXÃO: backoff exponencial (s) e mensagens por bloco no reenvio do spool
+        self.reconectar = reconectar
+        self.atraso_reconexao_inicial = 0.5
+        self.atraso_reconexao_maximo = 30.0
+        self.tamanho_bloco_reenvio = 500
+        self.spool = SpoolMensagens(caminho_spool, max_bytes_spool) if caminho_spool else None
+        
+        # Em falha: envios vão para o spool até a reconexão esvaziá-lo.
+        # O lock torna atômicos "checar a falha e gravar" e "esvaziou, sair da falha"
+        self._em_falha = False
+        self._lock_falha = threading.RLock()
+        self._encerrado = threading.Event()
+        self._thread_reconexao: Optional[threading.Thread] = None
+        
+        # Métricas de reconexão e reenvio
+        self._total_reconexoes = 0
+        self._total_reenviadas = 0
+        self._total_recusadas_reenvio = 0
+        self._ultimo_reenvio: Dict[str, float] = {}
+        
+        # Publicações/s e latência até a confirmação, por exchange (compartilhado no processo)
+        self.metricas = MetricasBroker.padrao()
+        
+        # Publicações aguardando confirmação: {delivery_tag: (Future, exchange, enviada_em)}.
+        # OrderedDict permite resolver acks multiple=True a partir do início em O(1).
+        # Só é acessado na thread de I/O.
+        self._pendentes: 'OrderedDict[int, Tuple[Future, str, float]]' = OrderedDict()
+        self._proxima_tag = 1
+        
+        # Última routing key de localização publicada por usuário
+        self._celula_publicada: Dict[str, str] = {}
     
     def conectar(self) -> bool:
-        """Conecta ao RabbitMQ"""
+        """Conecta ao RabbitMQ (abre um canal na conexão compartilhada)"""
         try:
-            credentials = pika.PlainCredentials(
-                self.configurador.usuario, 
-                self.configurador.senha
-            )
-            parameters = pika.ConnectionParameters(
-                host=self.configurador.host,
-                port=self.configurador.porta,
-                credentials=credentials
-            )
+            self._encerrado.clear()
+            self.gerenciador = GerenciadorConexaoAMQP.obter_para(self.configurador)
+            self._abrir_canal()
             
-            self.connection = pika.BlockingConnection(parameters)
-            self.channel = self.connection.channel()
+            if self.spool and self.spool.pendentes:
+                # Spool que sobrou de uma execução anterior: é reenviado antes
+                # de qualquer mensagem nova
+                print(f"Spool com {self.spool.pendentes} mensagem(ns) de uma execução anterior")
+                self._entrar_em_falha()
             
             return True
             
@@ -264,14 +889,447 @@ class PublisherMensagem:
             print(f"Erro ao conectar publisher: {e}")
             return False
     
+    def _abrir_canal(self):
+        """Abre o canal de publicação no gerenciador atual (em confirm mode, se configurado)"""
+        self.channel = self.gerenciador.abrir_canal().result(self.configurador.timeout_operacao)
+        self.channel.add_on_close_callback(self._on_canal_fechado)
+        
+        if self.confirmacoes:
+            # Delivery tags de confirmação começam em 1 a cada canal novo
+            self._proxima_tag = 1
+            self.gerenciador.executar_com_callback(
+                self.channel,
+                lambda concluir: self.channel.confirm_delivery(
+                    ack_nack_callback=self._on_confirmacao,
+                    callback=concluir
+                )
+            ).result(self.configurador.timeout_operacao)
+    
     def desconectar(self):
-        """Desconecta do RabbitMQ"""
+        """Desconecta do RabbitMQ (o spool pendente fica em disco para a próxima conexão)"""
         try:
-            if self.connection and not self.connection.is_closed:
-                self.connection.close()
+            # Fechamento pedido: não dispara reconexão
+            self._encerrado.set()
+            thread = self._thread_reconexao
+            if thread and thread is not threading.current_thread():
+                thread.join(timeout=self.configurador.timeout_operacao)
+            if self.gerenciador:
+                if self.channel:
+                    self.gerenciador.fechar_canal(self.channel)
+                self.gerenciador.liberar()
+            self.gerenciador = None
+            self.channel = None
         except Exception as e:
             print(f"Erro ao desconectar publisher: {e}")
     
+    def _publicar(self, exchange: str, routing_key: str, body: str,
+                  properties: pika.BasicProperties) -> Future:
+        """
+        Publica na thread de I/O da conexão compartilhada
+        
+        MARSHALLING: basic_publish roda na thread dona da conexão; quem chama
+        não bloqueia e recebe um Future.
+        
+        Returns:
+            Future resolvido com True quando o broker confirma (ou logo após
+            a publicação, sem confirm mode) e False se o broker rejeitar
+        """
+        futuro = self._novo_futuro()
+        self._publicar_bloco(exchange, [(routing_key, body, futuro)], properties)
+        return futuro
+    
+    def _novo_futuro(self) -> Future:
+        """Cria o Future que representa uma publicação (sobrescrito na versão asyncio)"""
+        return Future()
+    
+    def _publicar_bloco(self, exchange: str, bloco: List[Tuple[str, str, Future]],
+                        properties: pika.BasicProperties):
+        """
+        Publica várias mensagens com um único despacho para a thread de I/O
+        
+        Args:
+            exchange: Exchange de destino
+            bloco: Lista de (routing_key, body, Future) a publicar em ordem
+            properties: Propriedades compartilhadas por todas as mensagens
+        """
+        # LATÊNCIA: Medida a partir daqui, incluindo a espera pela thread de I/O
+        enviada_em = time.monotonic()
+        
+        def publicar():
+            for routing_key, body, futuro in bloco:
+                self._publicar_na_thread_io(exchange, routing_key, body, properties, futuro,
+                                            enviada_em)
+            self._registrar_bloco_publicado(exchange, len(bloco), enviada_em)
+        
+        def falha_execucao(execucao: Future):
+            # Conexão indisponível: publicar() nem chegou a rodar
+            erro = execucao.exception()
+            if erro:
+                for _, _, futuro in bloco:
+                    if not futuro.done():
+                        futuro.set_exception(erro)
+        
+        self.gerenciador.executar(publicar).add_done_callback(falha_execucao)
+    
+    def _publicar_na_thread_io(self, exchange: str, routing_key: str, body: str,
+                               properties: pika.BasicProperties, futuro: Future,
+                               enviada_em: float):
+        """
+        Publica uma mensagem (só na thread de I/O) e registra seu delivery tag
+        
+        O tag só é consumido depois que basic_publish retorna: uma exceção
+        antes do envio (ex: tipo inválido no corpo ou nas propriedades) não
+        chega ao broker e não pode deslocar os tags das publicações seguintes.
+        Na thread de I/O nenhuma confirmação chega entre o envio e o registro.
+        """
+        try:
+            self.channel.basic_publish(
+                exchange=exchange,
+                routing_key=routing_key,
+                body=body,
+                properties=properties
+            )
+        except Exception as e:
+            futuro.set_exception(e)
+            return
+        if self.confirmacoes:
+            self._pendentes[self._proxima_tag] = (futuro, exchange, enviada_em)
+            self._proxima_tag += 1
+        else:
+            futuro.set_result(True)
+    
+    def _registrar_bloco_publicado(self, exchange: str, quantidade: int, enviada_em: float):
+        """
+        Conta as publicações de um bloco (thread de I/O)
+        
+        Sem confirm mode não há resposta do broker: a latência registrada
+        vai até o basic_publish.
+        """
+        self.metricas.registrar_publicacoes(exchange, quantidade)
+        if not self.confirmacoes:
+            self.metricas.registrar_confirmacoes(
+                exchange, [time.monotonic() - enviada_em] * quantidade, True
+            )
+    
+    def _on_confirmacao(self, frame):
+        """
+        Resolve os Futures confirmados (ack) ou rejeitados (nack) pelo broker
+        
+        ACK EM LOTE: Com multiple=True, o broker confirma de uma vez todas as
+        publicações com delivery tag menor ou igual ao informado.
+        
+        MÉTRICAS: As latências do frame são registradas de uma vez por exchange.
+        """
+        metodo = frame.method
+        confirmada = isinstance(metodo, pika.spec.Basic.Ack)
+        agora = time.monotonic()
+        
+        if metodo.multiple:
+            latencias: Dict[str, List[float]] = {}
+            while self._pendentes and next(iter(self._pendentes)) <= metodo.delivery_tag:
+                _, (futuro, exchange, enviada_em) = self._pendentes.popitem(last=False)
+                latencias.setdefault(exchange, []).append(agora - enviada_em)
+                if not futuro.done():
+                    futuro.set_result(confirmada)
+            for exchange, valores in latencias.items():
+                self.metricas.registrar_confirmacoes(exchange, valores, confirmada)
+        else:
+            pendente = self._pendentes.pop(metodo.delivery_tag, None)
+            if pendente:
+                futuro, exchange, enviada_em = pendente
+                if not futuro.done():
+                    futuro.set_result(confirmada)
+                self.metricas.registrar_confirmacoes(exchange, (agora - enviada_em,), confirmada)
+    
+    def _on_canal_fechado(self, canal, motivo):
+        """
+        Falha as publicações sem confirmação e inicia a reconexão
+        
+        Sem a confirmação não dá para saber se o broker recebeu a mensagem:
+        os Futures falham com ConnectionError (e não False, que é recusa do
+        broker) para que o envio possa ir para o spool.
+        """
+        erro = ConnectionError(f"Canal do publisher fechado antes da confirmação: {motivo}")
+        perdidas: Dict[str, int] = {}
+        while self._pendentes:
+            _, (futuro, exchange, _) = self._pendentes.popitem(last=False)
+            perdidas[exchange] = perdidas.get(exchange, 0) + 1
+            if not futuro.done():
+                futuro.set_exception(erro)
+        for exchange, quantidade in perdidas.items():
+            self.metricas.registrar_publicacoes_perdidas(exchange, quantidade)
+        
+        if self.reconectar and canal is self.channel and not self._encerrado.is_set():
+            print(f"Canal do publisher caiu: {motivo}")
+            self._entrar_em_falha()
+    
+    def _entrar_em_falha(self):
+        """Passa a desviar envios para o spool e inicia a thread de reconexão (uma só)"""
+        with self._lock_falha:
+            if self._em_falha:
+                return
+            self._em_falha = True
+            self._thread_reconexao = threading.Thread(target=self._loop_reconexao, daemon=True,
+                                                      name="geochat-publisher-reconexao")
+            self._thread_reconexao.start()
+    
+    def _loop_reconexao(self):
+        """
+        Reconecta e esvazia o spool; só então sai do modo falha
+        
+        BACKOFF: As esperas dobram a cada tentativa (até atraso_reconexao_maximo)
+        e são sorteadas entre metade e o total do atraso, para que vários
+        clientes não voltem todos no mesmo instante depois de uma queda.
+        """
+        atraso = self.atraso_reconexao_inicial
+        tentativa = 0
+        esperar = not (self.channel and self.channel.is_open)
+        while not self._encerrado.is_set():
+            if esperar:
+                # Espera antes de tentar: quando o canal cai junto com a conexão,
+                # o callback do canal roda antes de a conexão ser dada como fechada
+                if self._encerrado.wait(random.uniform(atraso / 2, atraso)):
+                    return
+                atraso = min(atraso * 2, self.atraso_reconexao_maximo)
+            
+            tentativa += 1
+            try:
+                if not (self.channel and self.channel.is_open):
+                    self._reabrir_conexao()
+                self._reenviar_spool()
+                
+                with self._lock_falha:
+                    if not (self.spool and self.spool.pendentes):
+                        self._em_falha = False
+                        print(f"Publisher reconectado (tentativa {tentativa})")
+                        return
+                # Chegaram mensagens no spool durante o reenvio: continua sem esperar
+                esperar = False
+                
+            except Exception as e:
+                print(f"Reconexão do publisher falhou (tentativa {tentativa}): {e or type(e).__name__}")
+                esperar = True
+    
+    def _reabrir_conexao(self):
+        """
+        Troca o gerenciador e abre um canal novo
+        
+        O gerenciador antigo só é liberado depois que o novo abriu o canal;
+        se a conexão não tinha caído (só o canal), obter devolve o mesmo.
+        """
+        antigo = self.gerenciador
+        novo = GerenciadorConexaoAMQP.obter_para(self.configurador)
+        self.gerenciador = novo
+        try:
+            self._abrir_canal()
+        except Exception:
+            self.gerenciador = antigo
+            novo.liberar()
+            raise
+        if antigo:
+            antigo.liberar()
+        self._total_reconexoes += 1
+    
+    def _reenviar_spool(self):
+        """
+        Reenvia o spool em ordem, em blocos de tamanho_bloco_reenvio
+        
+        BLOCOS: Registros seguidos com o mesmo exchange saem em um único
+        despacho para a thread de I/O, com confirmações pipelined.
+        
+        OFFSET: Só avança até a última publicação respondida em sequência.
+        Se a conexão cair no meio, o reenvio recomeça dali na próxima
+        tentativa; as duplicatas são descartadas pelo consumidor pelo 'id'.
+        Registros recusados pelo broker (ex: fila do destinatário cheia)
+        não voltam para o spool.
+        """
+        if not (self.spool and self.spool.pendentes):
+            return
+        
+        inicio = time.monotonic()
+        reenviadas = recusadas = 0
+        while True:
+            registros = self.spool.ler(self.tamanho_bloco_reenvio)
+            if not registros:
+                break
+            
+            futuros = []
+            for (exchange, modo), grupo in itertools.groupby(
+                registros, key=lambda item: (item[1]['e'], item[1]['m'])
+            ):
+                futuros.extend(self._publicar_corpos(
+                    exchange, [(registro['r'], registro['b']) for _, registro in grupo], modo
+                ))
+            
+            offset = quantidade = 0
+            try:
+                for (fim, _), futuro in zip(registros, futuros):
+                    if futuro.result(self.configurador.timeout_operacao):
+                        reenviadas += 1
+                    else:
+                        recusadas += 1
+                    offset, quantidade = fim, quantidade + 1
+            finally:
+                if quantidade:
+                    self.spool.confirmar(offset, quantidade)
+                    self._total_reenviadas += quantidade
+        
+        duracao = time.monotonic() - inicio
+        self._total_recusadas_reenvio += recusadas
+        self._ultimo_reenvio = {
+            'mensagens': reenviadas,
+            'recusadas': recusadas,
+            'segundos': duracao,
+            'mensagens_por_segundo': reenviadas / duracao if duracao > 0 else 0.0,
+        }
+        print(f"Spool reenviado: {reenviadas} mensagem(ns) em {duracao:.2f}s "
+              f"({self._ultimo_reenvio['mensagens_por_segundo']:.0f} msg/s)"
+              + (f", {recusadas} recusada(s) pelo broker" if recusadas else ""))
+    
+    def _guardar_no_spool(self, registros: List[Tuple[str, str, str, int]],
+                          forcar: bool = False) -> Optional[bool]:
+        """
+        Grava publicações no spool se o publisher estiver em falha
+        
+        ORDEM: Enquanto houver spool pendente, envios novos também vão para
+        ele (senão passariam na frente das mensagens guardadas). Checar a
+        falha e gravar acontece sob o mesmo lock usado para sair dela.
+        
+        Args:
+            registros: Lista de (exchange, routing_key, body, delivery_mode)
+            forcar: Grava mesmo fora do modo falha (a publicação direta
+                    acabou de falhar) e entra nele
+            
+        Returns:
+            None se não há spool ou o publisher não está em falha (publicar
+            direto); True se gravado em disco; False se o spool está cheio
+        """
+        if not self.spool:
+            return None
+        
+        with self._lock_falha:
+            if not (forcar or self._em_falha):
+                return None
+            gravado = self.spool.gravar(registros)
+            if forcar:
+                self._entrar_em_falha()
+        
+        if not gravado:
+            print(f"Spool cheio ({self.spool.max_bytes} bytes): "
+                  f"{len(registros)} mensagem(ns) não guardada(s)")
+            return False
+        # Fora do lock: threads que gravaram juntas dividem o mesmo fsync
+        self.spool.sincronizar()
+        return True
+    
+    def _registro_mensagem(self, destinatario: str, body: str) -> Tuple[str, str, str, int]:
+        """Registro do spool para uma mensagem assíncrona"""
+        return (self.configurador.exchange_mensagens, destinatario, body, 2)
+    
+    def em_falha(self) -> bool:
+        """Indica se o publisher perdeu o canal e está reconectando (envios vão para o spool)"""
+        return self._em_falha
+    
+    def obter_metricas(self) -> Dict[str, float]:
+        """
+        Retorna métricas de reconexão, do spool e do último reenvio
+        
+        Returns:
+            Dicionário com em_falha, reconexões, totais de reenvio, métricas
+            do spool (prefixo spool_), do último reenvio (prefixo
+            ultimo_reenvio_, com a vazão em mensagens_por_segundo) e da
+            compressão (prefixo compressao_)
+        """
+        metricas = {
+            'em_falha': self._em_falha,
+            'reconexoes': self._total_reconexoes,
+            'reenviadas': self._total_reenviadas,
+            'recusadas_reenvio': self._total_recusadas_reenvio,
+        }
+        if self.spool:
+            metricas.update({f'spool_{chave}': valor
+                             for chave, valor in self.spool.obter_metricas().items()})
+        metricas.update({f'ultimo_reenvio_{chave}': valor
+                         for chave, valor in self._ultimo_reenvio.items()})
+        metricas.update({f'compressao_{chave}': valor
+                         for chave, valor in self.compressor.obter_metricas().items()})
+        return metricas
+    
+    def _montar_mensagem(self, remetente: str, destinatario: str,
+                         conteudo: str, motivo: str, timestamp: Optional[str] = None) -> str:
+        """Monta o corpo JSON de uma mensagem assíncrona"""
+        # Estrutura da mensagem com metadados
+        mensagem = {
+            'tipo': 'mensagem_assincrona',
+            'id': uuid.uuid4().hex,  # Identifica reentregas (deduplicação)
+            'remetente': remetente,
+            'destinatario': destinatario,
+            'conteudo': conteudo,
+            'motivo': motivo,  # Para tracking: por que foi assíncrona?
+            'timestamp': timestamp or datetime.now().isoformat()
+        }
+        return json.dumps(mensagem)
+    
+    def enviar_mensagem_confirmada(self, remetente: str, destinatario: str, conteudo: str,
+                                   motivo: str = "offline",
+                                   callback: Optional[Callable[[bool], None]] = None) -> Future:
+        """
+        Publica mensagem assíncrona sem aguardar a confirmação do broker
+        
+        PIPELINING: Várias chamadas seguidas ficam pendentes ao mesmo tempo;
+        use o Future (ou o callback) para saber quando cada uma foi confirmada.
+        
+        Args:
+            remetente: Nome do remetente
+            destinatario: Nome do destinatário
+            conteudo: Conteúdo da mensagem
+            motivo: Motivo da mensagem assíncrona (offline, fora_do_raio, forcado)
+            callback: Chamado com True/False quando a confirmação chegar
+                      (na thread de I/O - não deve bloquear)
+            
+        Returns:
+            Future resolvido com True (confirmada) ou False (rejeitada/perdida)
+        """
+        body = self._montar_mensagem(remetente, destinatario, conteudo, motivo)
+        guardada = self._guardar_no_spool([self._registro_mensagem(destinatario, body)])
+        if guardada is not None:
+            # Broker fora: a mensagem está no spool em disco (ou o spool está cheio)
+            futuro = self._novo_futuro()
+            futuro.set_result(guardada)
+        elif not self.channel:
+            futuro = self._novo_futuro()
+            futuro.set_exception(ConnectionError("Publisher não está conectado"))
+        else:
+            futuro = self._publicar_mensagem(destinatario, body)
+        
+        if callback:
+            futuro.add_done_callback(
+                lambda f: callback(f.exception() is None and f.result())
+            )
+        return futuro
+    
+    def republicar(self, exchange: str, routing_key: str, body: bytes,
+                   properties: pika.BasicProperties) -> Future:
+        """
+        Publica uma mensagem já serializada, como está (ex: reprocessar dead letters)
+        
+        Returns:
+            Future resolvido com True (confirmada) ou False (rejeitada/perdida)
+        """
+        if not self.channel:
+            futuro = self._novo_futuro()
+            futuro.set_exception(ConnectionError("Publisher não está conectado"))
+            return futuro
+        return self._publicar(exchange, routing_key, body, properties)
+    
+    def _publicar_mensagem(self, destinatario: str, body: str) -> Future:
+        """Publica o corpo de uma mensagem assíncrona na fila do destinatário"""
+        # Publica no exchange direct com routing key = destinatario
+        # ROTEAMENTO: Exchange direct roteia para fila específica do usuário
+        # PERSISTÊNCIA: delivery_mode=2, a mensagem sobrevive a restart
+        return self._publicar_corpos(self.configurador.exchange_mensagens,
+                                     [(destinatario, body)], 2)[0]
+    
     def enviar_mensagem_assincrona(self, remetente: str, destinatario: str, 
                                  conteudo: str, motivo: str = "offline") -> bool:
         """
@@ -286,6 +1344,13 @@ class PublisherMensagem:
         METADADOS: Inclui timestamp e motivo (offline/fora_do_raio/forcado)
         para debugging e possível auditoria.
         
+        CONFIRMAÇÃO: Em confirm mode, aguarda o ack do broker antes de retornar.
+        Para envios em sequência sem esperar cada ack, use enviar_mensagem_confirmada.
+        
+        QUEDA DO BROKER: Com spool, se a publicação falhar por conexão (ou o
+        publisher já estiver reconectando), a mensagem é gravada no spool e
+        o envio conta como feito: ela sai na reconexão.
+        
         Args:
             remetente: Nome do remetente
             destinatario: Nome do destinatário
@@ -293,45 +1358,188 @@ class PublisherMensagem:
             motivo: Motivo da mensagem assíncrona (offline, fora_do_raio, forcado)
             
         Returns:
-            True se enviada com sucesso, False caso contrário
+            True se enviada (e confirmada) ou guardada no spool, False caso contrário
         """
+        body = self._montar_mensagem(remetente, destinatario, conteudo, motivo)
+        registro = self._registro_mensagem(destinatario, body)
         try:
+            guardada = self._guardar_no_spool([registro])
+            if guardada is not None:
+                if guardada:
+                    print(f"Broker indisponível, mensagem guardada no spool: {remetente} -> {destinatario}")
+                return guardada
+            
             if not self.channel:
                 print("Publisher não está conectado")
                 return False
             
-            # Estrutura da mensagem com metadados
-            mensagem = {
-                'tipo': 'mensagem_assincrona',
-                'remetente': remetente,
-                'destinatario': destinatario,
-                'conteudo': conteudo,
-                'motivo': motivo,  # Para tracking: por que foi assíncrona?
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            # Publica no exchange direct com routing key = destinatario
-            # ROTEAMENTO: Exchange direct roteia para fila específica do usuário
-            self.channel.basic_publish(
-                exchange=self.configurador.exchange_mensagens,
-                routing_key=destinatario,  # Fila do destinatário
-                body=json.dumps(mensagem),
-                properties=pika.BasicProperties(
-                    delivery_mode=2,  # PERSISTÊNCIA: Mensagem sobrevive a restart
-                )
-            )
+            futuro = self._publicar_mensagem(destinatario, body)
+            if not futuro.result(self.configurador.timeout_operacao):
+                print(f"Mensagem assíncrona rejeitada pelo broker: {remetente} -> {destinatario}")
+                return False
             
             print(f"Mensagem assíncrona enviada: {remetente} -> {destinatario} (motivo: {motivo})")
             return True
             
         except Exception as e:
             print(f"Erro ao enviar mensagem assíncrona: {e}")
+            if self._guardar_no_spool([registro], forcar=True):
+                print(f"Mensagem guardada no spool para reenvio: {remetente} -> {destinatario}")
+                return True
             return False
     
+    def enviar_mensagens_lote(self, remetente: str, itens: Iterable[Tuple[str, str, str]],
+                              tamanho_bloco: int = 500) -> List[bool]:
+        """
+        Envia várias mensagens assíncronas de uma vez
+        
+        USO: Esvaziar uma caixa de saída ou distribuir uma mensagem para
+        muitos usuários offline.
+        
+        OTIMIZAÇÕES em relação a chamar enviar_mensagem_assincrona em loop:
+        1. Um único BasicProperties e um único timestamp para o lote
+        2. Um despacho para a thread de I/O por bloco, não por mensagem;
+           o pika acumula os frames e os escreve juntos no socket
+        3. Confirmações pipelined: espera os acks só no final
+        4. Um Future por bloco (ConfirmacaoBloco), não por mensagem, e os
+           ids das mensagens saem de uma única leitura de os.urandom
+        
+        Args:
+            remetente: Nome do remetente de todas as mensagens
+            itens: Iterável de (destinatario, conteudo, motivo)
+            tamanho_bloco: Mensagens por despacho (blocos grandes demais
+                           atrasam heartbeats na thread de I/O)
+            
+        Returns:
+            Lista de bool, na ordem dos itens: True se enviada (e confirmada)
+            ou guardada no spool
+        """
+        mensagens = self._montar_lote(remetente, list(itens))
+        registros = [self._registro_mensagem(destinatario, body) for destinatario, body in mensagens]
+        
+        # Broker fora: o lote inteiro vai para o spool com um único fsync
+        guardado = self._guardar_no_spool(registros)
+        if guardado is not None:
+            print(f"Broker indisponível, lote de {remetente} "
+                  f"{'guardado no spool' if guardado else 'não coube no spool'}: {len(registros)} mensagens")
+            return [guardado] * len(registros)
+        
+        if not self.channel:
+            print("Publisher não está conectado")
+            return [False] * len(registros)
+        
+        exchange = self.configurador.exchange_mensagens
+        blocos = []
+        for inicio in range(0, len(mensagens), tamanho_bloco):
+            parte = mensagens[inicio:inicio + tamanho_bloco]
+            confirmacao = ConfirmacaoBloco(len(parte))
+            # PERSISTÊNCIA: delivery_mode=2, a mensagem sobrevive a restart
+            self._publicar_corpos(exchange, parte, 2, confirmacao)
+            blocos.append((len(parte), confirmacao.futuro))
+        
+        resultados = []
+        falhas = []
+        for quantidade, futuro in blocos:
+            try:
+                parciais = futuro.result(self.configurador.timeout_operacao)
+            except Exception as e:
+                parciais = [e] * quantidade
+            for resultado in parciais:
+                if isinstance(resultado, BaseException):
+                    print(f"Erro ao enviar mensagem do lote: {resultado}")
+                    falhas.append((len(resultados), registros[len(resultados)]))
+                    resultados.append(False)
+                else:
+                    resultados.append(bool(resultado))
+        
+        # Falhas de conexão no meio do lote vão para o spool
+        if falhas and self._guardar_no_spool([registro for _, registro in falhas], forcar=True):
+            for indice, _ in falhas:
+                resultados[indice] = True
+        
+        print(f"Lote assíncrono enviado por {remetente}: {sum(resultados)}/{len(resultados)} mensagens")
+        return resultados
+    
+    def _montar_lote(self, remetente: str, itens: List[Tuple[str, str, str]]) -> List[Tuple[str, str]]:
+        """
+        Monta os corpos do lote (um único timestamp) como (destinatario, body)
+        
+        IDS: 16 bytes aleatórios por mensagem, lidos de uma vez para o lote
+        (mesmo formato hex de 32 caracteres de uuid4().hex)
+        
+        SERIALIZAÇÃO: Remetente e timestamp são codificados uma vez; por
+        mensagem só os campos variáveis passam pelo codificador de strings
+        do json. O corpo sai idêntico ao de _montar_mensagem.
+        """
+        codificar = json.encoder.encode_basestring_ascii
+        timestamp = datetime.now().isoformat()
+        aleatorio = os.urandom(16 * len(itens)).hex()
+        comum = f', "remetente": {codificar(remetente)}, "destinatario": '
+        final = f', "timestamp": {codificar(timestamp)}}}'
+        return [(destinatario,
+                 '{"tipo": "mensagem_assincrona", "id": "' + aleatorio[32 * indice:32 * indice + 32] + '"'
+                 + comum + codificar(destinatario) + ', "conteudo": ' + codificar(conteudo)
+                 + ', "motivo": ' + codificar(motivo) + final)
+                for indice, (destinatario, conteudo, motivo) in enumerate(itens)]
+    
+    def _publicar_lote(self, remetente: str, itens: List[Tuple[str, str, str]],
+                       tamanho_bloco: int) -> List[Future]:
+        """Publica o lote em blocos, sem esperar confirmações"""
+        return self._publicar_mensagens(self._montar_lote(remetente, itens), tamanho_bloco)
+    
+    def _publicar_mensagens(self, mensagens: List[Tuple[str, str]], tamanho_bloco: int) -> List[Future]:
+        """Publica (destinatario, body) em blocos com propriedades compartilhadas"""
+        exchange = self.configurador.exchange_mensagens
+        
+        futuros = []
+        for inicio in range(0, len(mensagens), tamanho_bloco):
+            # PERSISTÊNCIA: delivery_mode=2, a mensagem sobrevive a restart
+            futuros.extend(self._publicar_corpos(exchange, mensagens[inicio:inicio + tamanho_bloco], 2))
+        return futuros
+    
+    def _publicar_corpos(self, exchange: str, itens: List[Tuple[str, str]],
+                         delivery_mode: int,
+                         confirmacao: Optional[ConfirmacaoBloco] = None) -> List[Future]:
+        """
+        Comprime (se valer a pena) e publica (routing_key, body) em ordem
+        
+        Corpos seguidos com a mesma codificação saem em um único bloco, com
+        um BasicProperties compartilhado.
+        
+        Args:
+            confirmacao: Se informado, as publicações são resolvidas nas
+                         partes dele (um Future para todos os itens)
+        
+        Returns:
+            Futures (ou ParteBloco) das publicações, na ordem dos itens
+        """
+        if confirmacao is None:
+            destinos = [self._novo_futuro() for _ in itens]
+        else:
+            destinos = [confirmacao.parte(indice) for indice in range(len(itens))]
+        
+        codificados = []
+        for (routing_key, body), destino in zip(itens, destinos):
+            dados, codificacao = self.compressor.comprimir(body.encode('utf-8'))
+            codificados.append((routing_key, dados, codificacao, destino))
+        
+        for codificacao, grupo in itertools.groupby(codificados, key=lambda item: item[2]):
+            bloco = [(routing_key, dados, destino) for routing_key, dados, _, destino in grupo]
+            self._publicar_bloco(exchange, bloco, pika.BasicProperties(
+                delivery_mode=delivery_mode,
+                content_encoding=codificacao
+            ))
+        return destinos
+    
     def publicar_atualizacao_localizacao(self, usuario: Usuario) -> bool:
         """
         Publica atualização de localização de um usuário
         
+        ROTEAMENTO GEOGRÁFICO: A routing key é a célula atual do usuário.
+        Ao mudar de célula, a célula anterior vai no header CC: o RabbitMQ
+        entrega uma única cópia a cada fila ligada a qualquer das duas, e
+        quem estava perto da posição antiga fica sabendo que ele saiu.
+        
         Args:
             usuario: Usuário que atualizou a localização
             
@@ -343,22 +1551,11 @@ class PublisherMensagem:
                 print("Publisher não está conectado")
                 return False
             
-            # Dados da atualização
-            atualizacao = {
-                'tipo': 'atualizacao_localizacao',
-                'usuario': usuario.to_dict(),
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            # Publica no exchange de localização (fanout)
-            self.channel.basic_publish(
-                exchange=self.configurador.exchange_localizacao,
-                routing_key='',  # Fanout ignora routing key
-                body=json.dumps(atualizacao),
-                properties=pika.BasicProperties(
-                    delivery_mode=2,
-                )
-            )
+            futuro, celula = self._publicar_localizacao(usuario)
+            if not futuro.result(self.configurador.timeout_operacao):
+                print(f"Atualização de localização rejeitada pelo broker: {usuario.nome}")
+                return False
+            self._celula_publicada[usuario.nome] = celula
             
             print(f"Atualização de localização publicada para: {usuario.nome}")
             return True
@@ -367,45 +1564,192 @@ class PublisherMensagem:
             print(f"Erro ao publicar atualização de localização: {e}")
             return False
 
+    def _publicar_localizacao(self, usuario: Usuario) -> Tuple[Future, str]:
+        """
+        Publica a atualização de localização sem esperar a confirmação
+        
+        Returns:
+            Tupla (Future da publicação, routing key usada)
+        """
+        # Dados da atualização
+        atualizacao = {
+            'tipo': 'atualizacao_localizacao',
+            'usuario': usuario.to_dict(),
+            'timestamp': datetime.now().isoformat()
+        }
+        
+        celula = self.configurador.chave_roteamento_localizacao(usuario.latitude,
+                                                                usuario.longitude)
+        celula_anterior = self._celula_publicada.get(usuario.nome)
+        cabecalhos = None
+        if celula_anterior and celula_anterior != celula:
+            cabecalhos = {'CC': [celula_anterior]}
+        
+        # Publica no exchange de localização (topic)
+        futuro = self._publicar(
+            exchange=self.configurador.exchange_localizacao,
+            routing_key=celula,  # Célula geohash de quem publicou
+            body=json.dumps(atualizacao),
+            properties=pika.BasicProperties(
+                delivery_mode=1,  # Transiente: posição antiga não vale um fsync
+                headers=cabecalhos
+            )
+        )
+        return futuro, celula
+
 class ConsumerMensagem:
-    """Consumer para receber mensagens assíncronas"""
+    """
+    Consumer para receber mensagens assíncronas
+    
+    CONTROLE DE FLUXO: basic_qos limita quantas entregas sem ack o broker
+    envia (prefetch), então um consumer lento não acumula o backlog inteiro
+    em memória.
+    
+    WORKERS: Callbacks rodam em um pool limitado (ExecutorOrdenado), não na
+    thread de I/O; um callback lento não atrasa heartbeats nem as outras
+    filas. Mensagens do mesmo remetente são processadas em ordem.
+    
+    ACKS EM LOTE: Entregas processadas são confirmadas com multiple=True a
+    cada lote_ack mensagens ou intervalo_ack segundos, o que vier primeiro.
+    
+    FALHAS: Entregas que falham não voltam para a fila; vão para as filas
+    de retentativa com atraso e, esgotadas as tentativas, para o
+    dead-letter declarado por configurar_topologia. A republicação passa
+    por um PublisherMensagem em confirm mode e a original só recebe ack
+    depois da confirmação; sem ela, a original volta para a fila.
+    
+    DRENAGEM DO BACKLOG: Com definir_callback_backlog, as mensagens que
+    se acumularam enquanto o usuário estava offline são entregues em lote,
+    ordenadas e sem duplicatas, antes do consumo normal começar.
+    
+    RECONEXÃO: Se o canal cai durante o consumo (ex: queda do broker), uma
+    thread reabre conexão e canal com backoff e reinicia o consumo, que
+    drena de novo o backlog acumulado na queda.
+    """
     
-    def __init__(self, configurador: ConfiguradorRabbitMQ, nome_usuario: str):
+    def __init__(self, configurador: ConfiguradorRabbitMQ, nome_usuario: str,
+                 prefetch: int = 50, lote_ack: int = 20, intervalo_ack: float = 0.2,
+                 max_workers: int = 4, reconectar: bool = True):
         """
         Inicializa o consumer
         
         Args:
             configurador: Instância do configurador RabbitMQ
             nome_usuario: Nome do usuário que irá consumir mensagens
+            prefetch: Máximo de entregas sem ack no canal
+            lote_ack: Entregas processadas que disparam um ack multiple=True
+            intervalo_ack: Tempo máximo (s) que uma entrega processada espera pelo ack
+            max_workers: Threads do pool que executa os callbacks
+            reconectar: Se True, reconecta e volta a consumir quando o canal cai
         """
         self.configurador = configurador
         self.nome_usuario = nome_usuario
-        self.connection = None
+        self.gerenciador = None
         self.channel = None
         
+        # RECONEXÃO: backoff exponencial (s), como no PublisherMensagem.
+        # _reconectando garante uma thread de reconexão por vez
+        self.reconectar = reconectar
+        self.atraso_reconexao_inicial = 0.5
+        self.atraso_reconexao_maximo = 30.0
+        self._reconectando = False
+        self._lock_reconexao = threading.Lock()
+        self._encerrado = threading.Event()
+        self._thread_reconexao: Optional[threading.Thread] = None
+        self._total_reconexoes = 0
+        
+        # Republica as falhas (retentativa/dead-letter) com confirmação,
+        # em um canal próprio aberto em conectar()
+        self.publisher_falhas: Optional[PublisherMensagem] = None
+        # Espera (s) antes de devolver à fila uma falha cuja republicação não
+        # foi confirmada (ex: publisher_falhas fora do ar)
+        self.atraso_devolucao_falha = 5.0
+        
+        self.prefetch = prefetch
+        self.lote_ack = lote_ack
+        self.intervalo_ack = intervalo_ack
+        self.max_workers = max_workers
+        self.executor = None
+        
         # Callbacks para diferentes tipos de mensagem
         self.callback_mensagem = None
         self.callback_localizacao = None
+        self.callback_localizacao_lote = None
+        self.janela_localizacao = 0.25
+        self._timer_lote_localizacao = None
+        self.callback_backlog = None
+        self.tamanho_lote_backlog = 10000
+        self.ociosidade_backlog = 0.5
+        
+        # Drenagem do backlog (só acessado na thread de I/O). Fases:
+        # 'drenando' acumula em _backlog; 'entregando' retém as mensagens
+        # novas em _retidas até o callback do backlog terminar
+        self._fase_backlog: Optional[str] = None
+        self._backlog_restante = 0
+        self._backlog: List[Tuple[int, dict]] = []
+        self._retidas: List[Tuple[int, dict]] = []
+        self._ids_backlog: Set = set()
+        self._ultima_entrega_backlog = 0.0
+        self._timer_backlog = None
+        self._partes_backlog_pendentes = 0
         
         # Controle do consumer
         self.consumindo = False
-        self.thread_consumer = None
+        self.tags_consumo = []
+        
+        # Só descomprime (corpos com content_encoding zlib/zstd) e mede a CPU gasta
+        self.compressor = CompressorPayload(None)
+        
+        # Última posição ainda não entregue ao callback, por usuário:
+        # {nome: [dados, delivery_tag, channel]}. Protegido por _lock_localizacoes
+        # (escrito na thread de I/O, lido nos workers)
+        self._localizacoes_pendentes: Dict[str, list] = {}
+        self._lock_localizacoes = threading.Lock()
+        self._total_localizacoes_colapsadas = 0
+        
+        # Entregas sem ack, em ordem de delivery tag:
+        # {tag: [recebida_em, processada, method, properties, body]}, com
+        # processada False, True, 'falha' (republicada com confirmação, também
+        # recebe ack) ou 'devolver' (republicação não confirmada, nack com requeue).
+        # Só é acessado na thread de I/O.
+        self._entregas: 'OrderedDict[int, list]' = OrderedDict()
+        self._processadas_sem_ack = 0
+        self._timer_ack = None
+        
+        # Métricas (escritas só na thread de I/O)
+        self._total_entregas = 0
+        self._total_confirmadas = 0
+        self._total_rejeitadas = 0
+        self._total_devolvidas = 0
+        self._frames_ack = 0
+        self._soma_latencia_ack = 0.0
+        self._max_latencia_ack = 0.0
+        self._total_backlog = 0
+        self._total_backlog_duplicadas = 0
+        self._total_retentativas = 0
+        self._total_dead_letters = 0
+        
+        # Entregas/s, reentregas, atraso até o callback e nacks, por exchange
+        # (compartilhado no processo). Entregas e atrasos são acumulados aqui
+        # (thread de I/O) e enviados junto com cada ack:
+        # {exchange: [entregas, reentregas]} e {exchange: [atraso, ...]}
+        self.metricas = MetricasBroker.padrao()
+        self._entregas_nao_registradas: Dict[str, List[int]] = {}
+        self._atrasos_nao_registrados: Dict[str, List[float]] = {}
     
     def conectar(self) -> bool:
-        """Conecta ao RabbitMQ"""
+        """Conecta ao RabbitMQ (abre um canal na conexão compartilhada)"""
         try:
-            credentials = pika.PlainCredentials(
-                self.configurador.usuario, 
-                self.configurador.senha
-            )
-            parameters = pika.ConnectionParameters(
-                host=self.configurador.host,
-                port=self.configurador.porta,
-                credentials=credentials
-            )
+            self._encerrado.clear()
+            self.gerenciador = GerenciadorConexaoAMQP.obter_para(self.configurador)
+            self._abrir_canal()
             
-            self.connection = pika.BlockingConnection(parameters)
-            self.channel = self.connection.channel()
+            # DECISÃO: Um exchange de retentativa/dead-letter inexistente
+            # fecha o canal de quem publica; fora do canal de consumo, isso
+            # não derruba o consumo (e o publisher reabre o próprio canal)
+            self.publisher_falhas = PublisherMensagem(self.configurador, compressao=None)
+            if not self.publisher_falhas.conectar():
+                raise ConnectionError("Publisher de falhas não conectou")
             
             return True
             
@@ -413,12 +1757,34 @@ class ConsumerMensagem:
             print(f"Erro ao conectar consumer: {e}")
             return False
     
+    def _abrir_canal(self):
+        """Abre o canal de consumo no gerenciador atual"""
+        self.channel = self.gerenciador.abrir_canal().result(self.configurador.timeout_operacao)
+        self.channel.add_on_close_callback(self._on_canal_fechado)
+    
     def desconectar(self):
         """Desconecta do RabbitMQ"""
         try:
+            # Fechamento pedido: não dispara reconexão
+            self._encerrado.set()
+            thread = self._thread_reconexao
+            if thread and thread is not threading.current_thread():
+                thread.join(timeout=self.configurador.timeout_operacao)
             self.parar_consumo()
-            if self.connection and not self.connection.is_closed:
-                self.connection.close()
+            if self.executor:
+                # Callbacks ainda na fila são descartados; as entregas
+                # sem ack voltam para a fila no broker quando o canal fecha
+                self.executor.encerrar(esperar=False)
+                self.executor = None
+            if self.publisher_falhas:
+                self.publisher_falhas.desconectar()
+                self.publisher_falhas = None
+            if self.gerenciador:
+                if self.channel:
+                    self.gerenciador.fechar_canal(self.channel)
+                self.gerenciador.liberar()
+            self.gerenciador = None
+            self.channel = None
         except Exception as e:
             print(f"Erro ao desconectar consumer: {e}")
     
@@ -440,6 +1806,45 @@ class ConsumerMensagem:
         """
         self.callback_localizacao = callback
     
+    def definir_callback_localizacao_lote(self, callback: Callable[[List[dict]], None],
+                                          janela: float = 0.25):
+        """
+        Define callback que recebe as atualizações de localização em lote
+        
+        MODO COALESCENTE: As atualizações são acumuladas (uma por usuário, a
+        mais recente) durante a janela e entregues em uma única chamada.
+        Uma rajada de movimentos vira no máximo uma chamada por janela.
+        Substitui o callback individual de localização.
+        
+        Args:
+            callback: Função chamada com a lista de atualizações da janela
+            janela: Duração da janela em segundos
+        """
+        self.callback_localizacao_lote = callback
+        self.janela_localizacao = janela
+    
+    def definir_callback_backlog(self, callback: Callable[[List[dict]], None],
+                                 tamanho_lote: int = 10000, ociosidade: float = 0.5):
+        """
+        Define callback que recebe de uma vez as mensagens acumuladas offline
+        
+        DRENAGEM: Ao iniciar o consumo, a profundidade da fila de mensagens é
+        lida (queue_declare passivo) e o prefetch sobe para trazer o backlog
+        em poucos lotes grandes. As mensagens são ordenadas por timestamp,
+        duplicatas (mesmo 'id') são descartadas e o callback é chamado uma
+        vez por lote - uma vez só, se o backlog couber em tamanho_lote. Só
+        então o consumo normal (callback de mensagem) começa.
+        
+        Args:
+            callback: Função chamada com a lista de mensagens do backlog
+            tamanho_lote: Máximo de mensagens por chamada do callback
+            ociosidade: Tempo (s) sem entregas que encerra a drenagem antes
+                        de atingir a profundidade lida (ex: mensagens expiradas)
+        """
+        self.callback_backlog = callback
+        self.tamanho_lote_backlog = tamanho_lote
+        self.ociosidade_backlog = ociosidade
+    
     def iniciar_consumo(self) -> bool:
         """
         Inicia o consumo de mensagens
@@ -448,8 +1853,10 @@ class ConsumerMensagem:
         1. Fila de mensagens diretas (user_X_messages)
         2. Fila de atualizações de localização (user_X_location)
         
-        THREADING: Consumer roda em thread separada para não bloquear a UI.
-        Thread é daemon (morre com main thread).
+        THREADING: As entregas chegam na thread de I/O da conexão compartilhada
+        (GerenciadorConexaoAMQP) e os callbacks rodam no pool de workers,
+        nunca na thread da UI. Callbacks devem repassar trabalho de interface
+        para a thread do Tk (root.after).
         
         ACK MANUAL: auto_ack=False garante que mensagens só são removidas
         da fila após confirmação explícita (reliability).
@@ -462,28 +1869,38 @@ class ConsumerMensagem:
                 print("Consumer não está conectado")
                 return False
             
+            if self.executor is None:
+                self.executor = ExecutorOrdenado(self.max_workers,
+                                                 f"geochat-consumer-{self.nome_usuario}")
+            
+            fila_mensagens = self.configurador.fila_mensagens(self.nome_usuario)
+            
+            backlog = self._profundidade_fila(fila_mensagens) if self.callback_backlog else 0
+            
+            # PREFETCH: O broker para de entregar ao atingir o limite de
+            # entregas sem ack, o que também limita a fila do pool de workers.
+            # Durante a drenagem o limite cobre um lote inteiro do backlog
+            prefetch = self.prefetch
+            if backlog:
+                prefetch = max(self.prefetch, min(backlog, self.tamanho_lote_backlog))
+            self.gerenciador.executar_com_callback(
+                self.channel,
+                lambda concluir: self.channel.basic_qos(
+                    prefetch_count=prefetch, callback=concluir
+                )
+            ).result(self.configurador.timeout_operacao)
+            
             self.consumindo = True
             
-            # Configura consumo da fila de mensagens pessoais
-            fila_mensagens = f"user_{self.nome_usuario}_messages"
-            self.channel.basic_consume(
-                queue=fila_mensagens,
-                on_message_callback=self._processar_mensagem,
-                auto_ack=False  # ACK manual para confiabilidade
-            )
+            def registrar_consumidores():
+                if backlog:
+                    self._iniciar_drenagem(backlog)
+                self._registrar_consumidores()
             
-            # Configura consumo da fila de localização (broadcast)
-            fila_localizacao = f"user_{self.nome_usuario}_location"
-            self.channel.basic_consume(
-                queue=fila_localizacao,
-                on_message_callback=self._processar_localizacao,
-                auto_ack=False
+            self.gerenciador.executar(registrar_consumidores).result(
+                self.configurador.timeout_operacao
             )
             
-            # THREAD DEDICADA: Consumer não pode bloquear UI principal
-            self.thread_consumer = threading.Thread(target=self._loop_consumo, daemon=True)
-            self.thread_consumer.start()
-            
             print(f"Consumo iniciado para usuário: {self.nome_usuario}")
             return True
             
@@ -491,30 +1908,76 @@ class ConsumerMensagem:
             print(f"Erro ao iniciar consumo: {e}")
             return False
     
+    def _registrar_consumidores(self):
+        """Registra os consumidores das filas do usuário com o qos atual (thread de I/O)"""
+        # Configura consumo da fila de mensagens pessoais
+        tag_mensagens = self.channel.basic_consume(
+            queue=self.configurador.fila_mensagens(self.nome_usuario),
+            on_message_callback=self._processar_mensagem,
+            auto_ack=False  # ACK manual para confiabilidade
+        )
+        
+        # Configura consumo da fila de localização (células próximas)
+        tag_localizacao = self.channel.basic_consume(
+            queue=self.configurador.fila_localizacao(self.nome_usuario),
+            on_message_callback=self._processar_localizacao,
+            auto_ack=False
+        )
+        self.tags_consumo = [tag_mensagens, tag_localizacao]
+    
     def parar_consumo(self):
-        """Para o consumo de mensagens"""
+        """Para o consumo de mensagens (confirmando o que já foi processado)"""
         try:
             self.consumindo = False
             
-            if self.channel:
-                self.channel.stop_consuming()
-            
-            if self.thread_consumer and self.thread_consumer.is_alive():
-                self.thread_consumer.join(timeout=2)
+            if self.channel and self.gerenciador and self.gerenciador.conectado:
+                def cancelar_consumidores():
+                    for tag in self.tags_consumo:
+                        self.channel.basic_cancel(tag)
+                    self._enviar_acks()
+                self.gerenciador.executar(cancelar_consumidores).result(
+                    self.configurador.timeout_operacao
+                )
+            self.tags_consumo = []
             
             print(f"Consumo parado para usuário: {self.nome_usuario}")
             
         except Exception as e:
             print(f"Erro ao parar consumo: {e}")
     
-    def _loop_consumo(self):
-        """Loop principal de consumo"""
-        try:
-            while self.consumindo:
-                self.channel.start_consuming()
-        except Exception as e:
-            if self.consumindo:
-                print(f"Erro no loop de consumo: {e}")
+    def obter_metricas(self) -> dict:
+        """
+        Retorna métricas do consumo
+        
+        Returns:
+            Dicionário com entregas em andamento (sem ack), callbacks na fila
+            do pool, totais (incluindo mensagens do backlog, duplicatas
+            descartadas, reconexões e falhas encaminhadas para retentativa ou
+            dead-letter ou devolvidas à fila por falta de confirmação dessa
+            republicação), latência entre a chegada e o ack (ms) e corpos
+            descomprimidos com a CPU gasta neles (ms)
+        """
+        confirmadas = self._total_confirmadas
+        compressao = self.compressor.obter_metricas()
+        return {
+            'em_andamento': len(self._entregas),
+            'callbacks_pendentes': self.executor.pendentes() if self.executor else 0,
+            'entregas': self._total_entregas,
+            'confirmadas': self._total_confirmadas,
+            'rejeitadas': self._total_rejeitadas,
+            'devolvidas': self._total_devolvidas,
+            'retentativas': self._total_retentativas,
+            'dead_letters': self._total_dead_letters,
+            'frames_ack': self._frames_ack,
+            'localizacoes_colapsadas': self._total_localizacoes_colapsadas,
+            'backlog': self._total_backlog,
+            'backlog_duplicadas': self._total_backlog_duplicadas,
+            'reconexoes': self._total_reconexoes,
+            'latencia_ack_media_ms': (self._soma_latencia_ack / confirmadas * 1000) if confirmadas else 0.0,
+            'latencia_ack_max_ms': self._max_latencia_ack * 1000,
+            'descomprimidas': compressao['descomprimidos'],
+            'cpu_descompressao_ms': compressao['cpu_descompressao_ms'],
+        }
     
     def _processar_mensagem(self, channel, method, properties, body):
         """
@@ -523,42 +1986,588 @@ class ConsumerMensagem:
         CALLBACK PATTERN: Delega processamento para callback registrado
         pela aplicação. Isso mantém baixo acoplamento entre broker e UI.
         
-        ACK/NACK: Confirma recebimento ou rejeita mensagem em caso de erro.
-        Mensagens rejeitadas voltam para a fila (requeue=True).
+        ORDEM: Mensagens do mesmo remetente são processadas na ordem de chegada.
+        """
+        if self._fase_backlog:
+            self._acumular_backlog(channel, method, properties, body)
+            return
+        self._despachar(channel, method, properties, body,
+                        lambda dados: (dados.get('remetente'), self.callback_mensagem))
+    
+    def _processar_localizacao(self, channel, method, properties, body):
+        """
+        Processa atualização de localização
+        
+        COLAPSO: Só a posição mais recente de cada usuário interessa. Se já
+        existe uma posição dele esperando o callback (ex: backlog acumulado
+        enquanto offline), ela é substituída pela nova e a antiga é
+        confirmada sem chamar o callback.
         """
+        delivery_tag = method.delivery_tag
+        self._registrar_entrega(method, properties, body)
+        
         try:
-            dados = json.loads(body.decode('utf-8'))
-            
-            # PADRÃO CALLBACK: Notifica aplicação sobre nova mensagem
-            if self.callback_mensagem:
-                self.callback_mensagem(dados)
-            
-            # CONFIRMAÇÃO: Remove mensagem da fila após processamento
-            channel.basic_ack(delivery_tag=method.delivery_tag)
-            
+            dados = decodificar_json(body, properties.content_encoding, self.compressor)
+            nome = dados.get('usuario', {}).get('nome')
+        except Exception as e:
+            print(f"Erro ao processar atualização de localização: {e}")
+            self._concluir_entrega(channel, delivery_tag, False, f"JSON inválido: {e}")
+            return
+        
+        # Ignora suas próprias atualizações
+        if nome == self.nome_usuario or not (self.callback_localizacao_lote or
+                                             self.callback_localizacao):
+            self._concluir_entrega(channel, delivery_tag, True)
+            return
+        
+        with self._lock_localizacoes:
+            pendente = self._localizacoes_pendentes.get(nome)
+            if pendente is None:
+                self._localizacoes_pendentes[nome] = [dados, delivery_tag, channel]
+            else:
+                tag_substituida = pendente[1]
+                pendente[:] = [dados, delivery_tag, channel]
+        
+        if pendente is None:
+            if not self.callback_localizacao_lote:
+                self.executor.submeter(nome, self._entregar_localizacao, nome)
+            elif self._timer_lote_localizacao is None:
+                # Primeira atualização da janela: agenda a entrega do lote
+                self._timer_lote_localizacao = self.gerenciador.chamar_depois(
+                    self.janela_localizacao, self._on_janela_localizacao
+                )
+        else:
+            self._total_localizacoes_colapsadas += 1
+            self._concluir_entrega(channel, tag_substituida, True)
+    
+    def _entregar_localizacao(self, nome: str):
+        """Entrega ao callback a posição mais recente de um usuário (thread do pool)"""
+        with self._lock_localizacoes:
+            pendente = self._localizacoes_pendentes.pop(nome, None)
+        if pendente is None:
+            return  # Canal fechou; a posição volta pela fila
+        dados, delivery_tag, channel = pendente
+        self._executar_callback(channel, delivery_tag, self.callback_localizacao, dados)
+    
+    def _on_janela_localizacao(self):
+        """Fim da janela de coalescência (thread de I/O): entrega o lote no pool"""
+        self._timer_lote_localizacao = None
+        # Chave única: lotes são entregues em ordem, um de cada vez
+        self.executor.submeter('__lote_localizacao__', self._entregar_lote_localizacao)
+    
+    def _entregar_lote_localizacao(self):
+        """Entrega ao callback de lote as posições acumuladas na janela (thread do pool)"""
+        with self._lock_localizacoes:
+            pendentes = list(self._localizacoes_pendentes.values())
+            self._localizacoes_pendentes.clear()
+        if not pendentes:
+            return
+        
+        lote = [dados for dados, _, _ in pendentes]
+        agora = datetime.now()
+        self.metricas.registrar_atrasos(self.configurador.exchange_localizacao,
+                                        [atraso_desde(dados.get('timestamp'), agora) for dados in lote])
+        erro = ''
+        try:
+            self.callback_localizacao_lote(lote)
+            sucesso = True
+        except Exception as e:
+            print(f"Erro ao processar lote de localizações: {e}")
+            sucesso, erro = False, repr(e)
+        
+        gerenciador = self.gerenciador
+        if gerenciador:
+            def concluir_lote():
+                for _, delivery_tag, channel in pendentes:
+                    self._concluir_entrega(channel, delivery_tag, sucesso, erro)
+            gerenciador.executar(concluir_lote)
+    
+    def _profundidade_fila(self, fila: str) -> int:
+        """Quantidade de mensagens prontas na fila (queue_declare passivo)"""
+        resposta = self.gerenciador.executar_com_callback(
+            self.channel,
+            lambda concluir: self.channel.queue_declare(queue=fila, passive=True,
+                                                        callback=concluir)
+        ).result(self.configurador.timeout_operacao)
+        return resposta.method.message_count
+    
+    def _iniciar_drenagem(self, backlog: int):
+        """Entra na fase de drenagem do backlog (thread de I/O)"""
+        self._fase_backlog = 'drenando'
+        self._backlog_restante = backlog
+        self._ultima_entrega_backlog = time.monotonic()
+        self._timer_backlog = self.gerenciador.chamar_depois(self.ociosidade_backlog,
+                                                             self._on_timer_backlog)
+    
+    def _acumular_backlog(self, channel, method, properties, body: bytes):
+        """
+        Guarda uma entrega recebida durante a drenagem (thread de I/O)
+        
+        Na fase 'drenando' a mensagem entra no lote do backlog; na fase
+        'entregando' (backlog já completo, callback em andamento) ela fica
+        retida para não passar à frente do backlog.
+        """
+        delivery_tag = method.delivery_tag
+        self._registrar_entrega(method, properties, body)
+        
+        try:
+            dados = decodificar_json(body, properties.content_encoding, self.compressor)
         except Exception as e:
             print(f"Erro ao processar mensagem: {e}")
-            # TRATAMENTO DE ERRO: Rejeita e recoloca na fila
-            channel.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            dados, erro = None, f"JSON inválido: {e}"
+        
+        if self._fase_backlog == 'entregando':
+            if dados is None:
+                self._concluir_entrega(channel, delivery_tag, False, erro)
+            else:
+                self._retidas.append((delivery_tag, dados))
+            return
+        
+        self._backlog_restante -= 1
+        self._ultima_entrega_backlog = time.monotonic()
+        if dados is None:
+            self._concluir_entrega(channel, delivery_tag, False, erro)
+        else:
+            self._backlog.append((delivery_tag, dados))
+        
+        if self._backlog_restante <= 0:
+            self._encerrar_drenagem()
+        elif len(self._backlog) >= self.tamanho_lote_backlog:
+            self._submeter_parte_backlog()
     
-    def _processar_localizacao(self, channel, method, properties, body):
-        """Processa atualização de localização"""
+    def _on_timer_backlog(self):
+        """Encerra a drenagem se as entregas pararam antes do esperado (thread de I/O)"""
+        self._timer_backlog = None
+        if self._fase_backlog != 'drenando':
+            return
+        ociosa_ha = time.monotonic() - self._ultima_entrega_backlog
+        if ociosa_ha >= self.ociosidade_backlog:
+            self._encerrar_drenagem()
+        else:
+            self._timer_backlog = self.gerenciador.chamar_depois(
+                self.ociosidade_backlog - ociosa_ha, self._on_timer_backlog
+            )
+    
+    def _encerrar_drenagem(self):
+        """Backlog completo: entrega o último lote e retém as mensagens novas (thread de I/O)"""
+        if self._timer_backlog is not None:
+            self.gerenciador.cancelar_chamada(self._timer_backlog)
+            self._timer_backlog = None
+        self._fase_backlog = 'entregando'
+        self._submeter_parte_backlog()
+        if not self._partes_backlog_pendentes:
+            self._iniciar_consumo_normal()
+    
+    def _submeter_parte_backlog(self):
+        """Envia o lote acumulado do backlog para o pool (thread de I/O)"""
+        if not self._backlog:
+            return
+        lote, self._backlog = self._backlog, []
+        self._partes_backlog_pendentes += 1
+        # Chave única: lotes do backlog são entregues em ordem, um de cada vez
+        self.executor.submeter('__backlog__', self._entregar_backlog, self.channel, lote)
+    
+    def _entregar_backlog(self, channel, lote: List[Tuple[int, dict]]):
+        """
+        Ordena, deduplica e entrega um lote do backlog ao callback (thread do pool)
+        
+        DEDUPLICAÇÃO: Mensagens reentregues (ex: publicadas de novo após uma
+        confirmação perdida) têm o mesmo 'id'; só a primeira é entregue.
+        Todas as entregas do lote são confirmadas juntas no final.
+        """
+        # Timestamps ISO 8601 ordenam como texto; sort estável mantém a
+        # ordem da fila entre mensagens do mesmo instante
+        ordenado = sorted(lote, key=lambda item: item[1].get('timestamp', ''))
+        mensagens = []
+        for _, dados in ordenado:
+            identificador = dados.get('id') or (dados.get('remetente'), dados.get('timestamp'),
+                                                dados.get('conteudo'))
+            if identificador in self._ids_backlog:
+                continue
+            self._ids_backlog.add(identificador)
+            mensagens.append(dados)
+        
+        agora = datetime.now()
+        self.metricas.registrar_atrasos(self.configurador.exchange_mensagens,
+                                        [atraso_desde(dados.get('timestamp'), agora)
+                                         for dados in mensagens])
+        erro = ''
         try:
-            dados = json.loads(body.decode('utf-8'))
-            
-            # Ignora suas próprias atualizações
-            if dados.get('usuario', {}).get('nome') != self.nome_usuario:
-                # Chama callback se definido
-                if self.callback_localizacao:
-                    self.callback_localizacao(dados)
-            
-            # Confirma recebimento
-            channel.basic_ack(delivery_tag=method.delivery_tag)
-            
+            if mensagens:
+                self.callback_backlog(mensagens)
+            sucesso = True
         except Exception as e:
-            print(f"Erro ao processar atualização de localização: {e}")
-            # Rejeita mensagem em caso de erro
-            channel.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            print(f"Erro ao processar backlog de mensagens: {e}")
+            sucesso, erro = False, repr(e)
+        
+        gerenciador = self.gerenciador
+        if gerenciador:
+            tags = [delivery_tag for delivery_tag, _ in lote]
+            gerenciador.executar(self._concluir_parte_backlog, channel, tags, sucesso,
+                                 len(mensagens), erro)
+    
+    def _concluir_parte_backlog(self, channel, tags: List[int], sucesso: bool, entregues: int,
+                                erro: str = ''):
+        """Confirma um lote do backlog com um único ack (thread de I/O)"""
+        # Lote de um canal anterior: as entregas já voltaram para a fila
+        if channel is not self.channel or not channel.is_open:
+            return
+        self._partes_backlog_pendentes -= 1
+        
+        if sucesso:
+            self._total_backlog += entregues
+            self._total_backlog_duplicadas += len(tags) - entregues
+            for delivery_tag in tags:
+                entrega = self._entregas.get(delivery_tag)
+                if entrega is not None and not entrega[1]:
+                    entrega[1] = True
+                    self._processadas_sem_ack += 1
+            self._enviar_acks()
+        else:
+            for delivery_tag in tags:
+                self._concluir_entrega(channel, delivery_tag, False, erro)
+        
+        if self._fase_backlog == 'entregando' and not self._partes_backlog_pendentes:
+            self._iniciar_consumo_normal()
+    
+    def _iniciar_consumo_normal(self):
+        """
+        Fim do backlog: volta ao prefetch normal e despacha as retidas (thread de I/O)
+        
+        PREFETCH: com global_qos=False o basic_qos só vale para consumidores
+        criados depois dele, então os consumidores registrados sob o prefetch
+        da drenagem são cancelados e registrados de novo. As entregas sem ack
+        continuam válidas no canal; as que o broker enviar entre o cancelamento
+        e o novo consumo voltam à fila e chegam pelo consumidor novo.
+        """
+        self._fase_backlog = None
+        self._ids_backlog.clear()
+        retidas, self._retidas = self._retidas, []
+        if not (self.channel and self.channel.is_open):
+            return
+        if self.consumindo:
+            for tag in self.tags_consumo:
+                self.channel.basic_cancel(tag)
+            self.channel.basic_qos(prefetch_count=self.prefetch)
+            self._registrar_consumidores()
+        for delivery_tag, dados in retidas:
+            self._submeter_callback(self.channel, delivery_tag, dados.get('remetente'),
+                                    self.callback_mensagem, dados)
+    
+    def _registrar_entrega(self, method, properties, body: bytes):
+        """
+        Passa a controlar uma entrega sem ack (thread de I/O)
+        
+        A mensagem original fica guardada até o ack para poder ser
+        republicada (retentativa ou dead-letter) se o processamento falhar.
+        """
+        self._entregas[method.delivery_tag] = [time.monotonic(), False, method, properties, body]
+        self._total_entregas += 1
+        contagem = self._entregas_nao_registradas.get(method.exchange)
+        if contagem is None:
+            contagem = self._entregas_nao_registradas[method.exchange] = [0, 0]
+        contagem[0] += 1
+        if method.redelivered:
+            contagem[1] += 1
+    
+    def _despachar(self, channel, method, properties, body: bytes,
+                   rotear: Callable[[dict], Tuple[Optional[str], Optional[Callable]]]):
+        """
+        Registra a entrega e envia o callback para o pool (thread de I/O)
+        
+        Args:
+            channel: Canal da entrega
+            method: Basic.Deliver da entrega
+            properties: Propriedades da mensagem
+            body: Corpo da mensagem
+            rotear: Recebe os dados e retorna (chave de ordenação, callback);
+                    sem callback, a entrega é confirmada direto
+        """
+        delivery_tag = method.delivery_tag
+        self._registrar_entrega(method, properties, body)
+        
+        try:
+            dados = decodificar_json(body, properties.content_encoding, self.compressor)
+            chave, callback = rotear(dados)
+        except Exception as e:
+            print(f"Erro ao processar mensagem: {e}")
+            self._concluir_entrega(channel, delivery_tag, False, f"JSON inválido: {e}")
+            return
+        
+        self._submeter_callback(channel, delivery_tag, chave, callback, dados)
+    
+    def _submeter_callback(self, channel, delivery_tag: int, chave: Optional[str],
+                           callback: Optional[Callable], dados: dict):
+        """Envia o callback para o pool; sem callback, confirma direto (thread de I/O)"""
+        if callback is None:
+            self._concluir_entrega(channel, delivery_tag, True)
+            return
+        self.executor.submeter(chave, self._executar_callback, channel, delivery_tag, callback, dados)
+    
+    def _executar_callback(self, channel, delivery_tag: int, callback: Callable[[dict], None],
+                           dados: dict):
+        """Executa o callback da aplicação (thread do pool) e devolve o resultado ao I/O"""
+        # ATRASO: Do 'timestamp' da mensagem até aqui, incluindo o tempo na
+        # fila do broker e na fila do pool
+        atraso = atraso_desde(dados.get('timestamp'))
+        erro = ''
+        try:
+            # PADRÃO CALLBACK: Notifica aplicação sobre nova mensagem
+            callback(dados)
+            sucesso = True
+        except Exception as e:
+            print(f"Erro ao processar mensagem: {e}")
+            sucesso, erro = False, repr(e)
+        
+        gerenciador = self.gerenciador
+        if gerenciador:
+            gerenciador.executar(self._concluir_entrega, channel, delivery_tag, sucesso, erro,
+                                 atraso)
+    
+    def _concluir_entrega(self, channel, delivery_tag: int, sucesso: bool, erro: str = '',
+                          atraso: Optional[float] = None):
+        """
+        Marca uma entrega como processada (thread de I/O)
+        
+        Args:
+            atraso: Atraso (s) entre o 'timestamp' da mensagem e o início do callback
+        
+        ACK EM LOTE: Sucessos entram no próximo ack em lote.
+        
+        MENSAGENS VENENOSAS: Uma falha não volta para a fila (requeue
+        deixaria a mesma mensagem falhando em loop). A mensagem é
+        republicada na fila de retentativa com o próximo atraso ou, esgotadas
+        as tentativas, no dead-letter (ConfiguradorRabbitMQ.destino_falha),
+        e a original é confirmada em _concluir_republicacao.
+        """
+        # Entregas de um canal anterior já voltaram para a fila no broker
+        if channel is not self.channel or not channel.is_open:
+            return
+        entrega = self._entregas.get(delivery_tag)
+        if entrega is None:
+            return
+        
+        if entrega[1]:
+            return
+        
+        if not sucesso:
+            # TRATAMENTO DE ERRO: Republica com o contador de tentativas; a
+            # entrega segue sem ack (e segura o ack em lote) até a confirmação
+            _, _, method, properties, body = entrega
+            exchange, routing_key, propriedades = self.configurador.destino_falha(
+                method, properties, erro
+            )
+            gerenciador = self.gerenciador
+            republicacao = self.publisher_falhas.republicar(exchange, routing_key, body, propriedades)
+            republicacao.add_done_callback(
+                lambda futuro: gerenciador.executar(
+                    self._concluir_republicacao, channel, delivery_tag, exchange, futuro, atraso
+                )
+            )
+            return
+        
+        self._marcar_processada(entrega, True, atraso)
+    
+    def _concluir_republicacao(self, channel, delivery_tag: int, exchange: str,
+                               republicacao: Future, atraso: Optional[float]):
+        """
+        Resultado da republicação de uma falha (thread de I/O)
+        
+        Confirmada pelo broker, a original recebe ack no próximo lote. Recusada
+        ou perdida (canal do publisher caiu, exchange inexistente), não há
+        garantia de que a cópia exista: a original volta para a fila (nack
+        com requeue) e é entregue de novo.
+        
+        ATRASO NA DEVOLUÇÃO: A original só é devolvida depois de
+        atraso_devolucao_falha segundos. Com o publisher de falhas fora do
+        ar, devolver na hora faria a mesma mensagem voltar e falhar em loop.
+        """
+        if channel is not self.channel or not channel.is_open:
+            return
+        entrega = self._entregas.get(delivery_tag)
+        if entrega is None or entrega[1]:
+            return
+        
+        if republicacao.exception() is None and republicacao.result():
+            self._total_rejeitadas += 1
+            if exchange == self.configurador.exchange_dead_letter:
+                self._total_dead_letters += 1
+            else:
+                self._total_retentativas += 1
+            self._marcar_processada(entrega, 'falha', atraso)
+        else:
+            self.gerenciador.chamar_depois(
+                self.atraso_devolucao_falha,
+                lambda: self._devolver_falha(channel, delivery_tag, atraso)
+            )
+    
+    def _devolver_falha(self, channel, delivery_tag: int, atraso: Optional[float]):
+        """Devolve à fila uma falha não republicada, após o atraso (thread de I/O)"""
+        if channel is not self.channel or not channel.is_open:
+            return
+        entrega = self._entregas.get(delivery_tag)
+        if entrega is None or entrega[1]:
+            return
+        self._total_devolvidas += 1
+        self._marcar_processada(entrega, 'devolver', atraso)
+    
+    def _marcar_processada(self, entrega: list, resultado, atraso: Optional[float]):
+        """Conta a entrega para o próximo ack em lote (thread de I/O)"""
+        entrega[1] = resultado
+        if atraso is not None:
+            self._atrasos_nao_registrados.setdefault(entrega[2].exchange, []).append(atraso)
+        self._processadas_sem_ack += 1
+        if self._processadas_sem_ack >= self.lote_ack:
+            self._enviar_acks()
+        elif self._timer_ack is None:
+            self._timer_ack = self.gerenciador.chamar_depois(self.intervalo_ack, self._on_timer_ack)
+    
+    def _on_timer_ack(self):
+        self._timer_ack = None
+        self._enviar_acks()
+    
+    def _enviar_acks(self):
+        """
+        Confirma de uma vez as entregas processadas no início da janela (thread de I/O)
+        
+        ACK EM LOTE: multiple=True confirma todas as tags até a informada,
+        então só o prefixo contíguo de entregas já processadas pode ser
+        confirmado. Entregas processadas depois de uma ainda em andamento
+        esperam por ela. As devolvidas no prefixo recebem nack individual
+        com requeue antes do ack.
+        """
+        if self._timer_ack is not None:
+            self.gerenciador.cancelar_chamada(self._timer_ack)
+            self._timer_ack = None
+        if not (self.channel and self.channel.is_open):
+            return
+        
+        ultima_tag = None
+        # {exchange: {processada: quantidade}} das entregas concluídas neste frame
+        concluidas: Dict[str, Dict] = {}
+        while self._entregas:
+            tag, entrega = next(iter(self._entregas.items()))
+            if not entrega[1]:
+                break
+            self._entregas.popitem(last=False)
+            self._processadas_sem_ack -= 1
+            contagem = concluidas.setdefault(entrega[2].exchange, {True: 0, 'falha': 0, 'devolver': 0})
+            contagem[entrega[1]] += 1
+            if entrega[1] == 'devolver':
+                self.channel.basic_nack(delivery_tag=tag, requeue=True)
+                continue
+            self._total_confirmadas += 1
+            self._registrar_latencia(entrega[0])
+            ultima_tag = tag
+        
+        if ultima_tag is not None:
+            # CONFIRMAÇÃO: Remove as mensagens da fila após processamento
+            self.channel.basic_ack(delivery_tag=ultima_tag, multiple=True)
+            self._frames_ack += 1
+        for exchange, contagem in concluidas.items():
+            self.metricas.registrar_conclusoes(exchange, confirmadas=contagem[True],
+                                               falhas=contagem['falha'],
+                                               devolvidas=contagem['devolver'])
+        for exchange, (entregas, reentregas) in self._entregas_nao_registradas.items():
+            self.metricas.registrar_entregas(exchange, entregas, reentregas)
+        self._entregas_nao_registradas.clear()
+        for exchange, atrasos in self._atrasos_nao_registrados.items():
+            self.metricas.registrar_atrasos(exchange, atrasos)
+        self._atrasos_nao_registrados.clear()
+        
+        # Entregas processadas atrás de uma em andamento: tenta de novo depois
+        if self._processadas_sem_ack and self._timer_ack is None:
+            self._timer_ack = self.gerenciador.chamar_depois(self.intervalo_ack, self._on_timer_ack)
+    
+    def _registrar_latencia(self, recebida_em: float):
+        latencia = time.monotonic() - recebida_em
+        self._soma_latencia_ack += latencia
+        self._max_latencia_ack = max(self._max_latencia_ack, latencia)
+    
+    def _on_canal_fechado(self, canal, motivo):
+        """Entregas sem ack voltam para a fila no broker; descarta o controle local"""
+        with self._lock_localizacoes:
+            self._localizacoes_pendentes.clear()
+        self._entregas.clear()
+        self._processadas_sem_ack = 0
+        self._timer_ack = None
+        self._timer_lote_localizacao = None
+        # Entregas do backlog também voltam; a próxima conexão drena de novo
+        self._fase_backlog = None
+        self._backlog = []
+        self._retidas = []
+        self._ids_backlog.clear()
+        self._timer_backlog = None
+        self._partes_backlog_pendentes = 0
+        
+        # Queda durante o consumo (parar_consumo e desconectar zeram consumindo)
+        if (self.reconectar and canal is self.channel and self.consumindo
+                and not self._encerrado.is_set()):
+            print(f"Canal do consumer caiu: {motivo}")
+            with self._lock_reconexao:
+                if self._reconectando:
+                    return
+                self._reconectando = True
+            self._thread_reconexao = threading.Thread(
+                target=self._loop_reconexao, daemon=True,
+                name=f"geochat-consumer-reconexao-{self.nome_usuario}"
+            )
+            self._thread_reconexao.start()
+    
+    def _loop_reconexao(self):
+        """
+        Reabre conexão e canal e reinicia o consumo
+        
+        BACKOFF: Mesma política do PublisherMensagem._loop_reconexao: esperas
+        que dobram até atraso_reconexao_maximo, sorteadas entre metade e o
+        total, e a primeira espera vem antes da tentativa (o canal cai antes
+        de a conexão ser dada como fechada).
+        """
+        atraso = self.atraso_reconexao_inicial
+        tentativa = 0
+        while not self._encerrado.wait(random.uniform(atraso / 2, atraso)):
+            atraso = min(atraso * 2, self.atraso_reconexao_maximo)
+            tentativa += 1
+            try:
+                self._reabrir_conexao()
+                if not self.iniciar_consumo():
+                    raise ConnectionError("consumo não reiniciou")
+                
+                with self._lock_reconexao:
+                    # Um canal que caiu de novo durante a reinicialização não
+                    # disparou outra thread (esta ainda estava ativa): tenta de novo
+                    if self.channel.is_open:
+                        self._reconectando = False
+                        self._total_reconexoes += 1
+                        print(f"Consumer reconectado (tentativa {tentativa})")
+                        return
+            except Exception as e:
+                print(f"Reconexão do consumer falhou (tentativa {tentativa}): {e or type(e).__name__}")
+                # Não deixa aberto o canal desta tentativa; a próxima abre outro
+                if self.channel and self.channel.is_open and self.gerenciador:
+                    self.gerenciador.fechar_canal(self.channel)
+        
+        with self._lock_reconexao:
+            self._reconectando = False
+    
+    def _reabrir_conexao(self):
+        """
+        Troca o gerenciador e abre um canal novo
+        
+        O gerenciador antigo só é liberado depois que o novo abriu o canal;
+        se a conexão não tinha caído (só o canal), obter devolve o mesmo.
+        """
+        antigo = self.gerenciador
+        novo = GerenciadorConexaoAMQP.obter_para(self.configurador)
+        self.gerenciador = novo
+        try:
+            self._abrir_canal()
+        except Exception:
+            self.gerenciador = antigo
+            novo.liberar()
+            raise
+        if antigo:
+            antigo.liberar()
 
 if __name__ == "__main__":
     # Teste básico do RabbitMQ
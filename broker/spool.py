@@ -0,0 +1,275 @@
+import json
+import os
+import shutil
+import threading
+from typing import Dict, List, Tuple
+
+class SpoolMensagens:
+    """
+    Caixa de saída local, em disco, para publicações feitas com o broker fora
+
+    APPEND-ONLY: Cada publicação vira uma linha JSON no fim do arquivo
+    (exchange, routing key, corpo e delivery_mode). Nada é reescrito no
+    lugar; o progresso do reenvio fica em um arquivo auxiliar '.offset'
+    (posição em bytes da próxima linha a reenviar), trocado atomicamente
+    com os.replace.
+
+    FSYNC EM LOTE (group commit): gravar() só escreve no buffer; o fsync
+    acontece em sincronizar(). Quem chega enquanto outra thread está no
+    fsync espera por ele e, se os seus bytes já foram cobertos, volta sem
+    fazer outro. Um lote inteiro (enviar_mensagens_lote) custa um fsync.
+
+    DISCO LIMITADO: Quando os registros ainda não reenviados passam de
+    max_bytes, novas gravações são recusadas (as antigas nunca são
+    descartadas para abrir espaço). Quando o reenvio alcança o fim do
+    arquivo, ele é truncado e o espaço volta a zero.
+
+    COMPACTAÇÃO: Se gravações novas continuam chegando durante o reenvio,
+    o fim do arquivo nunca é alcançado. Quando o prefixo já reenviado
+    passa de 1/4 de max_bytes e do tamanho da cauda pendente, a cauda é
+    copiada para um arquivo novo que substitui o atual (cada byte é
+    copiado poucas vezes; o arquivo fica abaixo de ~2x max_bytes).
+
+    QUEDA NO MEIO DA ESCRITA: Uma última linha incompleta (sem '\\n') é
+    cortada ao abrir o spool.
+    """
+
+    def __init__(self, caminho: str, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Abre (ou cria) o spool
+
+        Args:
+            caminho: Arquivo do spool (o diretório é criado se necessário)
+            max_bytes: Tamanho máximo do arquivo
+        """
+        self.caminho = caminho
+        self.caminho_offset = caminho + '.offset'
+        self.max_bytes = max_bytes
+
+        # Protege arquivo, offsets e contadores
+        self._lock = threading.Lock()
+        # Serializa os fsyncs (group commit)
+        self._lock_fsync = threading.Lock()
+
+        diretorio = os.path.dirname(os.path.abspath(caminho))
+        os.makedirs(diretorio, exist_ok=True)
+
+        self._arquivo = open(caminho, 'ab')
+        self._tamanho = self._recuperar_cauda()
+        self._inicio = min(self._ler_offset(), self._tamanho)
+        self._sincronizado = self._tamanho
+        self._pendentes = self._contar_linhas(self._inicio, self._tamanho)
+
+        # Prefixo reenviado a partir do qual vale compactar
+        self.limite_compactacao = max_bytes // 4
+
+        # Métricas
+        self._total_gravadas = 0
+        self._total_recusadas = 0
+        self._total_fsyncs = 0
+        self._total_confirmadas = 0
+        self._total_compactacoes = 0
+
+    def _recuperar_cauda(self) -> int:
+        """Corta uma linha incompleta no fim do arquivo; retorna o tamanho válido"""
+        tamanho = os.path.getsize(self.caminho)
+        if tamanho == 0:
+            return 0
+        with open(self.caminho, 'rb') as leitor:
+            # Procura o último '\n' de trás para frente, em blocos
+            fim = tamanho
+            while fim > 0:
+                inicio = max(0, fim - 65536)
+                leitor.seek(inicio)
+                bloco = leitor.read(fim - inicio)
+                posicao = bloco.rfind(b'\n')
+                if posicao >= 0:
+                    valido = inicio + posicao + 1
+                    break
+                fim = inicio
+            else:
+                valido = 0
+        if valido < tamanho:
+            print(f"Spool {self.caminho}: descartando {tamanho - valido} bytes de uma gravação incompleta")
+            self._arquivo.truncate(valido)
+        return valido
+
+    def _ler_offset(self) -> int:
+        try:
+            with open(self.caminho_offset, 'r') as arquivo:
+                return int(arquivo.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _gravar_offset(self, offset: int):
+        """Grava o offset de forma atômica (arquivo temporário + os.replace)"""
+        temporario = self.caminho_offset + '.tmp'
+        with open(temporario, 'w') as arquivo:
+            arquivo.write(str(offset))
+            arquivo.flush()
+            os.fsync(arquivo.fileno())
+        os.replace(temporario, self.caminho_offset)
+
+    def _contar_linhas(self, inicio: int, fim: int) -> int:
+        if fim <= inicio:
+            return 0
+        with open(self.caminho, 'rb') as leitor:
+            leitor.seek(inicio)
+            return leitor.read(fim - inicio).count(b'\n')
+
+    @property
+    def pendentes(self) -> int:
+        """Quantidade de registros ainda não reenviados"""
+        return self._pendentes
+
+    def gravar(self, registros: List[Tuple[str, str, str, int]]) -> bool:
+        """
+        Acrescenta registros ao fim do spool, sem fsync
+
+        Args:
+            registros: Lista de (exchange, routing_key, body, delivery_mode)
+
+        Returns:
+            True se gravados; False se os bytes pendentes passariam de
+            max_bytes (nenhum registro do lote é gravado nesse caso)
+        """
+        linhas = b''.join(
+            json.dumps({'e': exchange, 'r': routing_key, 'b': body, 'm': delivery_mode},
+                       ensure_ascii=False).encode('utf-8') + b'\n'
+            for exchange, routing_key, body, delivery_mode in registros
+        )
+        with self._lock:
+            if self._tamanho - self._inicio + len(linhas) > self.max_bytes:
+                self._total_recusadas += len(registros)
+                return False
+            self._arquivo.write(linhas)
+            self._tamanho += len(linhas)
+            self._pendentes += len(registros)
+            self._total_gravadas += len(registros)
+            return True
+
+    def sincronizar(self):
+        """Garante em disco tudo que foi gravado até agora (um fsync para vários chamadores)"""
+        with self._lock:
+            alvo = self._tamanho
+        with self._lock_fsync:
+            if self._sincronizado >= alvo:
+                # Outra thread já fez o fsync que cobre estes bytes
+                return
+            with self._lock:
+                self._arquivo.flush()
+                alvo = self._tamanho
+            os.fsync(self._arquivo.fileno())
+            self._sincronizado = alvo
+            self._total_fsyncs += 1
+
+    def anexar(self, registros: List[Tuple[str, str, str, int]]) -> bool:
+        """Grava e sincroniza (atalho para gravar + sincronizar)"""
+        if not self.gravar(registros):
+            return False
+        self.sincronizar()
+        return True
+
+    def ler(self, limite: int) -> List[Tuple[int, dict]]:
+        """
+        Lê os próximos registros a reenviar, a partir do offset confirmado
+
+        Returns:
+            Lista de (offset logo após o registro, registro), em ordem
+        """
+        with self._lock:
+            self._arquivo.flush()
+            inicio, fim = self._inicio, self._tamanho
+
+        registros = []
+        with open(self.caminho, 'rb') as leitor:
+            leitor.seek(inicio)
+            posicao = inicio
+            while len(registros) < limite and posicao < fim:
+                linha = leitor.readline()
+                if not linha.endswith(b'\n'):
+                    break
+                posicao += len(linha)
+                registros.append((posicao, json.loads(linha)))
+        return registros
+
+    def confirmar(self, offset: int, quantidade: int):
+        """
+        Avança o offset depois que registros foram reenviados
+
+        COMPACTAÇÃO: Se não sobrou nada para reenviar, o arquivo é truncado
+        e o offset volta a zero. Se o prefixo reenviado ficou grande, só a
+        cauda pendente é reescrita (ver _compactar).
+
+        Args:
+            offset: Offset logo após o último registro reenviado
+            quantidade: Registros reenviados até esse offset
+        """
+        # Mesmo lock do fsync: um fsync em andamento não pode marcar como
+        # sincronizados bytes de antes do truncamento
+        with self._lock_fsync, self._lock:
+            self._inicio = offset
+            self._pendentes -= quantidade
+            self._total_confirmadas += quantidade
+            if self._inicio >= self._tamanho:
+                self._arquivo.truncate(0)
+                self._tamanho = self._inicio = 0
+                self._sincronizado = 0
+                self._pendentes = 0
+            elif (self._inicio >= self.limite_compactacao
+                  and self._inicio >= self._tamanho - self._inicio):
+                self._compactar()
+                return
+            self._gravar_offset(self._inicio)
+
+    def _compactar(self):
+        """
+        Reescreve só a cauda ainda não reenviada (chamado com os dois locks)
+
+        ORDEM: O offset é zerado antes de o arquivo novo entrar no lugar.
+        Uma queda entre os dois passos reenvia de novo o prefixo já
+        confirmado (duplicatas descartadas pelo consumidor pelo 'id'); a
+        ordem inversa apontaria o offset para além dos dados e perderia
+        registros.
+        """
+        self._arquivo.flush()
+        temporario = self.caminho + '.tmp'
+        with open(self.caminho, 'rb') as leitor, open(temporario, 'wb') as escritor:
+            leitor.seek(self._inicio)
+            shutil.copyfileobj(leitor, escritor)
+            escritor.flush()
+            os.fsync(escritor.fileno())
+
+        self._gravar_offset(0)
+        os.replace(temporario, self.caminho)
+        self._arquivo.close()
+        self._arquivo = open(self.caminho, 'ab')
+
+        # A cópia já passou por fsync
+        self._tamanho -= self._inicio
+        self._inicio = 0
+        self._sincronizado = self._tamanho
+        self._total_compactacoes += 1
+
+    def fechar(self):
+        """Sincroniza e fecha o arquivo"""
+        try:
+            self.sincronizar()
+            self._arquivo.close()
+        except Exception as e:
+            print(f"Erro ao fechar spool: {e}")
+
+    def obter_metricas(self) -> Dict[str, float]:
+        """Retorna métricas do spool"""
+        with self._lock:
+            return {
+                'pendentes': self._pendentes,
+                'bytes': self._tamanho,
+                'bytes_pendentes': self._tamanho - self._inicio,
+                'max_bytes': self.max_bytes,
+                'gravadas': self._total_gravadas,
+                'recusadas': self._total_recusadas,
+                'fsyncs': self._total_fsyncs,
+                'reenviadas': self._total_confirmadas,
+                'compactacoes': self._total_compactacoes,
+            }
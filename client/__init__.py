@@ -0,0 +1,9 @@
+"""
+Módulo do cliente GeoChat sem interface (usado pela GUI, por bots e testes de carga)
+"""
+
+from .cliente_geochat import ClienteGeoChat, ErroCliente, MODO_AUTO, MODO_SINCRONO, MODO_ASSINCRONO
+from .laco_recebimento import LacoRecebimento
+
+__all__ = ['ClienteGeoChat', 'ErroCliente', 'LacoRecebimento', 'MODO_AUTO', 'MODO_SINCRONO',
+           'MODO_ASSINCRONO']
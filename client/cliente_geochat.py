@@ -0,0 +1,539 @@
+import itertools
+import socket
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.usuario import Usuario, StatusUsuario
+from common.config import config
+from common.protocolo import DecodificadorFrames, codificar_mensagem, decodificar_mensagem
+from common.compressao import CompressorPayload, algoritmos_disponiveis
+from broker.rabbitmq_manager import ConfiguradorRabbitMQ, PublisherMensagem, ConsumerMensagem
+from client.laco_recebimento import LacoRecebimento
+
+# Modos de envio (os mesmos do combobox da GUI)
+MODO_AUTO = 'Auto'
+MODO_SINCRONO = 'Síncrono'
+MODO_ASSINCRONO = 'Assíncrono'
+
+# Eventos de adicionar_callback() e o que cada callback recebe
+EVENTOS = (
+    'mensagem',          # dict: remetente, conteudo, tipo ("Síncrona" / "Assíncrona (motivo)"), timestamp
+    'backlog',           # List[dict]: mensagens acumuladas enquanto offline (RabbitMQ direto)
+    'localizacoes',      # List[dict]: lote de atualizações de localização (RabbitMQ direto)
+    'lista_usuarios',    # List[dict]: usuários com distancia, no_raio e status
+    'erro',              # str: erro do servidor que não é resposta a uma requisição
+    'entrega_assincrona_indisponivel',  # str: o servidor não conseguiu assinar a fila no gateway
+    'conexao_perdida',   # Exception ou None: o servidor fechou ou a conexão caiu
+)
+
+
+class ErroCliente(Exception):
+    """Requisição recusada pelo servidor ou operação impossível no estado atual"""
+
+
+class ClienteGeoChat:
+    """
+    Cliente GeoChat sem interface: protocolo, roteamento e eventos
+
+    SEM TK: Toda a lógica que ficava na janela do ClienteIntegrado (conexão
+    e handshake, localização, listagem, roteamento Auto/Síncrono/Assíncrono,
+    recebimento, RabbitMQ direto) está aqui, para bots, testes de carga e a
+    própria GUI, que vira só uma visão em cima deste cliente.
+
+    CORRELAÇÃO: Cada requisição leva um 'id_requisicao' que o servidor ecoa
+    na resposta (sucesso ou 'erro'). requisitar() retorna um Future
+    resolvido com a resposta certa mesmo com várias requisições em voo e
+    mensagens de outros usuários chegando no meio; um 'erro' vira
+    ErroCliente no Future.
+
+    EVENTOS: O que chega sem ter sido pedido (mensagens, listas, erros,
+    queda da conexão) é entregue aos callbacks de adicionar_callback(). Os
+    callbacks rodam na thread de recebimento e devem só repassar o evento
+    (ex: para a fila da GUI).
+
+    THREAD SAFETY: Os métodos podem ser chamados de qualquer thread; os
+    envios pelo socket são serializados por um lock. Os que esperam rede
+    (conectar, conectar_broker, envio pelo RabbitMQ) bloqueiam a thread que
+    chamou; os demais retornam um Future.
+
+    ESCALA: O recebimento usa um LacoRecebimento compartilhado (uma thread
+    para todos os clientes do processo), então milhares de clientes
+    simulados cabem num único processo.
+    """
+
+    def __init__(self, nome: str, latitude: float, longitude: float,
+                 raio: float = config.DEFAULT_RADIUS, compressor: Optional[CompressorPayload] = None,
+                 laco: Optional[LacoRecebimento] = None):
+        """
+        Args:
+            nome: Nome do usuário
+            latitude: Latitude inicial
+            longitude: Longitude inicial
+            raio: Raio de comunicação (metros)
+            compressor: Compressor de frames (padrão: CompressorPayload() da configuração)
+            laco: Laço de recebimento (padrão: o compartilhado do processo)
+        """
+        self.usuario = Usuario(nome, latitude, longitude, raio, StatusUsuario.ONLINE)
+        self.compressor = compressor or CompressorPayload()
+        self.laco = laco or LacoRecebimento.padrao()
+
+        # Socket connection
+        self.socket_cliente: Optional[socket.socket] = None
+        self.conectado = False
+        self.entrega_assincrona_servidor = False
+        self.compressao_socket: Optional[str] = None
+        self._lock_envio = threading.Lock()
+
+        # Requisições aguardando resposta: {id_requisicao: Future}
+        self._ids = itertools.count(1)
+        self._pendentes: Dict[int, Future] = {}
+        self._lock_pendentes = threading.Lock()
+
+        # RabbitMQ connection (opcional, direto do cliente)
+        self.configurador_rabbitmq: Optional[ConfiguradorRabbitMQ] = None
+        self.publisher: Optional[PublisherMensagem] = None
+        self.consumer: Optional[ConsumerMensagem] = None
+
+        # Última lista de usuários recebida (usada no roteamento Auto)
+        self.usuarios_disponiveis: List[dict] = []
+
+        self._callbacks: Dict[str, List[Callable]] = {evento: [] for evento in EVENTOS}
+
+    @property
+    def nome(self) -> str:
+        return self.usuario.nome
+
+    @property
+    def conectado_broker(self) -> bool:
+        """Se há conexão própria com o RabbitMQ"""
+        return self.publisher is not None
+
+    @property
+    def assincrono_disponivel(self) -> bool:
+        """Mensagens assíncronas são possíveis pelo RabbitMQ direto ou pelo gateway do servidor"""
+        return self.conectado_broker or (self.conectado and self.entrega_assincrona_servidor)
+
+    def adicionar_callback(self, evento: str, callback: Callable):
+        """
+        Registra um callback para um evento (ver EVENTOS)
+
+        Raises:
+            ValueError: Evento desconhecido
+        """
+        if evento not in self._callbacks:
+            raise ValueError(f"Evento desconhecido: {evento}")
+        self._callbacks[evento].append(callback)
+
+    def _emitir(self, evento: str, dados):
+        for callback in self._callbacks[evento]:
+            try:
+                callback(dados)
+            except Exception as e:
+                print(f"Erro em callback de {evento}: {e}")
+
+    # ------------------------------------------------------------------
+    # Conexão socket
+    # ------------------------------------------------------------------
+
+    def conectar(self, host: str = config.SOCKET_HOST, porta: int = config.SOCKET_PORT,
+                 timeout: float = None) -> dict:
+        """
+        Conecta ao servidor e faz o handshake (bloqueia até a resposta)
+
+        Args:
+            host: Endereço do servidor
+            porta: Porta do servidor
+            timeout: Tempo máximo para conectar e receber a resposta
+                     (padrão: config.SOCKET_TIMEOUT_CONEXAO)
+
+        Returns:
+            A resposta 'conexao_aceita'
+
+        Raises:
+            OSError: Falha de rede ou timeout
+            ErroCliente: Servidor recusou a conexão
+        """
+        if self.conectado:
+            raise ErroCliente("Já conectado")
+        timeout = config.SOCKET_TIMEOUT_CONEXAO if timeout is None else timeout
+
+        conexao = socket.create_connection((host, porta), timeout=timeout)
+        decodificador = DecodificadorFrames(self.compressor)
+        try:
+            mensagem_conexao = {
+                'tipo': 'conectar',
+                'usuario': self.usuario.to_dict(),
+                'entrega_assincrona': True,  # Aceita mensagens assíncronas pelo socket
+                'compressao': algoritmos_disponiveis() if self.compressor.ativo else []
+            }
+            conexao.sendall(codificar_mensagem(mensagem_conexao, self.compressor, None))
+
+            # Lê só até a resposta; o que vier junto (ex: backlog do gateway)
+            # fica no decodificador para o laço de recebimento
+            payloads = []
+            while not payloads:
+                dados = conexao.recv(65536)
+                if not dados:
+                    raise ErroCliente("Sem resposta do servidor")
+                payloads = decodificador.alimentar(dados)
+            resposta = decodificar_mensagem(payloads[0])
+            if resposta.get('tipo') != 'conexao_aceita':
+                raise ErroCliente(resposta.get('mensagem', 'Erro desconhecido'))
+        except BaseException:
+            conexao.close()
+            raise
+
+        # O timeout vale só para a conexão; os envios esperam o que precisarem
+        conexao.settimeout(None)
+        self.socket_cliente = conexao
+        self.entrega_assincrona_servidor = resposta.get('entrega_assincrona', False)
+        self.compressao_socket = resposta.get('compressao')
+        self.conectado = True
+
+        for payload in payloads[1:]:
+            self._processar_recebida(decodificar_mensagem(payload))
+        self.laco.registrar(conexao, decodificador, self._processar_recebida,
+                            lambda erro: self._on_conexao_fechada(conexao, erro))
+        return resposta
+
+    def desconectar(self):
+        """Fecha a conexão com o servidor (a do RabbitMQ, se houver, continua)"""
+        conexao = self.socket_cliente
+        self.conectado = False
+        self.entrega_assincrona_servidor = False
+        self.compressao_socket = None
+        self.socket_cliente = None
+        if conexao is not None:
+            self.laco.remover(conexao)
+            try:
+                conexao.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conexao.close()
+        self._falhar_pendentes(ConnectionError("Desconectado"))
+
+    def fechar(self):
+        """Fecha a conexão com o servidor e com o RabbitMQ (bloqueia)"""
+        if self.conectado_broker:
+            self.desconectar_broker()
+        self.desconectar()
+
+    def _on_conexao_fechada(self, conexao: socket.socket, erro: Optional[Exception]):
+        """Laço de recebimento viu a conexão fechar"""
+        if conexao is not self.socket_cliente:
+            # Fechamento pedido por desconectar()
+            return
+        self.conectado = False
+        self.socket_cliente = None
+        try:
+            conexao.close()
+        except OSError:
+            pass
+        self._falhar_pendentes(ConnectionError("Conexão com o servidor foi perdida"))
+        self._emitir('conexao_perdida', erro)
+
+    def _falhar_pendentes(self, erro: Exception):
+        with self._lock_pendentes:
+            pendentes, self._pendentes = self._pendentes, {}
+        for futuro in pendentes.values():
+            if not futuro.done():
+                futuro.set_exception(erro)
+
+    # ------------------------------------------------------------------
+    # Requisições
+    # ------------------------------------------------------------------
+
+    def enviar(self, mensagem: dict):
+        """
+        Envia uma mensagem ao servidor sem esperar resposta
+
+        Raises:
+            ErroCliente: Não conectado
+            OSError: Falha no envio
+        """
+        conexao = self.socket_cliente
+        if conexao is None:
+            raise ErroCliente("Não conectado ao servidor")
+        dados = codificar_mensagem(mensagem, self.compressor, self.compressao_socket)
+        with self._lock_envio:
+            conexao.sendall(dados)
+
+    def requisitar(self, mensagem: dict) -> Future:
+        """
+        Envia uma requisição com id de correlação
+
+        Returns:
+            Future resolvido com a resposta do servidor (ou ErroCliente se
+            ele respondeu 'erro', ConnectionError se a conexão caiu antes)
+        """
+        futuro = Future()
+        id_requisicao = next(self._ids)
+        with self._lock_pendentes:
+            self._pendentes[id_requisicao] = futuro
+        try:
+            self.enviar(dict(mensagem, id_requisicao=id_requisicao))
+        except Exception as e:
+            with self._lock_pendentes:
+                self._pendentes.pop(id_requisicao, None)
+            futuro.set_exception(e)
+        return futuro
+
+    def listar_usuarios(self, apenas_no_raio: bool = False) -> Future:
+        """
+        Pede a lista de usuários
+
+        Returns:
+            Future com a lista (também emitida no evento 'lista_usuarios')
+        """
+        return _encadear(self.requisitar({'tipo': 'listar_usuarios', 'apenas_no_raio': apenas_no_raio}),
+                         lambda resposta: resposta['usuarios'])
+
+    def atualizar_localizacao(self, latitude: float, longitude: float) -> Future:
+        """
+        Atualiza a localização no servidor e, se conectado, no RabbitMQ
+
+        A publicação no RabbitMQ (e a troca das células assinadas) roda na
+        thread que chamou.
+
+        Returns:
+            Future com a resposta 'localizacao_atualizada'
+        """
+        futuro = self.requisitar({'tipo': 'atualizar_localizacao',
+                                  'latitude': latitude, 'longitude': longitude})
+        self.usuario.atualizar_localizacao(latitude, longitude)
+
+        # Publica no RabbitMQ se conectado e passa a ouvir as células da nova posição
+        if self.conectado_broker:
+            self.publisher.publicar_atualizacao_localizacao(self.usuario)
+            self.configurador_rabbitmq.atualizar_vinculos_localizacao(self.usuario)
+        return futuro
+
+    def tipo_comunicacao(self, usuario: dict) -> str:
+        """
+        Que comunicação é possível com um usuário da lista
+
+        LÓGICA DE DISPONIBILIDADE: Baseada em status online/offline, distância
+        dentro/fora do raio e conexões disponíveis (socket/RabbitMQ).
+
+        Returns:
+            "Síncrona + Assíncrona", "Síncrona", "Assíncrona" ou "Indisponível"
+        """
+        if usuario['status'] == 'online' and usuario['no_raio']:
+            # Usuário online + no raio: síncrona sempre disponível
+            return "Síncrona + Assíncrona" if self.assincrono_disponivel else "Síncrona"
+        if self.assincrono_disponivel:
+            # Usuário offline ou fora do raio: só assíncrona (RabbitMQ ou gateway)
+            return "Assíncrona"
+        # Sem opções de comunicação
+        return "Indisponível"
+
+    def enviar_mensagem(self, destinatario: str, conteudo: str, modo: str = MODO_AUTO) -> Future:
+        """
+        Envia uma mensagem, escolhendo síncrona ou assíncrona
+
+        LÓGICA DE DECISÃO AUTOMÁTICA (modo Auto): síncrona se o destinatário
+        está online, no raio e há socket; senão assíncrona (motivo offline ou
+        fora_do_raio), se disponível. Os modos Síncrono e Assíncrono forçam
+        o caminho.
+
+        Pelo RabbitMQ direto, o envio aguarda a confirmação do broker na
+        thread que chamou.
+
+        Returns:
+            Future com a descrição do caminho usado ("Síncrona",
+            "Assíncrona (motivo)" ou "Assíncrona via servidor (motivo)")
+
+        Raises:
+            ErroCliente: Destinatário desconhecido ou nenhum caminho disponível
+        """
+        if modo == MODO_AUTO:
+            usuario_destinatario = next((usuario for usuario in self.usuarios_disponiveis
+                                         if usuario['nome'] == destinatario), None)
+            if not usuario_destinatario:
+                raise ErroCliente("Destinatário não encontrado")
+
+            # CRITÉRIOS PARA SÍNCRONO: online + no raio + socket conectado
+            if (usuario_destinatario['status'] == 'online' and
+                    usuario_destinatario['no_raio'] and self.conectado):
+                return self._enviar_sincrona(destinatario, conteudo)
+
+            # FALLBACK PARA ASSÍNCRONO: qualquer falha nos critérios acima
+            if self.assincrono_disponivel:
+                motivo = "offline" if usuario_destinatario['status'] == 'offline' else "fora_do_raio"
+                return self._enviar_assincrona(destinatario, conteudo, motivo)
+            raise ErroCliente("Não é possível enviar mensagem - destinatário offline/fora do raio "
+                              "e mensagens assíncronas indisponíveis")
+
+        if modo == MODO_SINCRONO:
+            if not self.conectado:
+                raise ErroCliente("Conexão socket não disponível")
+            return self._enviar_sincrona(destinatario, conteudo)
+
+        if modo == MODO_ASSINCRONO:
+            if not self.assincrono_disponivel:
+                raise ErroCliente("Conexão RabbitMQ não disponível")
+            return self._enviar_assincrona(destinatario, conteudo, "forcado")
+
+        raise ErroCliente(f"Modo de envio desconhecido: {modo}")
+
+    def _enviar_sincrona(self, destinatario: str, conteudo: str) -> Future:
+        """Envia mensagem síncrona via socket"""
+        return _encadear(self.requisitar({'tipo': 'enviar_mensagem', 'destinatario': destinatario,
+                                          'conteudo': conteudo}),
+                         lambda _: "Síncrona")
+
+    def _enviar_assincrona(self, destinatario: str, conteudo: str, motivo: str) -> Future:
+        """Envia mensagem assíncrona via RabbitMQ (direto ou pelo servidor)"""
+        if self.publisher:
+            futuro = Future()
+            if self.publisher.enviar_mensagem_assincrona(self.nome, destinatario, conteudo, motivo):
+                futuro.set_result(f"Assíncrona ({motivo})")
+            else:
+                futuro.set_exception(ErroCliente("Falha ao enviar mensagem assíncrona"))
+            return futuro
+
+        # GATEWAY: o servidor publica no RabbitMQ
+        return _encadear(self.requisitar({'tipo': 'enviar_mensagem_assincrona', 'destinatario': destinatario,
+                                          'conteudo': conteudo, 'motivo': motivo}),
+                         lambda _: f"Assíncrona via servidor ({motivo})")
+
+    # ------------------------------------------------------------------
+    # Recebimento
+    # ------------------------------------------------------------------
+
+    def _processar_recebida(self, mensagem: dict):
+        """Resolve a requisição correspondente e emite os eventos (thread de recebimento)"""
+        tipo = mensagem.get('tipo')
+
+        futuro = None
+        id_requisicao = mensagem.get('id_requisicao')
+        if id_requisicao is not None:
+            with self._lock_pendentes:
+                futuro = self._pendentes.pop(id_requisicao, None)
+
+        if tipo == 'lista_usuarios':
+            self.usuarios_disponiveis = mensagem['usuarios']
+            self._emitir('lista_usuarios', self.usuarios_disponiveis)
+
+        elif tipo == 'mensagem_recebida':
+            # Mensagens do gateway do broker chegam pelo mesmo socket, marcadas
+            if mensagem.get('assincrona'):
+                tipo_mensagem = f"Assíncrona ({mensagem.get('motivo', 'desconhecido')})"
+            else:
+                tipo_mensagem = "Síncrona"
+            self._emitir('mensagem', {'remetente': mensagem['remetente'], 'conteudo': mensagem['conteudo'],
+                                      'tipo': tipo_mensagem, 'timestamp': mensagem.get('timestamp')})
+
+        elif tipo == 'entrega_assincrona_indisponivel':
+            # conexao_aceita anunciou a entrega, mas a assinatura no gateway falhou
+            self.entrega_assincrona_servidor = False
+            self._emitir('entrega_assincrona_indisponivel', mensagem['mensagem'])
+
+        elif tipo == 'erro' and futuro is None:
+            self._emitir('erro', mensagem['mensagem'])
+
+        if futuro is not None and not futuro.done():
+            if tipo == 'erro':
+                futuro.set_exception(ErroCliente(mensagem['mensagem']))
+            else:
+                futuro.set_result(mensagem)
+
+    # ------------------------------------------------------------------
+    # RabbitMQ direto
+    # ------------------------------------------------------------------
+
+    def conectar_broker(self, host: str = config.RABBITMQ_HOST, porta: int = config.RABBITMQ_PORT):
+        """
+        Abre configurador, publisher e consumer do RabbitMQ (bloqueia)
+
+        Em caso de falha, fecha o que já tinha sido aberto.
+
+        Raises:
+            ErroCliente: Alguma etapa falhou
+        """
+        if self.conectado_broker:
+            raise ErroCliente("Já conectado ao RabbitMQ")
+
+        configurador = ConfiguradorRabbitMQ(host, porta)
+        publisher = consumer = None
+        try:
+            if not configurador.conectar():
+                raise ErroCliente("Falha ao conectar ao RabbitMQ")
+
+            if not configurador.configurar_topologia():
+                raise ErroCliente("Falha ao configurar topologia RabbitMQ")
+
+            if not configurador.criar_fila_usuario(self.nome, self.usuario):
+                raise ErroCliente("Falha ao criar filas do usuário")
+
+            # Configura publisher (com spool em disco para quedas do broker)
+            publisher = PublisherMensagem(
+                configurador,
+                caminho_spool=config.get_spool_path(self.nome),
+                max_bytes_spool=config.SPOOL_MAX_MB * 1024 * 1024
+            )
+            if not publisher.conectar():
+                raise ErroCliente("Falha ao conectar publisher")
+
+            # Configura consumer
+            consumer = ConsumerMensagem(configurador, self.nome)
+            if not consumer.conectar():
+                raise ErroCliente("Falha ao conectar consumer")
+
+            consumer.definir_callback_mensagem(self._on_mensagem_broker)
+            consumer.definir_callback_backlog(lambda mensagens: self._emitir('backlog', mensagens))
+            consumer.definir_callback_localizacao_lote(lambda lote: self._emitir('localizacoes', lote))
+
+            if not consumer.iniciar_consumo():
+                raise ErroCliente("Falha ao iniciar consumo")
+        except BaseException:
+            _fechar_broker(consumer, publisher, configurador)
+            raise
+
+        self.configurador_rabbitmq, self.publisher, self.consumer = configurador, publisher, consumer
+
+    def desconectar_broker(self):
+        """Fecha consumer, publisher e configurador do RabbitMQ (bloqueia)"""
+        consumer, publisher, configurador = self.consumer, self.publisher, self.configurador_rabbitmq
+        self.consumer = self.publisher = self.configurador_rabbitmq = None
+        _fechar_broker(consumer, publisher, configurador)
+
+    def _on_mensagem_broker(self, dados: dict):
+        """Mensagem assíncrona consumida da fila do usuário"""
+        self._emitir('mensagem', {'remetente': dados['remetente'], 'conteudo': dados['conteudo'],
+                                  'tipo': f"Assíncrona ({dados.get('motivo', 'desconhecido')})",
+                                  'timestamp': dados.get('timestamp')})
+
+
+def _fechar_broker(consumer, publisher, configurador):
+    """Fecha consumer, publisher e configurador, nesta ordem"""
+    for componente in (consumer, publisher, configurador):
+        if componente is None:
+            continue
+        try:
+            componente.desconectar()
+        except Exception as e:
+            print(f"Erro ao desconectar RabbitMQ: {e}")
+
+
+def _encadear(futuro: Future, transformar: Callable) -> Future:
+    """Future com transformar(resultado) do original (as exceções passam direto)"""
+    derivado = Future()
+
+    def concluido(original: Future):
+        erro = original.exception()
+        if erro is not None:
+            derivado.set_exception(erro)
+            return
+        try:
+            derivado.set_result(transformar(original.result()))
+        except Exception as e:
+            derivado.set_exception(e)
+
+    futuro.add_done_callback(concluido)
+    return derivado
@@ -0,0 +1,161 @@
+import selectors
+import socket
+import threading
+from collections import deque
+from typing import Callable, Optional
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.protocolo import DecodificadorFrames, ErroProtocolo, decodificar_mensagem
+
+
+class LacoRecebimento:
+    """
+    Uma thread que recebe de muitas conexões de clientes (selectors)
+
+    ESCALA: Com uma thread de recebimento por cliente, milhares de clientes
+    simulados num processo (bots, testes de carga) viram milhares de
+    threads paradas em recv(). Aqui todas as conexões ficam num único
+    seletor (epoll/kqueue quando disponíveis): a thread só acorda quando
+    algum socket tem dados, lê o que chegou e separa os frames com um
+    DecodificadorFrames por conexão.
+
+    THREAD SAFETY: registrar() e remover() podem ser chamados de qualquer
+    thread; as mudanças são aplicadas pela própria thread do laço (acordada
+    por um socketpair), então o seletor só é usado por ela.
+
+    Os callbacks rodam na thread do laço: devem ser rápidos e não bloquear
+    (ex: resolver um Future, colocar um evento numa fila).
+    """
+
+    _padrao: Optional['LacoRecebimento'] = None
+    _lock_padrao = threading.Lock()
+
+    def __init__(self, tamanho_leitura: int = 65536):
+        """
+        Args:
+            tamanho_leitura: Quantidade máxima de bytes por chamada recv()
+        """
+        self.tamanho_leitura = tamanho_leitura
+        self._seletor = selectors.DefaultSelector()
+        self._despertador, self._sinal = socket.socketpair()
+        self._despertador.setblocking(False)
+        self._sinal.setblocking(False)
+        self._seletor.register(self._despertador, selectors.EVENT_READ, None)
+
+        self._mudancas = deque()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._conexoes = 0
+
+    @classmethod
+    def padrao(cls) -> 'LacoRecebimento':
+        """Laço compartilhado pelos clientes do processo (criado no primeiro uso)"""
+        with cls._lock_padrao:
+            if cls._padrao is None:
+                cls._padrao = cls()
+            return cls._padrao
+
+    def conexoes(self) -> int:
+        """Conexões registradas"""
+        return self._conexoes
+
+    def registrar(self, conexao: socket.socket, decodificador: DecodificadorFrames,
+                  ao_receber: Callable[[dict], None], ao_fechar: Callable[[Optional[Exception]], None]):
+        """
+        Passa a receber de uma conexão
+
+        Args:
+            conexao: Socket conectado (bloqueante; só é lido quando há dados)
+            decodificador: Decodificador da conexão (pode já ter bytes do handshake)
+            ao_receber: Chamado com cada mensagem recebida
+            ao_fechar: Chamado uma vez quando a conexão fecha (com o erro, se houve)
+        """
+        self._mudancas.append(('registrar', conexao, (decodificador, ao_receber, ao_fechar)))
+        self._garantir_thread()
+        self._acordar()
+
+    def remover(self, conexao: socket.socket):
+        """Para de receber de uma conexão (sem chamar ao_fechar)"""
+        self._mudancas.append(('remover', conexao, None))
+        self._acordar()
+
+    def _garantir_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._executar, daemon=True,
+                                                name="geochat-laco-recebimento")
+                self._thread.start()
+
+    def _acordar(self):
+        try:
+            self._sinal.send(b'\0')
+        except (BlockingIOError, InterruptedError):
+            # Buffer cheio: o laço já tem um despertar pendente
+            pass
+
+    def _aplicar_mudancas(self):
+        """Registra/remove conexões pedidas por outras threads (thread do laço)"""
+        while self._mudancas:
+            operacao, conexao, dados = self._mudancas.popleft()
+            try:
+                if operacao == 'registrar':
+                    self._seletor.register(conexao, selectors.EVENT_READ, dados)
+                    self._conexoes += 1
+                else:
+                    self._seletor.unregister(conexao)
+                    self._conexoes -= 1
+            except (KeyError, ValueError, OSError):
+                # Já removida, ou o socket foi fechado antes de registrar
+                if operacao == 'registrar':
+                    self._notificar_fechamento(dados[2], None)
+
+    def _executar(self):
+        """Laço principal"""
+        while True:
+            self._aplicar_mudancas()
+            for chave, _ in self._seletor.select(timeout=1.0):
+                if chave.data is None:
+                    try:
+                        while self._despertador.recv(4096):
+                            pass
+                    except (BlockingIOError, InterruptedError):
+                        pass
+                    continue
+                self._ler(chave)
+
+    def _ler(self, chave: selectors.SelectorKey):
+        """Lê o que chegou numa conexão e entrega as mensagens completas"""
+        conexao = chave.fileobj
+        decodificador, ao_receber, ao_fechar = chave.data
+        erro = None
+        try:
+            dados = conexao.recv(self.tamanho_leitura)
+            if dados:
+                for payload in decodificador.alimentar(dados):
+                    try:
+                        ao_receber(decodificar_mensagem(payload))
+                    except ValueError as e:
+                        print(f"Mensagem inválida recebida: {e}")
+                    except Exception as e:
+                        print(f"Erro em callback de recebimento: {e}")
+                return
+        except (OSError, ErroProtocolo) as e:
+            erro = e
+
+        # Conexão fechada pelo outro lado, resetada ou fluxo corrompido
+        try:
+            self._seletor.unregister(conexao)
+            self._conexoes -= 1
+        except (KeyError, ValueError):
+            pass
+        self._notificar_fechamento(ao_fechar, erro)
+
+    @staticmethod
+    def _notificar_fechamento(ao_fechar: Callable, erro: Optional[Exception]):
+        try:
+            ao_fechar(erro)
+        except Exception as e:
+            print(f"Erro em callback de fechamento: {e}")
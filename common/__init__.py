@@ -4,5 +4,13 @@ Módulo comum com classes e funções compartilhadas entre cliente e servidor
 
 from .usuario import Usuario, StatusUsuario, calcular_distancia_haversine
 from .config import Config, config
+from .geohash import (codificar_geohash, decodificar_geohash, codificar_inteiro,
+                      vizinhos, celulas_cobertura, precisao_para_raio, geohash_para_topico)
+from .compressao import (CompressorPayload, ErroCompressao, algoritmos_disponiveis, escolher_algoritmo,
+                         decodificar_json)
 
-__all__ = ['Usuario', 'StatusUsuario', 'calcular_distancia_haversine', 'Config', 'config']
+__all__ = ['Usuario', 'StatusUsuario', 'calcular_distancia_haversine', 'Config', 'config',
+           'codificar_geohash', 'decodificar_geohash', 'codificar_inteiro',
+           'vizinhos', 'celulas_cobertura', 'precisao_para_raio', 'geohash_para_topico',
+           'CompressorPayload', 'ErroCompressao', 'algoritmos_disponiveis', 'escolher_algoritmo',
+           'decodificar_json']
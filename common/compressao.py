@@ -0,0 +1,271 @@
+"""
+Compressão opcional de payloads: corpos de mensagens AMQP e frames do socket
+
+ACIMA DE UM LIMITE: Mensagens de chat são pequenas e não compensam a CPU;
+respostas grandes (lista_usuarios com milhares de usuários, lotes de
+mensagens longas) repetem as mesmas chaves JSON e encolhem várias vezes.
+Só payloads com pelo menos 'limite' bytes são comprimidos, e o resultado só
+é usado se ficar menor que o original.
+
+ALGORITMOS: zlib (biblioteca padrão) sempre; zstd se o pacote opcional
+'zstandard' estiver instalado. O nome do algoritmo é o mesmo no
+content_encoding do AMQP e na negociação do socket.
+
+ESTATÍSTICAS: Cada CompressorPayload conta bytes economizados e o tempo de
+CPU gasto comprimindo e descomprimindo, para decidir se vale a pena.
+"""
+
+import json
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    # zstandard não instalado, usa apenas zlib
+    zstandard = None
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.config import config
+
+ZLIB = 'zlib'
+ZSTD = 'zstd'
+
+# Limite de segurança contra payloads comprimidos maliciosos (compression bomb)
+TAMANHO_MAXIMO_DESCOMPRIMIDO = 64 * 1024 * 1024
+
+
+class ErroCompressao(ValueError):
+    """Payload com codificação desconhecida, corrompido ou grande demais"""
+
+
+def algoritmos_disponiveis() -> List[str]:
+    """Algoritmos suportados neste processo, em ordem de preferência"""
+    return [ZSTD, ZLIB] if zstandard is not None else [ZLIB]
+
+
+def escolher_algoritmo(oferecidos: Iterable[str], preferido: Optional[str] = None) -> Optional[str]:
+    """
+    Escolhe o algoritmo de uma negociação
+
+    Args:
+        oferecidos: Algoritmos que o outro lado aceita
+        preferido: Algoritmo deste lado (None: nenhuma compressão)
+
+    Returns:
+        O preferido, se o outro lado aceita; senão o primeiro disponível
+        aqui que ele aceite; None se não há algoritmo em comum
+    """
+    if preferido is None:
+        return None
+    oferecidos = set(oferecidos or ())
+    if preferido in oferecidos:
+        return preferido
+    for algoritmo in algoritmos_disponiveis():
+        if algoritmo in oferecidos:
+            return algoritmo
+    return None
+
+
+def _resolver_algoritmo(nome: Optional[str]) -> Optional[str]:
+    """Converte a configuração ('auto', 'zlib', 'zstd', 'nenhuma') no algoritmo usado"""
+    if not nome or nome == 'nenhuma':
+        return None
+    if nome == 'auto':
+        return algoritmos_disponiveis()[0]
+    if nome == ZSTD and zstandard is None:
+        print("Aviso: compressão zstd pedida, mas o pacote 'zstandard' não está instalado; usando zlib")
+        return ZLIB
+    if nome not in (ZLIB, ZSTD):
+        raise ValueError(f"Algoritmo de compressão desconhecido: {nome}")
+    return nome
+
+
+class CompressorPayload:
+    """
+    Comprime e descomprime payloads, com estatísticas de ganho e custo
+
+    Thread safe: pode ser compartilhado por todas as conexões de um servidor.
+    """
+
+    def __init__(self, algoritmo: Optional[str] = config.COMPRESSAO,
+                 limite: int = config.COMPRESSAO_LIMITE_BYTES, nivel_zlib: int = 1,
+                 nivel_zstd: int = 3):
+        """
+        Inicializa o compressor
+
+        Args:
+            algoritmo: 'auto' (zstd se disponível, senão zlib), 'zlib', 'zstd'
+                       ou 'nenhuma'/None (só descomprime)
+            limite: Tamanho mínimo (bytes) para tentar comprimir
+            nivel_zlib: Nível do zlib (1 = rápido, 9 = menor). DECISÃO: 1 por
+                        padrão; numa listagem de 10k usuários o nível 6
+                        economiza só ~4% a mais com quase 3x a CPU
+            nivel_zstd: Nível do zstd
+        """
+        self.algoritmo = _resolver_algoritmo(algoritmo)
+        self.limite = limite
+        self.nivel_zlib = nivel_zlib
+        self.nivel_zstd = nivel_zstd
+
+        self._lock = threading.Lock()
+        self._total_comprimidos = 0
+        self._total_sem_ganho = 0
+        self._total_descomprimidos = 0
+        self._bytes_originais = 0
+        self._bytes_comprimidos = 0
+        self._cpu_compressao = 0.0
+        self._cpu_descompressao = 0.0
+
+    @property
+    def ativo(self) -> bool:
+        """Se este lado comprime (senão só descomprime)"""
+        return self.algoritmo is not None
+
+    def comprimir(self, dados: bytes, algoritmo: Optional[str] = ...) -> Tuple[bytes, Optional[str]]:
+        """
+        Comprime um payload, se valer a pena
+
+        Args:
+            dados: Payload original
+            algoritmo: Algoritmo a usar (padrão: o do compressor; None não comprime),
+                       ex: o negociado com uma conexão
+
+        Returns:
+            Tupla (payload, algoritmo usado ou None se foi mantido como está)
+        """
+        if algoritmo is ...:
+            algoritmo = self.algoritmo
+        if algoritmo is None or len(dados) < self.limite:
+            return dados, None
+
+        inicio = time.thread_time()
+        if algoritmo == ZSTD:
+            comprimido = zstandard.ZstdCompressor(level=self.nivel_zstd).compress(dados)
+        else:
+            comprimido = zlib.compress(dados, self.nivel_zlib)
+        cpu = time.thread_time() - inicio
+
+        with self._lock:
+            self._cpu_compressao += cpu
+            if len(comprimido) >= len(dados):
+                self._total_sem_ganho += 1
+                return dados, None
+            self._total_comprimidos += 1
+            self._bytes_originais += len(dados)
+            self._bytes_comprimidos += len(comprimido)
+        return comprimido, algoritmo
+
+    def descomprimir(self, dados: bytes, codificacao: Optional[str]) -> bytes:
+        """
+        Desfaz comprimir()
+
+        Args:
+            dados: Payload recebido
+            codificacao: Algoritmo indicado pelo remetente (None: não comprimido)
+
+        Raises:
+            ErroCompressao: Codificação desconhecida, dados corrompidos ou
+                            resultado acima de TAMANHO_MAXIMO_DESCOMPRIMIDO
+        """
+        if not codificacao:
+            return dados
+
+        inicio = time.thread_time()
+        original = descomprimir(dados, codificacao)
+        cpu = time.thread_time() - inicio
+
+        with self._lock:
+            self._total_descomprimidos += 1
+            self._cpu_descompressao += cpu
+        return original
+
+    def obter_metricas(self) -> Dict[str, float]:
+        """
+        Retorna o ganho e o custo da compressão
+
+        Returns:
+            Dicionário com algoritmo, limite, payloads comprimidos (e os que
+            não encolheram), bytes antes/depois, bytes economizados, razão de
+            compressão, CPU (ms) gasta comprimindo e descomprimindo e KB
+            economizados por ms de CPU de compressão
+        """
+        with self._lock:
+            economizados = self._bytes_originais - self._bytes_comprimidos
+            cpu_ms = self._cpu_compressao * 1000
+            return {
+                'algoritmo': self.algoritmo or 'nenhuma',
+                'limite_bytes': self.limite,
+                'comprimidos': self._total_comprimidos,
+                'sem_ganho': self._total_sem_ganho,
+                'descomprimidos': self._total_descomprimidos,
+                'bytes_originais': self._bytes_originais,
+                'bytes_comprimidos': self._bytes_comprimidos,
+                'bytes_economizados': economizados,
+                'razao': (self._bytes_originais / self._bytes_comprimidos
+                          if self._bytes_comprimidos else 0.0),
+                'cpu_compressao_ms': cpu_ms,
+                'cpu_descompressao_ms': self._cpu_descompressao * 1000,
+                'kb_economizados_por_ms_cpu': (economizados / 1024 / cpu_ms) if cpu_ms else 0.0,
+            }
+
+
+def descomprimir(dados: bytes, codificacao: Optional[str]) -> bytes:
+    """
+    Descomprime um payload sem contabilizar estatísticas
+
+    Raises:
+        ErroCompressao: Codificação desconhecida, dados corrompidos ou
+                        resultado acima de TAMANHO_MAXIMO_DESCOMPRIMIDO
+    """
+    if not codificacao:
+        return dados
+    try:
+        if codificacao == ZLIB:
+            descompressor = zlib.decompressobj()
+            original = descompressor.decompress(dados, TAMANHO_MAXIMO_DESCOMPRIMIDO)
+            if descompressor.unconsumed_tail:
+                raise ErroCompressao("Payload descomprimido excede o limite")
+            return original
+        if codificacao == ZSTD:
+            if zstandard is None:
+                raise ErroCompressao("Payload zstd recebido, mas o pacote 'zstandard' não está instalado")
+            tamanho = zstandard.frame_content_size(dados)
+            if tamanho > TAMANHO_MAXIMO_DESCOMPRIMIDO:
+                raise ErroCompressao("Payload descomprimido excede o limite")
+            return zstandard.ZstdDecompressor().decompress(
+                dados, max_output_size=TAMANHO_MAXIMO_DESCOMPRIMIDO
+            )
+    except ErroCompressao:
+        raise
+    except Exception as e:
+        raise ErroCompressao(f"Payload {codificacao} inválido: {e}") from e
+    raise ErroCompressao(f"Codificação desconhecida: {codificacao}")
+
+
+def decodificar_json(dados: bytes, codificacao: Optional[str] = None,
+                     compressor: Optional[CompressorPayload] = None):
+    """
+    Desserializa um payload JSON, descomprimindo-o antes se preciso
+
+    Args:
+        dados: Payload recebido (ex: corpo de uma mensagem AMQP)
+        codificacao: content_encoding da mensagem; valores que não são de
+                     compressão (ex: 'utf-8') são ignorados
+        compressor: Compressor que contabiliza a descompressão (opcional)
+
+    Raises:
+        ValueError: JSON inválido ou payload comprimido corrompido
+                    (ErroCompressao)
+    """
+    if codificacao in (ZLIB, ZSTD):
+        if compressor is not None:
+            dados = compressor.descomprimir(dados, codificacao)
+        else:
+            dados = descomprimir(dados, codificacao)
+    return json.loads(dados.decode('utf-8'))
@@ -2,7 +2,9 @@
 Módulo de configuração para carregar variáveis de ambiente
 """
 
+import hashlib
 import os
+import re
 from typing import Optional
 
 try:
@@ -23,9 +25,42 @@ class Config:
     RABBITMQ_PASS = os.getenv('RABBITMQ_PASS', 'geochat123')
     RABBITMQ_MANAGEMENT_PORT = int(os.getenv('RABBITMQ_MANAGEMENT_PORT', '15672'))
     
+    # Broker: 'rabbitmq' (servidor real) ou 'memoria' (no processo, sem rede)
+    BROKER_BACKEND = os.getenv('GEOCHAT_BROKER', 'rabbitmq')
+    
+    # Tipo da fila de mensagens de cada usuário: 'classica', 'lazy'
+    # (mensagens vão direto para o disco) ou 'quorum' (replicada no cluster)
+    TIPO_FILA_MENSAGENS = os.getenv('GEOCHAT_TIPO_FILA', 'classica')
+    
+    # Spool de mensagens assíncronas enviadas com o broker fora do ar
+    SPOOL_DIR = os.getenv('GEOCHAT_SPOOL_DIR', os.path.join(os.path.expanduser('~'), '.geochat'))
+    SPOOL_MAX_MB = int(os.getenv('GEOCHAT_SPOOL_MAX_MB', '64'))
+    
     # Servidor Socket
     SOCKET_HOST = os.getenv('SOCKET_HOST', 'localhost')
     SOCKET_PORT = int(os.getenv('SOCKET_PORT', '8888'))
+    # Tempo máximo (s) para conectar e receber a resposta do handshake
+    SOCKET_TIMEOUT_CONEXAO = float(os.getenv('GEOCHAT_TIMEOUT_CONEXAO', '10'))
+    
+    # Gateway do broker: o servidor consome as filas dos usuários conectados
+    # e entrega as mensagens assíncronas pelo socket (clientes sem AMQP)
+    GATEWAY_BROKER = os.getenv('GEOCHAT_GATEWAY', '0').lower() in ('1', 'true', 'sim')
+    
+    # Compressão de payloads grandes (corpos AMQP e frames do socket):
+    # 'auto' (zstd se instalado, senão zlib), 'zlib', 'zstd' ou 'nenhuma'
+    COMPRESSAO = os.getenv('GEOCHAT_COMPRESSAO', 'auto')
+    COMPRESSAO_LIMITE_BYTES = int(os.getenv('GEOCHAT_COMPRESSAO_LIMITE', '1024'))
+    
+    # Métricas do broker: porta do endpoint HTTP (JSON) do servidor (0 desliga)
+    # e intervalo (s) da amostragem da profundidade das filas
+    METRICAS_PORTA = int(os.getenv('GEOCHAT_METRICAS_PORTA', '0'))
+    METRICAS_INTERVALO_FILAS = float(os.getenv('GEOCHAT_METRICAS_INTERVALO', '5'))
+    
+    # Histórico do chat e do log nas GUIs: linhas mantidas no widget (e em
+    # memória); as mais antigas vão para um arquivo temporário em
+    # HISTORICO_DIR (vazio: diretório temporário do sistema)
+    HISTORICO_MAX_LINHAS = int(os.getenv('GEOCHAT_HISTORICO_LINHAS', '5000'))
+    HISTORICO_DIR = os.getenv('GEOCHAT_HISTORICO_DIR', '')
     
     # Localização padrão
     DEFAULT_LATITUDE = float(os.getenv('DEFAULT_LATITUDE', '-23.5505'))
@@ -47,6 +82,27 @@ class Config:
         """Retorna tupla (host, porta) para socket"""
         return (cls.SOCKET_HOST, cls.SOCKET_PORT)
     
+    @classmethod
+    def get_spool_path(cls, nome: str, servidor: bool = False) -> str:
+        """
+        Retorna o arquivo do spool de queda do broker para um usuário ou servidor
+        
+        SEGURANÇA: O nome vem do usuário; caracteres fora de [A-Za-z0-9_-]
+        viram '_' (nada de '/' ou '..' saindo de SPOOL_DIR) e, se algum foi
+        trocado, um hash do nome original evita que dois nomes diferentes
+        caiam no mesmo arquivo. Nomes já seguros mantêm o arquivo de antes.
+        
+        Args:
+            nome: Nome do usuário (ou do componente do servidor)
+            servidor: Se True, usa o subdiretório 'servidor', que nenhum
+                      nome de usuário alcança
+        """
+        seguro = re.sub(r'[^A-Za-z0-9_-]', '_', nome)
+        if seguro != nome or not seguro:
+            seguro += '-' + hashlib.sha1(nome.encode('utf-8')).hexdigest()[:12]
+        diretorio = os.path.join(cls.SPOOL_DIR, 'servidor') if servidor else cls.SPOOL_DIR
+        return os.path.join(diretorio, f"spool_{seguro}.jsonl")
+    
     @classmethod
     def get_default_location(cls) -> tuple:
         """Retorna tupla (latitude, longitude) padrão"""
@@ -56,7 +112,15 @@ class Config:
     def print_config(cls):
         """Imprime configurações atuais (sem senhas)"""
         print("🔧 Configurações atuais:")
-        print(f"   Socket: {cls.SOCKET_HOST}:{cls.SOCKET_PORT}")
+        print(f"   Socket: {cls.SOCKET_HOST}:{cls.SOCKET_PORT} (timeout de conexão {cls.SOCKET_TIMEOUT_CONEXAO:.0f}s)")
+        print(f"   Gateway do broker no servidor: {'sim' if cls.GATEWAY_BROKER else 'não'}")
+        print(f"   Broker: {cls.BROKER_BACKEND}")
+        print(f"   Tipo das filas de mensagens: {cls.TIPO_FILA_MENSAGENS}")
+        print(f"   Compressão: {cls.COMPRESSAO} (acima de {cls.COMPRESSAO_LIMITE_BYTES} bytes)")
+        print(f"   Endpoint de métricas: "
+              f"{f'porta {cls.METRICAS_PORTA}' if cls.METRICAS_PORTA else 'desligado'}")
+        print(f"   Histórico nas GUIs: {cls.HISTORICO_MAX_LINHAS} linhas na tela")
+        print(f"   Spool de queda: {cls.SPOOL_DIR} (máx. {cls.SPOOL_MAX_MB} MB por usuário)")
         print(f"   RabbitMQ: {cls.RABBITMQ_HOST}:{cls.RABBITMQ_PORT}")
         print(f"   RabbitMQ User: {cls.RABBITMQ_USER}")
         print(f"   Management UI: {cls.get_rabbitmq_management_url()}")
@@ -0,0 +1,308 @@
+"""
+Módulo de indexação espacial baseada em geohash
+
+CHAVE ESPACIAL COMPARTILHADA: Servidor, broker e análises usam a mesma
+célula geohash para agrupar usuários próximos, evitando recalcular a
+distância Haversine entre todos os pares de usuários.
+
+REPRESENTAÇÃO: Cada célula pode ser representada de duas formas:
+1. String base32 (ex: '6gycfq') - legível e usada como routing key
+2. Inteiro com bits intercalados (Morton) - comparação e prefixo baratos
+"""
+
+import math
+from typing import Set, Tuple
+
+# Alfabeto base32 do geohash (sem 'a', 'i', 'l', 'o')
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_DECODIFICACAO_BASE32 = {caractere: indice for indice, caractere in enumerate(BASE32)}
+
+PRECISAO_MINIMA = 1
+PRECISAO_MAXIMA = 12
+
+# Metros por grau de latitude (aproximação esférica, consistente com Haversine)
+METROS_POR_GRAU = 111320.0
+
+
+def _espalhar_bits(valor: int) -> int:
+    """Intercala zeros entre os bits de um inteiro de até 32 bits"""
+    valor &= 0xFFFFFFFF
+    valor = (valor | (valor << 16)) & 0x0000FFFF0000FFFF
+    valor = (valor | (valor << 8)) & 0x00FF00FF00FF00FF
+    valor = (valor | (valor << 4)) & 0x0F0F0F0F0F0F0F0F
+    valor = (valor | (valor << 2)) & 0x3333333333333333
+    valor = (valor | (valor << 1)) & 0x5555555555555555
+    return valor
+
+
+def _compactar_bits(valor: int) -> int:
+    """Operação inversa de _espalhar_bits (extrai os bits de posição par)"""
+    valor &= 0x5555555555555555
+    valor = (valor | (valor >> 1)) & 0x3333333333333333
+    valor = (valor | (valor >> 2)) & 0x0F0F0F0F0F0F0F0F
+    valor = (valor | (valor >> 4)) & 0x00FF00FF00FF00FF
+    valor = (valor | (valor >> 8)) & 0x0000FFFF0000FFFF
+    valor = (valor | (valor >> 16)) & 0x00000000FFFFFFFF
+    return valor
+
+
+def _bits_por_eixo(precisao: int) -> Tuple[int, int]:
+    """
+    Retorna quantos bits cada eixo recebe em uma precisão
+
+    Returns:
+        Tupla (bits_latitude, bits_longitude). A longitude recebe o bit
+        extra quando o total (5 * precisao) é ímpar, como no geohash padrão.
+    """
+    total = 5 * precisao
+    return total // 2, (total + 1) // 2
+
+
+def _validar_precisao(precisao: int) -> None:
+    """Garante que a precisão está no intervalo suportado"""
+    if not PRECISAO_MINIMA <= precisao <= PRECISAO_MAXIMA:
+        raise ValueError(f"Precisão deve estar entre {PRECISAO_MINIMA} e {PRECISAO_MAXIMA}")
+
+
+def _quantizar(valor: float, minimo: float, maximo: float, bits: int) -> int:
+    """Converte uma coordenada em índice inteiro da grade com 2^bits divisões"""
+    divisoes = 1 << bits
+    indice = int((valor - minimo) / (maximo - minimo) * divisoes)
+    return min(max(indice, 0), divisoes - 1)
+
+
+def codificar_inteiro(latitude: float, longitude: float, precisao: int = 9) -> int:
+    """
+    Codifica uma posição em chave inteira com bits intercalados
+
+    BITS INTERCALADOS (ordem Morton): O bit mais significativo é de longitude,
+    o seguinte de latitude, e assim por diante. Células vizinhas em uma
+    precisão compartilham o mesmo prefixo de bits, então comparar células
+    em precisões menores é um simples deslocamento (ver mesma_celula).
+
+    Args:
+        latitude: Latitude em graus (-90 a 90)
+        longitude: Longitude em graus (-180 a 180)
+        precisao: Número de caracteres geohash equivalentes (1 a 12)
+
+    Returns:
+        Inteiro com 5 * precisao bits
+    """
+    _validar_precisao(precisao)
+    bits_lat, bits_lon = _bits_por_eixo(precisao)
+
+    indice_lat = _quantizar(latitude, -90.0, 90.0, bits_lat)
+    indice_lon = _quantizar(longitude, -180.0, 180.0, bits_lon)
+    return _intercalar(indice_lat, indice_lon, bits_lat, bits_lon)
+
+
+def _intercalar(indice_lat: int, indice_lon: int, bits_lat: int, bits_lon: int) -> int:
+    """Monta a chave Morton a partir dos índices da grade"""
+    # Com total ímpar a longitude ocupa as posições pares (incluindo a mais alta);
+    # com total par a latitude fica nas posições pares e a longitude nas ímpares
+    if bits_lon > bits_lat:
+        return _espalhar_bits(indice_lon) | (_espalhar_bits(indice_lat) << 1)
+    return (_espalhar_bits(indice_lon) << 1) | _espalhar_bits(indice_lat)
+
+
+def _indices_de_inteiro(chave: int, precisao: int) -> Tuple[int, int]:
+    """Extrai os índices (latitude, longitude) da grade a partir da chave inteira"""
+    bits_lat, bits_lon = _bits_por_eixo(precisao)
+    if bits_lon > bits_lat:
+        return _compactar_bits(chave >> 1), _compactar_bits(chave)
+    return _compactar_bits(chave), _compactar_bits(chave >> 1)
+
+
+def inteiro_para_geohash(chave: int, precisao: int) -> str:
+    """Converte chave inteira em string geohash base32"""
+    _validar_precisao(precisao)
+    caracteres = []
+    for deslocamento in range(5 * (precisao - 1), -1, -5):
+        caracteres.append(BASE32[(chave >> deslocamento) & 0x1F])
+    return ''.join(caracteres)
+
+
+def geohash_para_inteiro(geohash: str) -> int:
+    """
+    Converte string geohash base32 em chave inteira
+
+    Raises:
+        ValueError: Se a string contém caracteres fora do alfabeto geohash
+    """
+    _validar_precisao(len(geohash))
+    chave = 0
+    for caractere in geohash:
+        try:
+            chave = (chave << 5) | _DECODIFICACAO_BASE32[caractere]
+        except KeyError:
+            raise ValueError(f"Caractere inválido no geohash: {caractere!r}")
+    return chave
+
+
+def codificar_geohash(latitude: float, longitude: float, precisao: int = 9) -> str:
+    """
+    Codifica uma posição em string geohash
+
+    Args:
+        latitude: Latitude em graus
+        longitude: Longitude em graus
+        precisao: Número de caracteres (1 a 12)
+
+    Returns:
+        String geohash base32
+    """
+    return inteiro_para_geohash(codificar_inteiro(latitude, longitude, precisao), precisao)
+
+
+def geohash_para_topico(geohash: str) -> str:
+    """
+    Converte geohash em routing key de topic exchange ('6gycf' -> '6.g.y.c.f')
+
+    Cada caractere vira uma palavra, então um binding com prefixo e '#'
+    (ex: '6.g.y.#') recebe tudo o que é publicado nas células internas.
+    """
+    return '.'.join(geohash)
+
+
+def dimensoes_celula(precisao: int) -> Tuple[float, float]:
+    """
+    Retorna as dimensões de uma célula em graus
+
+    Returns:
+        Tupla (altura_graus_latitude, largura_graus_longitude)
+    """
+    _validar_precisao(precisao)
+    bits_lat, bits_lon = _bits_por_eixo(precisao)
+    return 180.0 / (1 << bits_lat), 360.0 / (1 << bits_lon)
+
+
+def limites_celula(geohash: str) -> Tuple[float, float, float, float]:
+    """
+    Retorna os limites geográficos de uma célula
+
+    Returns:
+        Tupla (lat_min, lat_max, lon_min, lon_max)
+    """
+    precisao = len(geohash)
+    indice_lat, indice_lon = _indices_de_inteiro(geohash_para_inteiro(geohash), precisao)
+    altura, largura = dimensoes_celula(precisao)
+    lat_min = -90.0 + indice_lat * altura
+    lon_min = -180.0 + indice_lon * largura
+    return lat_min, lat_min + altura, lon_min, lon_min + largura
+
+
+def decodificar_geohash(geohash: str) -> Tuple[float, float]:
+    """Retorna o centro (latitude, longitude) de uma célula geohash"""
+    lat_min, lat_max, lon_min, lon_max = limites_celula(geohash)
+    return (lat_min + lat_max) / 2, (lon_min + lon_max) / 2
+
+
+def mesma_celula(chave_a: int, chave_b: int, precisao_chaves: int, precisao: int) -> bool:
+    """
+    Verifica se duas chaves inteiras caem na mesma célula em uma precisão menor
+
+    COMPARAÇÃO BARATA: Como os bits são intercalados, basta comparar os
+    prefixos - sem trigonometria e sem decodificar coordenadas.
+
+    Args:
+        chave_a, chave_b: Chaves inteiras codificadas em precisao_chaves
+        precisao_chaves: Precisão em que as chaves foram codificadas
+        precisao: Precisão (menor ou igual) em que comparar
+    """
+    deslocamento = 5 * (precisao_chaves - precisao)
+    return (chave_a >> deslocamento) == (chave_b >> deslocamento)
+
+
+def _deslocamento_graus(latitude: float, raio: float) -> Tuple[float, float]:
+    """Converte um raio em metros para deslocamentos (dlat, dlon) em graus"""
+    dlat = raio / METROS_POR_GRAU
+    # Perto dos polos o cosseno tende a zero; limita para não explodir o dlon
+    cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+    dlon = raio / (METROS_POR_GRAU * cos_lat)
+    return dlat, min(dlon, 360.0)
+
+
+def precisao_para_raio(raio: float, latitude: float = 0.0) -> int:
+    """
+    Escolhe a maior precisão cujas células não são menores que o raio
+
+    DECISÃO: Com células pelo menos do tamanho do raio, qualquer ponto
+    dentro do raio está na célula central ou em uma vizinha imediata,
+    então a cobertura tem no máximo 3x3 células.
+
+    Args:
+        raio: Raio de comunicação em metros
+        latitude: Latitude de referência (células estreitam perto dos polos)
+
+    Returns:
+        Precisão entre PRECISAO_MINIMA e PRECISAO_MAXIMA
+    """
+    dlat, dlon = _deslocamento_graus(latitude, raio)
+    for precisao in range(PRECISAO_MAXIMA, PRECISAO_MINIMA - 1, -1):
+        altura, largura = dimensoes_celula(precisao)
+        if altura >= dlat and largura >= dlon:
+            return precisao
+    return PRECISAO_MINIMA
+
+
+def vizinhos(geohash: str) -> Set[str]:
+    """
+    Retorna as (até) 8 células vizinhas de uma célula
+
+    Células além dos polos são omitidas; a longitude dá a volta no
+    antimeridiano.
+    """
+    precisao = len(geohash)
+    lat_centro, lon_centro = decodificar_geohash(geohash)
+    altura, largura = dimensoes_celula(precisao)
+
+    resultado = set()
+    for passo_lat in (-1, 0, 1):
+        lat = lat_centro + passo_lat * altura
+        if lat <= -90.0 or lat >= 90.0:
+            continue
+        for passo_lon in (-1, 0, 1):
+            if passo_lat == 0 and passo_lon == 0:
+                continue
+            lon = (lon_centro + passo_lon * largura + 180.0) % 360.0 - 180.0
+            resultado.add(codificar_geohash(lat, lon, precisao))
+    return resultado
+
+
+def celulas_cobertura(latitude: float, longitude: float, raio: float,
+                      precisao: int = None) -> Set[str]:
+    """
+    Retorna o conjunto de células que cobre um círculo de raio dado
+
+    Args:
+        latitude, longitude: Centro do círculo
+        raio: Raio em metros
+        precisao: Precisão das células (padrão: precisao_para_raio)
+
+    Returns:
+        Conjunto de geohashes cuja união contém o círculo
+    """
+    if precisao is None:
+        precisao = precisao_para_raio(raio, latitude)
+    _validar_precisao(precisao)
+
+    dlat, dlon = _deslocamento_graus(latitude, raio)
+    altura, largura = dimensoes_celula(precisao)
+    bits_lat, bits_lon = _bits_por_eixo(precisao)
+    divisoes_lon = 1 << bits_lon
+
+    # Percorre a grade de índices da caixa envolvente do círculo
+    lat_inicio = _quantizar(latitude - dlat, -90.0, 90.0, bits_lat)
+    lat_fim = _quantizar(latitude + dlat, -90.0, 90.0, bits_lat)
+    lon_inicio = math.floor((longitude - dlon + 180.0) / largura)
+    lon_fim = math.floor((longitude + dlon + 180.0) / largura)
+    if lon_fim - lon_inicio + 1 >= divisoes_lon:
+        lon_inicio, lon_fim = 0, divisoes_lon - 1
+
+    celulas = set()
+    for indice_lat in range(lat_inicio, lat_fim + 1):
+        for indice_lon in range(lon_inicio, lon_fim + 1):
+            chave = _intercalar(indice_lat, indice_lon % divisoes_lon, bits_lat, bits_lon)
+            celulas.add(inteiro_para_geohash(chave, precisao))
+    return celulas
+
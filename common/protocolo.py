@@ -0,0 +1,206 @@
+"""
+Enquadramento (framing) das mensagens trocadas via socket TCP
+
+FRAMES COM PREFIXO DE TAMANHO: TCP é um fluxo de bytes, então uma única
+chamada recv() pode trazer meia mensagem ou várias mensagens juntas.
+Cada mensagem é enviada como 4 bytes (big-endian) com o tamanho do
+payload, seguidos do payload JSON em UTF-8. Isso permite respostas
+grandes (listagens com milhares de usuários) e rajadas de mensagens.
+
+COMPRESSÃO: Os 2 bits mais altos do cabeçalho indicam o algoritmo do
+payload (0 = sem compressão, 1 = zlib, 2 = zstd); os 30 restantes, o
+tamanho. Quem não negociou compressão nunca liga esses bits, então o
+formato continua igual para clientes antigos. Só se comprime depois que
+os dois lados concordaram no algoritmo (mensagem 'conectar').
+"""
+
+import json
+import socket
+import struct
+from typing import List, Optional, Tuple
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.compressao import ZLIB, ZSTD, CompressorPayload, ErroCompressao, descomprimir
+
+# Cabeçalho: inteiro sem sinal de 32 bits com o algoritmo e o tamanho do payload
+_CABECALHO = struct.Struct('!I')
+_BITS_TAMANHO = 30
+_MASCARA_TAMANHO = (1 << _BITS_TAMANHO) - 1
+_CODIGOS_ALGORITMO = {None: 0, ZLIB: 1, ZSTD: 2}
+_ALGORITMOS_CODIGO = {codigo: nome for nome, codigo in _CODIGOS_ALGORITMO.items()}
+
+# Limite de segurança contra frames corrompidos ou maliciosos
+TAMANHO_MAXIMO_FRAME = 64 * 1024 * 1024
+
+
+class ErroProtocolo(Exception):
+    """Erro de enquadramento no fluxo de mensagens"""
+
+
+def codificar_frame(payload: bytes, compressor: Optional[CompressorPayload] = None,
+                    algoritmo: Optional[str] = None) -> bytes:
+    """
+    Prefixa o payload com seu tamanho
+
+    Args:
+        payload: JSON já codificado
+        compressor: Compressor usado se houver algoritmo negociado
+        algoritmo: Algoritmo negociado com o outro lado (None: sem compressão)
+    """
+    usado = None
+    if compressor is not None and algoritmo is not None:
+        payload, usado = compressor.comprimir(payload, algoritmo)
+    return _CABECALHO.pack(len(payload) | _CODIGOS_ALGORITMO[usado] << _BITS_TAMANHO) + payload
+
+
+def codificar_mensagem(mensagem: dict, compressor: Optional[CompressorPayload] = None,
+                       algoritmo: Optional[str] = None) -> bytes:
+    """Serializa um dicionário em frame pronto para envio"""
+    return codificar_frame(json.dumps(mensagem).encode('utf-8'), compressor, algoritmo)
+
+
+def decodificar_mensagem(payload: bytes) -> dict:
+    """Desserializa o payload de um frame"""
+    return json.loads(payload.decode('utf-8'))
+
+
+def _ler_cabecalho(buffer: bytearray, inicio: int = 0) -> Tuple[int, Optional[str]]:
+    """
+    Interpreta o cabeçalho que começa em 'inicio' no buffer
+
+    Returns:
+        Tupla (tamanho do payload, algoritmo de compressão ou None)
+
+    Raises:
+        ErroProtocolo: Tamanho acima do limite ou código de algoritmo inválido
+    """
+    (cabecalho,) = _CABECALHO.unpack_from(buffer, inicio)
+    tamanho = cabecalho & _MASCARA_TAMANHO
+    codigo = cabecalho >> _BITS_TAMANHO
+    if tamanho > TAMANHO_MAXIMO_FRAME:
+        raise ErroProtocolo(f"Frame de {tamanho} bytes excede o limite")
+    if codigo not in _ALGORITMOS_CODIGO:
+        raise ErroProtocolo(f"Código de compressão {codigo} desconhecido")
+    return tamanho, _ALGORITMOS_CODIGO[codigo]
+
+
+def _abrir_payload(payload: bytes, algoritmo: Optional[str],
+                   compressor: Optional[CompressorPayload]) -> bytes:
+    """Descomprime o payload de um frame, se ele veio comprimido"""
+    if algoritmo is None:
+        return payload
+    try:
+        if compressor is not None:
+            return compressor.descomprimir(payload, algoritmo)
+        return descomprimir(payload, algoritmo)
+    except ErroCompressao as e:
+        raise ErroProtocolo(str(e)) from e
+
+
+class LeitorFrames:
+    """
+    Lê frames completos de um socket, acumulando bytes parciais
+
+    Cada conexão deve ter seu próprio leitor, usado por uma única thread.
+    Payloads comprimidos são descomprimidos de forma transparente.
+    """
+
+    def __init__(self, conexao: socket.socket, tamanho_leitura: int = 65536,
+                 compressor: Optional[CompressorPayload] = None):
+        """
+        Inicializa o leitor
+
+        Args:
+            conexao: Socket conectado
+            tamanho_leitura: Quantidade máxima de bytes por chamada recv()
+            compressor: Compressor que contabiliza as descompressões (opcional)
+        """
+        self.conexao = conexao
+        self.tamanho_leitura = tamanho_leitura
+        self.compressor = compressor
+        self._buffer = bytearray()
+
+    def receber_frame(self) -> Optional[bytes]:
+        """
+        Bloqueia até um frame completo chegar
+
+        Returns:
+            Payload do frame, ou None se a conexão foi fechada
+
+        Raises:
+            ErroProtocolo: Se o cabeçalho indica um tamanho ou algoritmo
+                           inválido, ou o payload comprimido está corrompido
+        """
+        if not self._preencher(_CABECALHO.size):
+            return None
+        tamanho, algoritmo = _ler_cabecalho(self._buffer)
+
+        if not self._preencher(_CABECALHO.size + tamanho):
+            return None
+        payload = bytes(self._buffer[_CABECALHO.size:_CABECALHO.size + tamanho])
+        del self._buffer[:_CABECALHO.size + tamanho]
+        return _abrir_payload(payload, algoritmo, self.compressor)
+
+    def receber_mensagem(self) -> Optional[dict]:
+        """Recebe e desserializa a próxima mensagem (None se a conexão fechou)"""
+        payload = self.receber_frame()
+        if payload is None:
+            return None
+        return decodificar_mensagem(payload)
+
+    def _preencher(self, quantidade: int) -> bool:
+        """Lê do socket até o buffer ter pelo menos 'quantidade' bytes"""
+        while len(self._buffer) < quantidade:
+            dados = self.conexao.recv(self.tamanho_leitura)
+            if not dados:
+                return False
+            self._buffer += dados
+        return True
+
+
+class DecodificadorFrames:
+    """
+    Separa frames de bytes recebidos aos pedaços, sem ler do socket
+
+    Para quem faz a leitura por conta própria (ex: um laço com selectors
+    atendendo muitas conexões em uma única thread): alimentar() recebe o que
+    o recv() trouxe e devolve os payloads dos frames que ficaram completos;
+    o resto fica guardado até o próximo pedaço.
+    """
+
+    def __init__(self, compressor: Optional[CompressorPayload] = None):
+        """
+        Args:
+            compressor: Compressor que contabiliza as descompressões (opcional)
+        """
+        self.compressor = compressor
+        self._buffer = bytearray()
+
+    def alimentar(self, dados: bytes) -> List[bytes]:
+        """
+        Acrescenta bytes recebidos e extrai os frames completos
+
+        Returns:
+            Payloads (já descomprimidos) na ordem de chegada
+
+        Raises:
+            ErroProtocolo: Cabeçalho inválido ou payload comprimido corrompido
+        """
+        self._buffer += dados
+        payloads = []
+        inicio = 0
+        while len(self._buffer) - inicio >= _CABECALHO.size:
+            tamanho, algoritmo = _ler_cabecalho(self._buffer, inicio)
+            fim = inicio + _CABECALHO.size + tamanho
+            if len(self._buffer) < fim:
+                break
+            payload = bytes(self._buffer[inicio + _CABECALHO.size:fim])
+            payloads.append(_abrir_payload(payload, algoritmo, self.compressor))
+            inicio = fim
+        if inicio:
+            # Um único corte por chamada, não um por frame
+            del self._buffer[:inicio]
+        return payloads
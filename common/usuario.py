@@ -1,7 +1,10 @@
+import json
 import math
 from typing import Tuple, Optional
 from enum import Enum
 
+from .geohash import codificar_geohash, codificar_inteiro, celulas_cobertura, precisao_para_raio
+
 class StatusUsuario(Enum):
     """Enum para status do usuário"""
     ONLINE = "online"
@@ -28,31 +31,48 @@ class Usuario:
         self.raio_comunicacao = raio_comunicacao
         self.status = status
         self.socket_connection = None  # Para armazenar a conexão socket quando online
+        
+        # CACHE DE SERIALIZAÇÃO: Representações prontas do usuário, refeitas
+        # apenas quando posição, raio ou status mudam (ver _invalidar_cache).
+        # Por isso os atributos acima devem ser alterados só pelos métodos atualizar_*
+        self._cache_dict: Optional[dict] = None
+        self._cache_json: Optional[bytes] = None
+        self._cache_presenca: Optional[bytes] = None
+    
+    def _invalidar_cache(self) -> None:
+        """Descarta as representações serializadas em cache"""
+        self._cache_dict = None
+        self._cache_json = None
+        self._cache_presenca = None
     
     def atualizar_localizacao(self, latitude: float, longitude: float) -> None:
         """Atualiza a localização do usuário"""
         self.latitude = latitude
         self.longitude = longitude
+        self._invalidar_cache()
     
     def atualizar_raio(self, novo_raio: float) -> None:
         """Atualiza o raio de comunicação do usuário"""
         if novo_raio > 0:
             self.raio_comunicacao = novo_raio
+            self._invalidar_cache()
         else:
             raise ValueError("Raio deve ser maior que zero")
     
     def atualizar_status(self, novo_status: StatusUsuario) -> None:
         """Atualiza o status do usuário"""
-        self.status = novo_status
+        if novo_status != self.status:
+            self.status = novo_status
+            self._invalidar_cache()
     
     def set_online(self, socket_connection=None) -> None:
         """Define o usuário como online"""
-        self.status = StatusUsuario.ONLINE
+        self.atualizar_status(StatusUsuario.ONLINE)
         self.socket_connection = socket_connection
     
     def set_offline(self) -> None:
         """Define o usuário como offline"""
-        self.status = StatusUsuario.OFFLINE
+        self.atualizar_status(StatusUsuario.OFFLINE)
         self.socket_connection = None
     
     def esta_online(self) -> bool:
@@ -108,26 +128,91 @@ class Usuario:
                 outro_usuario.esta_online() and 
                 self.esta_no_raio(outro_usuario))
     
+    def precisao_celula(self) -> int:
+        """Retorna a precisão geohash adequada ao raio de comunicação do usuário"""
+        return precisao_para_raio(self.raio_comunicacao, self.latitude)
+    
+    def celula_geohash(self, precisao: Optional[int] = None) -> str:
+        """
+        Retorna a célula geohash onde o usuário está
+        
+        Args:
+            precisao: Precisão da célula (padrão: adequada ao raio de comunicação)
+            
+        Returns:
+            String geohash da célula
+        """
+        if precisao is None:
+            precisao = self.precisao_celula()
+        return codificar_geohash(self.latitude, self.longitude, precisao)
+    
+    def chave_celula(self, precisao: int = 9) -> int:
+        """Retorna a chave inteira (bits intercalados) da posição do usuário"""
+        return codificar_inteiro(self.latitude, self.longitude, precisao)
+    
+    def celulas_vizinhanca(self, precisao: Optional[int] = None) -> set:
+        """
+        Retorna as células geohash que cobrem o raio de comunicação
+        
+        Qualquer usuário dentro do raio está em uma destas células, então
+        basta comparar chaves em vez de calcular distâncias com todos.
+        """
+        return celulas_cobertura(self.latitude, self.longitude, self.raio_comunicacao, precisao)
+    
     def to_dict(self) -> dict:
         """Converte o usuário para dicionário (útil para serialização)"""
-        return {
-            'nome': self.nome,
-            'latitude': self.latitude,
-            'longitude': self.longitude,
-            'raio_comunicacao': self.raio_comunicacao,
-            'status': self.status.value
-        }
+        if self._cache_dict is None:
+            self._cache_dict = {
+                'nome': self.nome,
+                'latitude': self.latitude,
+                'longitude': self.longitude,
+                'raio_comunicacao': self.raio_comunicacao,
+                'status': self.status.value
+            }
+        # Cópia rasa: quem recebe pode alterar o dicionário sem corromper o cache
+        return dict(self._cache_dict)
+    
+    def to_json(self) -> bytes:
+        """Retorna o JSON (UTF-8) de to_dict, codificado uma única vez por versão"""
+        if self._cache_json is None:
+            self._cache_json = json.dumps(self.to_dict()).encode('utf-8')
+        return self._cache_json
+    
+    def fragmento_presenca(self) -> bytes:
+        """
+        Retorna os campos de presença já codificados em JSON, sem as chaves
+        
+        SERIALIZAÇÃO INCREMENTAL: Listagens de usuários juntam este fragmento
+        com os campos que dependem do solicitante (distância, no_raio), sem
+        recodificar nome, posição e status de cada usuário a cada listagem.
+        
+        Returns:
+            Bytes no formato '"nome": ..., "latitude": ..., "longitude": ..., "status": ...'
+        """
+        if self._cache_presenca is None:
+            presenca = json.dumps({
+                'nome': self.nome,
+                'latitude': self.latitude,
+                'longitude': self.longitude,
+                'status': self.status.value
+            })
+            self._cache_presenca = presenca[1:-1].encode('utf-8')
+        return self._cache_presenca
     
     @classmethod
     def from_dict(cls, data: dict) -> 'Usuario':
         """Cria um usuário a partir de um dicionário"""
-        return cls(
+        usuario = cls(
             nome=data['nome'],
             latitude=data['latitude'],
             longitude=data['longitude'],
             raio_comunicacao=data.get('raio_comunicacao', 1000.0),
             status=StatusUsuario(data.get('status', 'offline'))
         )
+        # Dicionário já no formato canônico vira o cache de to_dict
+        if data.keys() == _CAMPOS_USUARIO:
+            usuario._cache_dict = dict(data)
+        return usuario
     
     def __str__(self) -> str:
         """Representação string do usuário"""
@@ -138,6 +223,9 @@ class Usuario:
         return self.__str__()
 
 
+_CAMPOS_USUARIO = {'nome', 'latitude', 'longitude', 'raio_comunicacao', 'status'}
+
+
 def calcular_distancia_haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """
     Calcula a distância entre dois pontos na Terra usando a fórmula Haversine
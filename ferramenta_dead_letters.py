@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Ferramenta para inspecionar e reprocessar as dead letters do GeoChat
+
+Uso:
+    python3 ferramenta_dead_letters.py listar [limite]
+    python3 ferramenta_dead_letters.py reprocessar [limite] [destinatario]
+    python3 ferramenta_dead_letters.py descartar
+"""
+
+import sys
+
+from broker.rabbitmq_manager import ConfiguradorRabbitMQ
+from broker.dead_letters import InspetorDeadLetters
+from common.config import config
+
+
+def listar(inspetor: InspetorDeadLetters, argumentos: list) -> bool:
+    """Mostra as primeiras dead letters sem removê-las"""
+    limite = int(argumentos[0]) if argumentos else 100
+    mensagens = inspetor.listar(limite)
+    for mensagem in mensagens:
+        print(f"[{mensagem['morta_em']}] {mensagem['exchange'] or '(padrão)'} -> "
+              f"{mensagem['routing_key']} | {mensagem['tentativas']} tentativa(s)")
+        print(f"   Erro: {mensagem['erro']}")
+        print(f"   Corpo: {mensagem['corpo'][:200]}")
+    print(f"📋 {len(mensagens)} dead letter(s) listada(s)")
+    return True
+
+
+def reprocessar(inspetor: InspetorDeadLetters, argumentos: list) -> bool:
+    """Republica dead letters na origem (opcionalmente só as de um destinatário)"""
+    limite = int(argumentos[0]) if argumentos else 100
+    destinatario = argumentos[1] if len(argumentos) > 1 else None
+    filtro = (lambda mensagem: mensagem['routing_key'] == destinatario) if destinatario else None
+    quantidade = inspetor.reprocessar(limite, filtro)
+    print(f"🔁 {quantidade} dead letter(s) reprocessada(s)")
+    return True
+
+
+def descartar(inspetor: InspetorDeadLetters, argumentos: list) -> bool:
+    """Apaga todas as dead letters"""
+    print(f"🗑️  {inspetor.descartar()} dead letter(s) descartada(s)")
+    return True
+
+
+COMANDOS = {
+    'listar': listar,
+    'reprocessar': reprocessar,
+    'descartar': descartar,
+}
+
+
+def main():
+    """Executa o comando informado na linha de comando"""
+    if len(sys.argv) < 2 or sys.argv[1] not in COMANDOS:
+        print(__doc__)
+        return False
+
+    configurador = ConfiguradorRabbitMQ(config.RABBITMQ_HOST, config.RABBITMQ_PORT,
+                                        config.RABBITMQ_USER, config.RABBITMQ_PASS)
+    if not configurador.conectar():
+        print("❌ Não foi possível conectar ao RabbitMQ")
+        return False
+
+    inspetor = InspetorDeadLetters(configurador)
+    try:
+        if not (configurador.configurar_topologia() and inspetor.conectar()):
+            return False
+        return COMANDOS[sys.argv[1]](inspetor, sys.argv[2:])
+    finally:
+        inspetor.desconectar()
+        configurador.desconectar()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,39 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
-import socket
-import json
-import threading
-import time
 from datetime import datetime
-from typing import Optional, Dict, List
+from concurrent.futures import Future
+from typing import Callable, Optional, List
 
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from common.usuario import Usuario, StatusUsuario
 from common.config import config
-from broker.rabbitmq_manager import ConfiguradorRabbitMQ, PublisherMensagem, ConsumerMensagem
+from common.compressao import CompressorPayload
+from client.cliente_geochat import ClienteGeoChat, ErroCliente
+from gui.tabela_incremental import TabelaIncremental
+from gui.fila_eventos import FilaEventosUI
+from gui.historico_texto import VisaoTextoLimitada
+from gui.trabalhador_io import TrabalhadorIO
 
 class ClienteIntegrado:
-    """Cliente integrado com comunicação síncrona (sockets) e assíncrona (RabbitMQ)"""
+    """
+    Cliente integrado com comunicação síncrona (sockets) e assíncrona (RabbitMQ)
+    
+    VISÃO: O protocolo, o roteamento Auto/Síncrono/Assíncrono e o
+    recebimento ficam no ClienteGeoChat (client/); esta classe só lê o
+    formulário, chama o cliente pelo TrabalhadorIO e mostra os eventos dele.
+    """
     
     def __init__(self):
         """Inicializa o cliente integrado"""
-        # Socket connection
-        self.socket_cliente = None
+        # Cliente sem interface (criado a cada conexão, com nome e posição do formulário)
+        self.cliente: Optional[ClienteGeoChat] = None
         self.conectado_socket = False
-        self.usuario = None
-        self.thread_recebimento_socket = None
-        
-        # RabbitMQ connection
-        self.configurador_rabbitmq = None
-        self.publisher = None
-        self.consumer = None
         self.conectado_rabbitmq = False
         
-        # Lista de usuários online e no raio
-        self.usuarios_disponiveis: List[dict] = []
+        # Compressão de frames oferecida ao servidor
+        self.compressor = CompressorPayload()
         
         # Configuração da interface
         self.root = tk.Tk()
@@ -42,6 +42,19 @@ class ClienteIntegrado:
         self.root.protocol("WM_DELETE_WINDOW", self.fechar_aplicacao)
         
         self.criar_interface()
+        
+        # Eventos das threads de rede aplicados em quadros (~60 Hz), com as
+        # linhas do chat inseridas em lote
+        self.fila_ui = FilaEventosUI(self.root)
+        self.fila_ui.registrar_texto('chat', self._inserir_texto_chat)
+        self.fila_ui.iniciar()
+        
+        # Conexões e envios rodam fora da thread do Tk; os resultados voltam
+        # pela fila_ui e só então a interface muda de estado
+        self.trabalhador_io = TrabalhadorIO(self.fila_ui)
+        self.conectando_socket = False
+        self.conectando_rabbitmq = False
+        self.fechando = False
     
     def criar_interface(self):
         """Cria a interface gráfica"""
@@ -162,6 +175,10 @@ class ClienteIntegrado:
         self.tree_usuarios.column('status', width=80)
         self.tree_usuarios.column('comunicacao', width=150)
         
+        # Linhas por nome de usuário: atualizações só tocam o que mudou
+        self.tabela_usuarios = TabelaIncremental(self.tree_usuarios)
+        self._destinatarios_combo: tuple = ()
+        
         scrollbar_users = ttk.Scrollbar(users_frame, orient=tk.VERTICAL, command=self.tree_usuarios.yview)
         self.tree_usuarios.configure(yscrollcommand=scrollbar_users.set)
         
@@ -181,6 +198,9 @@ class ClienteIntegrado:
         
         self.text_mensagens = scrolledtext.ScrolledText(chat_frame, height=15, state='disabled')
         self.text_mensagens.grid(row=0, column=0, columnspan=4, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 10))
+        # Chat limitado: mensagens antigas vão para o histórico local e
+        # voltam ao rolar para cima
+        self.visao_chat = VisaoTextoLimitada(self.text_mensagens)
         
         envio_frame = ttk.Frame(chat_frame)
         envio_frame.grid(row=1, column=0, columnspan=4, sticky=(tk.W, tk.E))
@@ -226,7 +246,14 @@ class ClienteIntegrado:
             self.desconectar_socket()
     
     def conectar_socket(self):
-        """Conecta ao servidor socket"""
+        """
+        Conecta ao servidor socket
+        
+        NÃO BLOQUEIA: ClienteGeoChat.conectar (connect, handshake e a espera
+        pela resposta, com timeout) roda no TrabalhadorIO; a interface fica
+        em "Conectando..." e muda conforme o resultado (_on_socket_conectado
+        ou _on_falha_conexao_socket).
+        """
         try:
             nome = self.entry_nome.get().strip()
             if not nome:
@@ -249,53 +276,78 @@ class ClienteIntegrado:
                 messagebox.showerror("Erro", "Localização e raio devem ser números válidos")
                 return
             
-            self.socket_cliente = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket_cliente.connect((host, porta))
-            
-            self.usuario = Usuario(nome, latitude, longitude, raio, StatusUsuario.ONLINE)
-            
-            mensagem_conexao = {
-                'tipo': 'conectar',
-                'usuario': self.usuario.to_dict()
-            }
-            self._enviar_mensagem_socket(mensagem_conexao)
-            
-            resposta = self._receber_mensagem_socket()
-            if resposta and resposta.get('tipo') == 'conexao_aceita':
-                self.conectado_socket = True
-                self._atualizar_interface_socket_conectado()
-                self._iniciar_thread_recebimento_socket()
-                self.adicionar_mensagem_sistema(f"Conectado ao servidor como {nome}")
-                self.atualizar_lista_usuarios()
-                
-                # Habilita conexão RabbitMQ
-                self.btn_conectar_rabbit.config(state="normal")
-            else:
-                erro = resposta.get('mensagem', 'Erro desconhecido') if resposta else 'Sem resposta do servidor'
-                messagebox.showerror("Erro", f"Falha na conexão: {erro}")
-                self.socket_cliente.close()
-                self.socket_cliente = None
-        
         except Exception as e:
             messagebox.showerror("Erro", f"Erro ao conectar: {str(e)}")
-            if self.socket_cliente:
-                try:
-                    self.socket_cliente.close()
-                except:
-                    pass
-                self.socket_cliente = None
+            return
+        
+        cliente = ClienteGeoChat(nome, latitude, longitude, raio, compressor=self.compressor)
+        self._registrar_callbacks(cliente)
+        
+        self.conectando_socket = True
+        self.btn_conectar_socket.config(state="disabled")
+        self.status_var.set(f"Conectando a {host}:{porta}...")
+        self.trabalhador_io.submeter('cliente', cliente.conectar, host, porta,
+                                     ao_concluir=lambda resposta: self._on_socket_conectado(cliente, resposta),
+                                     ao_falhar=self._on_falha_conexao_socket)
+    
+    def _registrar_callbacks(self, cliente: ClienteGeoChat):
+        """
+        Liga os eventos do cliente à interface
+        
+        Os callbacks rodam na thread de recebimento (ou do consumer do
+        RabbitMQ): nada toca no Tk ali, tudo vai para a fila da interface
+        (FilaEventosUI). Mensagens de chat viram texto inserido em lote por
+        quadro; de uma rajada de listas de usuários só a mais recente é
+        aplicada.
+        """
+        cliente.adicionar_callback('mensagem', self.on_mensagem_recebida)
+        cliente.adicionar_callback('backlog', self.on_backlog_mensagens)
+        cliente.adicionar_callback('localizacoes', self.on_atualizacoes_localizacao)
+        cliente.adicionar_callback('lista_usuarios', lambda usuarios: self.fila_ui.agendar_unico(
+            'lista_usuarios', lambda: self._atualizar_lista_usuarios_gui(usuarios)))
+        cliente.adicionar_callback('erro', lambda erro: self.fila_ui.agendar(
+            messagebox.showerror, "Erro do Servidor", erro))
+        cliente.adicionar_callback('entrega_assincrona_indisponivel', lambda erro: self.fila_ui.agendar(
+            self._entrega_assincrona_indisponivel, cliente, erro))
+        cliente.adicionar_callback('conexao_perdida', lambda _: self.fila_ui.agendar(
+            self._conexao_socket_perdida, cliente))
+    
+    def _on_socket_conectado(self, cliente: ClienteGeoChat, resposta: dict):
+        """Conexão aceita pelo servidor (thread do Tk)"""
+        self.conectando_socket = False
+        self.btn_conectar_socket.config(state="normal")
+        if self.fechando:
+            cliente.desconectar()
+            return
+        
+        self.cliente = cliente
+        self.conectado_socket = True
+        self._atualizar_interface_socket_conectado()
+        self.adicionar_mensagem_sistema(f"Conectado ao servidor como {cliente.nome}")
+        if cliente.entrega_assincrona_servidor:
+            self.adicionar_mensagem_sistema(
+                "Mensagens assíncronas habilitadas pelo servidor (sem conexão RabbitMQ própria)"
+            )
+        self.atualizar_lista_usuarios()
+        
+        # Habilita conexão RabbitMQ
+        self.btn_conectar_rabbit.config(state="normal")
+    
+    def _on_falha_conexao_socket(self, erro: Exception):
+        """Conexão recusada, sem resposta ou timeout (thread do Tk)"""
+        self.conectando_socket = False
+        self.btn_conectar_socket.config(state="normal")
+        self._atualizar_status()
+        messagebox.showerror("Erro", f"Falha na conexão: {erro}")
     
     def desconectar_socket(self):
         """Desconecta do servidor socket"""
         try:
             self.conectado_socket = False
             
-            if self.socket_cliente:
-                self.socket_cliente.close()
-                self.socket_cliente = None
-            
-            if self.thread_recebimento_socket and self.thread_recebimento_socket.is_alive():
-                self.thread_recebimento_socket.join(timeout=1)
+            # Fecha no canal do cliente: envios já pedidos saem antes
+            if self.cliente:
+                self.trabalhador_io.submeter('cliente', self.cliente.desconectar)
             
             self._atualizar_interface_socket_desconectado()
             self.adicionar_mensagem_sistema("Desconectado do servidor")
@@ -315,72 +367,63 @@ class ClienteIntegrado:
             self.desconectar_rabbitmq()
     
     def conectar_rabbitmq(self):
-        """Conecta ao RabbitMQ"""
+        """
+        Conecta ao RabbitMQ
+        
+        NÃO BLOQUEIA: ClienteGeoChat.conectar_broker (configurador,
+        publisher e consumer) roda no TrabalhadorIO (canal 'rabbitmq'); a
+        interface muda quando o resultado chega.
+        """
         try:
-            if not self.usuario:
+            if not self.conectado_socket:
                 messagebox.showerror("Erro", "Conecte-se ao servidor socket primeiro")
                 return
             
             host = self.entry_rabbit_host.get().strip()
             porta = int(self.entry_rabbit_porta.get().strip())
-            
-            self.configurador_rabbitmq = ConfiguradorRabbitMQ(host, porta)
-            
-            if not self.configurador_rabbitmq.conectar():
-                messagebox.showerror("Erro", "Falha ao conectar ao RabbitMQ")
-                return
-            
-            if not self.configurador_rabbitmq.configurar_topologia():
-                messagebox.showerror("Erro", "Falha ao configurar topologia RabbitMQ")
-                return
-            
-            if not self.configurador_rabbitmq.criar_fila_usuario(self.usuario.nome):
-                messagebox.showerror("Erro", "Falha ao criar filas do usuário")
-                return
-            
-            # Configura publisher
-            self.publisher = PublisherMensagem(self.configurador_rabbitmq)
-            if not self.publisher.conectar():
-                messagebox.showerror("Erro", "Falha ao conectar publisher")
-                return
-            
-            # Configura consumer
-            self.consumer = ConsumerMensagem(self.configurador_rabbitmq, self.usuario.nome)
-            if not self.consumer.conectar():
-                messagebox.showerror("Erro", "Falha ao conectar consumer")
-                return
-            
-            # Define callbacks
-            self.consumer.definir_callback_mensagem(self.on_mensagem_assincrona)
-            self.consumer.definir_callback_localizacao(self.on_atualizacao_localizacao)
-            
-            if not self.consumer.iniciar_consumo():
-                messagebox.showerror("Erro", "Falha ao iniciar consumo")
-                return
-            
-            self.conectado_rabbitmq = True
-            self._atualizar_interface_rabbitmq_conectado()
-            self.adicionar_mensagem_sistema("Conectado ao RabbitMQ - mensagens assíncronas habilitadas")
-            
         except Exception as e:
             messagebox.showerror("Erro", f"Erro ao conectar RabbitMQ: {str(e)}")
+            return
+        
+        cliente = self.cliente
+        self.conectando_rabbitmq = True
+        self.btn_conectar_rabbit.config(state="disabled")
+        self.status_var.set(f"Conectando ao RabbitMQ em {host}:{porta}...")
+        self.trabalhador_io.submeter('rabbitmq', cliente.conectar_broker, host, porta,
+                                     ao_concluir=lambda _: self._on_rabbitmq_conectado(cliente),
+                                     ao_falhar=self._on_falha_conexao_rabbitmq)
+    
+    def _on_rabbitmq_conectado(self, cliente: ClienteGeoChat):
+        """Conexões do RabbitMQ prontas (thread do Tk)"""
+        self.conectando_rabbitmq = False
+        if self.fechando or not self.conectado_socket or cliente is not self.cliente:
+            # O socket caiu (ou a janela fechou) enquanto conectava
+            self.trabalhador_io.submeter('rabbitmq', cliente.desconectar_broker)
+            return
+        
+        self.conectado_rabbitmq = True
+        self.btn_conectar_rabbit.config(state="normal")
+        self._atualizar_interface_rabbitmq_conectado()
+        self.adicionar_mensagem_sistema("Conectado ao RabbitMQ - mensagens assíncronas habilitadas")
+    
+    def _on_falha_conexao_rabbitmq(self, erro: Exception):
+        """Alguma etapa da conexão ao RabbitMQ falhou (thread do Tk)"""
+        self.conectando_rabbitmq = False
+        if self.conectado_socket:
+            self.btn_conectar_rabbit.config(state="normal")
+        self._atualizar_status()
+        if isinstance(erro, ErroCliente):
+            messagebox.showerror("Erro", str(erro))
+        else:
+            messagebox.showerror("Erro", f"Erro ao conectar RabbitMQ: {str(erro)}")
     
     def desconectar_rabbitmq(self):
-        """Desconecta do RabbitMQ"""
+        """Desconecta do RabbitMQ (as conexões são fechadas em segundo plano)"""
         try:
             self.conectado_rabbitmq = False
             
-            if self.consumer:
-                self.consumer.desconectar()
-                self.consumer = None
-            
-            if self.publisher:
-                self.publisher.desconectar()
-                self.publisher = None
-            
-            if self.configurador_rabbitmq:
-                self.configurador_rabbitmq.desconectar()
-                self.configurador_rabbitmq = None
+            if self.cliente:
+                self.trabalhador_io.submeter('rabbitmq', self.cliente.desconectar_broker)
             
             self._atualizar_interface_rabbitmq_desconectado()
             self.adicionar_mensagem_sistema("Desconectado do RabbitMQ")
@@ -397,18 +440,10 @@ class ClienteIntegrado:
             latitude = float(self.entry_latitude.get())
             longitude = float(self.entry_longitude.get())
             
-            # Atualiza no servidor socket
-            mensagem = {
-                'tipo': 'atualizar_localizacao',
-                'latitude': latitude,
-                'longitude': longitude
-            }
-            self._enviar_mensagem_socket(mensagem)
-            self.usuario.atualizar_localizacao(latitude, longitude)
-            
-            # Publica no RabbitMQ se conectado
-            if self.conectado_rabbitmq and self.publisher:
-                self.publisher.publicar_atualizacao_localizacao(self.usuario)
+            self._requisitar(
+                self.cliente.atualizar_localizacao, latitude, longitude,
+                ao_falhar=lambda erro: messagebox.showerror("Erro", f"Erro ao atualizar localização: {str(erro)}")
+            )
             
         except ValueError:
             messagebox.showerror("Erro", "Latitude e longitude devem ser números válidos")
@@ -416,18 +451,25 @@ class ClienteIntegrado:
             messagebox.showerror("Erro", f"Erro ao atualizar localização: {str(e)}")
     
     def atualizar_lista_usuarios(self):
-        """Atualiza lista de usuários disponíveis"""
+        """Atualiza lista de usuários disponíveis (a lista chega pelo evento 'lista_usuarios')"""
         if not self.conectado_socket:
             return
         
         try:
-            mensagem = {'tipo': 'listar_usuarios'}
-            self._enviar_mensagem_socket(mensagem)
+            self._requisitar(
+                self.cliente.listar_usuarios,
+                ao_falhar=lambda erro: messagebox.showerror("Erro", f"Erro ao atualizar lista: {str(erro)}")
+            )
         except Exception as e:
             messagebox.showerror("Erro", f"Erro ao atualizar lista: {str(e)}")
     
     def enviar_mensagem(self):
-        """Envia mensagem (síncrona ou assíncrona conforme configuração)"""
+        """
+        Envia mensagem (síncrona ou assíncrona conforme configuração)
+        
+        A escolha do caminho (Auto/Síncrono/Assíncrono) é do ClienteGeoChat;
+        a linha entra no chat quando o servidor (ou o broker) confirma.
+        """
         destinatario = self.combo_destinatario.get()
         conteudo = self.entry_mensagem.get().strip()
         tipo_envio = self.combo_tipo_envio.get()
@@ -436,124 +478,133 @@ class ClienteIntegrado:
             messagebox.showwarning("Aviso", "Selecione um destinatário e digite uma mensagem")
             return
         
+        def enviada(tipo: str):
+            self.adicionar_mensagem_enviada(destinatario, conteudo, tipo)
+            # Limpa o campo se o usuário ainda não começou outra mensagem
+            if self.entry_mensagem.get().strip() == conteudo:
+                self.entry_mensagem.delete(0, tk.END)
+        
+        def falhou(erro: Exception):
+            if isinstance(erro, ErroCliente):
+                messagebox.showerror("Erro", str(erro))
+            else:
+                messagebox.showerror("Erro", f"Erro ao enviar mensagem: {str(erro)}")
+        
         try:
-            # Encontra informações do destinatário
-            usuario_destinatario = None
-            for usuario in self.usuarios_disponiveis:
-                if usuario['nome'] == destinatario:
-                    usuario_destinatario = usuario
-                    break
-            
-            if not usuario_destinatario:
-                messagebox.showerror("Erro", "Destinatário não encontrado")
-                return
-            
-            # LÓGICA DE DECISÃO AUTOMÁTICA: Core do sistema híbrido
-            # Determina automaticamente se usa comunicação síncrona ou assíncrona
-            if tipo_envio == 'Auto':
-                # CRITÉRIOS PARA SÍNCRONO: online + no raio + socket conectado
-                if (usuario_destinatario['status'] == 'online' and 
-                    usuario_destinatario['no_raio'] and 
-                    self.conectado_socket):
-                    self._enviar_mensagem_sincrona(destinatario, conteudo)
-                
-                # FALLBACK PARA ASSÍNCRONO: qualquer falha nos critérios acima
-                elif self.conectado_rabbitmq:
-                    # DECISÃO INTELIGENTE: determina motivo para debugging
-                    motivo = "offline" if usuario_destinatario['status'] == 'offline' else "fora_do_raio"
-                    self._enviar_mensagem_assincrona(destinatario, conteudo, motivo)
-                else:
-                    messagebox.showerror("Erro", "Não é possível enviar mensagem - destinatário offline/fora do raio e RabbitMQ não conectado")
-                    return
-            
-            # MODO FORÇADO SÍNCRONO: usuário escolhe explicitamente
-            elif tipo_envio == 'Síncrono':
-                if self.conectado_socket:
-                    self._enviar_mensagem_sincrona(destinatario, conteudo)
-                else:
-                    messagebox.showerror("Erro", "Conexão socket não disponível")
-                    return
-            
-            # MODO FORÇADO ASSÍNCRONO: usuário escolhe explicitamente
-            elif tipo_envio == 'Assíncrono':
-                if self.conectado_rabbitmq:
-                    self._enviar_mensagem_assincrona(destinatario, conteudo, "forcado")
-                else:
-                    messagebox.showerror("Erro", "Conexão RabbitMQ não disponível")
-                    return
-            
-            self.entry_mensagem.delete(0, tk.END)
-            
+            self._requisitar(self.cliente.enviar_mensagem, destinatario, conteudo, tipo_envio,
+                             ao_concluir=enviada, ao_falhar=falhou)
         except Exception as e:
             messagebox.showerror("Erro", f"Erro ao enviar mensagem: {str(e)}")
     
-    def _enviar_mensagem_sincrona(self, destinatario: str, conteudo: str):
-        """Envia mensagem síncrona via socket"""
-        mensagem = {
-            'tipo': 'enviar_mensagem',
-            'destinatario': destinatario,
-            'conteudo': conteudo
-        }
-        self._enviar_mensagem_socket(mensagem)
-        self.adicionar_mensagem_enviada(destinatario, conteudo, "Síncrona")
-    
-    def _enviar_mensagem_assincrona(self, destinatario: str, conteudo: str, motivo: str):
-        """Envia mensagem assíncrona via RabbitMQ"""
-        if self.publisher:
-            if self.publisher.enviar_mensagem_assincrona(self.usuario.nome, destinatario, conteudo, motivo):
-                self.adicionar_mensagem_enviada(destinatario, conteudo, f"Assíncrona ({motivo})")
-            else:
-                messagebox.showerror("Erro", "Falha ao enviar mensagem assíncrona")
+    def _requisitar(self, metodo: Callable, *args, ao_concluir: Optional[Callable] = None,
+                    ao_falhar: Optional[Callable[[Exception], None]] = None):
+        """
+        Chama um método do ClienteGeoChat no TrabalhadorIO
+        
+        O método envia (sem bloquear a interface) e retorna um Future que o
+        cliente resolve quando chega a resposta com o mesmo id_requisicao;
+        ao_concluir/ao_falhar rodam então na thread do Tk. Sem ao_falhar,
+        uma falha vira mensagem de sistema no chat.
+        
+        ORDEM: Todas as requisições vão para o canal 'cliente', saiam elas
+        pelo socket ou pelo RabbitMQ direto; o cliente escolhe o caminho
+        quando a requisição roda. Assim conectar ou desconectar o RabbitMQ
+        (canal 'rabbitmq') no meio de uma conversa não reordena mensagens.
+        """
+        ao_falhar = ao_falhar or self._on_falha_envio_socket
+        
+        def enviado(resposta: Future):
+            resposta.add_done_callback(
+                lambda futuro: self.fila_ui.agendar(self._entregar_resposta, futuro, ao_concluir, ao_falhar))
+        
+        self.trabalhador_io.submeter('cliente', metodo, *args, ao_concluir=enviado, ao_falhar=ao_falhar)
+    
+    def _entregar_resposta(self, futuro: Future, ao_concluir: Optional[Callable],
+                           ao_falhar: Callable[[Exception], None]):
+        """Resposta (ou falha) de uma requisição (thread do Tk)"""
+        erro = futuro.exception()
+        if erro is None:
+            if ao_concluir is not None:
+                ao_concluir(futuro.result())
+        elif not isinstance(erro, ConnectionError):
+            ao_falhar(erro)
+        # ConnectionError: desconexão pedida ou queda, já avisada por _conexao_socket_perdida
     
     def enviar_mensagem_enter(self, event):
         """Envia mensagem quando Enter é pressionado"""
         self.enviar_mensagem()
     
-    def on_mensagem_assincrona(self, dados: dict):
-        """Callback para mensagem assíncrona recebida"""
-        remetente = dados['remetente']
-        conteudo = dados['conteudo']
-        motivo = dados.get('motivo', 'desconhecido')
-        
-        self.root.after(0, lambda: self.adicionar_mensagem_recebida(remetente, conteudo, f"Assíncrona ({motivo})"))
+    def on_mensagem_recebida(self, dados: dict):
+        """Callback para mensagem recebida (síncrona, via servidor ou do RabbitMQ direto)"""
+        self.fila_ui.adicionar_texto('chat', self._linha_recebida(dados['remetente'], dados['conteudo'],
+                                                                  dados['tipo']))
     
-    def on_atualizacao_localizacao(self, dados: dict):
-        """Callback para atualização de localização recebida"""
-        usuario_dados = dados['usuario']
-        nome = usuario_dados['nome']
+    def on_backlog_mensagens(self, mensagens: List[dict]):
+        """
+        Callback para as mensagens acumuladas enquanto o usuário estava offline
+        
+        Chega já ordenado e sem duplicatas; tudo é inserido no chat de uma
+        vez, no próximo quadro da fila da interface.
+        """
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        texto = self._linha_sistema(f"{len(mensagens)} mensagens recebidas enquanto offline") + "".join(
+            self._linha_recebida(dados['remetente'], dados['conteudo'],
+                                 f"Assíncrona ({dados.get('motivo', 'desconhecido')})", timestamp)
+            for dados in mensagens
+        )
+        self.fila_ui.adicionar_texto('chat', texto)
+    
+    def on_atualizacoes_localizacao(self, lote: List[dict]):
+        """
+        Callback para o lote de atualizações de localização de uma janela
         
-        self.root.after(0, lambda: self.adicionar_mensagem_sistema(f"Localização atualizada: {nome}"))
-        self.root.after(0, self.atualizar_lista_usuarios)
+        COALESCÊNCIA: Uma rajada de movimentos gera uma única mensagem de
+        sistema e uma única requisição de lista ao servidor.
+        """
+        nomes = [dados['usuario']['nome'] for dados in lote]
+        if len(nomes) == 1:
+            texto = f"Localização atualizada: {nomes[0]}"
+        else:
+            resumo = ', '.join(nomes[:5]) + (f" e mais {len(nomes) - 5}" if len(nomes) > 5 else "")
+            texto = f"Localizações atualizadas: {resumo}"
+        
+        self.fila_ui.adicionar_texto('chat', self._linha_sistema(texto))
+        self.fila_ui.agendar_unico('pedir_lista_usuarios', self.atualizar_lista_usuarios)
+    
+    @staticmethod
+    def _linha_sistema(mensagem: str) -> str:
+        """Formata uma linha de mensagem do sistema para o chat"""
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        return f"[{timestamp}] SISTEMA: {mensagem}\n"
+    
+    @staticmethod
+    def _linha_recebida(remetente: str, conteudo: str, tipo: str, timestamp: Optional[str] = None) -> str:
+        """Formata uma linha de mensagem recebida para o chat"""
+        timestamp = timestamp or datetime.now().strftime("%H:%M:%S")
+        return f"[{timestamp}] {remetente} ({tipo}): {conteudo}\n"
+    
+    def _inserir_texto_chat(self, texto: str):
+        """Insere texto (uma ou mais linhas) no fim da área de chat"""
+        self.visao_chat.adicionar(texto)
     
     def adicionar_mensagem_sistema(self, mensagem: str):
         """Adiciona mensagem do sistema na área de chat"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        texto = f"[{timestamp}] SISTEMA: {mensagem}\n"
-        
-        self.text_mensagens.config(state='normal')
-        self.text_mensagens.insert(tk.END, texto)
-        self.text_mensagens.config(state='disabled')
-        self.text_mensagens.see(tk.END)
+        self._inserir_texto_chat(self._linha_sistema(mensagem))
     
     def adicionar_mensagem_enviada(self, destinatario: str, conteudo: str, tipo: str):
         """Adiciona mensagem enviada na área de chat"""
         timestamp = datetime.now().strftime("%H:%M:%S")
-        texto = f"[{timestamp}] Você -> {destinatario} ({tipo}): {conteudo}\n"
-        
-        self.text_mensagens.config(state='normal')
-        self.text_mensagens.insert(tk.END, texto)
-        self.text_mensagens.config(state='disabled')
-        self.text_mensagens.see(tk.END)
+        self._inserir_texto_chat(f"[{timestamp}] Você -> {destinatario} ({tipo}): {conteudo}\n")
     
     def adicionar_mensagem_recebida(self, remetente: str, conteudo: str, tipo: str):
         """Adiciona mensagem recebida na área de chat"""
+        self._inserir_texto_chat(self._linha_recebida(remetente, conteudo, tipo))
+    
+    def adicionar_mensagens_recebidas(self, mensagens: List[tuple]):
+        """Adiciona várias mensagens recebidas (remetente, conteudo, tipo) de uma vez"""
         timestamp = datetime.now().strftime("%H:%M:%S")
-        texto = f"[{timestamp}] {remetente} ({tipo}): {conteudo}\n"
-        
-        self.text_mensagens.config(state='normal')
-        self.text_mensagens.insert(tk.END, texto)
-        self.text_mensagens.config(state='disabled')
-        self.text_mensagens.see(tk.END)
+        self._inserir_texto_chat("".join(self._linha_recebida(remetente, conteudo, tipo, timestamp)
+                                         for remetente, conteudo, tipo in mensagens))
     
     def _atualizar_interface_socket_conectado(self):
         """Atualiza interface quando socket conectado"""
@@ -578,9 +629,10 @@ class ClienteIntegrado:
         self.entry_nome.config(state="normal")
         self.entry_servidor.config(state="normal")
         
-        self.tree_usuarios.delete(*self.tree_usuarios.get_children())
+        self.tabela_usuarios.limpar()
         self.combo_destinatario.set('')
         self.combo_destinatario['values'] = []
+        self._destinatarios_combo = ()
         
         self._atualizar_status()
     
@@ -603,71 +655,40 @@ class ClienteIntegrado:
         status_parts = []
         
         if self.conectado_socket:
-            status_parts.append(f"Socket: {self.usuario.nome}")
+            status_parts.append(f"Socket: {self.cliente.nome}")
         else:
             status_parts.append("Socket: Desconectado")
         
         if self.conectado_rabbitmq:
             status_parts.append("RabbitMQ: Conectado")
+        elif self.conectado_socket and self.cliente.entrega_assincrona_servidor:
+            status_parts.append("RabbitMQ: Via servidor")
         else:
             status_parts.append("RabbitMQ: Desconectado")
         
         self.status_var.set(" | ".join(status_parts))
     
-    def _iniciar_thread_recebimento_socket(self):
-        """Inicia thread para receber mensagens do socket"""
-        self.thread_recebimento_socket = threading.Thread(target=self._receber_mensagens_socket_loop, daemon=True)
-        self.thread_recebimento_socket.start()
-    
-    def _receber_mensagens_socket_loop(self):
-        """Loop para receber mensagens do socket"""
-        while self.conectado_socket:
-            try:
-                mensagem = self._receber_mensagem_socket()
-                if mensagem:
-                    self._processar_mensagem_socket_recebida(mensagem)
-                else:
-                    break
-            except Exception as e:
-                if self.conectado_socket:
-                    print(f"Erro ao receber mensagem socket: {e}")
-                break
-        
-        if self.conectado_socket:
-            self.root.after(0, self._conexao_socket_perdida)
-    
-    def _processar_mensagem_socket_recebida(self, mensagem: dict):
-        """Processa mensagem recebida do socket"""
-        tipo = mensagem.get('tipo')
-        
-        if tipo == 'mensagem_recebida':
-            remetente = mensagem['remetente']
-            conteudo = mensagem['conteudo']
-            self.root.after(0, lambda: self.adicionar_mensagem_recebida(remetente, conteudo, "Síncrona"))
-        
-        elif tipo == 'lista_usuarios':
-            usuarios = mensagem['usuarios']
-            self.root.after(0, lambda: self._atualizar_lista_usuarios_gui(usuarios))
-        
-        elif tipo == 'erro':
-            erro = mensagem['mensagem']
-            self.root.after(0, lambda: messagebox.showerror("Erro do Servidor", erro))
-    
     def _atualizar_lista_usuarios_gui(self, usuarios: List[dict]):
         """
         Atualiza GUI com lista de usuários
         
-        INTERFACE INTELIGENTE: Calcula automaticamente que tipos de comunicação
-        estão disponíveis para cada usuário baseado em:
+        INTERFACE INTELIGENTE: Mostra que tipos de comunicação estão
+        disponíveis para cada usuário (ClienteGeoChat.tipo_comunicacao),
+        baseado em:
         1. Status online/offline
         2. Distância dentro/fora do raio
         3. Conexões disponíveis (socket/RabbitMQ)
         
         FEEDBACK VISUAL: TreeView mostra claramente as opções para cada usuário
+        
+        INCREMENTAL: Só usuários que entraram, saíram ou mudaram geram
+        chamadas ao Tk (TabelaIncremental); a seleção é mantida.
         """
-        self.tree_usuarios.delete(*self.tree_usuarios.get_children())
-        self.usuarios_disponiveis = usuarios
+        if not self.conectado_socket:
+            # Lista que chegou depois da desconexão
+            return
         
+        linhas = []
         usuarios_para_combo = []
         
         for usuario in usuarios:
@@ -675,52 +696,42 @@ class ClienteIntegrado:
             distancia = f"{usuario['distancia']:.1f}"
             no_raio = "Sim" if usuario['no_raio'] else "Não"
             status = usuario['status']
+            tipo_com = self.cliente.tipo_comunicacao(usuario)
             
-            # LÓGICA DE DISPONIBILIDADE: Determina que comunicação é possível
-            if status == 'online' and usuario['no_raio']:
-                # Usuário online + no raio: síncrona sempre disponível
-                if self.conectado_rabbitmq:
-                    tipo_com = "Síncrona + Assíncrona"  # Ambas opções
-                else:
-                    tipo_com = "Síncrona"  # Só síncrona
-            elif self.conectado_rabbitmq:
-                # Usuário offline ou fora do raio: só assíncrona se RabbitMQ conectado
-                tipo_com = "Assíncrona"
-            else:
-                # Sem opções de comunicação
-                tipo_com = "Indisponível"
-            
-            self.tree_usuarios.insert('', 'end', values=(nome, distancia, no_raio, status, tipo_com))
+            linhas.append((nome, (nome, distancia, no_raio, status, tipo_com)))
             
             # Adiciona ao combobox apenas usuários com comunicação disponível
             if tipo_com != "Indisponível":
                 usuarios_para_combo.append(nome)
         
-        # Atualiza combobox de destinatários
-        self.combo_destinatario['values'] = usuarios_para_combo
+        self.tabela_usuarios.sincronizar(linhas)
+        
+        # Atualiza combobox de destinatários (só se a lista mudou)
+        usuarios_para_combo = tuple(usuarios_para_combo)
+        if usuarios_para_combo != self._destinatarios_combo:
+            self.combo_destinatario['values'] = usuarios_para_combo
+            self._destinatarios_combo = usuarios_para_combo
         if usuarios_para_combo and not self.combo_destinatario.get():
             self.combo_destinatario.set(usuarios_para_combo[0])
     
-    def _conexao_socket_perdida(self):
+    def _entrega_assincrona_indisponivel(self, cliente: ClienteGeoChat, erro: str):
+        """O servidor desfez a entrega assíncrona anunciada na conexão (thread do Tk)"""
+        if cliente is not self.cliente or not self.conectado_socket:
+            return
+        self.adicionar_mensagem_sistema(f"{erro}; conecte ao RabbitMQ para receber mensagens assíncronas")
+        self._atualizar_status()
+    
+    def _conexao_socket_perdida(self, cliente: ClienteGeoChat):
         """Chamado quando conexão socket é perdida"""
+        if cliente is not self.cliente or not self.conectado_socket:
+            return
         messagebox.showerror("Erro", "Conexão com o servidor foi perdida")
         self.desconectar_socket()
     
-    def _enviar_mensagem_socket(self, mensagem: dict):
-        """Envia mensagem para o servidor socket"""
-        if self.socket_cliente:
-            dados = json.dumps(mensagem).encode('utf-8')
-            self.socket_cliente.send(dados)
-    
-    def _receber_mensagem_socket(self) -> Optional[dict]:
-        """Recebe mensagem do servidor socket"""
-        try:
-            dados = self.socket_cliente.recv(4096)
-            if dados:
-                return json.loads(dados.decode('utf-8'))
-        except:
-            pass
-        return None
+    def _on_falha_envio_socket(self, erro: Exception):
+        """Envio pelo socket falhou (thread do Tk)"""
+        if self.conectado_socket:
+            self.adicionar_mensagem_sistema(f"Falha ao enviar ao servidor: {erro}")
     
     def fechar_aplicacao(self):
         """
@@ -735,8 +746,13 @@ class ClienteIntegrado:
         """
         if self.conectado_rabbitmq:
             self.desconectar_rabbitmq()
+        self.fechando = True
         if self.conectado_socket:
             self.desconectar_socket()
+        self.fila_ui.parar()
+        self.visao_chat.fechar()
+        # Fechamentos já pedidos terminam em segundo plano
+        self.trabalhador_io.encerrar()
         self.root.destroy()
     
     def executar(self):
@@ -0,0 +1,203 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+# ~60 Hz: uma passagem da bomba por quadro de tela
+INTERVALO_PADRAO_MS = 16
+# Tempo máximo aplicando eventos por quadro (o resto fica para o Tk)
+ORCAMENTO_PADRAO_MS = 8.0
+
+_TEXTO = 0
+_FUNCAO = 1
+_UNICO = 2
+
+
+class FilaEventosUI:
+    """
+    Fila thread safe de eventos para a thread do Tk, drenada em quadros
+
+    PROBLEMA: Cada frame do socket ou callback do broker agendava o seu
+    próprio root.after(0, ...). Uma rajada de mensagens enchia a fila de
+    eventos do Tk com milhares de callbacks, cada um com a sua inserção no
+    widget de texto, e teclado/mouse ficavam esperando atrás deles.
+
+    SOLUÇÃO: As threads de rede só colocam eventos nesta fila. Uma única
+    bomba, agendada com root.after a cada ~16 ms (60 Hz), aplica os eventos
+    em bloco até gastar o orçamento do quadro; o que sobrar fica para o
+    próximo quadro, e o Tk processa a entrada do usuário entre eles.
+
+    LOTES DE TEXTO: Linhas destinadas ao mesmo widget de texto (chat, log)
+    são juntadas e inseridas com uma única chamada por quadro, em vez de
+    config/insert/see por linha. A ordem relativa aos demais eventos é
+    mantida: o texto pendente é aplicado antes de qualquer outro evento.
+
+    COALESCÊNCIA: agendar_unico() guarda só a última versão de um evento
+    com a mesma chave (ex: a lista de usuários mais recente); as anteriores
+    ainda não aplicadas são descartadas.
+    """
+
+    def __init__(self, root, intervalo_ms: int = INTERVALO_PADRAO_MS,
+                 orcamento_ms: float = ORCAMENTO_PADRAO_MS):
+        """
+        Args:
+            root: Janela Tk (ou objeto com after/after_cancel)
+            intervalo_ms: Intervalo entre passagens da bomba
+            orcamento_ms: Tempo máximo aplicando eventos por passagem
+        """
+        self.root = root
+        self.intervalo_ms = intervalo_ms
+        self.orcamento = orcamento_ms / 1000
+
+        # DECISÃO: deque.append/popleft são atômicos no CPython; o lock só
+        # protege a coalescência (dicionário + marcador na fila)
+        self._eventos = deque()
+        self._unicos: Dict[str, Callable] = {}
+        self._lock = threading.Lock()
+
+        self._destinos_texto: Dict[str, Callable[[str], None]] = {}
+        self._agendamento = None
+        self._ativa = False
+
+        self.quadros = 0
+        self.eventos_aplicados = 0
+        self.quadros_estourados = 0
+        self.maior_fila = 0
+
+    def registrar_texto(self, destino: str, inserir: Callable[[str], None]):
+        """
+        Registra um widget de texto que recebe linhas em lote
+
+        Args:
+            destino: Nome usado em adicionar_texto() (ex: 'chat')
+            inserir: Chamada na thread do Tk com todas as linhas do quadro
+                     concatenadas
+        """
+        self._destinos_texto[destino] = inserir
+
+    def adicionar_texto(self, destino: str, texto: str):
+        """Enfileira texto para um destino registrado (qualquer thread)"""
+        self._eventos.append((_TEXTO, destino, texto))
+
+    def agendar(self, funcao: Callable, *args):
+        """Enfileira uma chamada para a thread do Tk (qualquer thread)"""
+        self._eventos.append((_FUNCAO, funcao, args))
+
+    def agendar_unico(self, chave: str, funcao: Callable):
+        """
+        Enfileira uma chamada que substitui a pendente com a mesma chave
+
+        A chamada roda na posição da primeira ainda não aplicada, com a
+        versão mais recente da função.
+        """
+        with self._lock:
+            if chave not in self._unicos:
+                self._eventos.append((_UNICO, chave, None))
+            self._unicos[chave] = funcao
+
+    def pendentes(self) -> int:
+        """Eventos ainda não aplicados"""
+        return len(self._eventos)
+
+    def iniciar(self):
+        """Começa a drenar a fila periodicamente"""
+        if not self._ativa:
+            self._ativa = True
+            self._agendamento = self.root.after(self.intervalo_ms, self._bombear)
+
+    def parar(self):
+        """Para a bomba (eventos pendentes ficam na fila)"""
+        self._ativa = False
+        if self._agendamento is not None:
+            try:
+                self.root.after_cancel(self._agendamento)
+            except Exception:
+                pass
+            self._agendamento = None
+
+    def _bombear(self):
+        """Passagem periódica na thread do Tk"""
+        self._agendamento = None
+        try:
+            self.drenar()
+        finally:
+            if self._ativa:
+                self._agendamento = self.root.after(self.intervalo_ms, self._bombear)
+
+    def drenar(self, orcamento: Optional[float] = None) -> int:
+        """
+        Aplica eventos até esvaziar a fila ou gastar o orçamento
+
+        Deve ser chamado na thread do Tk.
+
+        Args:
+            orcamento: Segundos disponíveis (padrão: o do quadro)
+
+        Returns:
+            Quantidade de eventos aplicados
+        """
+        limite = time.perf_counter() + (self.orcamento if orcamento is None else orcamento)
+        self.maior_fila = max(self.maior_fila, len(self._eventos))
+
+        textos: Dict[str, List[str]] = {}
+        aplicados = 0
+        while self._eventos:
+            tipo, alvo, dados = self._eventos.popleft()
+            aplicados += 1
+
+            if tipo == _TEXTO:
+                # Barato: só junta; a inserção é uma por destino no fim
+                textos.setdefault(alvo, []).append(dados)
+            else:
+                if textos:
+                    self._aplicar_textos(textos)
+                    textos = {}
+                self._aplicar_funcao(tipo, alvo, dados)
+
+            if self._eventos and time.perf_counter() >= limite:
+                # Orçamento do quadro esgotado: o resto fica para o próximo
+                self.quadros_estourados += 1
+                break
+
+        if textos:
+            self._aplicar_textos(textos)
+
+        self.quadros += 1
+        self.eventos_aplicados += aplicados
+        return aplicados
+
+    def _aplicar_funcao(self, tipo: int, alvo, args: tuple):
+        """Executa um evento agendar()/agendar_unico()"""
+        if tipo == _UNICO:
+            with self._lock:
+                funcao = self._unicos.pop(alvo, None)
+            args = ()
+        else:
+            funcao = alvo
+        if funcao is None:
+            return
+        try:
+            funcao(*args)
+        except Exception as e:
+            print(f"Erro ao aplicar evento na interface: {e}")
+
+    def _aplicar_textos(self, textos: Dict[str, List[str]]):
+        """Insere o texto acumulado de cada destino com uma única chamada"""
+        for destino, partes in textos.items():
+            inserir = self._destinos_texto.get(destino)
+            if inserir is None:
+                continue
+            try:
+                inserir("".join(partes))
+            except Exception as e:
+                print(f"Erro ao inserir texto na interface: {e}")
+
+    def obter_metricas(self) -> dict:
+        """Quadros, eventos aplicados, quadros que estouraram o orçamento e maior fila vista"""
+        return {
+            'quadros': self.quadros,
+            'eventos_aplicados': self.eventos_aplicados,
+            'quadros_estourados': self.quadros_estourados,
+            'maior_fila': self.maior_fila,
+            'pendentes': len(self._eventos),
+        }
@@ -0,0 +1,314 @@
+import tempfile
+import threading
+import tkinter as tk
+from array import array
+from collections import deque
+from typing import Iterable, List, Optional
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.config import config
+
+# Linhas por bloco do índice do arquivo (um offset a cada BLOCO_INDICE linhas)
+BLOCO_INDICE = 256
+
+
+def dividir_linhas(texto: str) -> List[str]:
+    """
+    Divide texto em linhas terminadas em '\\n'
+
+    DECISÃO: Só '\\n' separa linhas (como no widget Text); str.splitlines()
+    também cortaria em caracteres como U+2028 vindos numa mensagem.
+    """
+    partes = texto.split('\n')
+    linhas = [parte + '\n' for parte in partes[:-1]]
+    if partes[-1]:
+        linhas.append(partes[-1] + '\n')
+    return linhas
+
+
+class HistoricoLocal:
+    """
+    Histórico de linhas de texto: as mais recentes em memória, o resto em disco
+
+    BUFFER CIRCULAR: As últimas 'memoria_linhas' linhas ficam num deque com
+    tamanho máximo. Cada linha que sai dele é anexada a um arquivo
+    temporário local, então a memória fica constante numa sessão longa e
+    nada do histórico se perde.
+
+    PAGINAÇÃO: Um offset a cada BLOCO_INDICE linhas (array de 8 bytes por
+    entrada) permite ler qualquer trecho antigo com um seek e poucas
+    leituras de linha, sem carregar o arquivo.
+
+    O arquivo é apagado ao fechar (tempfile); se não puder ser criado, as
+    linhas antigas são descartadas e primeira_disponivel avança.
+    """
+
+    def __init__(self, memoria_linhas: int = config.HISTORICO_MAX_LINHAS,
+                 diretorio: Optional[str] = config.HISTORICO_DIR or None):
+        """
+        Args:
+            memoria_linhas: Linhas mantidas em memória
+            diretorio: Onde criar o arquivo do histórico (padrão: temporário do sistema)
+        """
+        self.diretorio = diretorio
+        self._recentes = deque(maxlen=max(1, memoria_linhas))
+        self._arquivo = None
+        self._arquivo_falhou = False
+        self._blocos = array('Q')
+        self._no_disco = 0
+        self._descartadas = 0
+        self._bytes_disco = 0
+        self._lendo = False
+        self._lock = threading.Lock()
+
+    @property
+    def total(self) -> int:
+        """Linhas adicionadas desde o início (ou desde limpar())"""
+        return self._no_disco + len(self._recentes)
+
+    @property
+    def primeira_disponivel(self) -> int:
+        """Índice da linha mais antiga que ainda pode ser lida"""
+        return self._descartadas
+
+    def adicionar(self, linhas: Iterable[str]):
+        """Adiciona linhas (cada uma terminada em '\\n') ao fim do histórico"""
+        with self._lock:
+            for linha in linhas:
+                if len(self._recentes) == self._recentes.maxlen:
+                    self._gravar(self._recentes[0])
+                self._recentes.append(linha)
+
+    def _gravar(self, linha: str):
+        """Anexa ao arquivo a linha que vai sair da memória"""
+        indice = self._no_disco
+        self._no_disco += 1
+        if self._arquivo is None and not self._arquivo_falhou:
+            try:
+                self._arquivo = tempfile.TemporaryFile(prefix='geochat_historico_', dir=self.diretorio)
+            except OSError as e:
+                print(f"Erro ao criar arquivo de histórico: {e}")
+                self._arquivo_falhou = True
+        if self._arquivo is None:
+            self._descartadas = self._no_disco
+            return
+
+        if self._lendo:
+            self._arquivo.seek(0, os.SEEK_END)
+            self._lendo = False
+        if indice % BLOCO_INDICE == 0:
+            self._blocos.append(self._bytes_disco)
+        dados = linha.encode('utf-8')
+        self._arquivo.write(dados)
+        self._bytes_disco += len(dados)
+
+    def linhas(self, inicio: int, fim: int) -> List[str]:
+        """
+        Lê as linhas [inicio, fim) do histórico
+
+        Índices antes de primeira_disponivel são ignorados.
+        """
+        with self._lock:
+            inicio = max(inicio, self._descartadas)
+            fim = min(fim, self.total)
+            if inicio >= fim:
+                return []
+
+            resultado = []
+            if inicio < self._no_disco:
+                resultado = self._ler_disco(inicio, min(fim, self._no_disco))
+            if fim > self._no_disco:
+                deslocamento = self._no_disco
+                resultado.extend(self._recentes[indice - deslocamento]
+                                 for indice in range(max(inicio, deslocamento), fim))
+            return resultado
+
+    def _ler_disco(self, inicio: int, fim: int) -> List[str]:
+        """Lê linhas do arquivo a partir do bloco indexado mais próximo"""
+        self._arquivo.flush()
+        bloco = inicio // BLOCO_INDICE
+        self._arquivo.seek(self._blocos[bloco])
+        self._lendo = True
+        for _ in range(inicio - bloco * BLOCO_INDICE):
+            self._arquivo.readline()
+        return [self._arquivo.readline().decode('utf-8') for _ in range(fim - inicio)]
+
+    def limpar(self):
+        """Descarta todo o histórico"""
+        with self._lock:
+            self._recentes.clear()
+            self._blocos = array('Q')
+            self._no_disco = 0
+            self._descartadas = 0
+            self._bytes_disco = 0
+            if self._arquivo is not None:
+                self._arquivo.seek(0)
+                self._arquivo.truncate()
+                self._lendo = False
+
+    def fechar(self):
+        """Fecha (e apaga) o arquivo do histórico"""
+        with self._lock:
+            if self._arquivo is not None:
+                self._arquivo.close()
+                self._arquivo = None
+
+    def obter_metricas(self) -> dict:
+        """Linhas totais, em memória, em disco e bytes do arquivo"""
+        return {
+            'linhas': self.total,
+            'linhas_memoria': len(self._recentes),
+            'linhas_disco': self._no_disco - self._descartadas,
+            'linhas_descartadas': self._descartadas,
+            'bytes_disco': self._bytes_disco,
+        }
+
+
+class VisaoTextoLimitada:
+    """
+    Widget Text com número de linhas limitado e histórico paginado
+
+    PROBLEMA: O chat do cliente e o log do servidor só cresciam. Depois de um
+    dia de tráfego o widget tinha centenas de milhares de linhas: memória
+    subindo e cada inserção mais lenta.
+
+    JANELA: O widget mostra só um trecho [inicio, fim) do HistoricoLocal,
+    com no máximo limite_linhas + bloco linhas. Quando passa disso, as
+    linhas do lado oposto à leitura são cortadas de uma vez (um bloco, não
+    uma linha por inserção).
+
+    ROLAGEM: Ao chegar ao topo, o bloco anterior é lido do histórico e
+    inserido acima, mantendo a posição da leitura. Enquanto o usuário lê o
+    passado, linhas novas só vão para o histórico; ao rolar até o fim elas
+    entram no widget, bloco a bloco, até voltar ao vivo.
+    """
+
+    def __init__(self, texto, historico: Optional[HistoricoLocal] = None,
+                 limite_linhas: int = config.HISTORICO_MAX_LINHAS, bloco: Optional[int] = None):
+        """
+        Args:
+            texto: Widget Text (ou ScrolledText, cuja barra é mantida)
+            historico: Onde guardar as linhas (padrão: HistoricoLocal novo)
+            limite_linhas: Linhas mantidas no widget
+            bloco: Linhas cortadas/carregadas de cada vez (padrão: 10% do limite)
+        """
+        self.texto = texto
+        self.historico = historico or HistoricoLocal(limite_linhas)
+        self.limite_linhas = max(1, limite_linhas)
+        self.bloco = bloco or max(1, self.limite_linhas // 10)
+
+        # Trecho do histórico que está no widget
+        self.inicio = self.historico.total
+        self.fim = self.historico.total
+
+        self._paginacao_agendada = False
+        barra = getattr(texto, 'vbar', None)
+        self._atualizar_barra = barra.set if barra is not None else None
+        self.texto.configure(yscrollcommand=self._on_rolagem)
+
+    @property
+    def ao_vivo(self) -> bool:
+        """Se o widget mostra o fim do histórico (linhas novas entram direto)"""
+        return self.fim == self.historico.total
+
+    def adicionar(self, texto: str, rolar: bool = True):
+        """
+        Adiciona texto (uma ou mais linhas) ao fim
+
+        Args:
+            texto: Texto a adicionar
+            rolar: Se deve rolar até o fim (só quando ao vivo)
+        """
+        linhas = dividir_linhas(texto)
+        if not linhas:
+            return
+        ao_vivo = self.ao_vivo
+        self.historico.adicionar(linhas)
+        if not ao_vivo:
+            # O usuário está lendo o passado; entra quando ele rolar até o fim
+            return
+
+        self.texto.config(state='normal')
+        self.texto.insert(tk.END, "".join(linhas))
+        self.fim += len(linhas)
+        excesso = self.fim - self.inicio - self.limite_linhas
+        if excesso >= self.bloco:
+            self._cortar_topo(excesso, manter_leitura=not rolar)
+        self.texto.config(state='disabled')
+        if rolar:
+            self.texto.see(tk.END)
+
+    def limpar(self):
+        """Apaga o widget e o histórico"""
+        self.texto.config(state='normal')
+        self.texto.delete('1.0', tk.END)
+        self.texto.config(state='disabled')
+        self.historico.limpar()
+        self.inicio = self.fim = 0
+
+    def fechar(self):
+        """Libera o arquivo do histórico"""
+        self.historico.fechar()
+
+    def _linha_no_topo(self) -> int:
+        """Linha do widget (1 = primeira) visível no topo"""
+        return int(self.texto.index('@0,0').split('.')[0])
+
+    def _cortar_topo(self, quantidade: int, manter_leitura: bool = True):
+        """Remove as primeiras linhas do widget"""
+        topo = self._linha_no_topo() if manter_leitura else 0
+        self.texto.delete('1.0', f'{quantidade + 1}.0')
+        self.inicio += quantidade
+        if topo > quantidade:
+            self.texto.yview(f'{topo - quantidade}.0')
+
+    def _cortar_fim(self, quantidade: int):
+        """Remove as últimas linhas do widget"""
+        self.texto.delete(f'{self.fim - self.inicio - quantidade + 1}.0', 'end-1c')
+        self.fim -= quantidade
+
+    def _on_rolagem(self, primeiro: str, ultimo: str):
+        """yscrollcommand: atualiza a barra e pagina ao chegar a uma ponta"""
+        if self._atualizar_barra is not None:
+            self._atualizar_barra(primeiro, ultimo)
+        if self._paginacao_agendada:
+            return
+        if float(primeiro) <= 0.0 and self.inicio > self.historico.primeira_disponivel:
+            self._paginacao_agendada = True
+            self.texto.after_idle(self._paginar_acima)
+        elif float(ultimo) >= 1.0 and not self.ao_vivo:
+            self._paginacao_agendada = True
+            self.texto.after_idle(self._paginar_abaixo)
+
+    def _paginar_acima(self):
+        """Carrega o bloco anterior ao topo do widget"""
+        self._paginacao_agendada = False
+        linhas = self.historico.linhas(self.inicio - self.bloco, self.inicio)
+        if not linhas:
+            return
+        self.texto.config(state='normal')
+        self.texto.insert('1.0', "".join(linhas))
+        self.inicio -= len(linhas)
+        excesso = self.fim - self.inicio - self.limite_linhas
+        if excesso >= self.bloco:
+            self._cortar_fim(excesso)
+        self.texto.config(state='disabled')
+        # Mantém visível a linha que estava no topo
+        self.texto.yview(f'{len(linhas) + 1}.0')
+
+    def _paginar_abaixo(self):
+        """Carrega o bloco seguinte ao fim do widget"""
+        self._paginacao_agendada = False
+        linhas = self.historico.linhas(self.fim, self.fim + self.bloco)
+        if not linhas:
+            return
+        self.texto.config(state='normal')
+        self.texto.insert(tk.END, "".join(linhas))
+        self.fim += len(linhas)
+        excesso = self.fim - self.inicio - self.limite_linhas
+        if excesso >= self.bloco:
+            self._cortar_topo(excesso)
+        self.texto.config(state='disabled')
@@ -11,6 +11,9 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from server.servidor_socket import ServidorSocket
 from common.usuario import Usuario
+from gui.tabela_incremental import TabelaIncremental
+from gui.fila_eventos import FilaEventosUI
+from gui.historico_texto import VisaoTextoLimitada
 
 class InterfaceServidor:
     """Interface Tkinter para administração do servidor"""
@@ -28,6 +31,13 @@ class InterfaceServidor:
         self.root.protocol("WM_DELETE_WINDOW", self.fechar_aplicacao)
         
         self.criar_interface()
+        
+        # Callbacks do servidor (threads dos clientes) aplicados em quadros
+        # (~60 Hz), com as linhas de log inseridas em lote
+        self.fila_ui = FilaEventosUI(self.root)
+        self.fila_ui.registrar_texto('log', self._inserir_texto_log)
+        self.fila_ui.iniciar()
+        
         self.configurar_servidor()
     
     def criar_interface(self):
@@ -105,6 +115,13 @@ class InterfaceServidor:
                                              command=self.atualizar_estatisticas)
         self.btn_atualizar_stats.grid(row=0, column=3, padx=(20, 0))
         
+        # Caminho assíncrono (MetricasBroker): vermelho quando está ficando para trás
+        self.label_broker_publicacao = ttk.Label(stats_frame, text="Broker: -")
+        self.label_broker_publicacao.grid(row=1, column=0, columnspan=2, sticky=tk.W, pady=(5, 0))
+        
+        self.label_broker_consumo = ttk.Label(stats_frame, text="")
+        self.label_broker_consumo.grid(row=1, column=2, columnspan=2, sticky=tk.W, pady=(5, 0))
+        
         # Variáveis para estatísticas
         self.tempo_inicio = None
         self.contador_mensagens = 0
@@ -134,6 +151,9 @@ class InterfaceServidor:
         self.tree_usuarios.column('status', width=80)
         self.tree_usuarios.column('conexao_tempo', width=150)
         
+        # Linhas por nome de usuário: atualizações só tocam o que mudou
+        self.tabela_usuarios = TabelaIncremental(self.tree_usuarios)
+        
         # Scrollbars
         scrollbar_v = ttk.Scrollbar(usuarios_frame, orient=tk.VERTICAL, command=self.tree_usuarios.yview)
         scrollbar_h = ttk.Scrollbar(usuarios_frame, orient=tk.HORIZONTAL, command=self.tree_usuarios.xview)
@@ -170,6 +190,9 @@ class InterfaceServidor:
         # Área de logs
         self.text_logs = scrolledtext.ScrolledText(logs_frame, height=12, state='disabled')
         self.text_logs.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        # Log limitado: linhas antigas vão para o histórico local e voltam
+        # ao rolar para cima
+        self.visao_logs = VisaoTextoLimitada(self.text_logs)
         
         # Frame para controles de log
         log_controles = ttk.Frame(logs_frame)
@@ -263,8 +286,8 @@ class InterfaceServidor:
             messagebox.showwarning("Aviso", "Selecione um usuário para desconectar")
             return
         
-        item = self.tree_usuarios.item(selecao[0])
-        nome_usuario = item['values'][0]
+        # O iid da linha é o nome do usuário (TabelaIncremental)
+        nome_usuario = selecao[0]
         
         resultado = messagebox.askyesno("Confirmar", 
                                        f"Desconectar usuário '{nome_usuario}'?")
@@ -277,29 +300,30 @@ class InterfaceServidor:
                 messagebox.showerror("Erro", f"Erro ao desconectar usuário: {str(e)}")
     
     def atualizar_lista_usuarios(self):
-        """Atualiza lista de usuários conectados"""
+        """
+        Atualiza lista de usuários conectados
+        
+        INCREMENTAL: Só usuários que entraram, saíram ou mudaram geram
+        chamadas ao Tk (TabelaIncremental); a seleção é mantida.
+        """
         if not self.servidor_rodando:
             return
         
         try:
-            # Limpa lista atual
-            self.tree_usuarios.delete(*self.tree_usuarios.get_children())
-            
             # Obtém usuários conectados
             usuarios = self.servidor.obter_usuarios_conectados()
             
-            for usuario in usuarios:
-                tempo_conexao = self.tempos_conexao.get(usuario.nome, "N/A")
-                valores = (
+            self.tabela_usuarios.sincronizar(
+                (usuario.nome, (
                     usuario.nome,
                     f"{usuario.latitude:.6f}",
                     f"{usuario.longitude:.6f}",
                     f"{usuario.raio_comunicacao:.0f}",
                     usuario.status.value,
-                    tempo_conexao
-                )
-                
-                self.tree_usuarios.insert('', 'end', values=valores)
+                    self.tempos_conexao.get(usuario.nome, "N/A")
+                ))
+                for usuario in usuarios
+            )
             
             # Atualiza botão de desconexão
             if usuarios:
@@ -329,6 +353,20 @@ class InterfaceServidor:
                 self.label_tempo_funcionamento.config(text=f"Tempo de Funcionamento: {tempo_str}")
             
             self.label_mensagens_enviadas.config(text=f"Mensagens Enviadas: {self.contador_mensagens}")
+            
+            self.label_broker_publicacao.config(
+                text=f"Broker: {stats['broker_publicadas_por_segundo']:.1f} pub/s, "
+                     f"confirmação p95 {stats['broker_latencia_publicacao_p95_ms']:.0f} ms, "
+                     f"filas {stats['broker_mensagens_em_filas']} msg"
+            )
+            cor = "red" if stats['broker_alertas'] else ""
+            self.label_broker_consumo.config(
+                text=f"{stats['broker_entregas_por_segundo']:.1f} entregas/s, "
+                     f"atraso p95 {stats['broker_atraso_consumo_p95_ms']:.0f} ms, "
+                     f"reentregas {stats['broker_reentregas']}, "
+                     f"nack {stats['broker_taxa_nack']:.1%}",
+                foreground=cor
+            )
         
         except Exception as e:
             self.adicionar_log(f"Erro ao atualizar estatísticas: {e}")
@@ -350,7 +388,7 @@ class InterfaceServidor:
         self.status_var.set("Servidor parado")
         
         # Limpa listas
-        self.tree_usuarios.delete(*self.tree_usuarios.get_children())
+        self.tabela_usuarios.limpar()
         self.btn_desconectar_usuario.config(state="disabled")
         self.tempos_conexao.clear()
     
@@ -363,8 +401,9 @@ class InterfaceServidor:
         """Loop de atualização automática"""
         while self.servidor_rodando:
             try:
-                self.root.after(0, self.atualizar_estatisticas)
-                self.root.after(0, self.atualizar_lista_usuarios)
+                # Se a interface atrasou, não acumula atualizações repetidas
+                self.fila_ui.agendar_unico('estatisticas', self.atualizar_estatisticas)
+                self.fila_ui.agendar_unico('lista_usuarios', self.atualizar_lista_usuarios)
                 time.sleep(2)  # Atualiza a cada 2 segundos
             except Exception as e:
                 print(f"Erro no loop de atualização: {e}")
@@ -374,37 +413,46 @@ class InterfaceServidor:
         """Callback chamado quando usuário se conecta"""
         timestamp = datetime.now().strftime("%H:%M:%S")
         self.tempos_conexao[usuario.nome] = timestamp
-        self.root.after(0, lambda: self.adicionar_log(f"Usuário conectado: {usuario.nome} ({usuario.latitude}, {usuario.longitude})"))
+        self._log_de_thread(f"Usuário conectado: {usuario.nome} ({usuario.latitude}, {usuario.longitude})")
     
     def on_usuario_desconectado(self, usuario: Usuario):
         """Callback chamado quando usuário se desconecta"""
         if usuario.nome in self.tempos_conexao:
             del self.tempos_conexao[usuario.nome]
-        self.root.after(0, lambda: self.adicionar_log(f"Usuário desconectado: {usuario.nome}"))
+        self._log_de_thread(f"Usuário desconectado: {usuario.nome}")
     
     def on_mensagem_recebida(self, remetente: str, destinatario: str, conteudo: str):
         """Callback chamado quando mensagem é recebida"""
         self.contador_mensagens += 1
         mensagem_log = f"Mensagem: {remetente} -> {destinatario}: {conteudo[:50]}{'...' if len(conteudo) > 50 else ''}"
-        self.root.after(0, lambda: self.adicionar_log(mensagem_log))
+        self._log_de_thread(mensagem_log)
     
-    def adicionar_log(self, mensagem: str):
-        """Adiciona mensagem ao log"""
+    @staticmethod
+    def _linha_log(mensagem: str) -> str:
+        """Formata uma linha do log com o horário atual"""
         timestamp = datetime.now().strftime("%H:%M:%S")
-        texto = f"[{timestamp}] {mensagem}\n"
-        
-        self.text_logs.config(state='normal')
-        self.text_logs.insert(tk.END, texto)
-        self.text_logs.config(state='disabled')
-        
-        if self.auto_scroll_var.get():
-            self.text_logs.see(tk.END)
+        return f"[{timestamp}] {mensagem}\n"
+    
+    def _log_de_thread(self, mensagem: str):
+        """
+        Adiciona ao log a partir de qualquer thread
+        
+        O horário é o do evento; a linha entra no widget no próximo quadro,
+        junto com as demais do mesmo quadro (uma inserção só).
+        """
+        self.fila_ui.adicionar_texto('log', self._linha_log(mensagem))
+    
+    def adicionar_log(self, mensagem: str):
+        """Adiciona mensagem ao log (thread do Tk)"""
+        self._inserir_texto_log(self._linha_log(mensagem))
+    
+    def _inserir_texto_log(self, texto: str):
+        """Insere texto (uma ou mais linhas) no fim do log"""
+        self.visao_logs.adicionar(texto, rolar=self.auto_scroll_var.get())
     
     def limpar_logs(self):
-        """Limpa área de logs"""
-        self.text_logs.config(state='normal')
-        self.text_logs.delete(1.0, tk.END)
-        self.text_logs.config(state='disabled')
+        """Limpa área de logs (e o histórico guardado)"""
+        self.visao_logs.limpar()
     
     def fechar_aplicacao(self):
         """Fecha a aplicação"""
@@ -412,6 +460,8 @@ class InterfaceServidor:
             self.parar_servidor()
         
         # Aguarda um pouco para finalizar operações
+        self.fila_ui.parar()
+        self.visao_logs.fechar()
         self.root.after(100, self.root.destroy)
     
     def executar(self):
@@ -0,0 +1,95 @@
+from typing import Dict, Hashable, Iterable, Optional, Tuple
+
+
+class TabelaIncremental:
+    """
+    Mantém um ttk.Treeview em sincronia com uma lista de linhas por chave
+
+    ATUALIZAÇÃO INCREMENTAL: Apagar todas as linhas e inserir a lista de novo
+    custa uma chamada ao Tk por linha a cada atualização (segundos com
+    milhares de usuários) e perde a seleção. Aqui cada linha tem como iid a
+    sua chave (ex: nome do usuário) e só o que mudou vai para o widget:
+    linhas novas são inseridas, linhas com valores diferentes são
+    atualizadas e linhas que sumiram são removidas de uma vez. Linhas iguais
+    não geram nenhuma chamada ao Tk, e a seleção delas é mantida.
+
+    ORDEM: A ordem da lista é respeitada. Se ela mudou (ex: lista ordenada
+    por distância), só as linhas a partir da primeira fora de lugar são
+    movidas.
+    """
+
+    def __init__(self, tree):
+        """
+        Args:
+            tree: Treeview (ou objeto com insert/item/delete/move/get_children)
+        """
+        self.tree = tree
+        # Valores exibidos por chave, na ordem do widget
+        self._linhas: Dict[str, tuple] = {}
+
+    def __len__(self) -> int:
+        return len(self._linhas)
+
+    def __contains__(self, chave: Hashable) -> bool:
+        return str(chave) in self._linhas
+
+    def sincronizar(self, linhas: Iterable[Tuple[Hashable, tuple]]) -> Dict[str, int]:
+        """
+        Aplica ao widget a diferença entre o que ele mostra e 'linhas'
+
+        Args:
+            linhas: (chave, valores) na ordem desejada; chaves repetidas
+                    ficam com a última ocorrência
+
+        Returns:
+            Quantas linhas foram inseridas, atualizadas, removidas e movidas
+        """
+        novas: Dict[str, tuple] = {}
+        for chave, valores in linhas:
+            novas[str(chave)] = tuple(valores)
+
+        removidas = [chave for chave in self._linhas if chave not in novas]
+        if removidas:
+            self.tree.delete(*removidas)
+            for chave in removidas:
+                del self._linhas[chave]
+
+        inseridas = atualizadas = 0
+        for chave, valores in novas.items():
+            atuais = self._linhas.get(chave)
+            if atuais is None:
+                self.tree.insert('', 'end', iid=chave, values=valores)
+                inseridas += 1
+            elif atuais != valores:
+                self.tree.item(chave, values=valores)
+                atualizadas += 1
+            self._linhas[chave] = valores
+
+        movidas = self._ordenar(list(novas))
+        if movidas:
+            # O cache segue a ordem do widget
+            self._linhas = {chave: self._linhas[chave] for chave in novas}
+        return {'inseridas': inseridas, 'atualizadas': atualizadas,
+                'removidas': len(removidas), 'movidas': movidas}
+
+    def _ordenar(self, ordem: list) -> int:
+        """Move as linhas fora de lugar a partir da primeira divergência"""
+        # O cache está na ordem do widget (inserções vão para o fim): não
+        # precisa perguntar ao Tk
+        atual = list(self._linhas)
+        if atual == ordem:
+            return 0
+        inicio = next(indice for indice, (a, b) in enumerate(zip(atual, ordem)) if a != b)
+        for indice in range(inicio, len(ordem)):
+            self.tree.move(ordem[indice], '', indice)
+        return len(ordem) - inicio
+
+    def valores(self, chave: Hashable) -> Optional[tuple]:
+        """Valores exibidos para a chave (None se ela não está na tabela)"""
+        return self._linhas.get(str(chave))
+
+    def limpar(self):
+        """Remove todas as linhas"""
+        if self._linhas:
+            self.tree.delete(*self._linhas)
+        self._linhas.clear()
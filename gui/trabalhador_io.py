@@ -0,0 +1,83 @@
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from broker.executor_ordenado import ExecutorOrdenado
+from gui.fila_eventos import FilaEventosUI
+
+
+class TrabalhadorIO:
+    """
+    Executa I/O de rede fora da thread do Tk e entrega o resultado nela
+
+    PROBLEMA: connect, handshake, sendall e as conexões do RabbitMQ rodavam
+    na thread do Tk. Um servidor lento congelava a janela durante todo o
+    timeout da conexão.
+
+    CANAIS: Cada tarefa vai para um canal (ex: 'cliente', 'rabbitmq'). Tarefas
+    do mesmo canal rodam uma de cada vez, na ordem de submissão (envios pelo
+    socket não se embaralham, e o fechamento roda depois dos envios já
+    pedidos); canais diferentes rodam em paralelo (conectar a um RabbitMQ
+    lento não atrasa o chat). Reusa o ExecutorOrdenado.
+
+    CONCLUSÃO: submeter() retorna um Future e, se dados, chama ao_concluir
+    com o resultado ou ao_falhar com a exceção na thread do Tk, pela
+    FilaEventosUI; é lá que a interface muda de estado.
+    """
+
+    def __init__(self, fila_ui: FilaEventosUI, max_workers: int = 2):
+        """
+        Args:
+            fila_ui: Fila que leva os resultados para a thread do Tk
+            max_workers: Canais que podem rodar ao mesmo tempo
+        """
+        self.fila_ui = fila_ui
+        self._executor = ExecutorOrdenado(max_workers=max_workers, prefixo_thread="geochat-io")
+
+    def submeter(self, canal: str, funcao: Callable, *args,
+                 ao_concluir: Optional[Callable] = None,
+                 ao_falhar: Optional[Callable[[Exception], None]] = None) -> Future:
+        """
+        Agenda uma tarefa de I/O
+
+        Args:
+            canal: Canal de ordenação da tarefa
+            funcao: Função bloqueante a executar em segundo plano
+            *args: Argumentos da função
+            ao_concluir: Chamada na thread do Tk com o retorno da função
+            ao_falhar: Chamada na thread do Tk com a exceção levantada
+
+        Returns:
+            Future com o retorno (ou a exceção) da função
+        """
+        futuro = Future()
+
+        def executar():
+            if not futuro.set_running_or_notify_cancel():
+                return
+            try:
+                resultado = funcao(*args)
+            except Exception as e:
+                futuro.set_exception(e)
+                if ao_falhar is not None:
+                    self.fila_ui.agendar(ao_falhar, e)
+                else:
+                    print(f"Erro em tarefa de I/O ({canal}): {e}")
+                return
+            futuro.set_result(resultado)
+            if ao_concluir is not None:
+                self.fila_ui.agendar(ao_concluir, resultado)
+
+        self._executor.submeter(canal, executar)
+        return futuro
+
+    def pendentes(self) -> int:
+        """Tarefas submetidas que ainda não terminaram"""
+        return self._executor.pendentes()
+
+    def encerrar(self):
+        """Não aceita novas tarefas; as já submetidas terminam em segundo plano"""
+        self._executor.encerrar(esperar=False)
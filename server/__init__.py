@@ -3,6 +3,7 @@ Módulo do servidor de sockets para comunicação síncrona (interface movida pa
 """
 
 from .servidor_socket import ServidorSocket
+from .grafo_proximidade import GrafoProximidade
 # Interface movida para gui/interface_servidor.py
 
-__all__ = ['ServidorSocket']
+__all__ = ['ServidorSocket', 'GrafoProximidade']
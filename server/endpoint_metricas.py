@@ -0,0 +1,93 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from broker.metricas import MetricasBroker
+
+class EndpointMetricas:
+    """
+    Endpoint HTTP somente leitura com as métricas do servidor em JSON
+
+    ROTAS:
+    - GET /metricas: {'servidor': estatísticas do servidor, 'broker':
+      MetricasBroker.padrao().obter()}
+    - GET /saude: 200 se o caminho assíncrono está em dia, 503 com os
+      alertas se não (para monitoração externa)
+
+    DECISÃO: http.server da biblioteca padrão, em uma thread própria; é
+    para ser lido de tempos em tempos por uma ferramenta de monitoração,
+    não para tráfego de usuários.
+    """
+
+    def __init__(self, obter_estatisticas: Callable[[], dict], host: str = 'localhost',
+                 porta: int = 9100, metricas: Optional[MetricasBroker] = None):
+        """
+        Args:
+            obter_estatisticas: Retorna as estatísticas do servidor
+            host: Endereço de escuta
+            porta: Porta de escuta (0 escolhe uma livre)
+            metricas: Métricas do broker (padrão: MetricasBroker.padrao())
+        """
+        self.obter_estatisticas = obter_estatisticas
+        self.host = host
+        self.porta = porta
+        self.metricas = metricas or MetricasBroker.padrao()
+        self.servidor_http: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def iniciar(self) -> bool:
+        """Começa a atender em segundo plano"""
+        try:
+            self.servidor_http = ThreadingHTTPServer((self.host, self.porta), self._criar_handler())
+            self.servidor_http.daemon_threads = True
+            self.porta = self.servidor_http.server_address[1]
+            self._thread = threading.Thread(target=self.servidor_http.serve_forever, daemon=True,
+                                            name="geochat-endpoint-metricas")
+            self._thread.start()
+            print(f"Endpoint de métricas em http://{self.host}:{self.porta}/metricas")
+            return True
+        except Exception as e:
+            print(f"Erro ao iniciar endpoint de métricas: {e}")
+            return False
+
+    def parar(self):
+        """Para de atender e fecha o socket"""
+        if self.servidor_http:
+            self.servidor_http.shutdown()
+            self.servidor_http.server_close()
+            self.servidor_http = None
+
+    def _criar_handler(self) -> type:
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                try:
+                    if self.path.rstrip('/') == '/metricas':
+                        status, corpo = 200, {'servidor': endpoint.obter_estatisticas(),
+                                              'broker': endpoint.metricas.obter()}
+                    elif self.path.rstrip('/') == '/saude':
+                        alertas = endpoint.metricas.obter()['alertas']
+                        status, corpo = (503 if alertas else 200), {'alertas': alertas}
+                    else:
+                        status, corpo = 404, {'erro': 'rota desconhecida'}
+                except Exception as e:
+                    status, corpo = 500, {'erro': str(e)}
+
+                dados = json.dumps(corpo, default=str).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(dados)))
+                self.end_headers()
+                self.wfile.write(dados)
+
+            def log_message(self, formato, *args):
+                # Sem uma linha no console por leitura
+                pass
+
+        return Handler
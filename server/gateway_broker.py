@@ -0,0 +1,237 @@
+import random
+import threading
+from typing import Callable, Dict, List, Optional, Set
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.config import config
+from broker.consumer_multiusuario import ConsumerMultiusuario
+from broker.rabbitmq_manager import ConfiguradorRabbitMQ, PublisherMensagem
+
+class GatewayBroker:
+    """
+    Ponte entre o RabbitMQ e os sockets dos usuários conectados ao servidor
+
+    UMA CONEXÃO POR SERVIDOR: Em vez de cada cliente abrir suas próprias
+    conexões AMQP, o servidor consome a fila user_X_messages de cada
+    usuário conectado e entrega as mensagens pelo socket que ele já tem.
+    O número de conexões no broker passa de O(usuários) para O(servidores).
+
+    CANAIS MULTIPLEXADOS: Os consumidores ficam em um ConsumerMultiusuario
+    (um basic_consume por usuário em poucos canais compartilhados).
+
+    ENTREGA: As mensagens são escritas no socket por um pool de workers
+    (em ordem por usuário) e só são confirmadas (ack) depois da escrita.
+    Se o usuário desconectou antes, voltam para a fila (nack com requeue)
+    e ficam esperando a próxima conexão dele.
+
+    RECUPERAÇÃO: O consumer reabre sozinho os canais que caem. Quando não
+    consegue (ex: a conexão caiu), avisa o gateway, que espera o publisher
+    sair do modo falha (sinal de que o broker voltou), reconecta o que
+    caiu e assina de novo os usuários que continuam conectados.
+    """
+
+    def __init__(self, configurador: ConfiguradorRabbitMQ,
+                 entregar: Callable[[str, dict], bool],
+                 numero_canais: int = 4, prefetch: int = 20, max_workers: int = 8):
+        """
+        Inicializa o gateway
+
+        Args:
+            configurador: Configurador já conectado, com a topologia declarada
+            entregar: Recebe (nome_usuario, mensagem) e escreve no socket do
+                      usuário; retorna False se ele não está mais conectado
+            numero_canais: Canais AMQP compartilhados pelos consumidores
+            prefetch: Entregas sem ack por usuário
+            max_workers: Threads que escrevem nos sockets
+        """
+        self.configurador = configurador
+        self.entregar = entregar
+
+        self.consumer = ConsumerMultiusuario(configurador, numero_canais=numero_canais,
+                                             prefetch=prefetch, max_workers=max_workers)
+        self.publisher = PublisherMensagem(
+            configurador,
+            caminho_spool=config.get_spool_path("gateway", servidor=True),
+            max_bytes_spool=config.SPOOL_MAX_MB * 1024 * 1024
+        )
+
+        # O configurador usa um único canal e não é thread safe: a
+        # declaração de filas de threads de clientes diferentes é serializada
+        self._lock_configurador = threading.Lock()
+
+        # Usuários assinados do ponto de vista do servidor (entre assinar e
+        # cancelar), mesmo que o consumer tenha perdido a assinatura
+        self._assinados: Set[str] = set()
+
+        # RECUPERAÇÃO: backoff exponencial (s); uma thread por vez. Perdas
+        # avisadas durante a recuperação fazem a thread repetir a passada
+        self.atraso_recuperacao_inicial = 1.0
+        self.atraso_recuperacao_maximo = 30.0
+        self._lock_recuperacao = threading.Lock()
+        self._recuperando = False
+        self._nova_perda = False
+        self._encerrado = threading.Event()
+        self._thread_recuperacao: Optional[threading.Thread] = None
+        self._total_recuperacoes = 0
+        self.consumer.definir_callback_assinaturas_perdidas(self._on_assinaturas_perdidas)
+
+    def iniciar(self) -> bool:
+        """Abre os canais de consumo e o publisher"""
+        try:
+            self._encerrado.clear()
+            if not self.consumer.conectar():
+                return False
+            if not self.publisher.conectar():
+                return False
+
+            print(f"Gateway do broker iniciado com {self.consumer.numero_canais} canais")
+            return True
+
+        except Exception as e:
+            print(f"Erro ao iniciar gateway do broker: {e}")
+            return False
+
+    def parar(self):
+        """Fecha os canais (mensagens sem ack voltam para as filas)"""
+        try:
+            self._encerrado.set()
+            thread = self._thread_recuperacao
+            if thread:
+                thread.join(timeout=self.configurador.timeout_operacao)
+            self.publisher.desconectar()
+            self.consumer.desconectar()
+        except Exception as e:
+            print(f"Erro ao parar gateway do broker: {e}")
+
+    def assinar(self, nome_usuario: str) -> bool:
+        """
+        Passa a consumir a fila de mensagens do usuário em nome dele
+
+        Returns:
+            True se a assinatura está ativa
+        """
+        if not self._assinar_no_consumer(nome_usuario):
+            return False
+        self._assinados.add(nome_usuario)
+        return True
+
+    def _assinar_no_consumer(self, nome_usuario: str) -> bool:
+        """Declara a fila do usuário e a assina no consumer multiusuário"""
+        try:
+            with self._lock_configurador:
+                if not self.configurador.criar_fila_usuario(nome_usuario):
+                    return False
+            return self.consumer.assinar(
+                nome_usuario, lambda dados: self.entregar(nome_usuario, dados)
+            )
+
+        except Exception as e:
+            print(f"Erro ao assinar fila de {nome_usuario} no gateway: {e}")
+            return False
+
+    def _reassinar(self, nome_usuario: str) -> bool:
+        """Assina de novo um usuário que ficou sem consumo (thread de recuperação)"""
+        if not self._assinar_no_consumer(nome_usuario):
+            return False
+        if nome_usuario not in self._assinados:
+            # Desconectou durante a recuperação: a assinatura não tem mais socket
+            self.consumer.cancelar(nome_usuario)
+        return True
+
+    def cancelar(self, nome_usuario: str):
+        """Para de consumir a fila do usuário (entregas pendentes voltam para ela)"""
+        self._assinados.discard(nome_usuario)
+        self.consumer.cancelar(nome_usuario)
+
+    def _on_assinaturas_perdidas(self, nomes: List[str]):
+        """Consumer desistiu de reabrir um canal: inicia a recuperação (uma thread só)"""
+        print(f"Gateway: {len(nomes)} assinatura(s) perdida(s), iniciando recuperação")
+        with self._lock_recuperacao:
+            self._nova_perda = True
+            if self._recuperando or self._encerrado.is_set():
+                return
+            self._recuperando = True
+            self._thread_recuperacao = threading.Thread(target=self._loop_recuperacao, daemon=True,
+                                                        name="geochat-gateway-recuperacao")
+            self._thread_recuperacao.start()
+
+    def _loop_recuperacao(self):
+        """
+        Reconecta o que caiu e assina de novo os usuários sem consumo
+
+        RECONEXÃO: O PublisherMensagem já reconecta sozinho; enquanto ele
+        está em falha o broker não voltou e a tentativa é adiada. As esperas
+        dobram a cada tentativa e são sorteadas entre metade e o total.
+        """
+        atraso = self.atraso_recuperacao_inicial
+        tentativa = 0
+        while True:
+            if self._encerrado.wait(random.uniform(atraso / 2, atraso)):
+                return
+            atraso = min(atraso * 2, self.atraso_recuperacao_maximo)
+            if self.publisher.em_falha():
+                continue
+
+            tentativa += 1
+            with self._lock_recuperacao:
+                self._nova_perda = False
+            try:
+                self._reconectar_se_preciso()
+                pendentes = [nome for nome in list(self._assinados)
+                             if not self.consumer.assinado(nome)]
+                falhas = [nome for nome in pendentes if not self._reassinar(nome)]
+                if not falhas:
+                    with self._lock_recuperacao:
+                        if not self._nova_perda:
+                            self._recuperando = False
+                            self._total_recuperacoes += 1
+                            print(f"Gateway recuperado (tentativa {tentativa}): "
+                                  f"{len(pendentes)} assinatura(s) refeita(s)")
+                            return
+                else:
+                    print(f"Recuperação do gateway (tentativa {tentativa}): "
+                          f"{len(falhas)} assinatura(s) não refeita(s)")
+            except Exception as e:
+                print(f"Recuperação do gateway falhou (tentativa {tentativa}): {e or type(e).__name__}")
+
+    def _reconectar_se_preciso(self):
+        """
+        Reabre o configurador e o consumer se a conexão deles caiu
+
+        Raises:
+            ConnectionError: Se algum deles não reconectou
+        """
+        with self._lock_configurador:
+            if not (self.configurador.channel and self.configurador.channel.is_open):
+                self.configurador.desconectar()
+                if not self.configurador.conectar():
+                    raise ConnectionError("Configurador não reconectou")
+        gerenciador = self.consumer.gerenciador
+        if not (gerenciador and gerenciador.conectado):
+            self.consumer.desconectar()
+            if not self.consumer.conectar():
+                raise ConnectionError("Consumer multiusuário não reconectou")
+
+    def publicar(self, remetente: str, destinatario: str, conteudo: str, motivo: str) -> bool:
+        """Publica uma mensagem assíncrona em nome de um usuário conectado"""
+        return self.publisher.enviar_mensagem_assincrona(remetente, destinatario, conteudo, motivo)
+
+    def obter_metricas(self) -> Dict[str, float]:
+        """Retorna métricas do gateway (as do consumer multiusuário)"""
+        metricas = self.consumer.obter_metricas()
+        return {
+            'assinaturas': metricas['assinaturas'],
+            'canais': len(metricas['assinaturas_por_canal']),
+            'entregues': metricas['confirmadas'],
+            'devolvidas': metricas['devolvidas'],
+            'invalidas': metricas['invalidas'],
+            'em_voo': metricas['em_voo'],
+            'atraso_medio_ms': metricas['atraso_medio_ms'],
+            'atraso_max_ms': metricas['atraso_max_ms'],
+            'aguardando_reabertura': metricas['aguardando_reabertura'],
+            'recuperacoes': self._total_recuperacoes,
+            'publisher_em_falha': self.publisher.em_falha(),
+        }
@@ -0,0 +1,216 @@
+from typing import Dict, Set
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.usuario import Usuario
+from common.geohash import codificar_geohash, celulas_cobertura, precisao_para_raio
+
+# CUSTO: Células de até 1/4 do raio (cobertura de até ~10x10 células)
+# equilibram células varridas e candidatos descartados pela distância
+FRACAO_RAIO_CELULA = 4
+
+
+class GrafoProximidade:
+    """
+    Grafo incremental de quem pode se comunicar sincronamente com quem
+
+    ARESTAS DIRECIONADAS: A regra de pode_comunicar_sincronamente usa o raio
+    do remetente, então A alcança B quando distância(A, B) <= raio de A.
+    O grafo mantém as duas direções:
+    - alcanca[A]: usuários dentro do raio de A (A pode enviar para eles)
+    - alcancado_por[B]: usuários cujo raio contém B
+    Usuários mutuamente alcançáveis são a interseção das duas.
+
+    ATUALIZAÇÃO INCREMENTAL: Quando um usuário conecta, move ou desconecta,
+    só as arestas dele são recalculadas. Os candidatos vêm de um índice de
+    células geohash, então o custo depende da densidade local e não do
+    total de usuários conectados.
+
+    BALDES POR RAIO: Cada usuário é indexado em uma precisão proporcional
+    ao seu raio (limitada a precisao_indice). Um usuário com raio de 50 km
+    fica em células de ~20 km e não obriga os demais a varrer milhares de
+    células de ~1 km a cada movimento.
+
+    THREAD SAFETY: O grafo não tem lock próprio; o ServidorSocket o
+    acessa sempre dentro do seu self.lock.
+    """
+
+    def __init__(self, precisao_indice: int = 6):
+        """
+        Inicializa o grafo
+
+        Args:
+            precisao_indice: Precisão geohash das células do índice espacial
+                             (6 = células de ~1,2 km x 0,6 km)
+        """
+        self.precisao_indice = precisao_indice
+
+        self.usuarios: Dict[str, Usuario] = {}
+
+        # Índice espacial por balde: {precisao: {prefixo: {nomes}}}. Cada
+        # usuário entra em todos os prefixos da sua célula, para que o balde
+        # possa ser consultado em qualquer precisão menor ou igual à dele.
+        # {nome: celula} guarda a célula (e, pelo tamanho, o balde) indexada
+        self.celulas: Dict[int, Dict[str, Set[str]]] = {}
+        self.celula_usuario: Dict[str, str] = {}
+
+        # Listas de adjacência direcionadas
+        self.alcanca: Dict[str, Set[str]] = {}
+        self.alcancado_por: Dict[str, Set[str]] = {}
+
+        # Raio de cada usuário no momento da indexação e contagem por raio
+        # em cada balde, para saber o maior raio de cada balde (o objeto
+        # Usuario pode mudar antes de atualizar_usuario ser chamado)
+        self.raio_usuario: Dict[str, float] = {}
+        self._contagem_raios: Dict[int, Dict[float, int]] = {}
+
+        # Maior raio de cada balde em cache; só é recalculado quando o
+        # último usuário com esse raio sai do balde
+        self._raio_maximo_balde: Dict[int, float] = {}
+
+    def adicionar_usuario(self, usuario: Usuario) -> None:
+        """Adiciona usuário online ao grafo (ou recalcula se já existir)"""
+        if usuario.nome in self.usuarios:
+            self.remover_usuario(usuario.nome)
+
+        self.usuarios[usuario.nome] = usuario
+        self.alcanca[usuario.nome] = set()
+        self.alcancado_por[usuario.nome] = set()
+        self.raio_usuario[usuario.nome] = usuario.raio_comunicacao
+        self._calcular_arestas(usuario)
+        self._indexar(usuario)
+
+    def atualizar_usuario(self, usuario: Usuario) -> None:
+        """
+        Recalcula as arestas de um usuário após mudança de posição ou raio
+
+        Deve ser chamado depois de atualizar_localizacao/atualizar_raio.
+        """
+        # Remove as arestas antigas e recalcula só a vizinhança deste usuário
+        self.adicionar_usuario(usuario)
+
+    def remover_usuario(self, nome: str) -> None:
+        """Remove usuário e todas as suas arestas"""
+        usuario = self.usuarios.pop(nome, None)
+        if usuario is None:
+            return
+
+        for vizinho in self.alcanca.pop(nome, set()):
+            self.alcancado_por[vizinho].discard(nome)
+        for vizinho in self.alcancado_por.pop(nome, set()):
+            self.alcanca[vizinho].discard(nome)
+
+        celula = self.celula_usuario.pop(nome)
+        balde = len(celula)
+        indice = self.celulas[balde]
+        for tamanho in range(1, balde + 1):
+            ocupantes = indice[celula[:tamanho]]
+            ocupantes.discard(nome)
+            if not ocupantes:
+                del indice[celula[:tamanho]]
+        if not indice:
+            del self.celulas[balde]
+
+        self._desregistrar_raio(balde, self.raio_usuario.pop(nome))
+
+    def pode_comunicar(self, remetente: str, destinatario: str) -> bool:
+        """
+        Equivalente a pode_comunicar_sincronamente em O(1)
+
+        Ambos estão online por estarem no grafo; resta checar o raio do remetente.
+        """
+        return destinatario in self.alcanca.get(remetente, ())
+
+    def alcancaveis(self, nome: str) -> Set[str]:
+        """Retorna usuários dentro do raio de comunicação do usuário"""
+        return set(self.alcanca.get(nome, ()))
+
+    def mutuamente_alcancaveis(self, nome: str) -> Set[str]:
+        """Retorna usuários que alcançam e são alcançados pelo usuário"""
+        return self.alcanca.get(nome, set()) & self.alcancado_por.get(nome, set())
+
+    def grau(self, nome: str) -> int:
+        """Retorna o número de usuários dentro do raio do usuário"""
+        return len(self.alcanca.get(nome, ()))
+
+    def numero_arestas(self) -> int:
+        """Retorna o total de arestas direcionadas do grafo"""
+        return sum(len(vizinhos) for vizinhos in self.alcanca.values())
+
+    def _balde(self, raio: float) -> int:
+        """Precisão do balde de um raio (células de pelo menos 1/FRACAO_RAIO_CELULA do raio)"""
+        return min(self.precisao_indice, precisao_para_raio(raio / FRACAO_RAIO_CELULA))
+
+    def _indexar(self, usuario: Usuario) -> None:
+        """Coloca o usuário na célula do balde do seu raio e em todos os prefixos dela"""
+        balde = self._balde(usuario.raio_comunicacao)
+        celula = codificar_geohash(usuario.latitude, usuario.longitude, balde)
+        self.celula_usuario[usuario.nome] = celula
+        indice = self.celulas.setdefault(balde, {})
+        for tamanho in range(1, balde + 1):
+            indice.setdefault(celula[:tamanho], set()).add(usuario.nome)
+        self._registrar_raio(balde, usuario.raio_comunicacao)
+
+    def _candidatos(self, usuario: Usuario) -> Set[str]:
+        """
+        Superconjunto dos usuários que este alcança ou que o alcançam
+
+        Em cada balde a busca cobre o maior entre o raio do próprio usuário
+        (arestas de saída) e o maior raio do balde (arestas de entrada).
+        Como as células do balde são proporcionais aos raios dele, a
+        cobertura é de poucas células; se o raio do usuário for maior, a
+        busca sobe para a precisão dele, que o índice de prefixos atende.
+        """
+        candidatos = set()
+        for balde, indice in self.celulas.items():
+            raio_busca = max(usuario.raio_comunicacao, self._raio_maximo_balde[balde])
+            precisao = min(balde, self._balde(raio_busca))
+            for celula in celulas_cobertura(usuario.latitude, usuario.longitude,
+                                            raio_busca, precisao):
+                ocupantes = indice.get(celula)
+                if ocupantes:
+                    candidatos |= ocupantes
+        candidatos.discard(usuario.nome)
+        return candidatos
+
+    def _calcular_arestas(self, usuario: Usuario) -> None:
+        """
+        Calcula as arestas de entrada e saída de um usuário
+
+        OTIMIZAÇÃO: Cada candidato tem a distância calculada uma única vez
+        e é testado nas duas direções.
+        """
+        nome = usuario.nome
+
+        for nome_candidato in self._candidatos(usuario):
+            candidato = self.usuarios[nome_candidato]
+            distancia = usuario.calcular_distancia(candidato)
+
+            if distancia <= usuario.raio_comunicacao:
+                self.alcanca[nome].add(nome_candidato)
+                self.alcancado_por[nome_candidato].add(nome)
+
+            if distancia <= candidato.raio_comunicacao:
+                self.alcanca[nome_candidato].add(nome)
+                self.alcancado_por[nome].add(nome_candidato)
+
+    def _registrar_raio(self, balde: int, raio: float) -> None:
+        contagem = self._contagem_raios.setdefault(balde, {})
+        contagem[raio] = contagem.get(raio, 0) + 1
+        if raio > self._raio_maximo_balde.get(balde, -1.0):
+            self._raio_maximo_balde[balde] = raio
+
+    def _desregistrar_raio(self, balde: int, raio: float) -> None:
+        contagem = self._contagem_raios[balde]
+        restantes = contagem.get(raio, 0) - 1
+        if restantes > 0:
+            contagem[raio] = restantes
+        else:
+            contagem.pop(raio, None)
+            if not contagem:
+                del self._contagem_raios[balde]
+                del self._raio_maximo_balde[balde]
+            elif raio == self._raio_maximo_balde[balde]:
+                self._raio_maximo_balde[balde] = max(contagem)
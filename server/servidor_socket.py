@@ -10,6 +10,14 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from common.usuario import Usuario, StatusUsuario
+from common.config import config
+from common.protocolo import LeitorFrames, ErroProtocolo, codificar_frame, decodificar_mensagem
+from common.compressao import CompressorPayload, escolher_algoritmo
+from server.grafo_proximidade import GrafoProximidade
+from server.gateway_broker import GatewayBroker
+from server.endpoint_metricas import EndpointMetricas
+from broker.metricas import MetricasBroker, AmostradorFilas
+from broker.rabbitmq_manager import ConfiguradorRabbitMQ
 
 class ServidorSocket:
     """
@@ -22,31 +30,71 @@ class ServidorSocket:
     4. Callbacks notificam a interface sobre eventos
     
     PADRÃO OBSERVER: Usa callbacks para desacoplar lógica de servidor da interface
+    
+    GATEWAY DO BROKER: Com gateway_broker=True, o servidor também consome as
+    filas de mensagens assíncronas dos usuários conectados (GatewayBroker) e
+    as entrega pelo socket como 'mensagem_recebida' com 'assincrona': True.
+    Clientes que pedem isso na conexão não precisam de conexão AMQP própria.
+    
+    COMPRESSÃO: O cliente oferece algoritmos na mensagem 'conectar' e o
+    servidor responde com o escolhido; a partir daí frames acima do limite
+    (ex: listagens grandes) são comprimidos nos dois sentidos.
     """
     
-    def __init__(self, host: str = 'localhost', porta: int = 8888):
+    def __init__(self, host: str = 'localhost', porta: int = 8888,
+                 gateway_broker: bool = config.GATEWAY_BROKER):
         """
         Inicializa o servidor
         
         Args:
             host: Endereço do servidor
             porta: Porta do servidor
+            gateway_broker: Se True, entrega mensagens assíncronas pelo socket
         """
         self.host = host
         self.porta = porta
         self.socket_servidor = None
         self.rodando = False
         
+        # Conexão do servidor com o RabbitMQ (None se ele não respondeu):
+        # amostra a profundidade das filas e, se habilitado, alimenta o gateway
+        self.configurador_broker: Optional[ConfiguradorRabbitMQ] = None
+        self.amostrador: Optional[AmostradorFilas] = None
+        
+        # Gateway do broker (None se desabilitado ou se o RabbitMQ não respondeu)
+        self.usar_gateway = gateway_broker
+        self.gateway: Optional[GatewayBroker] = None
+        
+        # Endpoint HTTP de métricas (só com config.METRICAS_PORTA)
+        self.endpoint_metricas: Optional[EndpointMetricas] = None
+        
         # Dicionário de usuários conectados: {nome_usuario: Usuario}
         self.usuarios_conectados: Dict[str, Usuario] = {}
         
         # Dicionário de conexões: {nome_usuario: socket_connection}
         self.conexoes: Dict[str, socket.socket] = {}
         
+        # GRAFO DE PROXIMIDADE: Quem pode falar sincronamente com quem,
+        # atualizado só na vizinhança de quem conecta, move ou desconecta
+        self.grafo_proximidade = GrafoProximidade()
+        
         # THREAD SAFETY: Lock para proteger acesso concorrente aos dicionários
         # Múltiplas threads (uma por cliente) acessam estes dados simultaneamente
         self.lock = threading.Lock()
         
+        # Um lock de envio por conexão: threads de clientes diferentes podem
+        # escrever no mesmo socket, e frames intercalados corromperiam o fluxo
+        self.locks_envio: Dict[socket.socket, threading.Lock] = {}
+        
+        # Compressão negociada por conexão: {socket: algoritmo}. O compressor
+        # é compartilhado por todas as conexões (estatísticas agregadas)
+        self.compressor = CompressorPayload()
+        self.compressao_conexoes: Dict[socket.socket, str] = {}
+        
+        # CORRELAÇÃO: id_requisicao da mensagem sendo processada pela thread
+        # do cliente, ecoado na resposta (sucesso ou erro) a ela
+        self._requisicao_atual = threading.local()
+        
         # PADRÃO OBSERVER: Lista de callbacks para eventos do servidor
         # Permite que a interface gráfica reaja a eventos sem acoplamento direto
         self.callbacks_usuario_conectado = []
@@ -80,6 +128,14 @@ class ServidorSocket:
             
             self.rodando = True
             
+            self._iniciar_broker()
+            
+            if config.METRICAS_PORTA:
+                self.endpoint_metricas = EndpointMetricas(self.obter_estatisticas, self.host,
+                                                          config.METRICAS_PORTA)
+                if not self.endpoint_metricas.iniciar():
+                    self.endpoint_metricas = None
+            
             # Thread para aceitar conexões
             thread_aceitar = threading.Thread(target=self._aceitar_conexoes, daemon=True)
             thread_aceitar.start()
@@ -91,14 +147,66 @@ class ServidorSocket:
             print(f"Erro ao iniciar servidor: {e}")
             return False
     
+    def _iniciar_broker(self):
+        """
+        Conecta ao RabbitMQ, inicia a amostragem das filas e o gateway (se habilitado)
+        
+        Sem RabbitMQ, o servidor segue só com mensagens síncronas e sem a
+        profundidade das filas nas métricas.
+        """
+        configurador = ConfiguradorRabbitMQ(config.RABBITMQ_HOST, config.RABBITMQ_PORT,
+                                            config.RABBITMQ_USER, config.RABBITMQ_PASS)
+        if not (configurador.conectar() and configurador.configurar_topologia()):
+            print("RabbitMQ indisponível: gateway do broker e profundidade das filas desabilitados")
+            configurador.desconectar()
+            return
+        self.configurador_broker = configurador
+        
+        # PROFUNDIDADE DAS FILAS: Amostrada com ou sem o gateway (com ele
+        # desligado, os clientes consomem as próprias filas direto no broker)
+        amostrador = AmostradorFilas(configurador, self._filas_amostradas,
+                                     config.METRICAS_INTERVALO_FILAS)
+        if amostrador.iniciar():
+            self.amostrador = amostrador
+        
+        if not self.usar_gateway:
+            return
+        gateway = GatewayBroker(configurador, self._entregar_mensagem_assincrona)
+        if not gateway.iniciar():
+            gateway.parar()
+            return
+        self.gateway = gateway
+    
+    def _filas_amostradas(self) -> List[str]:
+        """Filas de mensagens dos usuários conectados e o dead-letter"""
+        with self.lock:
+            nomes = list(self.usuarios_conectados)
+        configurador = self.configurador_broker
+        return [configurador.fila_dead_letters] + [configurador.fila_mensagens(nome) for nome in nomes]
+    
     def parar_servidor(self):
         """Para o servidor"""
         self.rodando = False
         
-        # Desconecta todos os usuários
+        # Desconecta todos os usuários (_desconectar_usuario adquire o lock)
         with self.lock:
-            for nome_usuario in list(self.usuarios_conectados.keys()):
-                self._desconectar_usuario(nome_usuario)
+            nomes = list(self.usuarios_conectados.keys())
+        for nome_usuario in nomes:
+            self._desconectar_usuario(nome_usuario)
+        
+        if self.gateway:
+            self.gateway.parar()
+            self.gateway = None
+        if self.amostrador:
+            self.amostrador.parar()
+            self.amostrador = None
+        if self.configurador_broker:
+            self.configurador_broker.desconectar()
+            self.configurador_broker = None
+        
+        if self.endpoint_metricas:
+            self.endpoint_metricas.parar()
+            self.endpoint_metricas = None
         
         # Fecha socket do servidor
         if self.socket_servidor:
@@ -141,32 +249,42 @@ class ServidorSocket:
     def _lidar_com_cliente(self, conn: socket.socket, endereco):
         """Lida com um cliente específico"""
         nome_usuario = None
+        leitor = LeitorFrames(conn, compressor=self.compressor)
+        self.locks_envio[conn] = threading.Lock()
         
         try:
             while self.rodando:
-                # Recebe dados do cliente
-                dados = conn.recv(4096)
-                if not dados:
+                # Recebe o próximo frame completo do cliente
+                dados = leitor.receber_frame()
+                if dados is None:
                     break
                 
                 try:
-                    mensagem = json.loads(dados.decode('utf-8'))
+                    mensagem = decodificar_mensagem(dados)
+                    self._requisicao_atual.id = mensagem.get('id_requisicao')
                     self._processar_mensagem(conn, endereco, mensagem)
                     
-                except json.JSONDecodeError:
+                except (json.JSONDecodeError, UnicodeDecodeError):
                     self._enviar_erro(conn, "Formato de mensagem inválido")
                 except Exception as e:
                     print(f"Erro ao processar mensagem: {e}")
                     self._enviar_erro(conn, f"Erro interno: {str(e)}")
+                finally:
+                    self._requisicao_atual.id = None
         
+        except ErroProtocolo as e:
+            print(f"Erro de protocolo na conexão com {endereco}: {e}")
         except Exception as e:
             print(f"Erro na conexão com {endereco}: {e}")
         
         finally:
             # Remove usuário se estava conectado
+            nome_usuario = self._encontrar_usuario_por_conexao(conn)
             if nome_usuario:
                 self._desconectar_usuario(nome_usuario)
             
+            self.locks_envio.pop(conn, None)
+            self.compressao_conexoes.pop(conn, None)
             try:
                 conn.close()
             except:
@@ -182,8 +300,10 @@ class ServidorSocket:
             self._processar_atualizacao_localizacao(conn, mensagem)
         elif tipo == 'enviar_mensagem':
             self._processar_envio_mensagem(conn, mensagem)
+        elif tipo == 'enviar_mensagem_assincrona':
+            self._processar_envio_assincrono(conn, mensagem)
         elif tipo == 'listar_usuarios':
-            self._processar_listagem_usuarios(conn)
+            self._processar_listagem_usuarios(conn, mensagem.get('apenas_no_raio', False))
         else:
             self._enviar_erro(conn, f"Tipo de mensagem desconhecido: {tipo}")
     
@@ -203,14 +323,40 @@ class ServidorSocket:
                 # Adiciona usuário
                 self.usuarios_conectados[usuario.nome] = usuario
                 self.conexoes[usuario.nome] = conn
+                self.grafo_proximidade.adicionar_usuario(usuario)
+            
+            # NEGOCIAÇÃO: O cliente pede a entrega assíncrona pelo socket; ela
+            # só é ativada se o gateway do broker estiver rodando
+            entrega_assincrona = bool(self.gateway and mensagem.get('entrega_assincrona'))
+            
+            # NEGOCIAÇÃO: Algoritmo de compressão em comum (None se o cliente
+            # não oferece nenhum, como os clientes antigos)
+            compressao = escolher_algoritmo(mensagem.get('compressao', []), self.compressor.algoritmo)
             
             # Resposta de sucesso
             resposta = {
                 'tipo': 'conexao_aceita',
                 'mensagem': 'Conectado com sucesso',
+                'entrega_assincrona': entrega_assincrona,
+                'compressao': compressao,
                 'timestamp': datetime.now().isoformat()
             }
-            self._enviar_mensagem(conn, resposta)
+            self._responder(conn, resposta)
+            
+            # A própria resposta vai sem compressão: o cliente ainda não sabe o algoritmo
+            if compressao:
+                self.compressao_conexoes[conn] = compressao
+            
+            # Só depois da resposta: as mensagens pendentes na fila chegam
+            # quando o cliente já está no fluxo normal de leitura. Se a
+            # assinatura falhar, um frame próprio desfaz o que a resposta
+            # anunciou (o cliente deixa de contar com a entrega pelo servidor)
+            if entrega_assincrona and not self.gateway.assinar(usuario.nome):
+                self._responder(conn, {
+                    'tipo': 'entrega_assincrona_indisponivel',
+                    'mensagem': "Entrega assíncrona pelo servidor indisponível",
+                    'timestamp': datetime.now().isoformat()
+                })
             
             # Notifica callbacks
             for callback in self.callbacks_usuario_conectado:
@@ -240,6 +386,7 @@ class ServidorSocket:
             with self.lock:
                 usuario = self.usuarios_conectados[nome_usuario]
                 usuario.atualizar_localizacao(nova_lat, nova_lon)
+                self.grafo_proximidade.atualizar_usuario(usuario)
             
             # Resposta de sucesso
             resposta = {
@@ -247,7 +394,7 @@ class ServidorSocket:
                 'mensagem': 'Localização atualizada com sucesso',
                 'timestamp': datetime.now().isoformat()
             }
-            self._enviar_mensagem(conn, resposta)
+            self._responder(conn, resposta)
             
         except KeyError as e:
             self._enviar_erro(conn, f"Campo obrigatório ausente: {e}")
@@ -264,7 +411,8 @@ class ServidorSocket:
         Critérios verificados:
         1. Remetente está autenticado
         2. Destinatário está online
-        3. Ambos estão no raio de comunicação (método pode_comunicar_sincronamente)
+        3. Ambos estão no raio de comunicação (mesma regra de pode_comunicar_sincronamente,
+           consultada no grafo de proximidade em O(1))
         
         Se qualquer critério falhar, mensagem é rejeitada.
         Cliente deve usar RabbitMQ para comunicação assíncrona.
@@ -280,18 +428,14 @@ class ServidorSocket:
             
             # SEÇÃO CRÍTICA: Acesso thread-safe aos dados compartilhados
             with self.lock:
-                usuario_remetente = self.usuarios_conectados[remetente]
-                
                 # Verifica se destinatário está conectado
                 if destinatario not in self.usuarios_conectados:
                     self._enviar_erro(conn, "Destinatário não está online")
                     return
                 
-                usuario_destinatario = self.usuarios_conectados[destinatario]
-                
                 # DECISÃO ARQUITETURAL: Verifica critérios para comunicação síncrona
                 # Esta é a linha que define quando usar socket vs RabbitMQ
-                if not usuario_remetente.pode_comunicar_sincronamente(usuario_destinatario):
+                if not self.grafo_proximidade.pode_comunicar(remetente, destinatario):
                     self._enviar_erro(conn, "Usuários não estão no raio de comunicação")
                     return
                 
@@ -311,7 +455,7 @@ class ServidorSocket:
                 'mensagem': 'Mensagem enviada com sucesso',
                 'timestamp': datetime.now().isoformat()
             }
-            self._enviar_mensagem(conn, resposta)
+            self._responder(conn, resposta)
             
             # Notifica callbacks
             for callback in self.callbacks_mensagem_recebida:
@@ -325,8 +469,85 @@ class ServidorSocket:
         except Exception as e:
             self._enviar_erro(conn, f"Erro ao enviar mensagem: {e}")
     
-    def _processar_listagem_usuarios(self, conn: socket.socket):
-        """Processa solicitação de listagem de usuários"""
+    def _processar_envio_assincrono(self, conn: socket.socket, mensagem: dict):
+        """
+        Publica no RabbitMQ uma mensagem assíncrona de um cliente sem conexão AMQP própria
+        
+        Vale para destinatários offline ou fora do raio: a mensagem vai para
+        a fila dele e chega pelo gateway (ou pelo consumer do cliente).
+        """
+        try:
+            remetente = self._encontrar_usuario_por_conexao(conn)
+            if not remetente:
+                self._enviar_erro(conn, "Usuário remetente não encontrado")
+                return
+            
+            if not self.gateway:
+                self._enviar_erro(conn, "Gateway do broker não está habilitado")
+                return
+            
+            destinatario = mensagem['destinatario']
+            conteudo = mensagem['conteudo']
+            motivo = mensagem.get('motivo', 'offline')
+            
+            if not self.gateway.publicar(remetente, destinatario, conteudo, motivo):
+                self._enviar_erro(conn, "Falha ao enviar mensagem assíncrona")
+                return
+            
+            # Confirmação para o remetente
+            resposta = {
+                'tipo': 'mensagem_enviada',
+                'mensagem': 'Mensagem assíncrona enviada com sucesso',
+                'assincrona': True,
+                'timestamp': datetime.now().isoformat()
+            }
+            self._responder(conn, resposta)
+            
+            # Notifica callbacks
+            for callback in self.callbacks_mensagem_recebida:
+                try:
+                    callback(remetente, destinatario, conteudo)
+                except Exception as e:
+                    print(f"Erro em callback de mensagem: {e}")
+            
+        except KeyError as e:
+            self._enviar_erro(conn, f"Campo obrigatório ausente: {e}")
+        except Exception as e:
+            self._enviar_erro(conn, f"Erro ao enviar mensagem assíncrona: {e}")
+    
+    def _entregar_mensagem_assincrona(self, nome_usuario: str, dados: dict) -> bool:
+        """
+        Entrega pelo socket uma mensagem consumida pelo gateway (chamado nos workers dele)
+        
+        Returns:
+            False se o usuário não está mais conectado ou o envio falhou
+            (a mensagem volta para a fila)
+        """
+        with self.lock:
+            conn = self.conexoes.get(nome_usuario)
+        if conn is None:
+            return False
+        
+        mensagem = {
+            'tipo': 'mensagem_recebida',
+            'assincrona': True,
+            'id': dados.get('id'),
+            'remetente': dados['remetente'],
+            'conteudo': dados['conteudo'],
+            'motivo': dados.get('motivo', 'desconhecido'),
+            'timestamp': dados.get('timestamp', datetime.now().isoformat())
+        }
+        return self._enviar_mensagem(conn, mensagem)
+    
+    def _processar_listagem_usuarios(self, conn: socket.socket, apenas_no_raio: bool = False):
+        """
+        Processa solicitação de listagem de usuários
+        
+        Args:
+            conn: Conexão do solicitante
+            apenas_no_raio: Se True, lista só os vizinhos do grafo de proximidade
+                            (custo proporcional ao grau, não ao total de usuários)
+        """
         try:
             nome_solicitante = self._encontrar_usuario_por_conexao(conn)
             if not nome_solicitante:
@@ -335,29 +556,38 @@ class ServidorSocket:
             
             with self.lock:
                 usuario_solicitante = self.usuarios_conectados[nome_solicitante]
-                usuarios_no_raio = []
+                vizinhos = self.grafo_proximidade.alcanca.get(nome_solicitante, set())
+                entradas = []
+                
+                if apenas_no_raio:
+                    candidatos = [(nome, self.usuarios_conectados[nome]) for nome in vizinhos]
+                else:
+                    candidatos = self.usuarios_conectados.items()
                 
-                for nome, usuario in self.usuarios_conectados.items():
+                # SERIALIZAÇÃO INCREMENTAL: Cada entrada reaproveita o fragmento
+                # JSON em cache do usuário e só codifica distância e no_raio,
+                # que dependem do solicitante
+                for nome, usuario in candidatos:
                     if nome != nome_solicitante:
                         distancia = usuario_solicitante.calcular_distancia(usuario)
-                        no_raio = usuario_solicitante.esta_no_raio(usuario)
-                        
-                        usuario_info = {
-                            'nome': usuario.nome,
-                            'latitude': usuario.latitude,
-                            'longitude': usuario.longitude,
-                            'status': usuario.status.value,
-                            'distancia': round(distancia, 2),
-                            'no_raio': no_raio
-                        }
-                        usuarios_no_raio.append(usuario_info)
+                        no_raio = b'true' if nome in vizinhos else b'false'
+                        entradas.append(b''.join((
+                            b'{', usuario.fragmento_presenca(),
+                            b', "distancia": ', repr(round(distancia, 2)).encode('ascii'),
+                            b', "no_raio": ', no_raio, b'}'
+                        )))
             
-            resposta = {
-                'tipo': 'lista_usuarios',
-                'usuarios': usuarios_no_raio,
-                'timestamp': datetime.now().isoformat()
-            }
-            self._enviar_mensagem(conn, resposta)
+            # Equivale a json.dumps({'tipo': 'lista_usuarios', 'usuarios': [...], 'timestamp': ...,
+            #                         'id_requisicao': ...})
+            id_requisicao = getattr(self._requisicao_atual, 'id', None)
+            resposta = b''.join((
+                b'{"tipo": "lista_usuarios", "usuarios": [', b', '.join(entradas),
+                b'], "timestamp": "', datetime.now().isoformat().encode('ascii'), b'"',
+                (b', "id_requisicao": ' + json.dumps(id_requisicao).encode('utf-8')
+                 if id_requisicao is not None else b''),
+                b'}'
+            ))
+            self._enviar_bytes(conn, resposta)
             
         except Exception as e:
             self._enviar_erro(conn, f"Erro ao listar usuários: {e}")
@@ -372,6 +602,7 @@ class ServidorSocket:
     
     def _desconectar_usuario(self, nome_usuario: str):
         """Desconecta usuário"""
+        removido = False
         with self.lock:
             if nome_usuario in self.usuarios_conectados:
                 usuario = self.usuarios_conectados[nome_usuario]
@@ -379,6 +610,7 @@ class ServidorSocket:
                 
                 del self.usuarios_conectados[nome_usuario]
                 del self.conexoes[nome_usuario]
+                self.grafo_proximidade.remover_usuario(nome_usuario)
                 
                 # Notifica callbacks
                 for callback in self.callbacks_usuario_desconectado:
@@ -388,14 +620,37 @@ class ServidorSocket:
                         print(f"Erro em callback de desconexão: {e}")
                 
                 print(f"Usuário {nome_usuario} desconectado")
+                removido = True
+        
+        # Fora do lock: cancelar espera a resposta do broker
+        if removido and self.gateway:
+            self.gateway.cancelar(nome_usuario)
     
-    def _enviar_mensagem(self, conn: socket.socket, mensagem: dict):
+    def _enviar_mensagem(self, conn: socket.socket, mensagem: dict) -> bool:
         """Envia mensagem para conexão"""
+        return self._enviar_bytes(conn, json.dumps(mensagem).encode('utf-8'))
+    
+    def _responder(self, conn: socket.socket, resposta: dict) -> bool:
+        """Envia a resposta à requisição em processamento, com o id_requisicao dela (se veio um)"""
+        id_requisicao = getattr(self._requisicao_atual, 'id', None)
+        if id_requisicao is not None:
+            resposta['id_requisicao'] = id_requisicao
+        return self._enviar_mensagem(conn, resposta)
+    
+    def _enviar_bytes(self, conn: socket.socket, dados: bytes) -> bool:
+        """Envia payload JSON já codificado como um frame (True se enviado)"""
         try:
-            dados = json.dumps(mensagem).encode('utf-8')
-            conn.send(dados)
+            frame = codificar_frame(dados, self.compressor, self.compressao_conexoes.get(conn))
+            lock_envio = self.locks_envio.get(conn)
+            if lock_envio:
+                with lock_envio:
+                    conn.sendall(frame)
+            else:
+                conn.sendall(frame)
+            return True
         except Exception as e:
             print(f"Erro ao enviar mensagem: {e}")
+            return False
     
     def _enviar_erro(self, conn: socket.socket, erro: str):
         """Envia mensagem de erro para conexão"""
@@ -404,7 +659,7 @@ class ServidorSocket:
             'mensagem': erro,
             'timestamp': datetime.now().isoformat()
         }
-        self._enviar_mensagem(conn, mensagem)
+        self._responder(conn, mensagem)
     
     def obter_usuarios_conectados(self) -> List[Usuario]:
         """Retorna lista de usuários conectados"""
@@ -412,14 +667,30 @@ class ServidorSocket:
             return list(self.usuarios_conectados.values())
     
     def obter_estatisticas(self) -> dict:
-        """Retorna estatísticas do servidor"""
+        """
+        Retorna estatísticas do servidor
+        
+        Inclui a compressão (prefixo compressao_), o gateway (prefixo
+        gateway_) e o resumo de MetricasBroker (prefixo broker_: publicações/s,
+        latências, atraso de consumo, reentregas, nacks e filas amostradas)
+        """
         with self.lock:
-            return {
+            estatisticas = {
                 'usuarios_conectados': len(self.usuarios_conectados),
+                'arestas_proximidade': self.grafo_proximidade.numero_arestas(),
                 'servidor_rodando': self.rodando,
+                'gateway_broker': self.gateway is not None,
                 'host': self.host,
                 'porta': self.porta
             }
+        estatisticas.update({f'compressao_{chave}': valor
+                             for chave, valor in self.compressor.obter_metricas().items()})
+        if self.gateway:
+            estatisticas.update({f'gateway_{chave}': valor
+                                 for chave, valor in self.gateway.obter_metricas().items()})
+        estatisticas.update({f'broker_{chave}': valor
+                             for chave, valor in MetricasBroker.padrao().resumo().items()})
+        return estatisticas
 
 if __name__ == "__main__":
     # Teste básico do servidor
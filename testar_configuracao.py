@@ -21,6 +21,10 @@ def testar_imports():
         from broker.rabbitmq_manager import ConfiguradorRabbitMQ
         print("✅ Módulo broker: OK")
         
+        # Testa cliente sem interface
+        from client.cliente_geochat import ClienteGeoChat
+        print("✅ Módulo cliente: OK")
+        
         # Testa GUI
         from gui.cliente_integrado import ClienteIntegrado
         from gui.interface_servidor import InterfaceServidor